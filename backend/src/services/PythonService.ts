@@ -38,6 +38,15 @@ export class PythonService {
   }>> = new Map();
   
   private cacheTTL: number = 8000; // Increased from 3000ms to 8000ms (8 seconds)
+  
+  // Requests this side gave up on (the Python metrics only see slow answers)
+  private clientTimeouts: number = 0;
+
+  // Sessions subscribed to event output, by session id
+  private eventHandlers: Map<string, (response: any) => void> = new Map();
+
+  // Landmarks (and fields) each exercise's analyzer reads, from the Python ready message
+  private landmarkManifests: Record<string, { indices: number[]; fields: string[] }> = {};
 
   constructor() {
     // Use the new modular server script
@@ -126,6 +135,7 @@ export class PythonService {
             if (response.status === 'ready') {
               clearTimeout(initTimeout);
               logger.info('Python service initialized successfully');
+              this.landmarkManifests = response.landmarkManifests || {};
               this.startResponseListener();
               this.startHealthCheck();
               this.isInitialized = true;
@@ -187,6 +197,9 @@ export class PythonService {
           // Resolve the promise
           resolve(response);
           this.requestQueue.delete(requestId);
+        } else if (response.sessionId && this.eventHandlers.has(response.sessionId)) {
+          // Streamed frames of subscribed sessions are only answered with events (or failures)
+          this.eventHandlers.get(response.sessionId)!(response);
         } else {
           logger.warn(`Received response for unknown request ID: ${requestId}`);
         }
@@ -220,6 +233,7 @@ export class PythonService {
       for (const [requestId, request] of this.requestQueue.entries()) {
         if (now - request.timestamp > 10000) {
           logger.warn(`Abandoning stale request ${requestId}`);
+          this.clientTimeouts++;
           request.reject(new Error('Request timed out'));
           this.requestQueue.delete(requestId);
         }
@@ -245,6 +259,12 @@ export class PythonService {
       this.requestQueue.delete(requestId);
     }
     
+    // A restarted process has no subscriptions
+    if (this.eventHandlers.size > 0) {
+      logger.warn(`Dropping ${this.eventHandlers.size} event subscriptions`);
+      this.eventHandlers.clear();
+    }
+    
     // Clean up process resources
     if (this.responseListener) {
       this.responseListener.close();
@@ -394,17 +414,7 @@ export class PythonService {
     const requestId = `${exerciseType}-${Date.now()}-${Math.random().toString(36).substring(2, 9)}`;
     
     // Create dedicated payload for Python to ensure consistent format
-    const pythonPayload = {
-      requestId,
-      exerciseType,
-      type: "landmarks",  // Add explicit type field to match frontend format
-      poseLandmarks: poseData.poseLandmarks,
-      // Include additional data that might be useful for analysis
-      timestamp: poseData.timestamp,
-      // Add additional metadata if available
-      frameId: (poseData as any).frameId, // Use type assertion for optional fields
-      isMirrored: poseData.isMirrored
-    };
+    const pythonPayload = this.encodePose(requestId, exerciseType, poseData);
 
     // Store the pose data for use in caching later
     this.lastAnalyzedPose = { ...poseData };
@@ -424,6 +434,7 @@ export class PythonService {
       const timeoutId = setTimeout(() => {
         if (this.requestQueue.has(requestId)) {
           this.requestQueue.delete(requestId);
+          this.clientTimeouts++;
           reject(new Error(`Analysis timed out after ${timeoutMs}ms`));
         }
       }, timeoutMs);
@@ -459,7 +470,7 @@ export class PythonService {
   /**
    * Reset the repetition counter for a specific exercise
    */
-  public async resetRepCounter(exerciseType: ExerciseType = 'squat'): Promise<boolean> {
+  public async resetRepCounter(exerciseType: ExerciseType = 'squat', sessionId?: string): Promise<boolean> {
     logger.info(`RESET_DEBUG: PythonService - Starting resetRepCounter for ${exerciseType}`);
     
     // Initialize if needed
@@ -505,6 +516,7 @@ export class PythonService {
             requestId,
             command: 'reset_counter',
             exerciseType,
+            sessionId,  // Only this session's counters when per-session rep state is on
             type: 'command',  // Add explicit type field for consistency
             timestamp: Date.now()
           };
@@ -540,4 +552,264 @@ export class PythonService {
       return false;
     }
   }
+
+  /**
+   * Per-exercise request counts, errors, latency percentiles, sessions,
+   * queue depth and RSS from the Python server's metrics command, plus the
+   * number of requests that timed out on this side.
+   * Pass a textfile path (null to stop) to have the server keep a
+   * Prometheus textfile-collector file up to date.
+   */
+  public async getMetrics(textfile?: string | null, interval?: number): Promise<any> {
+    if (!this.isInitialized || !this.pythonProcess || !this.pythonProcess.stdin) {
+      return { success: false, clientTimeouts: this.clientTimeouts };
+    }
+
+    const requestId = `metrics-${Date.now()}-${Math.random().toString(36).substring(2, 9)}`;
+    const payload: Record<string, any> = { requestId, command: 'metrics', type: 'command' };
+    if (textfile !== undefined) {
+      payload.textfile = textfile;
+      payload.interval = interval;
+    }
+
+    return new Promise<any>((resolve, reject) => {
+      this.requestQueue.set(requestId, {
+        resolve,
+        reject,
+        timestamp: Date.now(),
+        exerciseType: 'squat'
+      });
+
+      const timeoutMs = 3000;
+      setTimeout(() => {
+        if (this.requestQueue.has(requestId)) {
+          this.requestQueue.delete(requestId);
+          reject(new Error(`Metrics request timed out after ${timeoutMs}ms`));
+        }
+      }, timeoutMs);
+
+      this.pythonProcess!.stdin!.write(JSON.stringify(payload) + '\n', (err) => {
+        if (err) {
+          this.requestQueue.delete(requestId);
+          reject(err);
+        }
+      });
+    }).then(response => ({ ...response, clientTimeouts: this.clientTimeouts }))
+      .catch(error => {
+        logger.error('Error getting Python metrics:', error);
+        return { success: false, clientTimeouts: this.clientTimeouts };
+      });
+  }
+
+  /**
+   * Switch a session to event output: instead of a full result per frame,
+   * the Python server only reports stage changes, new or cleared errors,
+   * completed reps (with range of motion, tempo and worst error) and a
+   * heartbeat with the current metrics every heartbeatInterval seconds.
+   * Frames sent with streamPose are not answered otherwise; their events
+   * and failures go to onEvents.
+   */
+  public async subscribeEvents(
+    sessionId: string,
+    exerciseType: ExerciseType,
+    onEvents: (response: any) => void,
+    heartbeatInterval: number = 1
+  ): Promise<boolean> {
+    const response = await this.sendCommand('subscribe', {
+      sessionId,
+      exerciseType,
+      mode: 'events',
+      heartbeatInterval
+    });
+    if (response.success) {
+      this.eventHandlers.set(sessionId, onEvents);
+    }
+    return !!response.success;
+  }
+
+  /**
+   * Go back to a full result per frame for the session
+   */
+  public async unsubscribeEvents(sessionId: string): Promise<boolean> {
+    this.eventHandlers.delete(sessionId);
+    const response = await this.sendCommand('subscribe', { sessionId, mode: 'frames' });
+    return !!response.success;
+  }
+
+  /**
+   * Send a frame of a subscribed session without waiting for an answer
+   */
+  public streamPose(sessionId: string, exerciseType: ExerciseType, poseData: PoseData): boolean {
+    if (!this.isInitialized || !this.pythonProcess || !this.pythonProcess.stdin || !this.isValidPoseData(poseData)) {
+      return false;
+    }
+
+    const requestId = `${sessionId}-${Date.now()}-${Math.random().toString(36).substring(2, 9)}`;
+    const payload = this.encodePose(requestId, exerciseType, poseData, sessionId);
+    this.pythonProcess.stdin.write(JSON.stringify(payload) + '\n');
+    return true;
+  }
+
+  /**
+   * Frame message for the Python server. With a landmark manifest for the
+   * exercise this is a reduced frame: only the landmarks and fields its
+   * analyzer reads, as one flat array in manifest order. Otherwise all
+   * landmarks are sent.
+   */
+  private encodePose(requestId: string, exerciseType: ExerciseType, poseData: PoseData, sessionId?: string): Record<string, any> {
+    const manifest = this.landmarkManifests[exerciseType];
+    const landmarks = poseData.poseLandmarks as any[];
+    if (manifest && manifest.indices.every(idx => idx < landmarks.length)) {
+      const values: number[] = [];
+      for (const idx of manifest.indices) {
+        for (const field of manifest.fields) {
+          values.push(landmarks[idx][field] ?? 0);
+        }
+      }
+      return {
+        requestId,
+        sessionId,
+        t: 'reduced',
+        e: exerciseType,
+        id: (poseData as any).frameId,
+        ts: poseData.timestamp,
+        p: values
+      };
+    }
+
+    return {
+      requestId,
+      sessionId,
+      exerciseType,
+      type: "landmarks",  // Add explicit type field to match frontend format
+      poseLandmarks: poseData.poseLandmarks,
+      // Include additional data that might be useful for analysis
+      timestamp: poseData.timestamp,
+      // Add additional metadata if available
+      frameId: (poseData as any).frameId, // Use type assertion for optional fields
+      isMirrored: poseData.isMirrored
+    };
+  }
+
+  /**
+   * Switch a session to compact errors: its results carry errorCodes
+   * ([code, value] pairs) instead of error objects. Returns the exercise's
+   * code table, loaded once per session and passed to expandErrorCodes.
+   */
+  public async loadErrorCodes(sessionId: string, exerciseType: ExerciseType): Promise<any | null> {
+    const response = await this.sendCommand('error_codes', { sessionId, exerciseType, mode: 'compact' });
+    return response.success ? response.errorCodes[exerciseType] : null;
+  }
+
+  /**
+   * Rebuild the error objects of a compact result from its code table
+   */
+  public static expandErrorCodes(table: any, errorCodes: [number, any][]): ExerciseError[] {
+    return errorCodes.map(([code, value]) => {
+      const entry = table.codes[code];
+      const values = value === null || value === undefined ? [] : Array.isArray(value) ? value : [value];
+      let next = 0;
+      const message = entry.message.replace(/\{\}/g, () => String(values[next++]));
+      return { type: entry.type, severity: entry.severity, message };
+    });
+  }
+
+  /**
+   * Turn capture rate advice on or off. When on, results (and heartbeats
+   * of subscribed sessions) carry frameRate: the recommended capture rate
+   * for the current motion and stage, and the minimum rep counting needs.
+   */
+  public async setFrameRateAdvice(enabled: boolean): Promise<boolean> {
+    const response = await this.sendCommand('frame_rate', { enabled });
+    return !!response.success;
+  }
+
+  /**
+   * Pin a session to a quality tier ('full', 'cheap' or 'geometric'), or
+   * hand it back to the server's load shedding with null. Every result
+   * reports the tier it was analyzed at as qualityTier.
+   */
+  public async setQualityTier(sessionId: string, exerciseType: ExerciseType, tier: string | null): Promise<string | null> {
+    const response = await this.sendCommand('quality', { sessionId, exerciseType, tier });
+    return response.success ? response.qualityTier : null;
+  }
+
+  /**
+   * Summary of a session kept by the server as results come in: angle
+   * statistics and range of motion, form score distribution, error counts
+   * and time in each stage. Pass reset at the end of a set to start over.
+   */
+  public async getSessionSummary(sessionId: string, exerciseType: ExerciseType, reset: boolean = false): Promise<any | null> {
+    const response = await this.sendCommand('session_summary', { sessionId, exerciseType, reset });
+    return response.success ? response.summary : null;
+  }
+
+  /**
+   * Chart-ready series of a session's key metrics (knee/curl/torso angle,
+   * form score), as [seconds, value] points, at most maxPoints per metric
+   * however long the set was. Pass reset at the end of a set to start over.
+   */
+  public async getSessionTimeline(sessionId: string, exerciseType: ExerciseType, maxPoints: number = 200,
+                                  reset: boolean = false): Promise<any | null> {
+    const response = await this.sendCommand('session_timeline', { sessionId, exerciseType, maxPoints, reset });
+    return response.success ? response.timeline : null;
+  }
+
+  /**
+   * Turn duplicate frame detection on or off (on by default). Frames whose
+   * quantized landmarks match the session's previous frame are answered
+   * from its result, flagged duplicate: true. Returns the duplicate rates.
+   */
+  public async setFrameDedup(enabled: boolean, quantization?: number): Promise<any | null> {
+    const response = await this.sendCommand('dedup', { enabled, quantization });
+    return response.success ? response.dedup : null;
+  }
+
+  /**
+   * Keep an exercise's rep state (squat, bicep, situp) per session instead
+   * of one counter shared by every session of that exercise. Returns the
+   * state store occupancy.
+   */
+  public async setStateStore(exerciseType: ExerciseType, enabled: boolean): Promise<any | null> {
+    const response = await this.sendCommand('state_store', { exerciseType, enabled });
+    return response.success ? response.stateStore : null;
+  }
+
+  /**
+   * Send a server command and wait for its acknowledgement
+   */
+  private async sendCommand(command: string, data: Record<string, any>, timeoutMs: number = 3000): Promise<any> {
+    if (!this.isInitialized || !this.pythonProcess || !this.pythonProcess.stdin) {
+      return { success: false };
+    }
+
+    const requestId = `${command}-${Date.now()}-${Math.random().toString(36).substring(2, 9)}`;
+    const payload = { ...data, requestId, command, type: 'command' };
+
+    return new Promise<any>((resolve, reject) => {
+      this.requestQueue.set(requestId, {
+        resolve,
+        reject,
+        timestamp: Date.now(),
+        exerciseType: data.exerciseType || 'squat'
+      });
+
+      setTimeout(() => {
+        if (this.requestQueue.has(requestId)) {
+          this.requestQueue.delete(requestId);
+          reject(new Error(`${command} command timed out after ${timeoutMs}ms`));
+        }
+      }, timeoutMs);
+
+      this.pythonProcess!.stdin!.write(JSON.stringify(payload) + '\n', (err) => {
+        if (err) {
+          this.requestQueue.delete(requestId);
+          reject(err);
+        }
+      });
+    }).catch(error => {
+      logger.error(`Error sending ${command} command:`, error);
+      return { success: false };
+    });
+  }
 } 
\ No newline at end of file
@@ -0,0 +1,325 @@
+"""
+Offline analysis of recorded landmark sessions.
+
+    python analyze_session.py session.jsonl --exercise squat --output-dir out
+    python analyze_session.py recordings/*.npz --exercise plank --format parquet --workers 4
+
+A session is a JSONL file of any message format the live server accepts, a
+packed .npy / .npz array of shape (frames, 33, 4) (x, y, z, visibility), or
+a server recording (.okrec, see session_recorder.py). An .npz may also hold
+`timestamps` (seconds) and `exercise_type`. Recordings can interleave several
+sessions; frames are selected by exercise and, with --session, session id.
+
+For analyzers with an ML stage model the stateless part (feature extraction,
+scaling, inference) runs once over the whole session through the analyzer's
+predict_batch(); the per-frame pass then replays the analyzer's own stage /
+rep state machine on those predictions, clocked by the frame timestamps.
+Writes <name>.frames.<format> per session and summary.<format> for the run.
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+import importlib
+import importlib.util
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from frame_decoder import NUM_LANDMARKS, decode_frame, landmarks_to_array, array_to_landmarks
+from session_recorder import RECORDING_SUFFIX, read_recording
+
+logger = logging.getLogger('AnalyzeSession')
+
+# Same module/class mapping as ExerciseAnalyzerServer.load_analyzer
+ANALYZER_CLASSES = {
+    "squat": ("squat_analyzer", "SquatAnalyzer"),
+    "bicep": ("bicep_analyzer", "BicepAnalyzer"),
+    "lunge": ("lunge_analyzer", "LungeAnalyzer"),
+    "plank": ("plank_analyzer", "PlankAnalyzer"),
+    "situp": ("situp_analyzer", "SitupAnalyzer"),
+    "shoulder_press": ("shoulder_press_analyzer", "ShoulderPressAnalyzer"),
+    "bench_press": ("bench_press_analyzer", "BenchPressAnalyzer"),
+    "pushup": ("pushup_analyzer", "PushupAnalyzer"),
+    "lateral_raise": ("lateral_raise_analyzer", "LateralRaiseAnalyzer"),
+}
+
+OUTPUT_FORMATS = ("csv", "jsonl", "parquet")
+
+# Analyzer instances are reused across the sessions a worker process handles
+_analyzers = {}
+
+
+class PredictionReplay:
+    """
+    Per-frame outputs of an analyzer's predict_batch(), handed back to the
+    analyzer one frame at a time through its prediction_replay hook
+    """
+
+    def __init__(self, predictions: List[Any]):
+        self.predictions = predictions
+        self.index = 0
+
+    def current(self) -> Any:
+        return self.predictions[self.index]
+
+
+def create_analyzer(exercise_type: str):
+    """New analyzer instance for an exercise type"""
+    if exercise_type not in ANALYZER_CLASSES:
+        raise ValueError(f"Unknown exercise type: {exercise_type}")
+
+    module_name, class_name = ANALYZER_CLASSES[exercise_type]
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def get_analyzer(exercise_type: str):
+    """Create (once per process) the analyzer for an exercise type"""
+    if exercise_type not in _analyzers:
+        _analyzers[exercise_type] = create_analyzer(exercise_type)
+    return _analyzers[exercise_type]
+
+
+def load_session(path: Path, exercise_type: Optional[str] = None, fps: float = 30.0,
+                 session_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Read a recorded session into a (frames, 33, 4) float32 array plus
+    per-frame timestamps in seconds. Frames without a timestamp are spaced
+    1/fps after the previous one.
+    """
+    skipped = 0
+    frame_timestamps = []
+
+    if path.suffix == ".jsonl":
+        frames = []
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                data = json.loads(line)
+                if "command" in data:
+                    continue
+
+                frame = decode_frame(data)
+                if len(frame["landmarks"]) < NUM_LANDMARKS:
+                    skipped += 1
+                    continue
+
+                exercise_type = exercise_type or frame["exerciseType"]
+                frames.append(landmarks_to_array(frame["landmarks"]))
+                frame_timestamps.append(frame["timestamp"])
+
+        frames = np.stack(frames) if frames else np.zeros((0, NUM_LANDMARKS, 4), dtype=np.float32)
+    elif path.suffix == RECORDING_SUFFIX:
+        frames = []
+        for record in read_recording(path):
+            exercise_type = exercise_type or record["exerciseType"]
+            if record["exerciseType"] != exercise_type:
+                continue
+            if session_id is not None and record["sessionId"] != session_id:
+                continue
+            if len(record["landmarks"]) < NUM_LANDMARKS:
+                skipped += 1
+                continue
+
+            frames.append(record["landmarks"][:NUM_LANDMARKS])
+            frame_timestamps.append(record["timestamp"])
+
+        frames = np.stack(frames) if frames else np.zeros((0, NUM_LANDMARKS, 4), dtype=np.float32)
+    elif path.suffix == ".npz":
+        with np.load(path, allow_pickle=False) as bundle:
+            frames = bundle["landmarks"] if "landmarks" in bundle else bundle["frames"]
+            if "timestamps" in bundle:
+                frame_timestamps = bundle["timestamps"].astype(np.float64).tolist()
+            if exercise_type is None and "exercise_type" in bundle:
+                exercise_type = str(bundle["exercise_type"])
+    elif path.suffix == ".npy":
+        frames = np.load(path, allow_pickle=False)
+    else:
+        raise ValueError(f"Unsupported session file: {path.name}")
+
+    frames = np.asarray(frames, dtype=np.float32)
+    if frames.ndim != 3 or frames.shape[1:] != (NUM_LANDMARKS, 4):
+        raise ValueError(f"Expected landmarks of shape (frames, 33, 4), got {frames.shape}")
+    if exercise_type is None:
+        raise ValueError("Exercise type not recorded in the session, pass --exercise")
+
+    timestamps = np.zeros(len(frames), dtype=np.float64)
+    previous = -1.0 / fps
+    for i in range(len(frames)):
+        timestamp = frame_timestamps[i] if i < len(frame_timestamps) else None
+        timestamps[i] = timestamp if timestamp is not None else previous + 1.0 / fps
+        previous = timestamps[i]
+
+    return {
+        "exerciseType": exercise_type,
+        "frames": frames,
+        "timestamps": timestamps,
+        "skippedFrames": skipped
+    }
+
+
+def flatten_result(index: int, timestamp: float, response: Dict[str, Any]) -> Dict[str, Any]:
+    """One output row from an analyzer response"""
+    row = {"frame": index, "timestamp": timestamp, "success": bool(response.get("success"))}
+    if not row["success"]:
+        row["error"] = response.get("error", {}).get("message")
+        return row
+
+    result = response.get("result", {})
+    errors = result.get("errors") or []
+    row.update({
+        "stage": result.get("stage"),
+        "repCount": result.get("repCount"),
+        "holdTime": result.get("holdTime"),
+        "formScore": result.get("formScore"),
+        "errorCount": len(errors),
+        "errorTypes": "|".join(sorted({error.get("type", "") for error in errors}))
+    })
+    for name, value in (result.get("metrics") or {}).items():
+        if isinstance(value, (bool, int, float)) or value is None:
+            row[f"metric_{name}"] = value
+    return row
+
+
+def analyze_frames(analyzer, frames: np.ndarray, timestamps: np.ndarray, batched: bool = True,
+                   make_row: Callable[[int, float, Dict[str, Any]], Any] = flatten_result) -> List[Any]:
+    """
+    Run one session through an analyzer: batched stateless inference (when
+    the analyzer supports it) followed by a per-frame state machine replay.
+    Each response is turned into a row by make_row(index, timestamp, response).
+    """
+    analyzer.reset_rep_counter()
+
+    replay = None
+    if batched and len(frames) and hasattr(analyzer, "predict_batch"):
+        predictions = analyzer.predict_batch(frames)
+        if predictions is not None:
+            replay = PredictionReplay(predictions)
+
+    rows = []
+    analyzer.prediction_replay = replay
+    try:
+        for i, (frame, timestamp) in enumerate(zip(frames, timestamps.tolist())):
+            if replay is not None:
+                replay.index = i
+            response = analyzer.analyze_pose(array_to_landmarks(frame), timestamp=timestamp)
+            rows.append(make_row(i, timestamp, response))
+    finally:
+        analyzer.prediction_replay = None
+    return rows
+
+
+def summarize(path: Path, session: Dict[str, Any], frames_df: pd.DataFrame,
+              processing_seconds: float, batched: bool) -> Dict[str, Any]:
+    """Rep summary of one analyzed session"""
+    timestamps = session["timestamps"]
+    duration = float(timestamps[-1] - timestamps[0]) if len(timestamps) > 1 else 0.0
+    ok = frames_df[frames_df["success"]] if len(frames_df) else frames_df
+
+    summary = {
+        "file": str(path),
+        "exerciseType": session["exerciseType"],
+        "frames": int(len(frames_df)),
+        "skippedFrames": session["skippedFrames"],
+        "failedFrames": int(len(frames_df) - len(ok)),
+        "durationSeconds": round(duration, 3),
+        "repCount": None,
+        "holdTime": None,
+        "avgFormScore": None,
+        "batchedInference": batched,
+        "processingSeconds": round(processing_seconds, 3),
+        "realtimeFactor": round(duration / processing_seconds, 1) if processing_seconds > 0 else None
+    }
+    if len(ok):
+        for column in ("repCount", "holdTime"):
+            if column in ok and ok[column].notna().any():
+                summary[column] = int(ok[column].dropna().iloc[-1])
+        summary["avgFormScore"] = round(float(ok["formScore"].mean()), 2)
+        for error_types in ok["errorTypes"]:
+            for error_type in filter(None, error_types.split("|")):
+                key = f"errorFrames_{error_type}"
+                summary[key] = summary.get(key, 0) + 1
+    return summary
+
+
+def write_table(df: pd.DataFrame, path: Path, output_format: str) -> None:
+    if output_format == "csv":
+        df.to_csv(path, index=False)
+    elif output_format == "jsonl":
+        df.to_json(path, orient="records", lines=True)
+    else:
+        # Needs pyarrow or fastparquet
+        df.to_parquet(path, index=False)
+
+
+def analyze_file(path: str, exercise_type: Optional[str], output_dir: str,
+                 output_format: str, fps: float, batched: bool,
+                 session_id: Optional[str] = None) -> Dict[str, Any]:
+    """Analyze one session file and write its per-frame results"""
+    path = Path(path)
+    try:
+        session = load_session(path, exercise_type, fps, session_id)
+        analyzer = get_analyzer(session["exerciseType"])
+
+        start_time = time.perf_counter()
+        rows = analyze_frames(analyzer, session["frames"], session["timestamps"], batched)
+        processing_seconds = time.perf_counter() - start_time
+
+        frames_df = pd.DataFrame(rows)
+        write_table(frames_df, Path(output_dir) / f"{path.stem}.frames.{output_format}", output_format)
+        return summarize(path, session, frames_df, processing_seconds, batched)
+    except Exception as e:
+        logger.error(f"Failed to analyze {path}: {str(e)}")
+        return {"file": str(path), "error": str(e)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Re-score recorded landmark sessions offline")
+    parser.add_argument("sessions", nargs="+", help=".jsonl, .npy, .npz or .okrec session files")
+    parser.add_argument("--exercise", choices=list(ANALYZER_CLASSES),
+                        help="Exercise type (default: taken from the recording)")
+    parser.add_argument("--session", help="Session id to select from server recordings")
+    parser.add_argument("--output-dir", default="session_results")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="csv")
+    parser.add_argument("--fps", type=float, default=30.0,
+                        help="Frame rate assumed for frames without a timestamp")
+    parser.add_argument("--workers", type=int, default=1, help="Process pool size across files")
+    parser.add_argument("--no-batch", action="store_true",
+                        help="Run inference frame by frame exactly as the live server does")
+    parser.add_argument("--verbose", action="store_true", help="Keep the analyzers' per-frame logging")
+    args = parser.parse_args(argv)
+
+    if args.format == "parquet" and not any(
+            importlib.util.find_spec(engine) for engine in ("pyarrow", "fastparquet")):
+        parser.error("--format parquet requires pyarrow or fastparquet to be installed")
+
+    if not args.verbose:
+        # The analyzers log every frame at INFO/WARNING, which dominates offline runtime
+        logging.disable(logging.WARNING)
+
+    Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    jobs = [
+        (session, args.exercise, args.output_dir, args.format, args.fps, not args.no_batch, args.session)
+        for session in args.sessions
+    ]
+
+    if args.workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            summaries = list(pool.map(analyze_file, *zip(*jobs)))
+    else:
+        summaries = [analyze_file(*job) for job in jobs]
+
+    write_table(pd.DataFrame(summaries), Path(args.output_dir) / f"summary.{args.format}", args.format)
+    for summary in summaries:
+        print(json.dumps(summary))
+    return 1 if any("error" in summary for summary in summaries) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
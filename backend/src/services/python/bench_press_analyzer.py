@@ -6,6 +6,9 @@ import os
 import traceback
 from typing import List, Dict, Any, Tuple, Literal, Optional
 
+from diagnostics import DIAG
+from error_codes import ERROR_TABLES
+
 # Configure logging
 logging.basicConfig(
     level=logging.WARNING,
@@ -13,6 +16,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger('BenchPressAnalyzer')
 
+ERRORS = ERROR_TABLES['bench_press']
+UNEVEN_PRESSING, INCOMPLETE_PRESS = ERRORS.codes('uneven_pressing', 'incomplete_press')
+
 # Error types
 ERROR_TYPES = Literal[
     'INVALID_INPUT',
@@ -175,7 +181,7 @@ class BenchPressPoseAnalysis:
     def analyze_pose(self, landmarks):
         """
         Analyze the bench press pose and detect errors
-        Returns: (left_shoulder_angle, right_shoulder_angle, is_visible, errors)
+        Returns: (left_shoulder_angle, right_shoulder_angle, is_visible, errors as [code, value] pairs)
         """
         left_shoulder_angle = None
         right_shoulder_angle = None
@@ -186,20 +192,19 @@ class BenchPressPoseAnalysis:
         
         # Cancel calculation if visibility is poor
         if not self.is_visible:
-            logger.warning("BENCH_PRESS_DEBUG: Poor visibility detected, can't calculate angles")
+            if DIAG.on("bench_press"):
+                DIAG.emit("bench_press", "low_visibility")
             return left_shoulder_angle, right_shoulder_angle, self.is_visible, errors
             
         # Calculate angles between shoulder, elbow, and wrist
         try:
             left_shoulder_angle = int(calculate_angle(self.left_shoulder, self.left_elbow, self.left_wrist))
-            logger.info(f"BENCH_PRESS_DEBUG: Left shoulder angle calculated: {left_shoulder_angle}°")
         except Exception as e:
             logger.error(f"BENCH_PRESS_DEBUG: Error calculating left shoulder angle: {e}")
             left_shoulder_angle = None
             
         try:
             right_shoulder_angle = int(calculate_angle(self.right_shoulder, self.right_elbow, self.right_wrist))
-            logger.info(f"BENCH_PRESS_DEBUG: Right shoulder angle calculated: {right_shoulder_angle}°")
         except Exception as e:
             logger.error(f"BENCH_PRESS_DEBUG: Error calculating right shoulder angle: {e}")
             right_shoulder_angle = None
@@ -222,24 +227,17 @@ class BenchPressPoseAnalysis:
             # Count rep when transitioning from down to up
             if previous_stage == "down":
                 self.counter += 1
-                logger.info(f"Bench Press rep counted: {self.counter}")
+                if DIAG.on("bench_press"):
+                    DIAG.emit("bench_press", "rep_counted", count=self.counter, left_angle=left_shoulder_angle, right_angle=right_shoulder_angle)
         
         # Check for uneven pressing (more than 15 degrees difference)
         if abs(left_shoulder_angle - right_shoulder_angle) > 15:
-            errors.append({
-                "type": "uneven_pressing",
-                "severity": "medium",
-                "message": "Keep both arms even during the press"
-            })
+            errors.append([UNEVEN_PRESSING, None])
             self.detected_errors["UNEVEN_PRESSING"] += 1
         
         # Check for incomplete pressing form
         if self.stage == "up" and (left_shoulder_angle < 150 or right_shoulder_angle < 150):
-            errors.append({
-                "type": "incorrect_form",
-                "severity": "low",
-                "message": "Extend arms fully for complete range of motion"
-            })
+            errors.append([INCOMPLETE_PRESS, None])
             self.detected_errors["INCOMPLETE_PRESS"] += 1
         
         # Save previous angles
@@ -259,6 +257,10 @@ class BenchPressAnalyzer:
                 visibility_threshold=self.visibility_threshold
             )
             
+            # Emit [code, value] pairs instead of error dicts, set per call by
+            # the server for sessions that loaded the error code table
+            self.compact_errors = False
+            
             logger.info("BenchPressAnalyzer initialized successfully")
             logger.info("""
             BENCH PRESS DETECTION CONFIGURATION:
@@ -283,33 +285,22 @@ class BenchPressAnalyzer:
         
         logger.warning(f"RESET_DEBUG: Bench Press counter reset from {old_count} to {new_count}")
     
-    def calculate_form_score(self, errors: List[Dict[str, str]]) -> float:
-        """Calculate form score based on errors."""
-        base_score = 100
-        
-        for error in errors:
-            if error['severity'] == 'high':
-                base_score -= 20
-            elif error['severity'] == 'medium':
-                base_score -= 10
-            elif error['severity'] == 'low':
-                base_score -= 5
-        
-        return max(0, min(100, base_score))
+    def calculate_form_score(self, errors: List[list]) -> float:
+        """Calculate form score from the integer weights of the error codes."""
+        return ERRORS.form_score(errors)
     
-    def analyze_pose(self, landmarks: List[Dict[str, float]]) -> Dict[str, Any]:
+    def analyze_pose(self, landmarks: List[Dict[str, float]], timestamp: Optional[float] = None) -> Dict[str, Any]:
         """
         Analyze the pose data and return metrics, stage, errors, and scores.
         
         Args:
             landmarks: List of landmark dictionaries with x, y, z and visibility.
+            timestamp: Capture time of the frame in seconds; wall clock if omitted.
                 
         Returns:
             Dictionary with stage, metrics, errors, repCount, and formScore.
         """
         try:
-            logger.info("BENCH_PRESS_DEBUG: Starting pose analysis")
-            
             if not landmarks or not isinstance(landmarks, list):
                 logger.error("BENCH_PRESS_DEBUG: No pose landmarks provided in input data")
                 return {
@@ -336,7 +327,6 @@ class BenchPressAnalyzer:
             
             # Use landmarks directly
             raw_landmarks = landmarks
-            logger.info(f"BENCH_PRESS_DEBUG: Received {len(raw_landmarks)} landmarks")
             
             # Default values in case of errors
             stage = "down"
@@ -346,10 +336,8 @@ class BenchPressAnalyzer:
             errors = []
             
             # Analyze bench press pose
-            logger.info("BENCH_PRESS_DEBUG: Analyzing bench press pose")
             try:
                 left_shoulder_angle, right_shoulder_angle, is_visible, errors = self.analyzer.analyze_pose(raw_landmarks)
-                logger.info(f"BENCH_PRESS_DEBUG: Pose analysis complete. Left angle: {left_shoulder_angle}, Right angle: {right_shoulder_angle}, Visible: {is_visible}")
             except Exception as analyze_err:
                 logger.error(f"BENCH_PRESS_DEBUG: Error in bench press pose analysis: {analyze_err}")
                 logger.error(traceback.format_exc())
@@ -359,7 +347,6 @@ class BenchPressAnalyzer:
             form_score = 100
             try:
                 form_score = self.calculate_form_score(errors)
-                logger.info(f"BENCH_PRESS_DEBUG: Form score: {form_score}")
             except Exception as score_err:
                 logger.error(f"BENCH_PRESS_DEBUG: Error calculating form score: {score_err}")
             
@@ -367,14 +354,12 @@ class BenchPressAnalyzer:
             rep_count = 0
             try:
                 rep_count = self.analyzer.get_counter()
-                logger.info(f"BENCH_PRESS_DEBUG: Repetition count: {rep_count}")
             except Exception as rep_err:
                 logger.error(f"BENCH_PRESS_DEBUG: Error getting rep count: {rep_err}")
             
             # Get current stage
             try:
                 stage = self.analyzer.stage
-                logger.info(f"BENCH_PRESS_DEBUG: Current stage: {stage}")
             except Exception as stage_err:
                 logger.error(f"BENCH_PRESS_DEBUG: Error getting stage: {stage_err}")
                 stage = "down"  # Default to down stage
@@ -386,17 +371,20 @@ class BenchPressAnalyzer:
                 "isVisible": is_visible
             }
             
-            logger.info("BENCH_PRESS_DEBUG: Analysis complete, returning results")
+            if DIAG.on("bench_press"):
+                DIAG.emit("bench_press", "result", stage=stage, rep_count=rep_count, left_angle=left_shoulder_angle,
+                          right_angle=right_shoulder_angle, visible=is_visible, form_score=form_score,
+                          errors=lambda: [ERRORS.types[code] for code, _ in errors])
             # Return complete analysis result
+            result = {
+                'stage': stage,
+                'metrics': metrics,
+                'formScore': form_score,
+                'repCount': rep_count
+            }
             return {
                 'success': True,
-                'result': {
-                    'stage': stage,
-                    'metrics': metrics,
-                    'errors': errors,
-                    'formScore': form_score,
-                    'repCount': rep_count
-                }
+                'result': ERRORS.put_errors(result, errors, self.compact_errors)
             }
             
         except Exception as e:
@@ -0,0 +1,331 @@
+"""
+Per-analyzer throughput and latency benchmark.
+
+    python benchmark_analyzers.py --save-baseline benchmark_baseline.json
+    python benchmark_analyzers.py --baseline benchmark_baseline.json --analyzers lunge plank
+
+Frame streams are built from the core/ model datasets:
+- squat: core/squat_model/train.csv
+- lunge: core/lunge_model/knee_angle.csv knee angle sequence applied to a
+  lunge pose from core/lunge_model/stage.test.csv
+- plank, situp, pushup: core/plank_model/test.csv
+- bicep, shoulder_press, bench_press, lateral_raise: core/bicep_model/test.csv
+Landmarks a dataset does not contain are copied from their nearest recorded
+neighbour (face -> nose, hand -> wrist -> elbow -> shoulder, foot -> ankle).
+
+Each analyzer runs in its own process so RSS is not shared. A timed pass
+measures frames/sec and per-frame latency; a separate tracemalloc pass
+measures bytes allocated per frame and blocks retained per frame. Exits
+with status 1 when a result regresses past the thresholds relative to the
+baseline file, or when --parity configurations change analyzer outputs
+(see parity_harness.py).
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tracemalloc
+import multiprocessing
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import numpy as np
+import pandas as pd
+
+from dense_network import CORE_DIR
+from frame_decoder import LANDMARK_NAMES, NUM_LANDMARKS, array_to_landmarks
+from analyze_session import ANALYZER_CLASSES, get_analyzer
+
+logger = logging.getLogger('BenchmarkAnalyzers')
+
+DATASETS = {
+    "squat": CORE_DIR / "squat_model" / "test.csv",
+    "plank": CORE_DIR / "plank_model" / "test.csv",
+    "bicep": CORE_DIR / "bicep_model" / "test.csv",
+    "lunge_pose": CORE_DIR / "lunge_model" / "stage.test.csv",
+    "lunge_knee_angles": CORE_DIR / "lunge_model" / "knee_angle.csv",
+}
+
+# Dataset each analyzer is driven with
+ANALYZER_DATASETS = {
+    "squat": "squat",
+    "lunge": "lunge",
+    "plank": "plank",
+    "situp": "plank",
+    "pushup": "plank",
+    "bicep": "bicep",
+    "shoulder_press": "bicep",
+    "bench_press": "bicep",
+    "lateral_raise": "bicep",
+}
+
+# Where to copy a landmark from when a dataset does not record it
+LANDMARK_FALLBACKS = {
+    **{name: ("nose",) for name in LANDMARK_NAMES[1:11]},
+    **{f"{side}_{part}": (f"{side}_wrist", f"{side}_elbow", f"{side}_shoulder")
+       for side in ("left", "right") for part in ("pinky", "index", "thumb")},
+    **{f"{side}_wrist": (f"{side}_elbow", f"{side}_shoulder") for side in ("left", "right")},
+    **{f"{side}_elbow": (f"{side}_shoulder",) for side in ("left", "right")},
+    **{f"{side}_{part}": (f"{side}_ankle",) for side in ("left", "right") for part in ("heel", "foot_index")},
+}
+
+# Metric name -> (direction that is worse, threshold option)
+REGRESSION_CHECKS = {
+    "framesPerSecond": ("lower", "max_throughput_drop"),
+    "p50Ms": ("higher", "max_latency_increase"),
+    "p95Ms": ("higher", "max_latency_increase"),
+    "p99Ms": ("higher", "max_latency_increase"),
+    "allocatedBytesPerFrame": ("higher", "max_alloc_increase"),
+    "peakRssMb": ("higher", "max_rss_increase"),
+}
+
+
+def frames_from_csv(path) -> np.ndarray:
+    """Rows of a core/ landmark CSV (name_x, name_y, name_z, name_v columns) -> (rows, 33, 4)"""
+    df = pd.read_csv(path)
+    frames = np.zeros((len(df), NUM_LANDMARKS, 4), dtype=np.float32)
+    for i, name in enumerate(LANDMARK_NAMES):
+        source = name
+        if f"{name}_x" not in df:
+            source = next((s for s in LANDMARK_FALLBACKS.get(name, ()) if f"{s}_x" in df), None)
+        if source is not None:
+            frames[:, i] = df[[f"{source}_x", f"{source}_y", f"{source}_z", f"{source}_v"]].to_numpy()
+    return frames
+
+
+def lunge_frames() -> np.ndarray:
+    """
+    A lunge pose whose ankles are swung around the knees so the hip-knee-ankle
+    angles follow the recorded knee_angle.csv sequence
+    """
+    pose = frames_from_csv(DATASETS["lunge_pose"])[0]
+    angles = pd.read_csv(DATASETS["lunge_knee_angles"])
+    frames = np.repeat(pose[None], len(angles), axis=0)
+
+    for side in ("left", "right"):
+        hip, knee, ankle = (LANDMARK_NAMES.index(f"{side}_{part}") for part in ("hip", "knee", "ankle"))
+        thigh = pose[hip, :2] - pose[knee, :2]
+        shin_length = np.linalg.norm(pose[ankle, :2] - pose[knee, :2])
+        radians = np.radians(angles[f"{side}_knee_angle"].to_numpy())
+        # Rotate the knee->hip direction by the knee angle (away from the body's front)
+        base = np.arctan2(thigh[1], thigh[0])
+        direction = base + np.where(pose[ankle, 0] >= pose[knee, 0], -radians, radians)
+        frames[:, ankle, 0] = pose[knee, 0] + shin_length * np.cos(direction)
+        frames[:, ankle, 1] = pose[knee, 1] + shin_length * np.sin(direction)
+    return frames
+
+
+def load_stream(dataset: str) -> np.ndarray:
+    if dataset == "lunge":
+        return lunge_frames()
+    return frames_from_csv(DATASETS[dataset])
+
+
+def _rss_mb() -> Dict[str, Optional[float]]:
+    """Current and peak resident set size (None where the platform does not report them)"""
+    if resource is None:
+        return {"rssMb": None, "peakRssMb": None}
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+    except OSError:
+        current = None
+    return {"rssMb": round(current, 1) if current is not None else None, "peakRssMb": round(peak, 1)}
+
+
+def benchmark_analyzer(exercise_type: str, min_frames: int = 2000, warmup: int = 50,
+                       alloc_frames: int = 200, fps: float = 30.0) -> Dict[str, Any]:
+    """Drive one analyzer's analyze_pose over its dataset stream (run in a fresh process)"""
+    logging.disable(logging.WARNING)
+    try:
+        stream = load_stream(ANALYZER_DATASETS[exercise_type])
+        repeats = max(1, -(-min_frames // len(stream)))
+        landmarks = [array_to_landmarks(frame) for frame in stream] * repeats
+
+        load_start = time.perf_counter()
+        analyzer = get_analyzer(exercise_type)
+        load_seconds = time.perf_counter() - load_start
+        analyzer.reset_rep_counter()
+
+        for i in range(min(warmup, len(landmarks))):
+            analyzer.analyze_pose(landmarks[i], timestamp=i / fps)
+
+        # Timed pass
+        analyzer.reset_rep_counter()
+        latencies = np.zeros(len(landmarks), dtype=np.int64)
+        failures = 0
+        start = time.perf_counter()
+        for i, frame in enumerate(landmarks):
+            frame_start = time.perf_counter_ns()
+            result = analyzer.analyze_pose(frame, timestamp=i / fps)
+            latencies[i] = time.perf_counter_ns() - frame_start
+            failures += not result.get("success", False)
+        elapsed = time.perf_counter() - start
+
+        # Allocation pass (tracemalloc slows everything down, so it is not timed)
+        analyzer.reset_rep_counter()
+        allocated = []
+        tracemalloc.start()
+        blocks_before = sys.getallocatedblocks()
+        for i, frame in enumerate(landmarks[:alloc_frames]):
+            tracemalloc.reset_peak()
+            baseline_bytes = tracemalloc.get_traced_memory()[0]
+            analyzer.analyze_pose(frame, timestamp=i / fps)
+            allocated.append(tracemalloc.get_traced_memory()[1] - baseline_bytes)
+        retained_blocks = sys.getallocatedblocks() - blocks_before
+        tracemalloc.stop()
+
+        latencies_ms = latencies / 1e6
+        return {
+            "exerciseType": exercise_type,
+            "dataset": ANALYZER_DATASETS[exercise_type],
+            "frames": len(landmarks),
+            "failedFrames": failures,
+            "loadSeconds": round(load_seconds, 3),
+            "framesPerSecond": round(len(landmarks) / elapsed, 1),
+            "meanMs": round(float(latencies_ms.mean()), 4),
+            "p50Ms": round(float(np.percentile(latencies_ms, 50)), 4),
+            "p95Ms": round(float(np.percentile(latencies_ms, 95)), 4),
+            "p99Ms": round(float(np.percentile(latencies_ms, 99)), 4),
+            "maxMs": round(float(latencies_ms.max()), 4),
+            "allocatedBytesPerFrame": int(np.mean(allocated)) if allocated else 0,
+            "retainedBlocksPerFrame": round(retained_blocks / max(len(allocated), 1), 2),
+            **_rss_mb()
+        }
+    except Exception as e:
+        return {"exerciseType": exercise_type, "error": f"{type(e).__name__}: {str(e)}"}
+
+
+def check_parity(exercise_type: str, configs: List[str], max_divergence: float,
+                 fps: float = 30.0) -> List[Dict[str, Any]]:
+    """Parity reports of optimized configurations on the analyzer's benchmark stream"""
+    from parity_harness import run_parity
+
+    logging.disable(logging.WARNING)
+    try:
+        frames = load_stream(ANALYZER_DATASETS[exercise_type])
+    except Exception as e:
+        return [{"exerciseType": exercise_type, "config": config, "error": f"{type(e).__name__}: {str(e)}"}
+                for config in configs]
+    timestamps = np.arange(len(frames)) / fps
+    reports = []
+    for config in configs:
+        try:
+            reports.append(run_parity(exercise_type, frames, timestamps, config,
+                                      max_divergence=max_divergence))
+        except Exception as e:
+            reports.append({"exerciseType": exercise_type, "config": config,
+                            "error": f"{type(e).__name__}: {str(e)}"})
+    return reports
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            thresholds: Dict[str, float]) -> List[Dict[str, Any]]:
+    """Metrics that got worse than the baseline by more than their threshold"""
+    regressions = []
+    for exercise_type, result in results.items():
+        previous = baseline.get(exercise_type)
+        if previous is None or "error" in result or "error" in previous:
+            continue
+
+        for metric, (worse, option) in REGRESSION_CHECKS.items():
+            old, new = previous.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (worse == "higher" and change > thresholds[option]) or \
+                    (worse == "lower" and -change > thresholds[option]):
+                regressions.append({
+                    "exerciseType": exercise_type,
+                    "metric": metric,
+                    "baseline": old,
+                    "current": new,
+                    "change": round(change, 4),
+                    "threshold": thresholds[option]
+                })
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark each exercise analyzer on the core datasets")
+    parser.add_argument("--analyzers", nargs="*", default=list(ANALYZER_CLASSES),
+                        help="Exercise types to benchmark (default: all)")
+    parser.add_argument("--min-frames", type=int, default=2000,
+                        help="Datasets are repeated until a stream has at least this many frames")
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--alloc-frames", type=int, default=200, help="Frames in the allocation pass")
+    parser.add_argument("--baseline", help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", help="Write the results as a baseline JSON")
+    parser.add_argument("--max-throughput-drop", type=float, default=0.10)
+    parser.add_argument("--max-latency-increase", type=float, default=0.25)
+    parser.add_argument("--max-alloc-increase", type=float, default=0.25)
+    parser.add_argument("--max-rss-increase", type=float, default=0.20)
+    parser.add_argument("--parity", nargs="*", default=[],
+                        help="Optimized configurations that must match the reference outputs, e.g. batched motion_gate")
+    parser.add_argument("--max-divergence", type=float, default=0.0,
+                        help="Fraction of frames a --parity configuration may change")
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.analyzers if name not in ANALYZER_CLASSES]
+    if unknown:
+        parser.error(f"unknown analyzers: {', '.join(unknown)}")
+
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for exercise_type in args.analyzers:
+        # A fresh process per analyzer keeps RSS and imports isolated
+        with context.Pool(1) as pool:
+            results[exercise_type] = pool.apply(
+                benchmark_analyzer, (exercise_type, args.min_frames, args.warmup, args.alloc_frames)
+            )
+            if args.parity:
+                results[exercise_type]["parity"] = pool.apply(
+                    check_parity, (exercise_type, args.parity, args.max_divergence)
+                )
+        print(json.dumps(results[exercise_type]))
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results
+    }
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+
+    parity_failures = [
+        report for result in results.values() for report in result.get("parity", [])
+        if "error" in report or report.get("passed") is False
+    ]
+    if parity_failures:
+        print(json.dumps({"parityFailures": [
+            {key: report.get(key) for key in ("exerciseType", "config", "divergence", "firstDivergence", "error")}
+            for report in parity_failures
+        ]}))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        thresholds = {option: getattr(args, option) for _, option in REGRESSION_CHECKS.values()}
+        regressions = compare(results, baseline.get("results", {}), thresholds)
+        print(json.dumps({"baseline": args.baseline, "regressions": regressions}))
+        if regressions:
+            return 1
+
+    if parity_failures:
+        return 1
+    return 1 if any("error" in result for result in results.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,6 +13,12 @@ import time
 import cv2
 import mediapipe as mp
 
+from model_cascade import ModelCascade, classify
+from prediction_cache import PredictionCache
+from session_state import SessionStateStore, update_bicep_reps
+from diagnostics import DIAG
+from error_codes import ERROR_TABLES
+
 # Configure logging
 logging.basicConfig(
     level=logging.WARNING,
@@ -25,6 +31,10 @@ mp_drawing = mp.solutions.drawing_utils
 mp_pose = mp.solutions.pose
 mp_drawing_styles = mp.solutions.drawing_styles
 
+ERRORS = ERROR_TABLES['bicep']
+LEAN_BACK, LEAN_BACK_FAILED, LOOSE_UPPER_ARM, PEAK_CONTRACTION = ERRORS.codes(
+    'lean_back', 'lean_back_failed', 'loose_upper_arm', 'peak_contraction')
+
 # Error types matching TypeScript interface
 ERROR_TYPES = Literal[
     'INVALID_INPUT',
@@ -143,12 +153,23 @@ class BicepPoseAnalysis:
         # Params for peak contraction error detection
         self.peak_contraction_angle = 1000
         
-    def reset(self):
-        """Reset counters and error tracking"""
+        # Optional per-session rep state (see session_state.py): when set,
+        # counter / stage / peak live in the row of `state_key` and the
+        # attributes above mirror that row during a call
+        self.state_store = None
+        self.state_key = None
+        
+    def reset(self, state_key=None):
+        """Reset counters and error tracking (with a state store: only the row of `state_key`, or every row if None)"""
         self.counter = 0
         self.stage = "down"
         self.is_visible = True
         self.peak_contraction_angle = 1000
+        if self.state_store is not None:
+            if state_key is not None:
+                self.state_store.reset_session(state_key)
+            else:
+                self.state_store.reset_all()
         self.loose_upper_arm = False
         self.detected_errors = {
             "PEAK_CONTRACTION": 0,
@@ -158,6 +179,12 @@ class BicepPoseAnalysis:
     def get_counter(self) -> int:
         """Return the current repetition count"""
         return self.counter
+    
+    def load_state(self) -> None:
+        """Mirror the state store row of `state_key` in counter / stage"""
+        row = self.state_store.rows([self.state_key])[0]
+        self.counter = int(self.state_store.rep_count[row])
+        self.stage = self.state_store.stages[self.state_store.stage[row]]
         
     def get_joints(self, landmarks) -> bool:
         """
@@ -207,13 +234,15 @@ class BicepPoseAnalysis:
     def analyze_pose(self, landmarks, lean_back_error=False):
         """
         Analyze the arm pose and detect errors
-        Returns: (curl_angle, upper_arm_angle, is_visible, errors)
+        Returns: (curl_angle, upper_arm_angle, is_visible, errors as [code, value] pairs)
         """
         curl_angle = None
         upper_arm_angle = None
         errors = []
         has_error = False
         
+        if self.state_store is not None:
+            self.load_state()
         self.get_joints(landmarks)
         
         # Cancel calculation if visibility is poor
@@ -222,7 +251,15 @@ class BicepPoseAnalysis:
             
         # * Calculate curl angle for counter
         bicep_curl_angle = int(calculate_angle(self.shoulder, self.elbow, self.wrist))
-        if bicep_curl_angle > self.stage_down_threshold:
+        if self.state_store is not None:
+            # Counter and peak contraction rules applied to this session's row
+            reps = update_bicep_reps(
+                self.state_store, self.state_store.rows([self.state_key]), [bicep_curl_angle],
+                self.stage_down_threshold, self.stage_up_threshold, self.peak_contraction_threshold,
+                [lean_back_error]
+            )
+            self.load_state()
+        elif bicep_curl_angle > self.stage_down_threshold:
             self.stage = "down"
         elif bicep_curl_angle < self.stage_up_threshold and self.stage == "down":
             self.stage = "up"
@@ -249,16 +286,17 @@ class BicepPoseAnalysis:
             if not self.loose_upper_arm:
                 self.loose_upper_arm = True
                 self.detected_errors["LOOSE_UPPER_ARM"] += 1
-                errors.append({
-                    "type": "loose_upper_arm",
-                    "severity": "medium",
-                    "message": f"Arm is not kept close to body ({ground_upper_arm_angle}°)"
-                })
+                errors.append([LOOSE_UPPER_ARM, ground_upper_arm_angle])
         else:
             self.loose_upper_arm = False
             
         # * Evaluate PEAK CONTRACTION error
-        if self.stage == "up" and bicep_curl_angle < self.peak_contraction_angle:
+        if self.state_store is not None:
+            if reps["peakContractionError"][0]:
+                self.detected_errors["PEAK_CONTRACTION"] += 1
+                errors.append([PEAK_CONTRACTION, int(reps["peakAngle"][0])])
+                has_error = True
+        elif self.stage == "up" and bicep_curl_angle < self.peak_contraction_angle:
             # Save peaked contraction every rep
             self.peak_contraction_angle = bicep_curl_angle
             
@@ -268,11 +306,7 @@ class BicepPoseAnalysis:
                 self.peak_contraction_angle >= self.peak_contraction_threshold):
                 
                 self.detected_errors["PEAK_CONTRACTION"] += 1
-                errors.append({
-                    "type": "peak_contraction",
-                    "severity": "medium",
-                    "message": f"Insufficient curl range of motion ({self.peak_contraction_angle}°)"
-                })
+                errors.append([PEAK_CONTRACTION, self.peak_contraction_angle])
                 has_error = True
             
             # Reset params
@@ -313,6 +347,40 @@ class BicepAnalyzer:
             self.input_scaler = None
             self.use_ml_for_lean_back = False
             
+            # Optional RF -> KNN cascade, off until enable_cascade() is called
+            self.cascade_margin = 0.9
+            self.cheap_model = None
+            self.cheap_model_loading_attempted = False
+            self.cascade = None
+            self.use_cascade = False
+            
+            # Optional LRU cache of classifier outputs keyed by quantized features,
+            # off until enable_prediction_cache() is called
+            self.prediction_cache = PredictionCache("bicep")
+            self.use_prediction_cache = False
+            
+            # Stateless predictions precomputed by predict_batch(), set during
+            # offline replay (see analyze_session.py)
+            self.prediction_replay = None
+            
+            # Per-request stage timing, set by the server for sampled
+            # requests (see request_trace.py)
+            self.trace = None
+            
+            # Emit [code, value] pairs instead of error dicts, set per call by
+            # the server for sessions that loaded the error code table
+            self.compact_errors = False
+            
+            # Quality tier of the current call, set by the server while it
+            # sheds load (see quality_controller.py): "cheap" runs the ML
+            # fallback on the RF model only (loaded on first use),
+            # "geometric" skips the ML fallback
+            self.quality_tier = "full"
+            
+            # Session of the current call (picks its rows in the state store),
+            # set by the server
+            self.session_key = None
+            
             # Create analyzers for left and right arms
             self.left_analyzer = BicepPoseAnalysis(
                 side="left",
@@ -468,14 +536,17 @@ class BicepAnalyzer:
             logger.error(f"BICEP_DEBUG: Error in model validation: {e}")
             logger.error(traceback.format_exc())
             
-    def reset_rep_counter(self) -> None:
-        """Reset repetition counters for both arms"""
+    def reset_rep_counter(self, session_key: Optional[str] = None) -> None:
+        """
+        Reset repetition counters for both arms (with the state store
+        enabled, only the session's rows when a session_key is given)
+        """
         logger.warning("RESET_DEBUG: Resetting rep counter in BicepAnalyzer")
         old_left_count = self.left_analyzer.get_counter()
         old_right_count = self.right_analyzer.get_counter()
         
-        self.left_analyzer.reset()
-        self.right_analyzer.reset()
+        self.left_analyzer.reset(None if session_key is None else (session_key, "left"))
+        self.right_analyzer.reset(None if session_key is None else (session_key, "right"))
         
         # Reset lean back tracking
         self.stand_posture = "C"
@@ -525,7 +596,8 @@ class BicepAnalyzer:
                 landmarks[right_hip_idx]['visibility'] < threshold or
                 landmarks[left_ankle_idx]['visibility'] < threshold or
                 landmarks[right_ankle_idx]['visibility'] < threshold):
-                logger.warning("BICEP_GEO: Low visibility for required landmarks")
+                if DIAG.on("bicep"):
+                    DIAG.emit("bicep", "low_visibility", step="lean_back_geometric")
                 return False
             
             # Calculate midpoints to use average body line
@@ -555,11 +627,9 @@ class BicepAnalyzer:
             
             is_leaning_back = alignment_angle < angle_threshold
             
-            # Log the detection for debugging
-            if is_leaning_back:
-                logger.warning(f"BICEP_GEO: Lean back detected! Alignment angle: {alignment_angle:.2f}° (threshold: {angle_threshold}°)")
-            else:
-                logger.debug(f"BICEP_GEO: Good posture. Alignment angle: {alignment_angle:.2f}° (threshold: {angle_threshold}°)")
+            if DIAG.on("bicep"):
+                DIAG.emit("bicep", "lean_back_geometric", alignment_angle=alignment_angle,
+                          threshold=angle_threshold, leaning_back=is_leaning_back)
             
             return is_leaning_back
             
@@ -584,6 +654,8 @@ class BicepAnalyzer:
         # Try geometric approach first
         try:
             is_leaning_back = self.detect_lean_back_geometric(landmarks)
+            if self.trace is not None:
+                self.trace.mark("geometry")
             if is_leaning_back:
                 return True
         except Exception as e:
@@ -591,8 +663,8 @@ class BicepAnalyzer:
             # Continue to ML fallback if geometric approach fails
         
         # If geometric approach didn't detect leaning back or failed, try ML as fallback
-        # Only if we have the required result object
-        if results is not None:
+        # Only if we have the required result object and the quality tier allows it
+        if results is not None and self.quality_tier != "geometric":
             try:
                 # Lazy load ML model if needed and not loaded yet
                 if not self.model_loading_attempted:
@@ -612,40 +684,41 @@ class BicepAnalyzer:
         """
         Original ML-based lean back detection method (renamed from detect_lean_back)
         """
-        logger.warning("BICEP_DEBUG: Starting lean back detection (ML-only)")
         
         # If model wasn't loaded successfully during initialization, we can't detect lean back
         if not hasattr(self, 'model') or self.model is None or not self.use_ml_for_lean_back:
             # Don't try to load the model here - it should have been loaded during initialization
-            logger.warning("BICEP_DEBUG: ML model not available for lean back detection")
+            if DIAG.on("bicep"):
+                DIAG.emit("bicep", "ml_unavailable")
             return False
             
         try:
-            # Extract keypoints exactly like in the notebook 
-            logger.warning("BICEP_DEBUG: Extracting keypoints for ML detection")
-            
-            # Use MediaPipe format results
-            mediapipe_results = results
+            if self.prediction_replay is not None:
+                # Precomputed by predict_batch() during offline replay
+                predicted_class, prediction_probabilities = self.prediction_replay.current()
+            else:
+                # Use MediaPipe format results
+                mediapipe_results = results
             
-            # Extract keypoints exactly as done in notebook
-            keypoints = extract_important_keypoints(mediapipe_results, self.important_landmarks)
-            logger.warning(f"BICEP_DEBUG: Extracted {len(keypoints)} keypoints")
+                # Extract keypoints exactly as done in notebook
+                keypoints = extract_important_keypoints(mediapipe_results, self.important_landmarks)
             
-            # Create DataFrame exactly as in notebook (column names matching self.headers[1:])
-            X = pd.DataFrame([keypoints], columns=self.headers[1:])
-            logger.warning(f"BICEP_DEBUG: Created DataFrame with columns: {list(X.columns)[:5]}...")
+                # Create DataFrame exactly as in notebook (column names matching self.headers[1:])
+                X = pd.DataFrame([keypoints], columns=self.headers[1:])
+                if self.trace is not None:
+                    self.trace.mark("feature_extraction")
             
-            # Transform with scaler - exactly as in notebook
-            X = pd.DataFrame(self.input_scaler.transform(X))
-            logger.warning(f"BICEP_DEBUG: Scaled features shape: {X.shape}")
+                # Transform with scaler - exactly as in notebook
+                X = pd.DataFrame(self.input_scaler.transform(X))
+                if self.trace is not None:
+                    self.trace.mark("scaling")
             
-            # Get prediction using exact same approach as notebook
-            predicted_class = self.model.predict(X)[0]
-            prediction_probabilities = self.model.predict_proba(X)[0]
+                # Get prediction using exact same approach as notebook
+                predicted_class, prediction_probabilities = self._classify(X)
             
             # Log raw outputs for debugging
-            logger.warning(f"BICEP_DEBUG: Raw prediction: {predicted_class}")
-            logger.warning(f"BICEP_DEBUG: Raw probabilities: {prediction_probabilities}")
+            if DIAG.on("bicep"):
+                DIAG.emit("bicep", "ml_prediction", predicted_class=predicted_class, probabilities=prediction_probabilities)
             
             # Use higher threshold (0.95) like in the working implementation
             posture_threshold = 0.95
@@ -662,8 +735,10 @@ class BicepAnalyzer:
             # Determine lean back probability - index 1 is for class "L" (leaning back)
             lean_back_probability = prediction_probabilities[1] if len(prediction_probabilities) > 1 else 0
             
-            # Log in exactly the same format as notebook display
-            logger.warning(f"BICEP_DEBUG: ML lean back result: {predicted_class}, {self.stand_posture}, {lean_back_probability:.1f}")
+            # Same fields as the notebook display
+            if DIAG.on("bicep"):
+                DIAG.emit("bicep", "lean_back_ml", predicted_class=predicted_class, stand_posture=self.stand_posture,
+                          lean_back_probability=lean_back_probability)
             
             # Check specifically for "L" classification as in working implementation
             is_leaning_back = (self.stand_posture == "L")
@@ -678,26 +753,159 @@ class BicepAnalyzer:
             logger.error(traceback.format_exc())
             return False
             
-    def calculate_form_score(self, errors: List[Dict[str, str]]) -> float:
-        """Calculate form score based on errors."""
-        base_score = 100
+    def predict_batch(self, frames: np.ndarray) -> Optional[List[Tuple[Any, np.ndarray]]]:
+        """
+        Vectorized lean back classification for a (frames, 33, 4) landmark
+        array: one (predicted_class, probabilities) per frame, or None if the
+        ML model is unavailable
+        """
+        if not self.model_loading_attempted:
+            self.load_machine_learning_model()
+        if not self.use_ml_for_lean_back:
+            return None
         
-        for error in errors:
-            if error['severity'] == 'high':
-                base_score -= 20
-            elif error['severity'] == 'medium':
-                base_score -= 10
-            elif error['severity'] == 'low':
-                base_score -= 5
+        indices = [mp_pose.PoseLandmark[lm].value for lm in self.important_landmarks]
+        X = pd.DataFrame(frames[:, indices, :].reshape(len(frames), -1).astype(np.float64), columns=self.headers[1:])
+        X = pd.DataFrame(self.input_scaler.transform(X))
+        
+        return list(zip(self.model.predict(X), self.model.predict_proba(X)))
+    
+    def _classify(self, X) -> Tuple[Any, np.ndarray]:
+        """Classify scaled features, through the prediction cache and cascade when enabled"""
+        cache_key = None
+        if self.use_prediction_cache:
+            cache_key = self.prediction_cache.make_key(X)
+            cached = self.prediction_cache.get(cache_key)
+            if self.trace is not None:
+                self.trace.note("cache", "hit" if cached is not None else "miss")
+            if cached is not None:
+                return cached
+        
+        if self.quality_tier == "cheap" and self.load_cheap_model():
+            # Not cached: the cache holds the full tier's answers. Without
+            # the RF model the cheap tier runs the full model below
+            predicted_class, prediction_probabilities = classify(self.cheap_model, X)
+            if self.trace is not None:
+                self.trace.note("model", "rf")
+            return predicted_class, prediction_probabilities
+        
+        if self.use_cascade and self.cascade is not None:
+            predicted_class, prediction_probabilities, escalated = self.cascade.predict(X)
+            model_name = "knn" if escalated else "rf"
+        else:
+            predicted_class, prediction_probabilities = classify(self.model, X)
+            model_name = "knn"
+        if self.trace is not None:
+            self.trace.note("model", model_name)
         
-        return max(0, min(100, base_score))
+        if cache_key is not None:
+            self.prediction_cache.put(cache_key, (predicted_class, prediction_probabilities))
+        return predicted_class, prediction_probabilities
     
-    def analyze_pose(self, landmarks: List[Dict[str, float]]) -> Dict[str, Any]:
+    def load_cheap_model(self) -> bool:
+        """Load the RF model (cascade first stage and cheap tier) once; True if it is available"""
+        if self.cheap_model is None and not self.cheap_model_loading_attempted:
+            self.cheap_model_loading_attempted = True
+            cheap_path = get_static_file_url("RF_model.pkl")
+            try:
+                with open(cheap_path, "rb") as f:
+                    self.cheap_model = pickle.load(f)
+                logger.warning(f"BICEP_DEBUG: Loaded cheap model from: {cheap_path}")
+            except Exception as e:
+                logger.error(f"BICEP_DEBUG: Error loading cheap model: {e}")
+        return self.cheap_model is not None
+    
+    def enable_cascade(self, margin: Optional[float] = None) -> bool:
+        """
+        Run the RF model first and escalate to the KNN model only when the
+        RF confidence is below the cascade margin
+        """
+        if margin is not None:
+            self.cascade_margin = float(margin)
+        
+        # The KNN model is the heavy tier, so make sure it has been loaded
+        if not self.model_loading_attempted:
+            self.load_machine_learning_model()
+        if not self.use_ml_for_lean_back:
+            logger.error("BICEP_DEBUG: Cannot enable cascade: KNN model not loaded")
+            return False
+        
+        if not self.load_cheap_model():
+            return False
+        
+        if self.cascade is None:
+            self.cascade = ModelCascade("bicep", self.cheap_model, self.model, self.cascade_margin)
+        self.cascade.margin = self.cascade_margin
+        self.use_cascade = True
+        self.prediction_cache.clear()
+        return True
+    
+    def disable_cascade(self) -> None:
+        """Go back to the single KNN model"""
+        self.use_cascade = False
+        self.prediction_cache.clear()
+    
+    def get_cascade_stats(self) -> Optional[Dict[str, Any]]:
+        """Escalation rate and latency of the cascade, if it was ever enabled"""
+        if self.cascade is None:
+            return None
+        stats = self.cascade.get_stats()
+        stats["enabled"] = self.use_cascade
+        return stats
+    
+    def enable_state_store(self) -> bool:
+        """
+        Keep both arms' rep state per session in a SessionStateStore (one row
+        per session and side) instead of in the arm analyzers shared by all sessions
+        """
+        if self.left_analyzer.state_store is None:
+            store = SessionStateStore("bicep", max_sessions=2048)
+            self.left_analyzer.state_store = store
+            self.right_analyzer.state_store = store
+        return True
+    
+    def disable_state_store(self) -> None:
+        """Go back to the shared arm analyzer state"""
+        self.left_analyzer.state_store = None
+        self.right_analyzer.state_store = None
+    
+    def get_state_store_stats(self) -> Dict[str, Any]:
+        """Occupancy of the state store"""
+        store = self.left_analyzer.state_store
+        if store is None:
+            return {"exerciseType": "bicep", "enabled": False}
+        stats = store.get_stats()
+        stats["enabled"] = True
+        return stats
+    
+    def enable_prediction_cache(self, max_entries: Optional[int] = None, quantization: Optional[float] = None) -> bool:
+        """Memoize classifier outputs for inputs that quantize to a seen feature vector"""
+        self.prediction_cache.configure(max_entries, quantization)
+        self.use_prediction_cache = True
+        return True
+    
+    def disable_prediction_cache(self) -> None:
+        """Stop using and drop the cached classifier outputs"""
+        self.use_prediction_cache = False
+        self.prediction_cache.clear()
+    
+    def get_prediction_cache_stats(self) -> Dict[str, Any]:
+        """Hit rate and occupancy of the prediction cache"""
+        stats = self.prediction_cache.get_stats()
+        stats["enabled"] = self.use_prediction_cache
+        return stats
+            
+    def calculate_form_score(self, errors: List[list]) -> float:
+        """Calculate form score from the integer weights of the error codes."""
+        return ERRORS.form_score(errors)
+    
+    def analyze_pose(self, landmarks: List[Dict[str, float]], timestamp: Optional[float] = None) -> Dict[str, Any]:
         """
         Analyze the pose data and return metrics, stage, errors, and scores.
         
         Args:
             landmarks: List of landmark dictionaries with x, y, z and visibility.
+            timestamp: Capture time of the frame in seconds; wall clock if omitted.
                 
         Returns:
             Dictionary with stage, metrics, errors, repCount, and formScore.
@@ -709,7 +917,9 @@ class BicepAnalyzer:
                 # Set the flag to true but don't load the model here to avoid delays
                 self.model_loading_attempted = True
             
-            logger.info("BICEP_DEBUG: Starting pose analysis")
+            # Rep state of the session being analyzed, when kept in the state store
+            self.left_analyzer.state_key = (self.session_key, "left")
+            self.right_analyzer.state_key = (self.session_key, "right")
             
             if not landmarks or not isinstance(landmarks, list):
                 logger.error("BICEP_DEBUG: No pose landmarks provided in input data")
@@ -735,9 +945,11 @@ class BicepAnalyzer:
                         }
                     }
             
+            if self.trace is not None:
+                self.trace.mark("validation")
+            
             # Use landmarks directly 
             raw_landmarks = landmarks
-            logger.info(f"BICEP_DEBUG: Received {len(raw_landmarks)} landmarks")
             
             # Default values in case of errors
             stage = "down"
@@ -754,7 +966,6 @@ class BicepAnalyzer:
             lean_back_error = False
             
             # Create a MediaPipe-compatible results object
-            logger.info("BICEP_DEBUG: Creating MediaPipe-compatible results object")
             try:
                 # Create a compatible structure that matches what MediaPipe would provide
                 landmark_objects = []
@@ -772,7 +983,8 @@ class BicepAnalyzer:
                 pose_landmarks = type('obj', (object,), {'landmark': landmark_objects})
                 processed_result = type('obj', (object,), {'pose_landmarks': pose_landmarks})
                 
-                logger.info(f"BICEP_DEBUG: Successfully created MediaPipe-compatible result object with {len(landmark_objects)} landmarks")
+                if self.trace is not None:
+                    self.trace.mark("feature_extraction")
             except Exception as e:
                 logger.error(f"BICEP_DEBUG: Error creating MediaPipe-compatible result: {e}")
                 logger.error(traceback.format_exc())
@@ -787,54 +999,51 @@ class BicepAnalyzer:
                 }
             
             # Detect lean back using geometric method by default
-            logger.info("BICEP_DEBUG: Detecting lean back")
             try:
                 # Use geometric detection by default (set to True)
                 lean_back_error = self.detect_lean_back(raw_landmarks, processed_result, use_geometric=True)
-                logger.info(f"BICEP_DEBUG: Lean back detection result: {lean_back_error}")
+                if DIAG.on("bicep"):
+                    DIAG.emit("bicep", "lean_back", lean_back=lean_back_error)
+                if self.trace is not None:
+                    self.trace.mark("inference")
                 
                 if lean_back_error:
-                    all_errors.append({
-                        'type': 'lean_back',
-                        'severity': 'high',
-                        'message': 'Leaning back during exercise'
-                    })
+                    all_errors.append([LEAN_BACK, None])
             except Exception as e:
                 logger.error(f"BICEP_DEBUG: Error in lean back detection: {e}")
                 logger.error(traceback.format_exc())
-                all_errors.append({
-                    'type': 'ANALYSIS_ERROR',
-                    'severity': 'error',
-                    'message': f'Lean back detection failed: {str(e)}'
-                })
+                all_errors.append([LEAN_BACK_FAILED, str(e)])
             
             # Analyze left and right arms
-            logger.info("BICEP_DEBUG: Analyzing left arm")
             try:
                 left_curl_angle, left_upper_arm_angle, left_arm_visible, left_errors = self.left_analyzer.analyze_pose(
                     raw_landmarks, lean_back_error
                 )
-                logger.info(f"BICEP_DEBUG: Left arm analysis complete. Curl angle: {left_curl_angle}, Visible: {left_arm_visible}")
+                if DIAG.on("bicep"):
+                    DIAG.emit("bicep", "arm", side="left", curl_angle=left_curl_angle,
+                              upper_arm_angle=left_upper_arm_angle, visible=left_arm_visible)
                 all_errors.extend(left_errors)
             except Exception as left_err:
                 logger.error(f"BICEP_DEBUG: Error in left arm analysis: {left_err}")
                 logger.error(traceback.format_exc())
                 left_curl_angle, left_upper_arm_angle, left_arm_visible, left_errors = None, None, False, []
             
-            logger.info("BICEP_DEBUG: Analyzing right arm")
             try:
                 right_curl_angle, right_upper_arm_angle, right_arm_visible, right_errors = self.right_analyzer.analyze_pose(
                     raw_landmarks, lean_back_error
                 )
-                logger.info(f"BICEP_DEBUG: Right arm analysis complete. Curl angle: {right_curl_angle}, Visible: {right_arm_visible}")
+                if DIAG.on("bicep"):
+                    DIAG.emit("bicep", "arm", side="right", curl_angle=right_curl_angle,
+                              upper_arm_angle=right_upper_arm_angle, visible=right_arm_visible)
                 all_errors.extend(right_errors)
             except Exception as right_err:
                 logger.error(f"BICEP_DEBUG: Error in right arm analysis: {right_err}")
                 logger.error(traceback.format_exc())
                 right_curl_angle, right_upper_arm_angle, right_arm_visible, right_errors = None, None, False, []
+            if self.trace is not None:
+                self.trace.mark("state_update")
             
             # Calculate shoulder width if both shoulders are visible
-            logger.info("BICEP_DEBUG: Calculating shoulder width")
             try:
                 left_shoulder = raw_landmarks[self._mp_pose.PoseLandmark.LEFT_SHOULDER.value]
                 right_shoulder = raw_landmarks[self._mp_pose.PoseLandmark.RIGHT_SHOULDER.value]
@@ -845,12 +1054,14 @@ class BicepAnalyzer:
                         [left_shoulder['x'], left_shoulder['y']],
                         [right_shoulder['x'], right_shoulder['y']]
                     )
-                    logger.info(f"BICEP_DEBUG: Shoulder width calculated: {shoulder_width}")
                 else:
-                    logger.info("BICEP_DEBUG: Shoulders not visible enough for width calculation")
+                    if DIAG.on("bicep"):
+                        DIAG.emit("bicep", "low_visibility", step="shoulder_width")
             except Exception as sw_err:
                 logger.error(f"BICEP_DEBUG: Error calculating shoulder width: {sw_err}")
                 logger.error(traceback.format_exc())
+            if self.trace is not None:
+                self.trace.mark("geometry")
             
             # Determine overall stage based on the arms
             try:
@@ -860,7 +1071,6 @@ class BicepAnalyzer:
                     stage = "down"
                 else:
                     stage = "middle"
-                logger.info(f"BICEP_DEBUG: Current stage: {stage}")
             except Exception as stage_err:
                 logger.error(f"BICEP_DEBUG: Error determining stage: {stage_err}")
                 stage = "down"  # Default to down stage
@@ -869,7 +1079,6 @@ class BicepAnalyzer:
             form_score = 100
             try:
                 form_score = self.calculate_form_score(all_errors)
-                logger.info(f"BICEP_DEBUG: Form score: {form_score}")
             except Exception as score_err:
                 logger.error(f"BICEP_DEBUG: Error calculating form score: {score_err}")
             
@@ -877,7 +1086,6 @@ class BicepAnalyzer:
             rep_count = 0
             try:
                 rep_count = max(self.left_analyzer.get_counter(), self.right_analyzer.get_counter())
-                logger.info(f"BICEP_DEBUG: Repetition count: {rep_count}")
             except Exception as rep_err:
                 logger.error(f"BICEP_DEBUG: Error getting rep count: {rep_err}")
             
@@ -897,17 +1105,19 @@ class BicepAnalyzer:
                 }
             }
             
-            logger.info("BICEP_DEBUG: Analysis complete, returning results")
+            if DIAG.on("bicep"):
+                DIAG.emit("bicep", "result", stage=stage, form_score=form_score, rep_count=rep_count,
+                          errors=lambda: [ERRORS.types[code] for code, _ in all_errors])
             # Return complete analysis result
+            result = {
+                'stage': stage,
+                'metrics': metrics,
+                'formScore': form_score,
+                'repCount': rep_count
+            }
             return {
                 'success': True,
-                'result': {
-                    'stage': stage,
-                    'metrics': metrics,
-                    'errors': all_errors,
-                    'formScore': form_score,
-                    'repCount': rep_count
-                }
+                'result': ERRORS.put_errors(result, all_errors, self.compact_errors)
             }
             
         except Exception as e:
@@ -0,0 +1,369 @@
+import io
+import sys
+import json
+import pickle
+import struct
+import tarfile
+import logging
+import argparse
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Configure logging
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('DenseNetwork')
+
+CORE_DIR = Path(__file__).parent.parent.parent.parent.parent / "core"
+
+# Keras networks trained in the core notebooks, with the evaluation outputs
+# the notebooks recorded for them on their test sets
+KERAS_MODELS = {
+    "plank": {
+        "model": CORE_DIR / "plank_model" / "model" / "plank_dp.pkl",
+        "bundle": CORE_DIR / "plank_model" / "model" / "plank_dp.npz",
+        "scaler": CORE_DIR / "plank_model" / "model" / "input_scaler.pkl",
+        "test_set": CORE_DIR / "plank_model" / "test.csv",
+        # Same integer classes as the plank LR/SVC models (C, H, L)
+        "labels": {"C": 0, "H": 1, "L": 2},
+        "classes": [0, 1, 2],
+        # plank_model/3.deep_learning.ipynb, 7_layers_with_dropout on test.csv
+        "confusion_matrix": [[234, 0, 0], [2, 239, 0], [2, 0, 233]],
+    },
+    "lunge_stage": {
+        "model": CORE_DIR / "lunge_model" / "model" / "dp" / "stage_lunge_dp.pkl",
+        "bundle": CORE_DIR / "lunge_model" / "model" / "dp" / "stage_lunge_dp.npz",
+        "scaler": CORE_DIR / "lunge_model" / "model" / "input_scaler.pkl",
+        "test_set": CORE_DIR / "lunge_model" / "stage.test.csv",
+        "labels": {"I": 0, "M": 1, "D": 2},
+        # Same string classes as the lunge stage LR/SVC models
+        "classes": ["I", "M", "D"],
+        # 3.stage.deep_learning.ipynb was evaluated on a test.csv that is not
+        # in the repo, so there is no recorded result for stage.test.csv
+        "confusion_matrix": None,
+    },
+    "lunge_err": {
+        "model": CORE_DIR / "lunge_model" / "model" / "dp" / "err_lunge_dp.pkl",
+        "bundle": CORE_DIR / "lunge_model" / "model" / "dp" / "err_lunge_dp.npz",
+        "scaler": CORE_DIR / "lunge_model" / "model" / "input_scaler.pkl",
+        "test_set": CORE_DIR / "lunge_model" / "err.test.csv",
+        "labels": {"L": 0, "C": 1},
+        "classes": ["L", "C"],
+        # lunge_model/7.err.deep_learning.ipynb, 3_layers on err.test.csv
+        "confusion_matrix": [[482, 79], [1, 545]],
+    },
+}
+
+
+def _softmax(x: np.ndarray) -> np.ndarray:
+    e = np.exp(x - x.max(axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+
+# Activations used by the networks in the 3.deep_learning notebooks
+ACTIVATIONS = {
+    "relu": lambda x: np.maximum(x, 0),
+    "tanh": np.tanh,
+    "sigmoid": lambda x: 1 / (1 + np.exp(-x)),
+    "softmax": _softmax,
+    "linear": lambda x: x,
+}
+
+
+class DenseNetwork:
+    """
+    Pure-NumPy forward pass for a stack of Keras Dense layers.
+
+    Exposes the same predict/predict_proba/classes_ surface as the scikit-learn
+    models so it can be dropped in wherever the analyzers use those, and works
+    on any number of rows at once.
+    """
+
+    def __init__(self, layers: List[Tuple[np.ndarray, np.ndarray, str]], classes: List[Any]):
+        for _, _, activation in layers:
+            if activation not in ACTIVATIONS:
+                raise ValueError(f"Unsupported activation: {activation}")
+
+        self.layers = [
+            (np.ascontiguousarray(kernel, dtype=np.float32), np.asarray(bias, dtype=np.float32), activation)
+            for kernel, bias, activation in layers
+        ]
+        self.classes_ = np.asarray(classes)
+        self.n_features_in_ = self.layers[0][0].shape[0]
+
+    def predict_proba(self, X) -> np.ndarray:
+        """Class probabilities for a (rows, features) batch"""
+        x = np.asarray(X, dtype=np.float32)
+        if x.ndim == 1:
+            x = x.reshape(1, -1)
+
+        for kernel, bias, activation in self.layers:
+            x = ACTIVATIONS[activation](x @ kernel + bias)
+        return x
+
+    def predict(self, X) -> np.ndarray:
+        """Most likely class label for each row"""
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def with_class_order(self, classes) -> "DenseNetwork":
+        """
+        Copy of the network whose output columns follow `classes`, e.g. the
+        sorted classes_ of a scikit-learn model it is paired with
+        """
+        order = [self.classes_.tolist().index(c) for c in list(classes)]
+        layers = list(self.layers)
+        kernel, bias, activation = layers[-1]
+        layers[-1] = (kernel[:, order], bias[order], activation)
+        return DenseNetwork(layers, list(classes))
+
+    def save(self, path) -> None:
+        """Write the network to an .npz model bundle"""
+        arrays = {"classes": self.classes_, "activations": np.array([a for _, _, a in self.layers])}
+        for i, (kernel, bias, _) in enumerate(self.layers):
+            arrays[f"kernel_{i}"] = kernel
+            arrays[f"bias_{i}"] = bias
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path) -> "DenseNetwork":
+        """Read a network from an .npz model bundle"""
+        with np.load(path, allow_pickle=False) as bundle:
+            activations = [str(a) for a in bundle["activations"]]
+            layers = [
+                (bundle[f"kernel_{i}"], bundle[f"bias_{i}"], activation)
+                for i, activation in enumerate(activations)
+            ]
+            return cls(layers, bundle["classes"].tolist())
+
+
+# ---------------------------------------------------------------------------
+# Exporter: reads the pickled Keras models without importing TensorFlow.
+#
+# Keras pickles a model as a tar archive of its SavedModel directory. The layer
+# configuration is JSON inside keras_metadata.pb and the weights live in the
+# TensorFlow checkpoint (variables.index is a LevelDB-style table that maps
+# variable names to offsets in variables.data-*).
+# ---------------------------------------------------------------------------
+
+_TF_FLOAT32 = 1
+_TABLE_MAGIC = 0xdb4775248b80fb57
+
+
+def _keras_archive_bytes(data) -> bytes:
+    return bytes(data)
+
+
+class _KerasPickleReader(pickle.Unpickler):
+    """Unpickler that returns the raw SavedModel archive instead of a Keras model"""
+
+    def find_class(self, module, name):
+        if module == "keras.saving.pickle_utils" and name == "deserialize_model_from_bytecode":
+            return _keras_archive_bytes
+        if module.startswith("numpy"):
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f"Unexpected object in Keras pickle: {module}.{name}")
+
+
+def _read_varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            return result, pos
+
+
+def _iter_proto_fields(buf: bytes) -> Iterator[Tuple[int, Any]]:
+    """Minimal protobuf wire-format reader yielding (field number, value)"""
+    pos = 0
+    while pos < len(buf):
+        key, pos = _read_varint(buf, pos)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _read_varint(buf, pos)
+        elif wire_type == 1:
+            value, pos = buf[pos:pos + 8], pos + 8
+        elif wire_type == 2:
+            length, pos = _read_varint(buf, pos)
+            value, pos = buf[pos:pos + length], pos + length
+        elif wire_type == 5:
+            value, pos = buf[pos:pos + 4], pos + 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type: {wire_type}")
+        yield field, value
+
+
+def _iter_table_block(block: bytes) -> Iterator[Tuple[bytes, bytes]]:
+    num_restarts = struct.unpack("<I", block[-4:])[0]
+    data = block[:-4 - 4 * num_restarts]
+    pos = 0
+    key = b""
+    while pos < len(data):
+        shared, pos = _read_varint(data, pos)
+        non_shared, pos = _read_varint(data, pos)
+        value_length, pos = _read_varint(data, pos)
+        key = key[:shared] + data[pos:pos + non_shared]
+        pos += non_shared
+        yield key, data[pos:pos + value_length]
+        pos += value_length
+
+
+def _read_checkpoint(index: bytes, data: bytes) -> Dict[str, np.ndarray]:
+    """Read every float32 tensor of a single-shard TensorFlow checkpoint"""
+    footer = index[-48:]
+    if struct.unpack("<Q", footer[-8:])[0] != _TABLE_MAGIC:
+        raise ValueError("variables.index is not a TensorFlow checkpoint table")
+
+    pos = 0
+    _, pos = _read_varint(footer, pos)  # metaindex offset
+    _, pos = _read_varint(footer, pos)  # metaindex size
+    index_offset, pos = _read_varint(footer, pos)
+    index_size, pos = _read_varint(footer, pos)
+
+    tensors = {}
+    for _, handle in _iter_table_block(index[index_offset:index_offset + index_size]):
+        block_offset, pos = _read_varint(handle, 0)
+        block_size, pos = _read_varint(handle, pos)
+        if index[block_offset + block_size] != 0:
+            raise ValueError("Compressed checkpoint tables are not supported")
+
+        for name, entry in _iter_table_block(index[block_offset:block_offset + block_size]):
+            dtype, shape, offset, size = 0, [], 0, 0
+            for field, value in _iter_proto_fields(entry):
+                if field == 1:
+                    dtype = value
+                elif field == 2:
+                    shape = [
+                        dict(_iter_proto_fields(dim)).get(1, 0)
+                        for dim_field, dim in _iter_proto_fields(value) if dim_field == 2
+                    ]
+                elif field == 4:
+                    offset = value
+                elif field == 5:
+                    size = value
+            if dtype != _TF_FLOAT32 or not name:
+                continue
+            tensors[name.decode()] = np.frombuffer(data[offset:offset + size], dtype="<f4").reshape(shape)
+    return tensors
+
+
+def _read_layer_configs(metadata: bytes) -> List[Dict[str, Any]]:
+    """Layer list of the root model from keras_metadata.pb"""
+    for field, node in _iter_proto_fields(metadata):
+        if field != 1:
+            continue
+        node_fields = dict(_iter_proto_fields(node))
+        if node_fields.get(3) == b"root":
+            return json.loads(node_fields[5])["config"]["layers"]
+    raise ValueError("Model configuration not found in keras_metadata.pb")
+
+
+def load_keras_pickle(model_path, classes: List[Any]) -> DenseNetwork:
+    """Convert a pickled Keras Sequential model of Dense/Dropout layers"""
+    with open(model_path, "rb") as f:
+        archive = _KerasPickleReader(f).load()
+
+    files = {}
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        for member in tar.getmembers():
+            if member.isfile():
+                files[Path(member.name).name] = tar.extractfile(member).read()
+
+    layer_configs = _read_layer_configs(files["keras_metadata.pb"])
+    tensors = _read_checkpoint(files["variables.index"], files["variables.data-00000-of-00001"])
+
+    layers = []
+    for layer in layer_configs:
+        class_name = layer["class_name"]
+        if class_name in ("InputLayer", "Dropout"):
+            # Dropout is the identity at inference time
+            continue
+        if class_name != "Dense":
+            raise ValueError(f"Unsupported layer type: {class_name}")
+
+        prefix = f"layer_with_weights-{len(layers)}"
+        layers.append((
+            tensors[f"{prefix}/kernel/.ATTRIBUTES/VARIABLE_VALUE"],
+            tensors[f"{prefix}/bias/.ATTRIBUTES/VARIABLE_VALUE"],
+            layer["config"]["activation"]
+        ))
+
+    return DenseNetwork(layers, classes)
+
+
+def export_model(name: str) -> Path:
+    """Export one of KERAS_MODELS to its .npz bundle"""
+    spec = KERAS_MODELS[name]
+    network = load_keras_pickle(spec["model"], spec["classes"])
+    network.save(spec["bundle"])
+    logger.warning(f"Exported {name}: {len(network.layers)} dense layers -> {spec['bundle']}")
+    return spec["bundle"]
+
+
+def check_parity(name: str) -> Dict[str, Any]:
+    """
+    Run the exported bundle over the notebook's test set and compare the
+    confusion matrix with the one the notebook recorded
+    """
+    import pandas as pd
+
+    spec = KERAS_MODELS[name]
+    network = DenseNetwork.load(spec["bundle"])
+    with open(spec["scaler"], "rb") as f:
+        input_scaler = pickle.load(f)
+
+    test_df = pd.read_csv(spec["test_set"])
+    y_true = test_df["label"].map(spec["labels"]).to_numpy()
+    X = input_scaler.transform(test_df.drop("label", axis=1))
+
+    y_pred = np.argmax(network.predict_proba(X), axis=1)
+    num_classes = len(spec["labels"])
+    confusion = np.zeros((num_classes, num_classes), dtype=int)
+    np.add.at(confusion, (y_true, y_pred), 1)
+
+    result = {
+        "model": name,
+        "rows": int(len(y_true)),
+        "accuracy": round(float((y_true == y_pred).mean()), 4),
+        "confusionMatrix": confusion.tolist(),
+        "expectedConfusionMatrix": spec["confusion_matrix"],
+        "mismatchedCells": None,
+        "passed": None
+    }
+    if spec["confusion_matrix"] is not None:
+        expected = np.array(spec["confusion_matrix"])
+        result["mismatchedCells"] = int((confusion != expected).sum())
+        result["passed"] = bool((confusion == expected).all())
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export Keras networks to NumPy bundles and check parity")
+    parser.add_argument("action", choices=["export", "parity"])
+    parser.add_argument("models", nargs="*", help=f"Any of {', '.join(KERAS_MODELS)} (default: all)")
+    args = parser.parse_args(argv)
+
+    names = args.models or list(KERAS_MODELS)
+    unknown = [name for name in names if name not in KERAS_MODELS]
+    if unknown:
+        parser.error(f"unknown model(s): {', '.join(unknown)}")
+    failed = False
+    for name in names:
+        if args.action == "export":
+            print(json.dumps({"model": name, "bundle": str(export_model(name))}))
+        else:
+            result = check_parity(name)
+            failed = failed or result["passed"] is False
+            print(json.dumps(result))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
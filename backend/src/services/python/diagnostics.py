@@ -0,0 +1,135 @@
+import time
+import logging
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger('Diagnostics')
+
+
+def _plain(value: Any) -> Any:
+    """NumPy scalars and arrays -> Python numbers and lists (JSON-serializable)"""
+    return value.tolist() if hasattr(value, "tolist") else value
+
+
+class Diagnostics:
+    """
+    Structured, sampled per-frame diagnostics for the analyzer hot paths.
+
+    Call sites guard every event with on(category), a set lookup, so a
+    disabled category costs one branch and nothing is formatted:
+
+        if DIAG.on("squat"):
+            DIAG.emit("squat", "ml_prediction", predicted_class=predicted_class, confidence=max_prob)
+
+    Field values may be zero-argument callables; they are only evaluated
+    for events that pass sampling and rate limiting. Accepted events go to
+    an in-memory ring buffer (and to the log at DEBUG when `log_events` is
+    set); nothing is formatted until the buffer is dumped, e.g. by
+    dump_on_error() when a request fails.
+
+    Categories are exercise types (plus "server"), toggled at runtime by the
+    server's diagnostics command.
+    """
+
+    def __init__(self, capacity: int = 2048, sample_every: int = 1, max_per_second: float = 200.0):
+        self.enabled = set()
+        self.buffer = deque(maxlen=capacity)
+        self.sample_every = sample_every
+        self.max_per_second = max_per_second
+        self.log_events = False
+        # category -> [events seen, tokens, last refill time]
+        self.state = {}
+        self.dropped = 0
+        self.last_error_dump = 0.0
+
+    def on(self, category: str) -> bool:
+        return category in self.enabled
+
+    def configure(self, enable: Iterable[str] = (), disable: Iterable[str] = (),
+                  sample_every: Optional[int] = None, max_per_second: Optional[float] = None,
+                  capacity: Optional[int] = None, log_events: Optional[bool] = None) -> None:
+        """Toggle categories ("*" disables all) and change sampling, rate limit or buffer size"""
+        for category in disable:
+            if category == "*":
+                self.enabled.clear()
+            else:
+                self.enabled.discard(category)
+        self.enabled.update(enable)
+
+        if sample_every is not None:
+            if int(sample_every) < 1:
+                raise ValueError("sampleEvery must be at least 1")
+            self.sample_every = int(sample_every)
+        if max_per_second is not None:
+            if float(max_per_second) <= 0:
+                raise ValueError("maxPerSecond must be positive")
+            self.max_per_second = float(max_per_second)
+        if capacity is not None:
+            self.buffer = deque(self.buffer, maxlen=int(capacity))
+        if log_events is not None:
+            self.log_events = bool(log_events)
+
+    def emit(self, category: str, event: str, **fields: Any) -> None:
+        """Record an event if its category is on, it is sampled and within the rate limit"""
+        if category not in self.enabled:
+            return
+
+        state = self.state.get(category)
+        now = time.monotonic()
+        if state is None:
+            state = self.state[category] = [0, self.max_per_second, now]
+        state[0] += 1
+        if (state[0] - 1) % self.sample_every:
+            return
+
+        # Token bucket of max_per_second events, refilled continuously
+        state[1] = min(self.max_per_second, state[1] + (now - state[2]) * self.max_per_second)
+        state[2] = now
+        if state[1] < 1.0:
+            self.dropped += 1
+            return
+        state[1] -= 1.0
+
+        for key, value in fields.items():
+            if callable(value):
+                fields[key] = value()
+        self.buffer.append((time.time(), category, event, fields))
+        if self.log_events:
+            logger.debug("%s %s %s", category, event, fields)
+
+    def dump(self, category: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Buffered events, oldest first, with NumPy values as plain Python ones"""
+        events = [
+            {"time": round(timestamp, 3), "category": event_category, "event": event,
+             **{key: _plain(value) for key, value in fields.items()}}
+            for timestamp, event_category, event, fields in self.buffer
+            if category is None or event_category == category
+        ]
+        return events[-limit:] if limit else events
+
+    def dump_on_error(self, reason: str, min_interval: float = 10.0) -> None:
+        """Write the buffered events to the error log, at most once per min_interval seconds"""
+        if not self.buffer:
+            return
+        now = time.monotonic()
+        if now - self.last_error_dump < min_interval:
+            return
+        self.last_error_dump = now
+        logger.error(f"{reason}; last {len(self.buffer)} diagnostic events:")
+        for event in self.dump():
+            logger.error(str(event))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": sorted(self.enabled),
+            "sampleEvery": self.sample_every,
+            "maxPerSecond": self.max_per_second,
+            "logEvents": self.log_events,
+            "capacity": self.buffer.maxlen,
+            "buffered": len(self.buffer),
+            "dropped": self.dropped
+        }
+
+
+# Shared by the server and every analyzer in the process
+DIAG = Diagnostics()
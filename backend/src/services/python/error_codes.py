@@ -0,0 +1,157 @@
+import logging
+from typing import Any, Dict, List, Sequence
+
+logger = logging.getLogger('ErrorCodes')
+
+# Form score deducted per error, by severity ("error" entries cost nothing)
+DEFAULT_WEIGHTS = {"high": 20, "medium": 10, "low": 5}
+# The pushup and lateral raise analyzers have always deducted less for high severity
+LIGHT_WEIGHTS = {"high": 15, "medium": 10, "low": 5}
+
+
+class ErrorTable:
+    """
+    Form error codes of one exercise.
+
+    Each entry is (name, type, severity, message template); its code is its
+    position in the list and never changes meaning, so new errors are only
+    appended. Analyzers collect [code, value] pairs per frame, where value
+    is None, a number or a list of numbers filling the template's {}
+    placeholders. The pairs go out as they are to clients that loaded the
+    table once at session start (describe()) and are expanded to the usual
+    {"type", "severity", "message"} dicts for everyone else. Messages
+    without placeholders are built once here and shared between frames,
+    so expanded dicts must not be modified.
+    """
+
+    def __init__(self, exercise_type: str, entries: Sequence[tuple], weights: Dict[str, int] = DEFAULT_WEIGHTS):
+        self.exercise_type = exercise_type
+        self.names = [entry[0] for entry in entries]
+        self.types = [entry[1] for entry in entries]
+        self.severities = [entry[2] for entry in entries]
+        self.templates = [entry[3] for entry in entries]
+        self.weights = [weights.get(severity, 0) for severity in self.severities]
+        self.static = [
+            {"type": error_type, "severity": severity, "message": template} if "{" not in template else None
+            for error_type, severity, template in zip(self.types, self.severities, self.templates)
+        ]
+
+    def codes(self, *names: str) -> List[int]:
+        """Codes of the named errors, in order"""
+        return [self.names.index(name) for name in names]
+
+    def message(self, code: int, value: Any = None) -> str:
+        template = self.templates[code]
+        if value is None:
+            return template
+        return template.format(*value) if isinstance(value, (list, tuple)) else template.format(value)
+
+    def expand(self, pairs: List[list]) -> List[Dict[str, str]]:
+        """[code, value] pairs -> error dicts"""
+        errors = []
+        for code, value in pairs:
+            static = self.static[code]
+            if static is not None and value is None:
+                errors.append(static)
+            else:
+                errors.append({"type": self.types[code], "severity": self.severities[code],
+                               "message": self.message(code, value)})
+        return errors
+
+    def form_score(self, pairs: List[list]) -> int:
+        """100 minus the integer weight of every error, floored at 0"""
+        score = 100
+        for code, _ in pairs:
+            score -= self.weights[code]
+        return max(0, score)
+
+    def put_errors(self, result: Dict[str, Any], pairs: List[list], compact: bool = False) -> Dict[str, Any]:
+        """Store the errors of a frame in a result as "errorCodes" (compact) or expanded "errors" """
+        if compact:
+            result["errorCodes"] = pairs
+        else:
+            result["errors"] = self.expand(pairs)
+        return result
+
+    def describe(self) -> Dict[str, Any]:
+        """The table as sent to clients once per session"""
+        return {
+            "exerciseType": self.exercise_type,
+            "codes": [
+                {"code": code, "name": name, "type": error_type, "severity": severity,
+                 "weight": weight, "message": template}
+                for code, (name, error_type, severity, weight, template) in enumerate(
+                    zip(self.names, self.types, self.severities, self.weights, self.templates))
+            ]
+        }
+
+
+ERROR_TABLES = {
+    "squat": ErrorTable("squat", [
+        ("feet_too_close", "foot_placement", "high", "Feet too close together"),
+        ("feet_too_wide", "foot_placement", "high", "Feet too far apart"),
+        ("knees_too_close", "knee_placement", "high", "Knees too close together"),
+        ("knees_too_wide", "knee_placement", "high", "Knees too far apart"),
+    ]),
+    "bicep": ErrorTable("bicep", [
+        ("lean_back", "lean_back", "high", "Leaning back during exercise"),
+        ("lean_back_failed", "ANALYSIS_ERROR", "error", "Lean back detection failed: {}"),
+        ("loose_upper_arm", "loose_upper_arm", "medium", "Arm is not kept close to body ({}°)"),
+        ("peak_contraction", "peak_contraction", "medium", "Insufficient curl range of motion ({}°)"),
+    ]),
+    "lunge": ErrorTable("lunge", [
+        ("left_knee_angle", "knee_angle", "high", "Left knee angle is not in proper range. Aim for 60-125 degrees."),
+        ("right_knee_angle", "knee_angle", "high", "Right knee angle is not in proper range. Aim for 60-125 degrees."),
+        ("knee_over_toe", "knee_over_toe", "high", "Knee is extending beyond toes. Ensure proper alignment."),
+    ]),
+    "plank": ErrorTable("plank", [
+        ("high_back", "high_back", "high",
+         "Your lower back is raised too high. Flatten your back to maintain proper form."),
+        ("low_back", "low_back", "high",
+         "Your lower back is dipping too low. Engage your core to maintain a straight line from head to heels."),
+    ]),
+    "situp": ErrorTable("situp", [
+        ("straight_legs", "straight_legs", "high", "Bend your knees to approximately 40-45 degrees for ideal form"),
+        ("improper_knee_angle", "improper_knee_angle", "medium",
+         "Adjust knee bend closer to 40-45 degrees for ideal form (current: {}°)"),
+        ("incomplete_situp", "incomplete_situp", "medium",
+         "Sit up more to reach at least a {}° angle (current: {}°)"),
+    ]),
+    "shoulder_press": ErrorTable("shoulder_press", [
+        ("uneven_pressing", "uneven_pressing", "medium", "Keep both arms even during the press"),
+        ("incomplete_press", "incorrect_form", "low", "Press the weights fully overhead for complete range of motion"),
+    ]),
+    "bench_press": ErrorTable("bench_press", [
+        ("uneven_pressing", "uneven_pressing", "medium", "Keep both arms even during the press"),
+        ("incomplete_press", "incorrect_form", "low", "Extend arms fully for complete range of motion"),
+    ]),
+    "pushup": ErrorTable("pushup", [
+        ("visibility", "visibility", "high", "Cannot see body clearly. Adjust your position."),
+        ("uneven_arms", "uneven_arms", "medium", "Arms are uneven. Keep shoulders level."),
+        ("incomplete_pushup", "incomplete_pushup", "medium", "Go lower for a complete push-up."),
+        ("back_alignment", "back_alignment", "high", "Keep your back straight during push-ups."),
+    ], LIGHT_WEIGHTS),
+    "lateral_raise": ErrorTable("lateral_raise", [
+        ("visibility", "visibility", "high", "Cannot see body clearly. Adjust your position."),
+        ("uneven_arms", "uneven_arms", "medium", "Keep both arms at the same height during lateral raises."),
+        ("excessive_raise", "excessive_raise", "medium", "Avoid raising arms too high above shoulder level."),
+        ("insufficient_raise", "insufficient_raise", "medium",
+         "Raise arms to at least shoulder level for full range of motion."),
+    ], LIGHT_WEIGHTS),
+}
+
+
+def error_types(exercise_type: str, result: Dict[str, Any]) -> List[str]:
+    """Error types of a result in either form"""
+    if "errorCodes" in result:
+        table = ERROR_TABLES.get(exercise_type)
+        return [table.types[code] for code, _ in result["errorCodes"]] if table is not None else []
+    return [error.get("type") for error in result.get("errors") or []]
+
+
+def expanded_errors(exercise_type: str, result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Error dicts of a result in either form"""
+    if "errorCodes" in result:
+        table = ERROR_TABLES.get(exercise_type)
+        return table.expand(result["errorCodes"]) if table is not None else []
+    return result.get("errors") or []
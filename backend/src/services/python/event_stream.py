@@ -0,0 +1,217 @@
+import time
+import numbers
+import logging
+from typing import Any, Dict, List, Optional
+
+from error_codes import expanded_errors
+
+logger = logging.getLogger('EventStream')
+
+SEVERITY_RANK = {"low": 1, "medium": 2, "high": 3}
+
+# Angles whose range over a rep is its range of motion; two-sided
+# exercises use the mean of the sides that are present
+ROM_METRICS = {
+    "squat": ("kneeAngle",),
+    "bicep": ("leftCurlAngle", "rightCurlAngle"),
+    "lunge": ("leftKneeAngle", "rightKneeAngle"),
+    "situp": ("torsoAngle",),
+    "shoulder_press": ("leftArmAngle", "rightArmAngle"),
+    "bench_press": ("leftShoulderAngle", "rightShoulderAngle"),
+    "pushup": ("leftArmAngle", "rightArmAngle"),
+    "lateral_raise": ("leftArmAngle", "rightArmAngle"),
+}
+
+
+def _rom_angle(exercise_type: str, metrics: Dict[str, Any]) -> Optional[float]:
+    values = [metrics.get(name) for name in ROM_METRICS.get(exercise_type, ())]
+    values = [float(value) for value in values if isinstance(value, numbers.Real) and not isinstance(value, bool)]
+    return sum(values) / len(values) if values else None
+
+
+class RepWindow:
+    """Running extremes of one rep, from the previous rep (or subscription) to now"""
+
+    def __init__(self, start: float):
+        self.start = start
+        self.frames = 0
+        self.first_angle = None
+        self.min_angle = None
+        self.max_angle = None
+        self.turn_angle = None
+        self.turn_time = start
+        self.min_form_score = None
+        self.worst_error = None
+
+    def update(self, timestamp: float, angle: Optional[float], form_score: Any,
+               errors: List[Dict[str, Any]]) -> None:
+        self.frames += 1
+        if angle is not None:
+            if self.first_angle is None:
+                self.first_angle = self.min_angle = self.max_angle = self.turn_angle = angle
+                self.turn_time = timestamp
+            self.min_angle = min(self.min_angle, angle)
+            self.max_angle = max(self.max_angle, angle)
+            # The turning point is the angle furthest from where the rep started,
+            # so lowering (squat, curl) and raising (lateral raise) reps both work
+            if abs(angle - self.first_angle) > abs(self.turn_angle - self.first_angle):
+                self.turn_angle = angle
+                self.turn_time = timestamp
+
+        if isinstance(form_score, numbers.Real):
+            self.min_form_score = form_score if self.min_form_score is None else min(self.min_form_score, form_score)
+
+        for error in errors:
+            rank = SEVERITY_RANK.get(error.get("severity"), 0)
+            if self.worst_error is None or rank > SEVERITY_RANK.get(self.worst_error.get("severity"), 0):
+                self.worst_error = {"type": error.get("type"), "severity": error.get("severity")}
+
+    def summary(self, end: float) -> Dict[str, Any]:
+        has_angle = self.first_angle is not None
+        return {
+            "frames": self.frames,
+            "durationSeconds": round(end - self.start, 3),
+            "rangeOfMotion": round(self.max_angle - self.min_angle, 2) if has_angle else None,
+            "turnAngle": round(self.turn_angle, 2) if has_angle else None,
+            "eccentricSeconds": round(self.turn_time - self.start, 3) if has_angle else None,
+            "concentricSeconds": round(end - self.turn_time, 3) if has_angle else None,
+            "minFormScore": self.min_form_score,
+            "worstError": self.worst_error
+        }
+
+
+class EventStream:
+    """
+    Event-driven output for one subscribed session.
+
+    update() takes each full analyzer result and returns only what changed:
+    a "stage" event on transitions, an "errors" event when error types
+    appear or clear, a "rep" event with a per-rep summary (range of motion,
+    eccentric / concentric tempo around the turning point, lowest form score
+    and worst error) whenever repCount goes up, and a "heartbeat" with the
+    current metrics (and capture rate advice, when enabled) every
+    `heartbeat_interval` seconds of frame time. Frames
+    that change nothing return an empty list; the server answers them with a
+    bare acknowledgement if the session asked for `ack`, and not at all
+    otherwise.
+
+    A drop in repCount (counter reset) starts a new rep window without
+    emitting a rep.
+    """
+
+    def __init__(self, exercise_type: str, heartbeat_interval: float = 1.0, ack: bool = False):
+        if heartbeat_interval <= 0:
+            raise ValueError("heartbeatInterval must be positive")
+        self.heartbeat_interval = heartbeat_interval
+        self.ack = ack
+        self.frames = 0
+        self.events = {"stage": 0, "errors": 0, "rep": 0, "heartbeat": 0}
+        self.restart(exercise_type)
+
+    def restart(self, exercise_type: str) -> None:
+        """Forget the session's state, as if it had just subscribed"""
+        self.exercise_type = exercise_type
+        self.stage = None
+        self.error_types = {}
+        self.rep_count = None
+        self.rep = None
+        self.last_heartbeat = None
+
+    def update(self, exercise_type: str, result: Dict[str, Any], timestamp: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Events for one successful analysis result"""
+        if exercise_type != self.exercise_type:
+            self.restart(exercise_type)
+        now = timestamp if timestamp is not None else time.time()
+        self.frames += 1
+        events = []
+
+        stage = result.get("stage")
+        metrics = result.get("metrics") or {}
+        errors = expanded_errors(exercise_type, result)
+        form_score = result.get("formScore")
+        rep_count = result.get("repCount")
+
+        if stage != self.stage:
+            if self.stage is not None:
+                events.append({"event": "stage", "from": self.stage, "to": stage})
+            self.stage = stage
+
+        error_types = {error.get("type"): error for error in errors}
+        added = [error for error_type, error in error_types.items() if error_type not in self.error_types]
+        cleared = [error_type for error_type in self.error_types if error_type not in error_types]
+        if added or cleared:
+            events.append({"event": "errors", "added": added, "cleared": cleared})
+        self.error_types = error_types
+
+        if self.rep is None:
+            self.rep = RepWindow(now)
+        self.rep.update(now, _rom_angle(exercise_type, metrics), form_score, errors)
+
+        if isinstance(rep_count, numbers.Integral):
+            if self.rep_count is not None and rep_count > self.rep_count:
+                events.append({"event": "rep", "repCount": rep_count, "summary": self.rep.summary(now)})
+                self.rep = RepWindow(now)
+            elif self.rep_count is not None and rep_count < self.rep_count:
+                self.rep = RepWindow(now)
+            self.rep_count = rep_count
+
+        if self.last_heartbeat is None or now - self.last_heartbeat >= self.heartbeat_interval or now < self.last_heartbeat:
+            heartbeat = {
+                "event": "heartbeat",
+                "stage": stage,
+                "repCount": rep_count,
+                "formScore": form_score,
+                "metrics": metrics
+            }
+            if "frameRate" in result:
+                heartbeat["frameRate"] = result["frameRate"]
+            events.append(heartbeat)
+            self.last_heartbeat = now
+
+        for event in events:
+            self.events[event["event"]] += 1
+        return events
+
+    def get_stats(self) -> Dict[str, Any]:
+        emitted = sum(self.events.values())
+        return {
+            "exerciseType": self.exercise_type,
+            "heartbeatInterval": self.heartbeat_interval,
+            "ack": self.ack,
+            "frames": self.frames,
+            "events": dict(self.events),
+            "eventsPerFrame": round(emitted / self.frames, 4) if self.frames else 0.0
+        }
+
+
+class EventStreams:
+    """Subscribed sessions, keyed by session id; the oldest is dropped past `max_sessions`"""
+
+    def __init__(self, max_sessions: int = 1024):
+        self.max_sessions = max_sessions
+        self.streams = {}
+
+    def get(self, session_id: Optional[str]) -> Optional[EventStream]:
+        if session_id is None:
+            return None
+        return self.streams.get(session_id)
+
+    def subscribe(self, session_id: str, exercise_type: str, heartbeat_interval: float = 1.0,
+                  ack: bool = False) -> EventStream:
+        stream = EventStream(exercise_type, heartbeat_interval, ack)
+        self.streams.pop(session_id, None)
+        self.streams[session_id] = stream
+        while len(self.streams) > self.max_sessions:
+            oldest = next(iter(self.streams))
+            logger.warning(f"Dropping event subscription of session {oldest}: too many subscribed sessions")
+            del self.streams[oldest]
+        return stream
+
+    def unsubscribe(self, session_id: str) -> Optional[EventStream]:
+        return self.streams.pop(session_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self.streams),
+            "maxSessions": self.max_sessions
+        }
@@ -7,6 +7,21 @@ import importlib
 from pathlib import Path
 from typing import Dict, Any, Optional
 
+from frame_decoder import decode_frame, LANDMARK_MANIFESTS
+from session_recorder import SessionRecorder
+from request_trace import RequestTrace, TraceStats
+from server_metrics import ServerMetrics
+from live_profiler import create_profiler
+from diagnostics import DIAG
+from event_stream import EventStreams
+from error_codes import ERROR_TABLES
+from frame_rate_advisor import FrameRateAdvisors
+from quality_controller import InputQueue, QualityController
+from session_aggregates import SessionAggregates
+from metric_timelines import MetricTimelines
+from frame_dedup import FrameDeduplicator
+from kernels import KERNELS
+
 # Configure logging
 logging.basicConfig(
     level=logging.WARNING,
@@ -20,9 +35,59 @@ class ExerciseAnalyzerServer:
         self.analyzers = {}
         self.loaded_models = set()
         
+        # Opt-in binary log of analyzed frames (see session_recorder.py)
+        self.recorder = None
+        
+        # Sampled per-stage request timings (see request_trace.py), off
+        # until the trace command sets a sample rate
+        self.trace_stats = TraceStats()
+        
+        # Request counters and latency histograms (see server_metrics.py)
+        self.metrics = ServerMetrics()
+        
+        # On-demand profiler (see live_profiler.py), started by the
+        # profile_start command or SIGUSR1
+        self.profiler = None
+        
+        # Sessions answered with change events instead of full results
+        # (see event_stream.py), set up by the subscribe command
+        self.event_streams = EventStreams()
+        
+        # Sessions that loaded the error code tables and get [code, value]
+        # pairs instead of error dicts (see error_codes.py), in the order
+        # they switched; the oldest is dropped past max_compact_sessions
+        self.compact_error_sessions = {}
+        self.max_compact_sessions = 1024
+        
+        # Recommended capture rates per session (see frame_rate_advisor.py),
+        # added to results once the frame_rate command enables them
+        self.frame_rate_advice = False
+        self.frame_rate_advisors = FrameRateAdvisors()
+        
+        # Requests are read from stdin by a background thread (see
+        # quality_controller.py) so the queue depth and wait time are known;
+        # the quality controller sheds analysis quality per session when
+        # they grow, and the tier goes out with every result
+        self.input_queue = None
+        self.quality = QualityController()
+        
+        # Running per-session summaries of the results (see
+        # session_aggregates.py), returned by the session_summary command
+        self.session_aggregates = SessionAggregates()
+        
+        # Fixed-size downsampled metric series per session for charts (see
+        # metric_timelines.py), returned by the session_timeline command
+        self.metric_timelines = MetricTimelines()
+        
+        # Frames identical (after quantization) to the session's previous
+        # one are answered from its result (see frame_dedup.py)
+        self.frame_dedup = FrameDeduplicator()
+        
         # Setup signal handlers for graceful shutdown
         signal.signal(signal.SIGINT, self.shutdown)
         signal.signal(signal.SIGTERM, self.shutdown)
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, self.toggle_profiler)
         
         logger.info("Exercise Analyzer Server initialized")
         
@@ -31,6 +96,7 @@ class ExerciseAnalyzerServer:
         if exercise_type in self.analyzers:
             return True
             
+        load_start = time.perf_counter()
         try:
             # Import the appropriate analyzer class
             if exercise_type == "squat":
@@ -111,9 +177,24 @@ class ExerciseAnalyzerServer:
         except Exception as e:
             logger.error(f"Error loading {exercise_type} analyzer: {str(e)}")
             return False
+        finally:
+            if exercise_type in self.analyzers:
+                self.metrics.record_model_load(exercise_type, time.perf_counter() - load_start)
+                self.quality.warm_up()
     
-    def analyze_pose(self, exercise_type: str, pose_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Analyze pose data for the given exercise type"""
+    def analyze_pose(self, exercise_type: str, pose_data: Dict[str, Any], timestamp: Optional[float] = None,
+                     trace: Optional[RequestTrace] = None, compact_errors: bool = False,
+                     quality_tier: str = "full", session_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Analyze pose data for the given exercise type. `timestamp` (seconds)
+        is the clock for all time-based analyzer logic; the analyzers fall
+        back to wall clock when it is None. A `trace` is handed to the
+        analyzer for this call so it can mark its own stages,
+        `compact_errors` makes it report "errorCodes" instead of "errors",
+        `quality_tier` (see quality_controller.py) limits the models it
+        may run, and `session_key` picks the session's motion gate and rep
+        state (once the state_store command enabled it).
+        """
         # Ensure the analyzer is loaded
         if exercise_type not in self.analyzers:
             success = self.load_analyzer(exercise_type)
@@ -130,10 +211,22 @@ class ExerciseAnalyzerServer:
         # Analyze the pose
         try:
             analyzer = self.analyzers[exercise_type]
-            result = analyzer.analyze_pose(pose_data)
-            return result
+            analyzer.session_key = session_key
+            if trace is None and not compact_errors and quality_tier == "full":
+                return analyzer.analyze_pose(pose_data, timestamp=timestamp)
+            
+            analyzer.trace = trace
+            analyzer.compact_errors = compact_errors
+            analyzer.quality_tier = quality_tier
+            try:
+                return analyzer.analyze_pose(pose_data, timestamp=timestamp)
+            finally:
+                analyzer.trace = None
+                analyzer.compact_errors = False
+                analyzer.quality_tier = "full"
         except Exception as e:
             logger.error(f"Error analyzing {exercise_type} pose: {str(e)}")
+            DIAG.dump_on_error(f"Error analyzing {exercise_type} pose")
             return {
                 "success": False,
                 "error": {
@@ -143,8 +236,12 @@ class ExerciseAnalyzerServer:
                 }
             }
     
-    def reset_counter(self, exercise_type: str) -> Dict[str, Any]:
-        """Reset the repetition counter for the given exercise type"""
+    def reset_counter(self, exercise_type: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Reset the repetition counter for the given exercise type. With a
+        session_id, analyzers that keep per-session rep state (state_store
+        command) reset only that session; without one, every session.
+        """
         logger.warning(f"RESET_DEBUG: Processing reset_counter command for {exercise_type}")
         
         # Ensure the analyzer is loaded
@@ -165,7 +262,11 @@ class ExerciseAnalyzerServer:
         try:
             analyzer = self.analyzers[exercise_type]
             logger.warning(f"RESET_DEBUG: Calling reset_rep_counter on {exercise_type} analyzer")
-            analyzer.reset_rep_counter()
+            if session_id is not None and hasattr(analyzer, "enable_state_store"):
+                analyzer.reset_rep_counter(session_id)
+            else:
+                analyzer.reset_rep_counter()
+            self.frame_dedup.forget(exercise_type, session_id)
             logger.warning(f"RESET_DEBUG: Successfully reset counter for {exercise_type}")
             return {
                 "success": True,
@@ -182,18 +283,776 @@ class ExerciseAnalyzerServer:
                 }
             }
     
+    def configure_cascade(self, exercise_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Enable, disable or re-tune the cheap/heavy model cascade for an exercise"""
+        # Ensure the analyzer is loaded
+        if exercise_type not in self.analyzers:
+            success = self.load_analyzer(exercise_type)
+            if not success:
+                return {
+                    "success": False,
+                    "error": {
+                        "type": "COMMAND_ERROR",
+                        "severity": "error",
+                        "message": f"Failed to load analyzer for {exercise_type}"
+                    }
+                }
+        
+        analyzer = self.analyzers[exercise_type]
+        if not hasattr(analyzer, "enable_cascade"):
+            return {
+                "success": False,
+                "error": {
+                    "type": "COMMAND_ERROR",
+                    "severity": "error",
+                    "message": f"Model cascade is not supported for {exercise_type}"
+                }
+            }
+        
+        try:
+            if data.get("enabled", True):
+                options = {}
+                if data.get("heavyModel") is not None:
+                    options["heavy_model"] = data["heavyModel"]
+                if not analyzer.enable_cascade(data.get("margin"), **options):
+                    return {
+                        "success": False,
+                        "error": {
+                            "type": "COMMAND_ERROR",
+                            "severity": "error",
+                            "message": f"Failed to enable model cascade for {exercise_type}"
+                        }
+                    }
+            else:
+                analyzer.disable_cascade()
+            
+            return {
+                "success": True,
+                "cascade": analyzer.get_cascade_stats()
+            }
+        except Exception as e:
+            logger.error(f"Error configuring cascade for {exercise_type}: {str(e)}")
+            return {
+                "success": False,
+                "error": {
+                    "type": "COMMAND_ERROR",
+                    "severity": "error",
+                    "message": str(e)
+                }
+            }
+    
+    def get_cascade_stats(self) -> Dict[str, Any]:
+        """Per-exercise escalation rate and latency for every loaded cascade"""
+        stats = {}
+        for exercise_type, analyzer in self.analyzers.items():
+            if hasattr(analyzer, "get_cascade_stats"):
+                exercise_stats = analyzer.get_cascade_stats()
+                if exercise_stats is not None:
+                    stats[exercise_type] = exercise_stats
+        
+        return {
+            "success": True,
+            "cascade": stats
+        }
+    
+    def configure_motion_gate(self, exercise_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Enable, disable or re-tune the motion gate for an exercise"""
+        # Ensure the analyzer is loaded
+        if exercise_type not in self.analyzers:
+            success = self.load_analyzer(exercise_type)
+            if not success:
+                return {
+                    "success": False,
+                    "error": {
+                        "type": "COMMAND_ERROR",
+                        "severity": "error",
+                        "message": f"Failed to load analyzer for {exercise_type}"
+                    }
+                }
+        
+        analyzer = self.analyzers[exercise_type]
+        if not hasattr(analyzer, "enable_motion_gate"):
+            return {
+                "success": False,
+                "error": {
+                    "type": "COMMAND_ERROR",
+                    "severity": "error",
+                    "message": f"Motion gate is not supported for {exercise_type}"
+                }
+            }
+        
+        try:
+            if data.get("enabled", True):
+                analyzer.enable_motion_gate(data.get("threshold"), data.get("refreshInterval"))
+            else:
+                analyzer.disable_motion_gate()
+            
+            return {
+                "success": True,
+                "motionGate": analyzer.get_motion_gate_stats()
+            }
+        except Exception as e:
+            logger.error(f"Error configuring motion gate for {exercise_type}: {str(e)}")
+            return {
+                "success": False,
+                "error": {
+                    "type": "COMMAND_ERROR",
+                    "severity": "error",
+                    "message": str(e)
+                }
+            }
+    
+    def configure_state_store(self, exercise_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Keep an exercise's rep state per session (see session_state.py), or go back to shared state"""
+        # Ensure the analyzer is loaded
+        if exercise_type not in self.analyzers:
+            success = self.load_analyzer(exercise_type)
+            if not success:
+                return {
+                    "success": False,
+                    "error": {
+                        "type": "COMMAND_ERROR",
+                        "severity": "error",
+                        "message": f"Failed to load analyzer for {exercise_type}"
+                    }
+                }
+        
+        analyzer = self.analyzers[exercise_type]
+        if not hasattr(analyzer, "enable_state_store"):
+            return {
+                "success": False,
+                "error": {
+                    "type": "COMMAND_ERROR",
+                    "severity": "error",
+                    "message": f"State store is not supported for {exercise_type}"
+                }
+            }
+        
+        try:
+            if data.get("enabled", True):
+                # The store's rep rules run on the kernels (see kernels.py); pick
+                # their backend, compiling or loading it from the disk cache, the
+                # first time a store is enabled rather than on every start
+                if not KERNELS.selected:
+                    kernels = KERNELS.select()
+                    logger.info(f"Kernels: {kernels['backend']} ({kernels['reason']}, {kernels['compileSeconds']}s)")
+                analyzer.enable_state_store()
+            else:
+                analyzer.disable_state_store()
+            
+            return {
+                "success": True,
+                "stateStore": analyzer.get_state_store_stats(),
+                "kernels": KERNELS.describe()
+            }
+        except Exception as e:
+            logger.error(f"Error configuring state store for {exercise_type}: {str(e)}")
+            return {
+                "success": False,
+                "error": {
+                    "type": "COMMAND_ERROR",
+                    "severity": "error",
+                    "message": str(e)
+                }
+            }
+    
+    def get_motion_gate_stats(self) -> Dict[str, Any]:
+        """Per-exercise skip ratio and refresh disagreements for every loaded analyzer"""
+        stats = {}
+        for exercise_type, analyzer in self.analyzers.items():
+            if hasattr(analyzer, "get_motion_gate_stats"):
+                stats[exercise_type] = analyzer.get_motion_gate_stats()
+        
+        return {
+            "success": True,
+            "motionGate": stats
+        }
+    
+    def configure_prediction_cache(self, exercise_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Enable, disable or resize the classifier output cache for an exercise"""
+        # Ensure the analyzer is loaded
+        if exercise_type not in self.analyzers:
+            success = self.load_analyzer(exercise_type)
+            if not success:
+                return {
+                    "success": False,
+                    "error": {
+                        "type": "COMMAND_ERROR",
+                        "severity": "error",
+                        "message": f"Failed to load analyzer for {exercise_type}"
+                    }
+                }
+        
+        analyzer = self.analyzers[exercise_type]
+        if not hasattr(analyzer, "enable_prediction_cache"):
+            return {
+                "success": False,
+                "error": {
+                    "type": "COMMAND_ERROR",
+                    "severity": "error",
+                    "message": f"Prediction cache is not supported for {exercise_type}"
+                }
+            }
+        
+        try:
+            if data.get("enabled", True):
+                analyzer.enable_prediction_cache(data.get("maxEntries"), data.get("quantization"))
+            else:
+                analyzer.disable_prediction_cache()
+            
+            return {
+                "success": True,
+                "predictionCache": analyzer.get_prediction_cache_stats()
+            }
+        except Exception as e:
+            logger.error(f"Error configuring prediction cache for {exercise_type}: {str(e)}")
+            return {
+                "success": False,
+                "error": {
+                    "type": "COMMAND_ERROR",
+                    "severity": "error",
+                    "message": str(e)
+                }
+            }
+    
+    def get_prediction_cache_stats(self) -> Dict[str, Any]:
+        """Per-exercise hit rate for every loaded analyzer with a prediction cache"""
+        stats = {}
+        for exercise_type, analyzer in self.analyzers.items():
+            if hasattr(analyzer, "get_prediction_cache_stats"):
+                stats[exercise_type] = analyzer.get_prediction_cache_stats()
+        
+        return {
+            "success": True,
+            "predictionCache": stats
+        }
+    
+    def configure_recorder(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Start, restart or stop recording analyzed frames"""
+        try:
+            if self.recorder is not None:
+                self.recorder.stop()
+                stats = self.recorder.get_stats()
+                self.recorder = None
+            else:
+                stats = {"enabled": False}
+            
+            if data.get("enabled", True):
+                self.recorder = SessionRecorder(
+                    data.get("directory", "recordings"),
+                    data.get("maxBytes", 64 * 1024 * 1024),
+                    data.get("maxSeconds", 3600.0)
+                )
+                stats = self.recorder.get_stats()
+            
+            return {
+                "success": True,
+                "recorder": stats
+            }
+        except Exception as e:
+            logger.error(f"Error configuring session recorder: {str(e)}")
+            return {
+                "success": False,
+                "error": {
+                    "type": "COMMAND_ERROR",
+                    "severity": "error",
+                    "message": str(e)
+                }
+            }
+    
+    def get_recorder_stats(self) -> Dict[str, Any]:
+        """Files written, record counts and drops of the session recorder"""
+        return {
+            "success": True,
+            "recorder": self.recorder.get_stats() if self.recorder is not None else {"enabled": False}
+        }
+    
+    def configure_trace(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Set the trace sample rate (0 disables), response embedding, or clear the histograms"""
+        try:
+            if not data.get("enabled", True):
+                self.trace_stats.configure(sample_rate=0.0)
+            else:
+                self.trace_stats.configure(data.get("sampleRate"), data.get("includeInResponse"))
+            if data.get("reset", False):
+                self.trace_stats.reset()
+            
+            return {
+                "success": True,
+                "trace": self.trace_stats.get_stats()
+            }
+        except Exception as e:
+            logger.error(f"Error configuring request tracing: {str(e)}")
+            return {
+                "success": False,
+                "error": {
+                    "type": "COMMAND_ERROR",
+                    "severity": "error",
+                    "message": str(e)
+                }
+            }
+    
+    def get_trace_stats(self) -> Dict[str, Any]:
+        """Per-exercise, per-stage latency histograms of the traced requests"""
+        return {
+            "success": True,
+            "trace": self.trace_stats.get_stats()
+        }
+    
+    def configure_metrics(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Current metrics; optionally start/stop the Prometheus textfile
+        ("textfile": path or null, "interval": seconds) or reset the counters
+        """
+        try:
+            if "textfile" in data:
+                if data["textfile"]:
+                    self.metrics.start_textfile(data["textfile"], data.get("interval", 15.0))
+                else:
+                    self.metrics.stop_textfile()
+            if data.get("reset", False):
+                self.metrics.reset()
+            
+            return {
+                "success": True,
+                "metrics": self.metrics.get_stats()
+            }
+        except Exception as e:
+            logger.error(f"Error configuring metrics: {str(e)}")
+            return {
+                "success": False,
+                "error": {
+                    "type": "COMMAND_ERROR",
+                    "severity": "error",
+                    "message": str(e)
+                }
+            }
+    
+    def start_profiler(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Start the sampling profiler ("mode": "sample", every "intervalMs") or
+        cProfile of the next "frames" requests per exercise ("mode":
+        "cprofile", optionally only "exerciseType"), writing to "directory"
+        """
+        try:
+            if self.profiler is not None:
+                self.profiler.stop()
+            
+            self.profiler = create_profiler(
+                data.get("mode", "sample"),
+                data.get("directory") or f"profiles/{time.strftime('%Y%m%d-%H%M%S')}",
+                interval=data.get("intervalMs", 5.0) / 1000.0,
+                frames=data.get("frames", 300),
+                exercise_type=data.get("exerciseType")
+            )
+            return {
+                "success": True,
+                "profile": self.profiler.get_stats()
+            }
+        except Exception as e:
+            self.profiler = None
+            logger.error(f"Error starting profiler: {str(e)}")
+            return {
+                "success": False,
+                "error": {
+                    "type": "COMMAND_ERROR",
+                    "severity": "error",
+                    "message": str(e)
+                }
+            }
+    
+    def stop_profiler(self) -> Dict[str, Any]:
+        """Stop the profiler and report the files it wrote"""
+        if self.profiler is None:
+            return {
+                "success": False,
+                "error": {
+                    "type": "COMMAND_ERROR",
+                    "severity": "error",
+                    "message": "Profiler is not running"
+                }
+            }
+        
+        try:
+            profile = self.profiler.stop()
+            return {
+                "success": True,
+                "profile": profile
+            }
+        except Exception as e:
+            logger.error(f"Error stopping profiler: {str(e)}")
+            return {
+                "success": False,
+                "error": {
+                    "type": "COMMAND_ERROR",
+                    "severity": "error",
+                    "message": str(e)
+                }
+            }
+        finally:
+            self.profiler = None
+    
+    def toggle_profiler(self, *args):
+        """SIGUSR1: start the sampling profiler with defaults, or stop it"""
+        if self.profiler is None:
+            result = self.start_profiler({})
+        else:
+            result = self.stop_profiler()
+        logger.warning(f"Profiler toggled by signal: {json.dumps(result)}")
+    
+    def subscribe(self, exercise_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Switch a session ("sessionId") to event output ("mode": "events",
+        with a heartbeat every "heartbeatInterval" seconds; frames without
+        events are only acknowledged with "ack": true) or back to a full
+        result per frame ("mode": "frames")
+        """
+        try:
+            session_id = data.get("sessionId")
+            if not session_id:
+                raise ValueError("sessionId is required")
+            
+            mode = data.get("mode", "events")
+            if mode == "events":
+                stream = self.event_streams.subscribe(session_id, exercise_type,
+                                                      float(data.get("heartbeatInterval", 1.0)),
+                                                      bool(data.get("ack", False)))
+            elif mode == "frames":
+                stream = self.event_streams.unsubscribe(session_id)
+            else:
+                raise ValueError(f"Unknown subscription mode: {mode} (expected events or frames)")
+            
+            return {
+                "success": True,
+                "sessionId": session_id,
+                "mode": mode,
+                "session": stream.get_stats() if stream is not None else None,
+                "subscriptions": self.event_streams.get_stats()
+            }
+        except Exception as e:
+            logger.error(f"Error configuring subscription: {str(e)}")
+            return {
+                "success": False,
+                "error": {
+                    "type": "COMMAND_ERROR",
+                    "severity": "error",
+                    "message": str(e)
+                }
+            }
+    
+    def configure_error_codes(self, exercise_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Return the error code table of the exercise (all exercises with
+        "all": true) and, given a "sessionId", switch that session to
+        compact [code, value] errors ("mode": "compact", the default) or
+        back to full error dicts ("mode": "full")
+        """
+        try:
+            if data.get("all"):
+                tables = {name: table.describe() for name, table in ERROR_TABLES.items()}
+            elif exercise_type in ERROR_TABLES:
+                tables = {exercise_type: ERROR_TABLES[exercise_type].describe()}
+            else:
+                raise ValueError(f"No error codes for exercise type: {exercise_type}")
+            
+            response = {
+                "success": True,
+                "errorCodes": tables
+            }
+            session_id = data.get("sessionId")
+            if session_id:
+                mode = data.get("mode", "compact")
+                if mode == "compact":
+                    self.compact_error_sessions.pop(session_id, None)
+                    self.compact_error_sessions[session_id] = True
+                    while len(self.compact_error_sessions) > self.max_compact_sessions:
+                        oldest = next(iter(self.compact_error_sessions))
+                        logger.warning(f"Dropping compact errors of session {oldest}: too many compact sessions")
+                        del self.compact_error_sessions[oldest]
+                elif mode == "full":
+                    self.compact_error_sessions.pop(session_id, None)
+                else:
+                    raise ValueError(f"Unknown error code mode: {mode} (expected compact or full)")
+                response["sessionId"] = session_id
+                response["mode"] = mode
+            response["compactSessions"] = len(self.compact_error_sessions)
+            return response
+        except Exception as e:
+            logger.error(f"Error configuring error codes: {str(e)}")
+            return {
+                "success": False,
+                "error": {
+                    "type": "COMMAND_ERROR",
+                    "severity": "error",
+                    "message": str(e)
+                }
+            }
+    
+    def get_landmark_manifest(self, exercise_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        The landmarks the exercise's analyzer reads (all exercises with
+        "all": true), for clients sending reduced frames
+        """
+        if data.get("all"):
+            manifests = {name: manifest.describe() for name, manifest in LANDMARK_MANIFESTS.items()}
+        elif exercise_type in LANDMARK_MANIFESTS:
+            manifests = {exercise_type: LANDMARK_MANIFESTS[exercise_type].describe()}
+        else:
+            return {
+                "success": False,
+                "error": {
+                    "type": "COMMAND_ERROR",
+                    "severity": "error",
+                    "message": f"No landmark manifest for exercise type: {exercise_type}"
+                }
+            }
+        return {
+            "success": True,
+            "landmarkManifests": manifests
+        }
+    
+    def configure_frame_rate(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Turn capture rate advice ("frameRate" in results and heartbeats) on
+        or off ("enabled"), or forget the sessions' motion history ("clear")
+        """
+        if "enabled" in data:
+            self.frame_rate_advice = bool(data["enabled"])
+            if not self.frame_rate_advice:
+                self.frame_rate_advisors.clear()
+        if data.get("clear"):
+            self.frame_rate_advisors.clear()
+        return {
+            "success": True,
+            "enabled": self.frame_rate_advice,
+            "frameRate": self.frame_rate_advisors.get_stats()
+        }
+    
+    def configure_quality(self, exercise_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Configure load shedding: turn the controller on or off ("enabled"),
+        set its thresholds ("highDepth", "lowDepth", "highLatencyMs",
+        "lowLatencyMs", "stepDownInterval", "stepUpHold"), pin a session
+        ("sessionId", defaulting to the exercise type) to a "tier" (null
+        hands it back to the controller) or forget all sessions ("reset")
+        """
+        try:
+            self.quality.configure(
+                enabled=data.get("enabled"),
+                high_depth=data.get("highDepth"),
+                low_depth=data.get("lowDepth"),
+                high_latency_ms=data.get("highLatencyMs"),
+                low_latency_ms=data.get("lowLatencyMs"),
+                step_down_interval=data.get("stepDownInterval"),
+                step_up_hold=data.get("stepUpHold")
+            )
+            if data.get("reset"):
+                self.quality.reset()
+            response = {
+                "success": True,
+                "quality": self.quality.get_stats()
+            }
+            if "tier" in data:
+                key = data.get("sessionId") or exercise_type
+                self.quality.force(key, exercise_type, data["tier"])
+                response["qualityTier"] = self.quality.tier(key, exercise_type)
+            return response
+        except Exception as e:
+            logger.error(f"Error configuring quality tiers: {str(e)}")
+            return {
+                "success": False,
+                "error": {
+                    "type": "COMMAND_ERROR",
+                    "severity": "error",
+                    "message": str(e)
+                }
+            }
+    
+    def get_session_summary(self, exercise_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Running summary of a session ("sessionId", defaulting to the exercise
+        type): angle statistics and range of motion, form score distribution,
+        error counts and time in each stage. "reset" starts the session's
+        summary over, e.g. at the end of a set.
+        """
+        key = data.get("sessionId") or exercise_type
+        summary = self.session_aggregates.summary(key, bool(data.get("reset", False)))
+        if summary is None:
+            return {
+                "success": False,
+                "error": {
+                    "type": "COMMAND_ERROR",
+                    "severity": "error",
+                    "message": f"No results for session {key}"
+                }
+            }
+        return {
+            "success": True,
+            "sessionId": key,
+            "summary": summary
+        }
+    
+    def get_session_timeline(self, exercise_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Chart series of a session ("sessionId", defaulting to the exercise
+        type): [seconds, value] points of its charted metrics, at most
+        "maxPoints" (default 200) per metric. "reset" starts them over.
+        """
+        key = data.get("sessionId") or exercise_type
+        try:
+            max_points = int(data.get("maxPoints", 200))
+            if max_points < 3:
+                raise ValueError("maxPoints must be at least 3")
+            timeline = self.metric_timelines.export(key, max_points, bool(data.get("reset", False)))
+            if timeline is None:
+                raise ValueError(f"No results for session {key}")
+            return {
+                "success": True,
+                "sessionId": key,
+                "timeline": timeline
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "error": {
+                    "type": "COMMAND_ERROR",
+                    "severity": "error",
+                    "message": str(e)
+                }
+            }
+    
+    def configure_dedup(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Turn duplicate frame detection on or off ("enabled"), set its
+        "quantization" or zero its counters ("reset"); answers with the
+        duplicate rates overall and of the most recent sessions
+        """
+        try:
+            self.frame_dedup.configure(data.get("enabled"), data.get("quantization"))
+            if data.get("reset"):
+                self.frame_dedup.reset()
+            return {
+                "success": True,
+                "dedup": self.frame_dedup.get_stats()
+            }
+        except Exception as e:
+            logger.error(f"Error configuring frame dedup: {str(e)}")
+            return {
+                "success": False,
+                "error": {
+                    "type": "COMMAND_ERROR",
+                    "severity": "error",
+                    "message": str(e)
+                }
+            }
+    
+    def configure_diagnostics(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Toggle diagnostic categories ("enable"/"disable": lists of exercise
+        types, "*" disables all) and sampling ("sampleEvery", "maxPerSecond",
+        "capacity", "logEvents"); "dump" returns the buffered events (true,
+        or a category), at most "limit" of them
+        """
+        try:
+            DIAG.configure(
+                enable=data.get("enable", ()),
+                disable=data.get("disable", ()),
+                sample_every=data.get("sampleEvery"),
+                max_per_second=data.get("maxPerSecond"),
+                capacity=data.get("capacity"),
+                log_events=data.get("logEvents")
+            )
+            
+            response = {
+                "success": True,
+                "diagnostics": DIAG.get_stats()
+            }
+            dump = data.get("dump")
+            if dump:
+                response["events"] = DIAG.dump(dump if isinstance(dump, str) else None, data.get("limit"))
+            return response
+        except Exception as e:
+            logger.error(f"Error configuring diagnostics: {str(e)}")
+            return {
+                "success": False,
+                "error": {
+                    "type": "COMMAND_ERROR",
+                    "severity": "error",
+                    "message": str(e)
+                }
+            }
+    
+    def handle_command(self, command: str, exercise_type: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Run a server command, returning None if the command is unknown"""
+        if command == "reset_counter":
+            # Reset the repetition counter
+            return self.reset_counter(exercise_type, data.get("sessionId"))
+        elif command == "cascade":
+            return self.configure_cascade(exercise_type, data)
+        elif command == "cascade_stats":
+            return self.get_cascade_stats()
+        elif command == "motion_gate":
+            return self.configure_motion_gate(exercise_type, data)
+        elif command == "motion_gate_stats":
+            return self.get_motion_gate_stats()
+        elif command == "state_store":
+            return self.configure_state_store(exercise_type, data)
+        elif command == "prediction_cache":
+            return self.configure_prediction_cache(exercise_type, data)
+        elif command == "prediction_cache_stats":
+            return self.get_prediction_cache_stats()
+        elif command == "recorder":
+            return self.configure_recorder(data)
+        elif command == "recorder_stats":
+            return self.get_recorder_stats()
+        elif command == "trace":
+            return self.configure_trace(data)
+        elif command == "trace_stats":
+            return self.get_trace_stats()
+        elif command == "metrics":
+            return self.configure_metrics(data)
+        elif command == "profile_start":
+            return self.start_profiler(data)
+        elif command == "profile_stop":
+            return self.stop_profiler()
+        elif command == "diagnostics":
+            return self.configure_diagnostics(data)
+        elif command == "subscribe":
+            return self.subscribe(exercise_type, data)
+        elif command == "error_codes":
+            return self.configure_error_codes(exercise_type, data)
+        elif command == "landmark_manifest":
+            return self.get_landmark_manifest(exercise_type, data)
+        elif command == "frame_rate":
+            return self.configure_frame_rate(data)
+        elif command == "quality":
+            return self.configure_quality(exercise_type, data)
+        elif command == "session_summary":
+            return self.get_session_summary(exercise_type, data)
+        elif command == "session_timeline":
+            return self.get_session_timeline(exercise_type, data)
+        elif command == "dedup":
+            return self.configure_dedup(data)
+        return None
+    
     def run_server(self):
         """Run the server loop, processing input from stdin"""
         logger.info("Exercise Analyzer Server starting")
         
         # Print startup message for Node.js to confirm server is ready
-        print(json.dumps({"status": "ready", "message": "Exercise Analyzer Server started"}))
+        # The landmark manifests let clients send reduced frames from the start
+        print(json.dumps({
+            "status": "ready",
+            "message": "Exercise Analyzer Server started",
+            "landmarkManifests": {name: manifest.describe() for name, manifest in LANDMARK_MANIFESTS.items()}
+        }))
         sys.stdout.flush()
         
+        self.input_queue = InputQueue()
         while True:
             try:
-                # Read a line from stdin
-                input_line = sys.stdin.readline().strip()
+                # Next line from stdin, with the time it arrived
+                input_line, received = self.input_queue.get()
                 
                 # Handle special commands
                 if input_line == "EXIT":
@@ -203,6 +1062,10 @@ class ExerciseAnalyzerServer:
                 # Process normal analysis request
                 if input_line:
                     start_time = time.time()
+                    start_ns = time.perf_counter_ns()
+                    wait_ms = max(0.0, start_ns / 1e6 - received * 1000)
+                    wait_ns = int(wait_ms * 1e6)
+                    self.metrics.record_input(len(input_line) + 1, self.input_queue.depth())
                     
                     try:
                         # Parse the input data
@@ -216,11 +1079,10 @@ class ExerciseAnalyzerServer:
                             message_type = data.get("type", "")
                             logger.info(f"Processing command: {command} (type: {message_type}) for {exercise_type}")
                             
-                            if command == "reset_counter":
-                                # Reset the repetition counter
-                                result = self.reset_counter(exercise_type)
+                            result = self.handle_command(command, exercise_type, data)
+                            if result is not None:
                                 result["requestId"] = request_id
-                                result["command"] = "reset_counter_ack"
+                                result["command"] = f"{command}_ack"
                                 result["type"] = "command_response"  # Add type for consistent response format
                                 result["processingTime"] = time.time() - start_time
                                 
@@ -243,98 +1105,93 @@ class ExerciseAnalyzerServer:
                                 sys.stdout.flush()
                                 continue
                         
-                        # Check for ultra-simplified format (just landmarks array)
-                        if 'landmarks' in data and isinstance(data['landmarks'], list):
-                            logger.debug(f"Processing ultra-simplified landmarks message")
-                            
-                            # Extract landmarks directly
-                            landmarks_list = data.get('landmarks', [])
-                            pose_landmarks = []
-                            
-                            # Convert from simple {x,y} format to full landmark format
-                            for lm in landmarks_list:
-                                pose_landmarks.append({
-                                    'x': lm.get('x', 0.0),
-                                    'y': lm.get('y', 0.0),
-                                    'z': 0.0,  # Z coordinate not provided
-                                    'visibility': 0.9  # Use default high visibility
-                                })
-                            
-                            # Use default exercise type if not specified
-                            exercise_type = data.get('exercise', 'squat')
-                            
-                            if len(pose_landmarks) > 0:
-                                logger.debug(f"Processing ultra-simple request {request_id}: {exercise_type} with {len(pose_landmarks)} landmarks")
-                        # Check for simplified format ('data' type)
-                        elif 'type' in data and data['type'] == 'data':
-                            message_type = 'data'
-                            exercise_type = data.get('exercise', 'squat')
-                            frame_id = data.get('frame', None)
-                            
-                            # Extract landmarks from 'points' field
-                            if 'points' in data:
-                                points = data.get('points', [])
-                                # Convert from {x, y, v} format to full landmark format
-                                pose_landmarks = []
-                                for pt in points:
-                                    pose_landmarks.append({
-                                        'x': pt.get('x', 0.0),
-                                        'y': pt.get('y', 0.0),
-                                        'z': 0.0,  # Z not provided in minimal format
-                                        'visibility': pt.get('v', 0.0)
-                                    })
-                                
-                                logger.debug(f"Processing simplified data: {exercise_type} frame {frame_id} with {len(pose_landmarks)} landmarks")
-                        # Check for compact format with 't' field
-                        elif 't' in data:
-                            message_type = data.get('t', '')
-                            if message_type == 'landmarks':
-                                logger.debug(f"Processing compact landmarks message")
-                                # Extract relevant data for analysis
-                                pose_landmarks = data.get('p', [])
-                                exercise_type = data.get('e', 'squat')
-                                frame_id = data.get('id', None)
-                                
-                                # Convert compact format [x,y,z,v] to dict format
-                                if pose_landmarks and isinstance(pose_landmarks[0], list):
-                                    pose_landmarks = [
-                                        {'x': lm[0], 'y': lm[1], 'z': lm[2], 'visibility': lm[3]} 
-                                        for lm in pose_landmarks
-                                    ]
-                                
-                                # Log minimal info to reduce stdout pollution
-                                if len(pose_landmarks) > 0:
-                                    logger.debug(f"Processing compact request {request_id}: {exercise_type} with {len(pose_landmarks)} landmarks (frame {frame_id})")
-                        # Check for legacy format with 'type' field
-                        elif 'type' in data:
-                            message_type = data.get('type', '')
-                            if message_type == 'landmarks':
-                                logger.debug(f"Processing legacy landmarks message (type: {message_type})")
-                                # Extract relevant data for analysis
-                                pose_landmarks = data.get('poseLandmarks', [])
-                                exercise_type = data.get('exerciseType', 'squat')
-                                frame_id = data.get('frameId', None)
+                        # Sampled (or "trace": true) requests get a per-stage timing breakdown
+                        trace = self.trace_stats.sample(bool(data.get("trace")), start_ns)
+                        
+                        # Normalize any of the accepted landmark message formats
+                        frame = decode_frame(data)
+                        exercise_type = frame["exerciseType"]
+                        pose_landmarks = frame["landmarks"]
+                        if trace is not None:
+                            trace.mark("decode")
+                        if self.profiler is not None:
+                            self.profiler.begin(exercise_type)
                         
                         # Log minimal info to reduce stdout pollution
                         if len(pose_landmarks) > 0:
-                                    logger.debug(f"Processing request {request_id}: {exercise_type} with {len(pose_landmarks)} landmarks (frame {frame_id})")
-                        else:
-                            # Handle older format without type field
-                            pose_landmarks = data.get('poseLandmarks', [])
-                            # Log minimal info to reduce stdout pollution
-                            if len(pose_landmarks) > 0:
-                                logger.debug(f"Processing classic request {request_id}: {exercise_type} with {len(pose_landmarks)} landmarks")
+                            logger.debug(f"Processing {frame['format']} request {request_id}: {exercise_type} with {len(pose_landmarks)} landmarks (frame {frame['frameId']})")
                         
                         # Analyze the pose
-                        result = self.analyze_pose(exercise_type, pose_landmarks)
+                        compact_errors = data.get("sessionId") in self.compact_error_sessions
+                        quality_key = data.get("sessionId") or exercise_type
+                        quality_tier = self.quality.tier(quality_key, exercise_type)
+                        result = self.frame_dedup.lookup(quality_key, exercise_type, pose_landmarks, compact_errors)
+                        if result is not None:
+                            # Same pose as the previous frame: only time-based state moves on
+                            analyzer = self.analyzers.get(exercise_type)
+                            if hasattr(analyzer, "advance_duplicate"):
+                                result = analyzer.advance_duplicate(result, frame["timestamp"])
+                            result["duplicate"] = True
+                        else:
+                            result = self.analyze_pose(exercise_type, pose_landmarks, frame["timestamp"], trace,
+                                                       compact_errors, quality_tier, quality_key)
+                            self.frame_dedup.store(quality_key, result)
+                        if trace is not None:
+                            trace.mark("analysis")
+                        self.quality.observe(quality_key, exercise_type, wait_ms,
+                                             (time.perf_counter_ns() - start_ns) / 1e6, self.input_queue.depth())
+                        if not result.get("success", False):
+                            DIAG.dump_on_error(f"{exercise_type} analysis failed for request {request_id}")
+                        elif result.get("result"):
+                            self.session_aggregates.update(quality_key, exercise_type, result["result"],
+                                                           frame["timestamp"])
+                            self.metric_timelines.update(quality_key, exercise_type, result["result"],
+                                                         frame["timestamp"])
+                            if self.frame_rate_advice and exercise_type in LANDMARK_MANIFESTS:
+                                result["result"]["frameRate"] = self.frame_rate_advisors.update(
+                                    quality_key, exercise_type, LANDMARK_MANIFESTS[exercise_type].indices,
+                                    pose_landmarks, result["result"].get("stage"), frame["timestamp"])
                         
-                        # Add the request ID and processing time to the response
-                        result["requestId"] = request_id
-                        result["processingTime"] = time.time() - start_time
-                        result["type"] = "analysis_result"  # Add consistent type field for all responses
+                        if self.recorder is not None:
+                            self.recorder.record(data.get("sessionId", ""), exercise_type, request_id, frame, result)
+                            if trace is not None:
+                                trace.mark("record")
+                        
+                        # Subscribed sessions only get what changed; failures still go out in full
+                        stream = self.event_streams.get(data.get("sessionId"))
+                        if stream is not None and result.get("success", False):
+                            events = stream.update(exercise_type, result.get("result") or {}, frame["timestamp"])
+                            result = {"success": True, "requestId": request_id, "type": "analysis_events",
+                                      "sessionId": data.get("sessionId"), "qualityTier": quality_tier}
+                            if events:
+                                result["events"] = events
+                            elif not stream.ack:
+                                self.metrics.record_request(exercise_type, time.perf_counter_ns() - start_ns, result,
+                                                            data.get("sessionId"), frame["frameId"], wait_ns)
+                                if trace is not None:
+                                    self.trace_stats.record(exercise_type, trace)
+                                continue
+                        else:
+                            # Add the request ID and processing time to the response
+                            result["requestId"] = request_id
+                            result["processingTime"] = time.time() - start_time
+                            result["type"] = "analysis_result"  # Add consistent type field for all responses
+                            result["qualityTier"] = quality_tier
+                            if stream is not None:
+                                result["sessionId"] = data.get("sessionId")
+                        
+                        output = json.dumps(result)
+                        if trace is not None:
+                            trace.mark("encode")
+                            self.trace_stats.record(exercise_type, trace)
+                            if self.trace_stats.include_in_response or data.get("trace"):
+                                # Splice the trace in after encoding so the encode time is in it
+                                output = output[:-1] + ', "trace": ' + json.dumps(trace.to_dict()) + "}"
+                        self.metrics.record_request(exercise_type, time.perf_counter_ns() - start_ns, result,
+                                                    data.get("sessionId"), frame["frameId"], wait_ns)
                         
                         # Send the result back to Node.js
-                        print(json.dumps(result))
+                        print(output)
                         sys.stdout.flush()
                         
                     except json.JSONDecodeError:
@@ -349,11 +1206,13 @@ class ExerciseAnalyzerServer:
                                 "message": "Invalid JSON input"
                             }
                         }
+                        self.metrics.record_error("unknown", "INVALID_INPUT")
                         print(json.dumps(error_response))
                         sys.stdout.flush()
                         
                     except Exception as e:
                         logger.error(f"Error processing request: {str(e)}")
+                        DIAG.dump_on_error("Error processing request")
                         error_response = {
                             "success": False,
                             "requestId": "unknown",
@@ -364,8 +1223,13 @@ class ExerciseAnalyzerServer:
                                 "message": str(e)
                             }
                         }
+                        self.metrics.record_error("unknown", "ANALYSIS_ERROR")
                         print(json.dumps(error_response))
                         sys.stdout.flush()
+                    
+                    finally:
+                        if self.profiler is not None:
+                            self.profiler.end()
             
             except KeyboardInterrupt:
                 logger.info("Keyboard interrupt received")
@@ -376,10 +1240,18 @@ class ExerciseAnalyzerServer:
                 # Continue to keep the server running
         
         logger.info("Exercise Analyzer Server shutting down")
+        if self.recorder is not None:
+            self.recorder.stop()
+        self.metrics.stop_textfile()
+        if self.profiler is not None:
+            self.profiler.stop()
     
     def shutdown(self, *args):
         """Handle graceful shutdown"""
         logger.info("Shutdown signal received")
+        if self.recorder is not None:
+            self.recorder.stop()
+        self.metrics.stop_textfile()
         sys.exit(0)
 
 if __name__ == "__main__":
@@ -0,0 +1,196 @@
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger('FrameDecoder')
+
+NUM_LANDMARKS = 33
+LANDMARK_FIELDS = ('x', 'y', 'z', 'visibility')
+
+# MediaPipe pose landmark names in index order (as used in the core/ CSV headers)
+LANDMARK_NAMES = (
+    'nose', 'left_eye_inner', 'left_eye', 'left_eye_outer', 'right_eye_inner', 'right_eye',
+    'right_eye_outer', 'left_ear', 'right_ear', 'mouth_left', 'mouth_right',
+    'left_shoulder', 'right_shoulder', 'left_elbow', 'right_elbow', 'left_wrist', 'right_wrist',
+    'left_pinky', 'right_pinky', 'left_index', 'right_index', 'left_thumb', 'right_thumb',
+    'left_hip', 'right_hip', 'left_knee', 'right_knee', 'left_ankle', 'right_ankle',
+    'left_heel', 'right_heel', 'left_foot_index', 'right_foot_index'
+)
+
+# Stands in for every landmark a reduced frame leaves out; shared between
+# frames, so analyzers must not write to landmarks outside their manifest
+MISSING_LANDMARK = {'x': 0.0, 'y': 0.0, 'z': 0.0, 'visibility': 0.0}
+
+
+class LandmarkManifest:
+    """
+    The landmarks (and fields of each) one exercise's analyzer reads.
+
+    Clients that load the manifest (landmark_manifest command, or the
+    server's ready message) can send "reduced" frames: a flat list of the
+    manifest's fields for each of its landmarks, in manifest order. expand()
+    places those at their MediaPipe indices in a full 33-landmark list and
+    fills the rest with MISSING_LANDMARK, so the analyzers index landmarks
+    exactly as before. Fields outside the manifest are 0.0.
+    """
+
+    def __init__(self, exercise_type: str, indices: List[int], fields: Tuple[str, ...] = LANDMARK_FIELDS):
+        self.exercise_type = exercise_type
+        self.indices = list(indices)
+        self.fields = tuple(fields)
+        self.stride = len(self.fields)
+        self.template = [MISSING_LANDMARK] * NUM_LANDMARKS
+
+    def expand(self, values: List[float]) -> List[Dict[str, float]]:
+        """Flat reduced values -> full landmark list as the analyzers expect"""
+        if len(values) != len(self.indices) * self.stride:
+            raise ValueError(f"Reduced {self.exercise_type} frame has {len(values)} values, "
+                             f"expected {len(self.indices)} landmarks x {self.stride} fields")
+        landmarks = list(self.template)
+        stride = self.stride
+        if self.fields == LANDMARK_FIELDS:
+            for i, idx in enumerate(self.indices):
+                x, y, z, visibility = values[i * stride:(i + 1) * stride]
+                landmarks[idx] = {'x': x, 'y': y, 'z': z, 'visibility': visibility}
+        else:
+            for i, idx in enumerate(self.indices):
+                landmark = dict(MISSING_LANDMARK)
+                landmark.update(zip(self.fields, values[i * stride:(i + 1) * stride]))
+                landmarks[idx] = landmark
+        return landmarks
+
+    def reduce(self, frame: np.ndarray) -> List[float]:
+        """(33, 4) array -> flat reduced values, the client side of expand()"""
+        columns = [LANDMARK_FIELDS.index(field) for field in self.fields]
+        return np.asarray(frame, dtype=np.float32)[np.ix_(self.indices, columns)].ravel().tolist()
+
+    def describe(self) -> Dict[str, Any]:
+        """The manifest as sent to clients"""
+        return {
+            "exerciseType": self.exercise_type,
+            "indices": self.indices,
+            "names": [LANDMARK_NAMES[idx] for idx in self.indices],
+            "fields": list(self.fields),
+            "dtype": "float32",
+            "values": len(self.indices) * self.stride
+        }
+
+
+# Landmarks read by each analyzer; the ML analyzers use all four fields as
+# model features, the geometric ones never read z
+GEOMETRIC_FIELDS = ('x', 'y', 'visibility')
+LANDMARK_MANIFESTS = {
+    # IMPORTANT_LMS plus the foot indices used for foot placement
+    "squat": LandmarkManifest("squat", [0, 11, 12, 23, 24, 25, 26, 27, 28, 31, 32]),
+    # Model features (nose, arms, hips) plus the ankles used by lean back detection
+    "bicep": LandmarkManifest("bicep", [0, 11, 12, 13, 14, 15, 16, 23, 24, 27, 28]),
+    "lunge": LandmarkManifest("lunge", [0, 11, 12, 23, 24, 25, 26, 27, 28, 29, 30, 31, 32]),
+    "plank": LandmarkManifest("plank", [0, 11, 12, 13, 14, 15, 16, 23, 24, 25, 26, 27, 28, 29, 30, 31, 32]),
+    "situp": LandmarkManifest("situp", [0, 11, 12, 23, 24, 25, 26, 27, 28], GEOMETRIC_FIELDS),
+    "shoulder_press": LandmarkManifest("shoulder_press", [11, 12, 13, 14, 15, 16], GEOMETRIC_FIELDS),
+    "bench_press": LandmarkManifest("bench_press", [11, 12, 13, 14, 15, 16], GEOMETRIC_FIELDS),
+    "pushup": LandmarkManifest("pushup", [0, 11, 12, 13, 14, 15, 16, 23, 24, 25, 26, 27, 28], GEOMETRIC_FIELDS),
+    "lateral_raise": LandmarkManifest("lateral_raise", [0, 11, 12, 13, 14, 15, 16, 23, 24, 25, 26, 27, 28],
+                                      GEOMETRIC_FIELDS),
+}
+
+
+def _frame_timestamp(data: Dict[str, Any]) -> Optional[float]:
+    """Client capture time in seconds from the millisecond `timestamp` / `ts` field"""
+    timestamp = data.get("timestamp", data.get("ts"))
+    if isinstance(timestamp, bool) or not isinstance(timestamp, (int, float)):
+        return None
+    return timestamp / 1000.0
+
+
+def decode_frame(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Normalize any accepted landmark message into
+    {"format", "exerciseType", "landmarks", "frameId", "timestamp"}.
+
+    Accepted formats (checked in this order):
+    - reduced:      {"t": "reduced", "p": [flat manifest values], "e", "id"}
+    - ultra-simple: {"landmarks": [{x, y}], "exercise"}
+    - data:         {"type": "data", "points": [{x, y, v}], "exercise", "frame"}
+    - compact:      {"t": "landmarks", "p": [[x, y, z, v]], "e", "id"}
+    - legacy:       {"type": "landmarks", "poseLandmarks", "exerciseType", "frameId"}
+    - classic:      {"poseLandmarks", "exerciseType"}
+    Landmarks are returned as dicts with x, y, z and visibility; timestamp
+    is in seconds (None if the client did not send one).
+    """
+    message_format = "classic"
+    exercise_type = data.get("exerciseType", "squat")
+    frame_id = data.get("frameId")
+    landmarks = []
+
+    if data.get('t') == 'reduced':
+        message_format = "reduced"
+        exercise_type = data.get('e', 'squat')
+        frame_id = data.get('id')
+        manifest = LANDMARK_MANIFESTS.get(exercise_type)
+        if manifest is None:
+            raise ValueError(f"No landmark manifest for exercise type: {exercise_type}")
+        landmarks = manifest.expand(data.get('p', []))
+    elif 'landmarks' in data and isinstance(data['landmarks'], list):
+        message_format = "simple"
+        exercise_type = data.get('exercise', 'squat')
+        # Z coordinate not provided, use default high visibility
+        landmarks = [
+            {'x': lm.get('x', 0.0), 'y': lm.get('y', 0.0), 'z': 0.0, 'visibility': 0.9}
+            for lm in data['landmarks']
+        ]
+    elif data.get('type') == 'data':
+        message_format = "data"
+        exercise_type = data.get('exercise', 'squat')
+        frame_id = data.get('frame')
+        # Z not provided in minimal format
+        landmarks = [
+            {'x': pt.get('x', 0.0), 'y': pt.get('y', 0.0), 'z': 0.0, 'visibility': pt.get('v', 0.0)}
+            for pt in data.get('points', [])
+        ]
+    elif 't' in data:
+        message_format = "compact"
+        if data.get('t') == 'landmarks':
+            exercise_type = data.get('e', 'squat')
+            frame_id = data.get('id')
+            landmarks = data.get('p', [])
+            # Convert compact format [x,y,z,v] to dict format
+            if landmarks and isinstance(landmarks[0], list):
+                landmarks = [
+                    {'x': lm[0], 'y': lm[1], 'z': lm[2], 'visibility': lm[3]}
+                    for lm in landmarks
+                ]
+    elif 'type' in data:
+        message_format = "legacy"
+        if data.get('type') == 'landmarks':
+            landmarks = data.get('poseLandmarks', [])
+            exercise_type = data.get('exerciseType', 'squat')
+
+    # Fall back to the classic poseLandmarks field
+    if not landmarks:
+        landmarks = data.get('poseLandmarks', [])
+
+    return {
+        "format": message_format,
+        "exerciseType": exercise_type,
+        "landmarks": landmarks,
+        "frameId": frame_id,
+        "timestamp": _frame_timestamp(data)
+    }
+
+
+def landmarks_to_array(landmarks: List[Dict[str, float]]) -> np.ndarray:
+    """List of landmark dicts -> (33, 4) float32 array of x, y, z, visibility"""
+    frame = np.zeros((NUM_LANDMARKS, len(LANDMARK_FIELDS)), dtype=np.float32)
+    for i, lm in enumerate(landmarks[:NUM_LANDMARKS]):
+        frame[i] = [lm.get(field, 0.0) for field in LANDMARK_FIELDS]
+    return frame
+
+
+def array_to_landmarks(frame: np.ndarray) -> List[Dict[str, float]]:
+    """(33, 4) array -> list of landmark dicts as the analyzers expect"""
+    return [
+        {'x': x, 'y': y, 'z': z, 'visibility': visibility}
+        for x, y, z, visibility in frame.tolist()
+    ]
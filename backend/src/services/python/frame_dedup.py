@@ -0,0 +1,122 @@
+import logging
+from typing import Any, Dict, List, Optional
+
+from frame_decoder import LANDMARK_MANIFESTS, LANDMARK_FIELDS
+
+logger = logging.getLogger('FrameDedup')
+
+ALL_LANDMARKS = list(range(33))
+
+
+class FrameDeduplicator:
+    """
+    Answers frames whose landmarks match the session's previous frame (a
+    paused video, a frozen camera) with the previous result instead of
+    analyzing them again.
+
+    A frame's signature is its landmarks quantized to `quantization`
+    (normalized units), limited to the indices and fields of the exercise's
+    landmark manifest, packed into one tuple of ints; a duplicate is a
+    frame whose signature equals the previous one. Only successful results
+    are reused, and only while the session keeps the same exercise and
+    error format ("variant"). The server lets the analyzer advance its
+    time-based state for a duplicate (advance_duplicate(), e.g. the plank
+    hold timer); everything else is answered as it was.
+    """
+
+    def __init__(self, quantization: float = 0.0005, max_sessions: int = 1024):
+        self.enabled = True
+        self.quantization = quantization
+        self.max_sessions = max_sessions
+        self.reset()
+
+    def reset(self) -> None:
+        # key -> {"exerciseType", "variant", "signature", "result", "frames", "duplicates"}
+        self.sessions = {}
+        self.frames = 0
+        self.duplicates = 0
+
+    def configure(self, enabled: Optional[bool] = None, quantization: Optional[float] = None) -> None:
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        if quantization is not None:
+            if quantization <= 0:
+                raise ValueError("quantization must be positive")
+            self.quantization = float(quantization)
+        if enabled is not None or quantization is not None:
+            self.sessions = {}
+
+    def signature(self, exercise_type: str, landmarks: List[Dict[str, float]]) -> tuple:
+        manifest = LANDMARK_MANIFESTS.get(exercise_type)
+        indices = manifest.indices if manifest is not None else ALL_LANDMARKS
+        fields = manifest.fields if manifest is not None else LANDMARK_FIELDS
+        scale = 1.0 / self.quantization
+        return tuple(
+            round(landmarks[idx].get(field, 0.0) * scale)
+            for idx in indices if idx < len(landmarks)
+            for field in fields
+        )
+
+    def lookup(self, key: str, exercise_type: str, landmarks: List[Dict[str, float]],
+               variant: Any = None) -> Optional[Dict[str, Any]]:
+        """
+        Copy of the previous result if this frame duplicates the previous
+        one, else None (store() then keeps the result of its analysis)
+        """
+        if not self.enabled:
+            return None
+        signature = self.signature(exercise_type, landmarks)
+        session = self.sessions.get(key)
+        if session is None or session["exerciseType"] != exercise_type or session["variant"] != variant:
+            session = {"exerciseType": exercise_type, "variant": variant, "signature": None, "result": None,
+                       "frames": 0, "duplicates": 0}
+            self.sessions.pop(key, None)
+            self.sessions[key] = session
+            while len(self.sessions) > self.max_sessions:
+                del self.sessions[next(iter(self.sessions))]
+
+        session["frames"] += 1
+        self.frames += 1
+        if session["result"] is not None and signature == session["signature"]:
+            session["duplicates"] += 1
+            self.duplicates += 1
+            # The server adds response fields to both levels, so hand out copies
+            result = dict(session["result"])
+            result["result"] = dict(result["result"])
+            return result
+
+        session["signature"] = signature
+        session["result"] = None
+        return None
+
+    def store(self, key: str, result: Dict[str, Any]) -> None:
+        """Keep the result of the frame last looked up for the session, if it succeeded"""
+        session = self.sessions.get(key)
+        if session is not None and result.get("success", False) and result.get("result"):
+            stored = dict(result)
+            stored["result"] = dict(result["result"])
+            session["result"] = stored
+
+    def forget(self, exercise_type: str, key: Optional[str] = None) -> None:
+        """Drop the results of an exercise's sessions, or of session `key` only (its counters were reset)"""
+        for session_key, session in self.sessions.items():
+            if session["exerciseType"] == exercise_type and (key is None or session_key == key):
+                session["result"] = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "quantization": self.quantization,
+            "frames": self.frames,
+            "duplicates": self.duplicates,
+            "duplicateRate": round(self.duplicates / self.frames, 4) if self.frames else 0.0,
+            "sessions": {
+                key: {
+                    "exerciseType": session["exerciseType"],
+                    "frames": session["frames"],
+                    "duplicates": session["duplicates"],
+                    "duplicateRate": round(session["duplicates"] / session["frames"], 4) if session["frames"] else 0.0
+                }
+                for key, session in list(self.sessions.items())[-16:]
+            }
+        }
@@ -0,0 +1,180 @@
+import math
+import time
+import logging
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger('FrameRateAdvisor')
+
+# Per exercise: (floor of the minimum rate, highest useful rate) in frames per second.
+# Holds need few frames; fast curls and push-ups need the most.
+FRAME_RATE_PROFILES = {
+    "squat": (6, 30),
+    "bicep": (10, 30),
+    "lunge": (6, 30),
+    "plank": (2, 10),
+    "situp": (6, 30),
+    "shoulder_press": (8, 30),
+    "bench_press": (8, 30),
+    "pushup": (10, 30),
+    "lateral_raise": (8, 30),
+}
+DEFAULT_PROFILE = (8, 30)
+
+# Rates are advised in these steps so small speed changes do not flap the capture rate
+FPS_STEPS = (2, 5, 10, 15, 20, 24, 30)
+
+
+class FrameRateAdvisor:
+    """
+    Recommended capture rate for one session.
+
+    Landmark speed is the mean (x, y) displacement per second of the
+    exercise's visible landmarks, smoothed with an EMA. The motion rate is
+    the speed divided by `max_step`, the largest movement (normalized
+    image units) we want between two frames. The minimum rate is what rep
+    counting needs: `frames_per_stage` frames in the median of the
+    current stage and those that ended in the last `stage_history`
+    seconds, and never below the exercise's floor. Around a stage
+    transition (`transition_hold` seconds) the advice stays at least at
+    twice the minimum. Rising advice applies immediately; falling advice
+    only after it has stayed lower for `decrease_hold` seconds.
+    """
+
+    def __init__(self, exercise_type: str, landmark_indices: List[int], max_step: float = 0.02,
+                 frames_per_stage: int = 3, stage_history: float = 10.0, transition_hold: float = 0.5,
+                 decrease_hold: float = 1.0, smoothing: float = 0.3, visibility_threshold: float = 0.5):
+        self.exercise_type = exercise_type
+        self.landmark_indices = list(landmark_indices)
+        self.min_floor, self.max_fps = FRAME_RATE_PROFILES.get(exercise_type, DEFAULT_PROFILE)
+        self.max_step = max_step
+        self.frames_per_stage = frames_per_stage
+        self.stage_history = stage_history
+        self.transition_hold = transition_hold
+        self.decrease_hold = decrease_hold
+        self.smoothing = smoothing
+        self.visibility_threshold = visibility_threshold
+        self.frames = 0
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget motion and stage history"""
+        self.last_points = None
+        self.last_time = None
+        self.speed = 0.0
+        self.stage = None
+        self.stage_start = None
+        # (end time, duration) of recent stages
+        self.stage_durations = deque(maxlen=8)
+        self.advised = None
+        self.lower_since = None
+
+    def _points(self, landmarks: List[Dict[str, float]]) -> Dict[int, tuple]:
+        points = {}
+        for idx in self.landmark_indices:
+            if idx < len(landmarks):
+                landmark = landmarks[idx]
+                if landmark.get('visibility', 0.0) >= self.visibility_threshold:
+                    points[idx] = (landmark.get('x', 0.0), landmark.get('y', 0.0))
+        return points
+
+    def _step_up(self, fps: float) -> int:
+        for step in FPS_STEPS:
+            if step >= fps:
+                return min(step, self.max_fps)
+        return self.max_fps
+
+    def update(self, landmarks: List[Dict[str, float]], stage: Any, timestamp: Optional[float] = None) -> Dict[str, Any]:
+        """Advice after one analyzed frame"""
+        now = timestamp if timestamp is not None else time.time()
+        self.frames += 1
+
+        points = self._points(landmarks)
+        if self.last_points is not None and self.last_time is not None and now > self.last_time:
+            shared = [idx for idx in points if idx in self.last_points]
+            if shared:
+                distance = sum(math.hypot(points[idx][0] - self.last_points[idx][0],
+                                          points[idx][1] - self.last_points[idx][1]) for idx in shared) / len(shared)
+                speed = distance / (now - self.last_time)
+                self.speed += self.smoothing * (speed - self.speed)
+        elif self.last_time is not None and now < self.last_time:
+            # Clock went backwards (new stream): start over
+            self.reset()
+        self.last_points = points
+        self.last_time = now
+
+        if stage != self.stage:
+            if self.stage is not None and self.stage_start is not None:
+                self.stage_durations.append((now, now - self.stage_start))
+            self.stage = stage
+            self.stage_start = now
+
+        while self.stage_durations and now - self.stage_durations[0][0] > self.stage_history:
+            self.stage_durations.popleft()
+        min_fps = float(self.min_floor)
+        if self.stage_durations:
+            # The current stage counts too, so a long hold outweighs the last few reps
+            durations = sorted([duration for _, duration in self.stage_durations] + [now - self.stage_start])
+            typical = durations[len(durations) // 2]
+            if typical > 0:
+                min_fps = max(min_fps, self.frames_per_stage / typical)
+        min_fps = min(min_fps, self.max_fps)
+
+        target = max(self.speed / self.max_step, min_fps)
+        if self.stage_durations and now - self.stage_start < self.transition_hold:
+            target = max(target, 2 * min_fps)
+        target = self._step_up(min(target, self.max_fps))
+
+        if self.advised is None or target >= self.advised:
+            self.advised = target
+            self.lower_since = None
+        elif self.lower_since is None:
+            self.lower_since = now
+        elif now - self.lower_since >= self.decrease_hold:
+            self.advised = target
+            self.lower_since = None
+
+        return {
+            "recommendedFps": self.advised,
+            "minFps": self._step_up(min_fps),
+            "maxFps": self.max_fps,
+            "speed": round(self.speed, 4)
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "exerciseType": self.exercise_type,
+            "frames": self.frames,
+            "recommendedFps": self.advised,
+            "speed": round(self.speed, 4),
+            "stageDurations": [round(duration, 3) for _, duration in self.stage_durations]
+        }
+
+
+class FrameRateAdvisors:
+    """Advisors by session id (by exercise type for requests without one); the oldest is dropped past `max_sessions`"""
+
+    def __init__(self, max_sessions: int = 1024):
+        self.max_sessions = max_sessions
+        self.advisors = {}
+
+    def update(self, key: str, exercise_type: str, landmark_indices: List[int], landmarks: List[Dict[str, float]],
+               stage: Any, timestamp: Optional[float] = None) -> Dict[str, Any]:
+        advisor = self.advisors.get(key)
+        if advisor is None or advisor.exercise_type != exercise_type:
+            advisor = FrameRateAdvisor(exercise_type, landmark_indices)
+            self.advisors.pop(key, None)
+            self.advisors[key] = advisor
+            while len(self.advisors) > self.max_sessions:
+                del self.advisors[next(iter(self.advisors))]
+        return advisor.update(landmarks, stage, timestamp)
+
+    def clear(self) -> None:
+        self.advisors = {}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self.advisors),
+            "maxSessions": self.max_sessions,
+            "advisors": {key: advisor.get_stats() for key, advisor in list(self.advisors.items())[-16:]}
+        }
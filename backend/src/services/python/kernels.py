@@ -0,0 +1,293 @@
+import os
+import time
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger('Kernels')
+
+# Sentinel values the per-object analyzers start from
+NO_PEAK_CONTRACTION = 1000.0
+NO_MIN_ANGLE = 180.0
+
+# "auto" (Numba when installed), "numba" or "numpy"
+BACKEND_ENV = "ANALYZER_KERNELS"
+
+
+# NumPy kernels: whole-array expressions, the reference results
+
+def _joint_angles_numpy(points: np.ndarray, a: int, b: int, c: int) -> np.ndarray:
+    ba = points[:, a] - points[:, b]
+    bc = points[:, c] - points[:, b]
+    radians = np.arctan2(bc[:, 1], bc[:, 0]) - np.arctan2(ba[:, 1], ba[:, 0])
+    degrees = np.abs(np.degrees(radians))
+    return np.where(degrees > 180.0, 360.0 - degrees, degrees)
+
+
+def _hysteresis_state_numpy(angle: np.ndarray, rest_threshold: float, work_threshold: float) -> np.ndarray:
+    with np.errstate(invalid="ignore"):
+        rest = angle > rest_threshold
+        work = angle < work_threshold
+    last_mark = np.maximum.accumulate(np.where(rest | work, np.arange(len(angle)), -1))
+    return np.where(last_mark >= 0, work[np.maximum(last_mark, 0)], False)
+
+
+def _squat_reps_numpy(stage: np.ndarray, in_rep: np.ndarray, codes: np.ndarray,
+                      down: int, up: int) -> Tuple[np.ndarray, np.ndarray]:
+    counted = (codes == up) & in_rep & (stage == down)
+    return (in_rep | (codes == down)) & ~counted, counted
+
+
+def _bicep_reps_numpy(stage: np.ndarray, peak: np.ndarray, curl_angles: np.ndarray, evaluate: np.ndarray,
+                      down: int, up: int, stage_down_threshold: float, stage_up_threshold: float,
+                      peak_contraction_threshold: float) -> Tuple[np.ndarray, ...]:
+    to_down = curl_angles > stage_down_threshold
+    counted = ~to_down & (curl_angles < stage_up_threshold) & (stage == down)
+    stage = np.where(to_down, down, np.where(counted, up, stage)).astype(np.int8)
+
+    peak = np.where(np.isnan(peak), NO_PEAK_CONTRACTION, peak)
+    is_up = evaluate & (stage == up)
+    new_peak = is_up & (curl_angles < peak)
+    is_down = evaluate & (stage == down)
+    peak_error = is_down & (peak != NO_PEAK_CONTRACTION) & (peak >= peak_contraction_threshold)
+    error_angles = np.where(peak_error, peak, np.nan)
+    peak = np.where(new_peak, curl_angles, np.where(is_down, NO_PEAK_CONTRACTION, peak))
+    return stage, peak, counted, peak_error, error_angles
+
+
+def _situp_reps_numpy(stage: np.ndarray, in_rep: np.ndarray, min_angle: np.ndarray, last_counted_time: np.ndarray,
+                      torso_angles: np.ndarray, is_down_position: np.ndarray, is_up_position: np.ndarray,
+                      min_angle_change: np.ndarray, current_time: float, min_rep_interval: float,
+                      down: int, up: int) -> Tuple[np.ndarray, ...]:
+    min_angle = np.where(np.isnan(min_angle), NO_MIN_ANGLE, min_angle)
+    tracking = is_down_position & ~in_rep
+    min_angle = np.where(tracking, np.minimum(min_angle, torso_angles), min_angle)
+    previous_stage = np.where(tracking, down, stage)
+
+    angle_change = min_angle - torso_angles
+    rising = ~is_down_position & is_up_position & (previous_stage == down)
+    counted = (rising
+               & (current_time - last_counted_time >= min_rep_interval)
+               & (angle_change >= min_angle_change))
+
+    stage = np.where(is_down_position, down, np.where(is_up_position, up, previous_stage)).astype(np.int8)
+    return stage, min_angle, counted
+
+
+# Loop kernels: the same rules frame by frame / row by row, compiled by Numba.
+# joint_angles has none: NumPy's vectorized arctan2 and the libm atan2 a
+# compiled loop calls differ in the last bit, and the NumPy expression is
+# already a single pass over the frames.
+
+def _hysteresis_state_loop(angle, rest_threshold, work_threshold):
+    working = np.zeros(angle.shape[0], dtype=np.bool_)
+    state = False
+    for i in range(angle.shape[0]):
+        if angle[i] > rest_threshold:
+            state = False
+        elif angle[i] < work_threshold:
+            state = True
+        working[i] = state
+    return working
+
+
+def _squat_reps_loop(stage, in_rep, codes, down, up):
+    new_in_rep = np.empty(codes.shape[0], dtype=np.bool_)
+    counted = np.empty(codes.shape[0], dtype=np.bool_)
+    for i in range(codes.shape[0]):
+        counted[i] = codes[i] == up and in_rep[i] and stage[i] == down
+        new_in_rep[i] = (in_rep[i] or codes[i] == down) and not counted[i]
+    return new_in_rep, counted
+
+
+def _bicep_reps_loop(stage, peak, curl_angles, evaluate, down, up, stage_down_threshold, stage_up_threshold,
+                     peak_contraction_threshold):
+    n = curl_angles.shape[0]
+    new_stage = np.empty(n, dtype=np.int8)
+    new_peak = np.empty(n)
+    counted = np.zeros(n, dtype=np.bool_)
+    peak_error = np.zeros(n, dtype=np.bool_)
+    error_angles = np.full(n, np.nan)
+    for i in range(n):
+        angle = curl_angles[i]
+        current = stage[i]
+        if angle > stage_down_threshold:
+            current = down
+        elif angle < stage_up_threshold and current == down:
+            counted[i] = True
+            current = up
+        new_stage[i] = current
+
+        p = NO_PEAK_CONTRACTION if np.isnan(peak[i]) else peak[i]
+        if evaluate[i] and current == up:
+            if angle < p:
+                p = angle
+        elif evaluate[i] and current == down:
+            if p != NO_PEAK_CONTRACTION and p >= peak_contraction_threshold:
+                peak_error[i] = True
+                error_angles[i] = p
+            p = NO_PEAK_CONTRACTION
+        new_peak[i] = p
+    return new_stage, new_peak, counted, peak_error, error_angles
+
+
+def _situp_reps_loop(stage, in_rep, min_angle, last_counted_time, torso_angles, is_down_position, is_up_position,
+                     min_angle_change, current_time, min_rep_interval, down, up):
+    n = torso_angles.shape[0]
+    new_stage = np.empty(n, dtype=np.int8)
+    new_min_angle = np.empty(n)
+    counted = np.zeros(n, dtype=np.bool_)
+    for i in range(n):
+        m = NO_MIN_ANGLE if np.isnan(min_angle[i]) else min_angle[i]
+        previous_stage = stage[i]
+        if is_down_position[i] and not in_rep[i]:
+            # np.minimum semantics: a NaN angle wins
+            if np.isnan(torso_angles[i]) or torso_angles[i] < m:
+                m = torso_angles[i]
+            previous_stage = down
+        new_min_angle[i] = m
+
+        if (not is_down_position[i] and is_up_position[i] and previous_stage == down
+                and current_time - last_counted_time[i] >= min_rep_interval
+                and m - torso_angles[i] >= min_angle_change[i]):
+            counted[i] = True
+
+        if is_down_position[i]:
+            new_stage[i] = down
+        elif is_up_position[i]:
+            new_stage[i] = up
+        else:
+            new_stage[i] = previous_stage
+    return new_stage, new_min_angle, counted
+
+
+KERNEL_NAMES = ("joint_angles", "hysteresis_state", "squat_reps", "bicep_reps", "situp_reps")
+NUMPY_KERNELS = {
+    "joint_angles": _joint_angles_numpy,
+    "hysteresis_state": _hysteresis_state_numpy,
+    "squat_reps": _squat_reps_numpy,
+    "bicep_reps": _bicep_reps_numpy,
+    "situp_reps": _situp_reps_numpy,
+}
+LOOP_KERNELS = {
+    "hysteresis_state": _hysteresis_state_loop,
+    "squat_reps": _squat_reps_loop,
+    "bicep_reps": _bicep_reps_loop,
+    "situp_reps": _situp_reps_loop,
+}
+
+
+def _sample_inputs(rows: int = 257) -> Dict[str, tuple]:
+    """Fixed random inputs (with NaNs and sentinels) for warm-up and the parity check"""
+    rng = np.random.default_rng(7)
+    angles = rng.uniform(0.0, 200.0, rows)
+    angles[::17] = np.nan
+    peak = rng.uniform(20.0, 120.0, rows)
+    peak[::5] = np.nan
+    peak[1::7] = NO_PEAK_CONTRACTION
+    min_angle = rng.uniform(40.0, 180.0, rows)
+    min_angle[::6] = np.nan
+    flags = lambda: rng.random(rows) < 0.5
+    return {
+        "hysteresis_state": (angles, 150.0, 110.0),
+        "squat_reps": (rng.integers(0, 4, rows).astype(np.int8), flags(),
+                       rng.integers(0, 4, rows).astype(np.int8), 1, 2),
+        "bicep_reps": (rng.integers(0, 2, rows).astype(np.int8), peak, angles, flags(), 0, 1, 120.0, 100.0, 60.0),
+        "situp_reps": (rng.integers(0, 2, rows).astype(np.int8), flags(), min_angle, rng.uniform(0.0, 10.0, rows),
+                       angles, flags(), flags(), rng.uniform(10.0, 40.0, rows), 10.0, 1.0, 0, 1),
+    }
+
+
+def _same(expected: Any, actual: Any) -> bool:
+    if isinstance(expected, tuple):
+        return len(expected) == len(actual) and all(_same(e, a) for e, a in zip(expected, actual))
+    expected, actual = np.asarray(expected), np.asarray(actual)
+    return expected.shape == actual.shape and np.array_equal(expected, actual, equal_nan=expected.dtype.kind == 'f')
+
+
+class Kernels:
+    """
+    Geometry and rep state-machine kernels for rep_segmentation.py and the
+    session state store (session_state.py, which the squat, bicep and situp
+    analyzers use once their state store is enabled), backed by NumPy or by
+    Numba.
+
+    The NumPy kernels are always available and are the reference. select()
+    picks Numba when it is installed and allowed by ANALYZER_KERNELS
+    ("auto", "numba" or "numpy"). It is called once before the kernels
+    matter: by rep_segmentation.py at startup, and by the server when the
+    state_store command first enables a store; until then the NumPy kernels
+    are used. It compiles the loop kernels (the rep state machines) on
+    sample inputs with the on-disk cache enabled, so later runs only load
+    them, and keeps them only if their outputs match the NumPy kernels
+    exactly; otherwise it falls back to NumPy and says why. describe() is
+    the report.
+    """
+
+    def __init__(self):
+        self.backend = "numpy"
+        self.selected = False
+        self.reason = "not selected yet"
+        self.compile_seconds = 0.0
+        self.cache_hits = 0
+        self._use(NUMPY_KERNELS)
+
+    def _use(self, kernels: Dict[str, Callable]) -> None:
+        for name in KERNEL_NAMES:
+            setattr(self, name, kernels[name])
+
+    def select(self, preference: Optional[str] = None) -> Dict[str, Any]:
+        preference = (preference or os.environ.get(BACKEND_ENV, "auto")).lower()
+        self.selected = True
+        self.compile_seconds = 0.0
+        self.cache_hits = 0
+        self.backend = "numpy"
+        self._use(NUMPY_KERNELS)
+
+        if preference == "numpy":
+            self.reason = f"{BACKEND_ENV}=numpy"
+            return self.describe()
+        try:
+            import numba
+        except ImportError:
+            self.reason = "numba not installed"
+            if preference == "numba":
+                logger.warning("Numba kernels requested but numba is not installed, using NumPy")
+            return self.describe()
+
+        try:
+            start = time.perf_counter()
+            compiled = {name: numba.njit(cache=True)(kernel) for name, kernel in LOOP_KERNELS.items()}
+            samples = _sample_inputs()
+            for name in compiled:
+                if not _same(NUMPY_KERNELS[name](*samples[name]), compiled[name](*samples[name])):
+                    self.reason = f"numba {name} differs from NumPy"
+                    logger.warning(f"{self.reason}, using NumPy kernels")
+                    return self.describe()
+            self.compile_seconds = time.perf_counter() - start
+            for kernel in compiled.values():
+                stats = getattr(kernel, "stats", None)
+                if stats is not None:
+                    self.cache_hits += sum(stats.cache_hits.values())
+        except Exception as e:
+            self.reason = f"numba compilation failed: {e}"
+            logger.warning(f"{self.reason}, using NumPy kernels")
+            return self.describe()
+
+        self.backend = "numba"
+        self.reason = f"numba {numba.__version__}"
+        self._use(dict(NUMPY_KERNELS, **compiled))
+        return self.describe()
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "reason": self.reason,
+            "compileSeconds": round(self.compile_seconds, 3),
+            "cacheHits": self.cache_hits,
+            "compiledKernels": list(LOOP_KERNELS) if self.backend == "numba" else []
+        }
+
+
+KERNELS = Kernels()
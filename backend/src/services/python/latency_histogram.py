@@ -0,0 +1,106 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class LatencyHistogram:
+    """
+    HDR-style log-linear histogram of non-negative integer values
+    (nanoseconds here).
+
+    Values below 2**sub_bucket_bits are counted exactly. Above that, every
+    power-of-two range is split into 2**(sub_bucket_bits - 1) equal buckets,
+    so a recorded value is known to within 1 / 2**(sub_bucket_bits - 1) of
+    itself (~1.6% with the default 7 bits) at any magnitude, in a few hundred
+    sparse counters at most.
+    """
+
+    def __init__(self, sub_bucket_bits: int = 7):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.half_count = 1 << (sub_bucket_bits - 1)
+        self.reset()
+
+    def reset(self) -> None:
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value: int) -> int:
+        shift = value.bit_length() - self.sub_bucket_bits
+        if shift <= 0:
+            return value
+        return shift * self.half_count + (value >> shift)
+
+    def _bounds(self, index: int) -> Tuple[int, int]:
+        """Lowest and highest value counted in a bucket"""
+        if index < 2 * self.half_count:
+            return index, index
+        shift = index // self.half_count - 1
+        mantissa = index - shift * self.half_count
+        return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+    def record(self, value: int) -> None:
+        value = max(0, int(value))
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        """Add another histogram's counts (same sub_bucket_bits) into this one"""
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def percentile(self, q: float) -> Optional[int]:
+        """Upper bound of the bucket holding the q-th percentile (0-100)"""
+        if not self.count:
+            return None
+        rank = max(1, -(-self.count * q // 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._bounds(index)[1], self.max)
+        return self.max
+
+    def cumulative_buckets(self, bounds: List[int]) -> List[Tuple[int, int]]:
+        """
+        (bound, number of values <= bound) for each bound, as for Prometheus
+        `le` buckets. Accurate to the bucket resolution.
+        """
+        ordered = sorted(self.counts.items())
+        result = []
+        position = 0
+        seen = 0
+        for bound in sorted(bounds):
+            while position < len(ordered) and self._bounds(ordered[position][0])[1] <= bound:
+                seen += ordered[position][1]
+                position += 1
+            result.append((bound, seen))
+        return result
+
+    def get_stats(self, scale: float = 1e-6, digits: int = 3) -> Dict[str, Any]:
+        """Count, mean and percentiles, scaled (default: ns -> ms)"""
+        def scaled(value):
+            return round(value * scale, digits) if value is not None else None
+
+        return {
+            "count": self.count,
+            "min": scaled(self.min),
+            "mean": scaled(self.total / self.count) if self.count else None,
+            "p50": scaled(self.percentile(50)),
+            "p90": scaled(self.percentile(90)),
+            "p99": scaled(self.percentile(99)),
+            "p999": scaled(self.percentile(99.9)),
+            "max": scaled(self.max)
+        }
@@ -4,6 +4,9 @@ import sys
 import logging
 from typing import Dict, List, Tuple, Any, Optional, Union
 
+from diagnostics import DIAG
+from error_codes import ERROR_TABLES
+
 # Setup logging
 logging.basicConfig(level=logging.INFO,
                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -20,26 +23,30 @@ REQUIRED_LANDMARKS = [
     27, 28   # ankles
 ]
 
+ERRORS = ERROR_TABLES["lateral_raise"]
+VISIBILITY, UNEVEN_ARMS, EXCESSIVE_RAISE, INSUFFICIENT_RAISE = ERRORS.codes(
+    "visibility", "uneven_arms", "excessive_raise", "insufficient_raise")
+
 class LateralRaisePoseAnalysis:
     """Class to hold lateral raise analysis results"""
     def __init__(self):
         self.stage = "unknown"
         self.rep_count = 0
         self.form_score = 100
-        self.errors = []
+        self.errors = []  # [code, value] pairs
         self.metrics = {}
         self.is_visible = True
     
-    def to_dict(self) -> Dict[str, Any]:
+    def to_dict(self, compact_errors: bool = False) -> Dict[str, Any]:
         """Convert analysis to dictionary for JSON response"""
-        return {
+        result = {
             "stage": self.stage,
             "repCount": self.rep_count,
             "formScore": self.form_score,
-            "errors": self.errors,
             "metrics": self.metrics,
             "isVisible": self.is_visible
         }
+        return ERRORS.put_errors(result, self.errors, compact_errors)
 
 class LateralRaiseAnalyzer:
     """Analyzer for lateral raise poses"""
@@ -62,6 +69,9 @@ class LateralRaiseAnalyzer:
         self.ANGLE_DELTA_THRESHOLD = 15  # Threshold for significant movement
         self.ANGLE_STABLE_THRESHOLD = 7  # Threshold for stable position
         
+        # Set per call by the server for sessions that loaded the error code table
+        self.compact_errors = False
+        
         logger.info("Lateral raise analyzer initialized")
     
     def calculate_angle(self, a: Dict[str, float], b: Dict[str, float], c: Dict[str, float]) -> float:
@@ -97,17 +107,13 @@ class LateralRaiseAnalyzer:
         visibility_percentage = visible_count / total_required
         return visibility_percentage >= 0.7
     
-    def detect_errors(self, landmarks: List[Dict[str, float]], metrics: Dict[str, float]) -> List[Dict[str, str]]:
-        """Detect errors in the lateral raise form"""
+    def detect_errors(self, landmarks: List[Dict[str, float]], metrics: Dict[str, float]) -> List[list]:
+        """Detect errors in the lateral raise form as [code, value] pairs"""
         errors = []
         
         # Check for visibility issues
         if not self.check_visibility(landmarks):
-            errors.append({
-                "type": "visibility",
-                "message": "Cannot see body clearly. Adjust your position.",
-                "severity": "high"
-            })
+            errors.append([VISIBILITY, None])
             return errors
         
         # Check for uneven arm angles
@@ -115,27 +121,15 @@ class LateralRaiseAnalyzer:
         right_arm_angle = metrics.get("rightArmAngle", 0)
         
         if abs(left_arm_angle - right_arm_angle) > 20:
-            errors.append({
-                "type": "uneven_arms",
-                "message": "Keep both arms at the same height during lateral raises.",
-                "severity": "medium"
-            })
+            errors.append([UNEVEN_ARMS, None])
         
         # Check for too high raise
         if left_arm_angle > 170 or right_arm_angle > 170:
-            errors.append({
-                "type": "excessive_raise",
-                "message": "Avoid raising arms too high above shoulder level.",
-                "severity": "medium"
-            })
+            errors.append([EXCESSIVE_RAISE, None])
         
         # Check for insufficient raise
         if self.current_stage == "down" and (left_arm_angle < 100 or right_arm_angle < 100):
-            errors.append({
-                "type": "insufficient_raise",
-                "message": "Raise arms to at least shoulder level for full range of motion.",
-                "severity": "medium"
-            })
+            errors.append([INSUFFICIENT_RAISE, None])
         
         # Check for body swinging
         # This would be more complex in a real implementation, 
@@ -148,10 +142,6 @@ class LateralRaiseAnalyzer:
         """Determine the current stage of the exercise"""
         avg_angle = (left_arm_angle + right_arm_angle) / 2
         
-        # Log the current angles for debugging
-        logger.info(f"Left arm angle: {left_arm_angle:.1f}, Right arm angle: {right_arm_angle:.1f}")
-        logger.info(f"Left delta: {left_delta:.1f}, Right delta: {right_delta:.1f}")
-        
         # If both angles are above threshold, we're in the 'down' position (INVERTED)
         if avg_angle > self.ANGLE_UP_THRESHOLD:
             return "down"
@@ -159,22 +149,11 @@ class LateralRaiseAnalyzer:
         else:
             return "up"
     
-    def calculate_form_score(self, errors: List[Dict[str, str]]) -> int:
-        """Calculate a form score based on detected errors"""
-        score = 100
-        
-        for error in errors:
-            if error["severity"] == "high":
-                score -= 15
-            elif error["severity"] == "medium":
-                score -= 10
-            elif error["severity"] == "low":
-                score -= 5
-        
-        # Ensure score is between 0 and 100
-        return max(0, min(100, score))
+    def calculate_form_score(self, errors: List[list]) -> int:
+        """Calculate a form score from the integer weights of the detected error codes"""
+        return ERRORS.form_score(errors)
     
-    def analyze_pose(self, landmarks: List[Dict[str, float]]) -> Dict[str, Any]:
+    def analyze_pose(self, landmarks: List[Dict[str, float]], timestamp: Optional[float] = None) -> Dict[str, Any]:
         """Analyze the lateral raise pose and return results"""
         analysis = LateralRaisePoseAnalysis()
         
@@ -182,11 +161,6 @@ class LateralRaiseAnalyzer:
             # Ensure landmarks is not empty
             if not landmarks or len(landmarks) < 15:
                 logger.error(f"Invalid landmarks data: received {len(landmarks) if landmarks else 0} landmarks")
-                analysis.errors.append({
-                    "type": "INVALID_INPUT",
-                    "message": "Insufficient landmark data for analysis",
-                    "severity": "error"
-                })
                 return {
                     "success": False,
                     "error": {
@@ -219,11 +193,7 @@ class LateralRaiseAnalyzer:
             # Check visibility first
             analysis.is_visible = self.check_visibility(landmarks)
             if not analysis.is_visible:
-                analysis.errors.append({
-                    "type": "visibility",
-                    "message": "Cannot see body clearly. Adjust your position.",
-                    "severity": "high"
-                })
+                analysis.errors.append([VISIBILITY, None])
                 # Important: Ensure we preserve the rep counter even when visibility is lost
                 analysis.rep_count = self.counter
                 analysis.stage = self.current_stage
@@ -231,7 +201,7 @@ class LateralRaiseAnalyzer:
                 analysis.form_score = 70
                 return {
                     "success": True,
-                    "result": analysis.to_dict()
+                    "result": analysis.to_dict(self.compact_errors)
                 }
             
             # Extract key landmarks
@@ -257,11 +227,13 @@ class LateralRaiseAnalyzer:
                 # Determine if we're in the raising motion
                 if not self.is_raising and left_delta > self.ANGLE_DELTA_THRESHOLD and right_delta > self.ANGLE_DELTA_THRESHOLD:
                     self.is_raising = True
-                    logger.info("Started raising motion")
+                    if DIAG.on("lateral_raise"):
+                        DIAG.emit("lateral_raise", "raising", left_delta=left_delta, right_delta=right_delta)
                 # Determine if we've stabilized (stopped moving)
                 elif self.is_raising and left_delta < self.ANGLE_STABLE_THRESHOLD and right_delta < self.ANGLE_STABLE_THRESHOLD:
                     self.is_raising = False
-                    logger.info("Finished raising motion")
+                    if DIAG.on("lateral_raise"):
+                        DIAG.emit("lateral_raise", "stable", left_delta=left_delta, right_delta=right_delta)
             
             # Save current angles for next frame's delta calculation
             self.prev_left_angle = left_arm_angle
@@ -284,7 +256,8 @@ class LateralRaiseAnalyzer:
             if self.is_raising and left_arm_angle > self.ANGLE_UP_THRESHOLD and right_arm_angle > self.ANGLE_UP_THRESHOLD:
                 if self.current_stage == "up" and current_stage == "down":
                     self.counter += 1
-                    logger.info(f"Lateral raise counted! Total: {self.counter}")
+                    if DIAG.on("lateral_raise"):
+                        DIAG.emit("lateral_raise", "rep_counted", count=self.counter, left_angle=left_arm_angle, right_angle=right_arm_angle)
             
             # Update stage
             self.previous_stage = self.current_stage
@@ -305,7 +278,7 @@ class LateralRaiseAnalyzer:
             
             return {
                 "success": True,
-                "result": analysis.to_dict()
+                "result": analysis.to_dict(self.compact_errors)
             }
             
         except Exception as e:
@@ -0,0 +1,216 @@
+import sys
+import time
+import cProfile
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger('LiveProfiler')
+
+PROFILE_MODES = ("sample", "cprofile")
+
+
+def _safe_name(exercise_type: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in exercise_type) or "unknown"
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for the live server.
+
+    A daemon thread wakes every `interval` seconds and records the stack of
+    the thread being profiled (the server loop) from sys._current_frames().
+    Samples are tagged with the exercise the server is working on (set
+    through begin()/end() around each request, "server" in between) and
+    written on stop() as collapsed stacks, one "<exercise>.collapsed" file
+    per exercise, ready for flamegraph.pl or speedscope.
+
+    Overhead is one stack walk per interval in the sampler thread, plus
+    the GIL handoffs it causes; the profiled thread itself runs unchanged.
+    """
+
+    mode = "sample"
+
+    def __init__(self, directory: str, interval: float = 0.005, thread_id: Optional[int] = None,
+                 max_depth: int = 64):
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self.directory = Path(directory)
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.max_depth = max_depth
+        self.exercise_type = "server"
+        self.stacks = {}
+        self.samples = 0
+        self.started = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self) -> None:
+        self.started = time.time()
+        self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+    def begin(self, exercise_type: str) -> None:
+        self.exercise_type = exercise_type
+
+    def end(self) -> None:
+        self.exercise_type = "server"
+
+    def _run(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            names = []
+            while frame is not None and len(names) < self.max_depth:
+                code = frame.f_code
+                names.append(f"{Path(code.co_filename).stem}:{code.co_name}")
+                frame = frame.f_back
+            stack = ";".join(reversed(names))
+
+            counts = self.stacks.setdefault(self.exercise_type, {})
+            counts[stack] = counts.get(stack, 0) + 1
+            self.samples += 1
+
+    def stop(self) -> Dict[str, Any]:
+        """Stop sampling and write one collapsed-stack file per exercise"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = {}
+        exercises = {}
+        for exercise_type, counts in list(self.stacks.items()):
+            path = self.directory / f"{_safe_name(exercise_type)}.collapsed"
+            with open(path, "w") as f:
+                for stack, count in sorted(counts.items(), key=lambda item: -item[1]):
+                    f.write(f"{stack} {count}\n")
+            files[exercise_type] = str(path)
+            exercises[exercise_type] = {"samples": sum(counts.values()), "top": self._top_frames(counts)}
+
+        return {
+            "mode": self.mode,
+            "intervalMs": self.interval * 1000,
+            "seconds": round(time.time() - self.started, 1) if self.started else 0.0,
+            "samples": self.samples,
+            "files": files,
+            "exercises": exercises
+        }
+
+    @staticmethod
+    def _top_frames(counts: Dict[str, int], limit: int = 10) -> List[Dict[str, Any]]:
+        """Innermost frames with the most samples"""
+        leaves = {}
+        for stack, count in counts.items():
+            leaf = stack.rsplit(";", 1)[-1]
+            leaves[leaf] = leaves.get(leaf, 0) + count
+        total = sum(leaves.values())
+        return [
+            {"frame": leaf, "samples": count, "share": round(count / total, 4)}
+            for leaf, count in sorted(leaves.items(), key=lambda item: -item[1])[:limit]
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "active": True,
+            "samples": self.samples,
+            "exercises": {exercise_type: sum(counts.values()) for exercise_type, counts in list(self.stacks.items())}
+        }
+
+
+class FrameProfiler:
+    """
+    Deterministic cProfile of the next `frames` requests per exercise
+    (only `exercise_type` if given).
+
+    Profiling is enabled only between begin() and end(), so the idle server
+    loop costs nothing. Each exercise gets its own profile, dumped to
+    "<exercise>.pstats" as soon as it has seen `frames` requests (and on
+    stop() for the rest). Read them with pstats or snakeviz.
+    """
+
+    mode = "cprofile"
+
+    def __init__(self, directory: str, frames: int = 300, exercise_type: Optional[str] = None):
+        if frames < 1:
+            raise ValueError("frames must be at least 1")
+        self.directory = Path(directory)
+        self.frames = frames
+        self.exercise_type = exercise_type
+        self.profiles = {}
+        self.counts = {}
+        self.files = {}
+        self.current = None
+        self.started = None
+
+    def start(self) -> None:
+        self.started = time.time()
+
+    def begin(self, exercise_type: str) -> None:
+        if self.exercise_type is not None and exercise_type != self.exercise_type:
+            return
+        if exercise_type in self.files:
+            return
+
+        profile = self.profiles.get(exercise_type)
+        if profile is None:
+            profile = self.profiles[exercise_type] = cProfile.Profile()
+        self.current = exercise_type
+        profile.enable()
+
+    def end(self) -> None:
+        exercise_type = self.current
+        if exercise_type is None:
+            return
+        self.current = None
+        self.profiles[exercise_type].disable()
+
+        self.counts[exercise_type] = self.counts.get(exercise_type, 0) + 1
+        if self.counts[exercise_type] >= self.frames:
+            self._dump(exercise_type)
+
+    def _dump(self, exercise_type: str) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{_safe_name(exercise_type)}.pstats"
+        self.profiles.pop(exercise_type).dump_stats(str(path))
+        self.files[exercise_type] = str(path)
+        logger.info(f"Wrote {self.counts[exercise_type]}-frame {exercise_type} profile to {path}")
+
+    def stop(self) -> Dict[str, Any]:
+        """Dump the profiles that have not reached `frames` yet"""
+        self.end()
+        for exercise_type in list(self.profiles):
+            self._dump(exercise_type)
+        return {
+            "mode": self.mode,
+            "seconds": round(time.time() - self.started, 1) if self.started else 0.0,
+            "frames": dict(self.counts),
+            "files": dict(self.files)
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "active": True,
+            "framesPerExercise": self.frames,
+            "frames": dict(self.counts),
+            "files": dict(self.files)
+        }
+
+
+def create_profiler(mode: str, directory: str, interval: float = 0.005, frames: int = 300,
+                    exercise_type: Optional[str] = None):
+    """SamplingProfiler ("sample") or FrameProfiler ("cprofile"), already started"""
+    if mode == "sample":
+        profiler = SamplingProfiler(directory, interval)
+    elif mode == "cprofile":
+        profiler = FrameProfiler(directory, frames, exercise_type)
+    else:
+        raise ValueError(f"Unknown profile mode: {mode} (expected one of {', '.join(PROFILE_MODES)})")
+    profiler.start()
+    return profiler
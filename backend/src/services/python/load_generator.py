@@ -0,0 +1,404 @@
+"""
+End-to-end load generator for the analyzer server protocol.
+
+    python load_generator.py --sessions 8 --fps 30 --duration 20 --mix squat=2,plank=1
+    python load_generator.py --find-saturation --format compact
+
+Spawns exercise_analyzer_server.py and simulates concurrent client sessions
+writing landmark frames to its stdin at a target rate per session. Frames
+come from the same core/ dataset streams as benchmark_analyzers.py and are
+sent in any of the message formats frame_decoder accepts. Responses are
+matched to requests by requestId to measure round-trip latency; the run
+also tracks throughput, error and timeout rates, the number of requests
+waiting on the server (queue growth), and the server's CPU and RSS from
+/proc.
+
+--events subscribes every session to event output (acknowledged, so
+latency is still measured) to compare response volume with full results.
+
+--find-saturation doubles the number of sessions until the server can no
+longer keep up (throughput falls below the offered rate, timeouts appear
+or p95 latency exceeds --max-p95-ms) and reports the last level it
+sustained.
+"""
+import os
+import sys
+import json
+import time
+import heapq
+import logging
+import argparse
+import threading
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from benchmark_analyzers import ANALYZER_DATASETS, load_stream
+from frame_decoder import LANDMARK_MANIFESTS
+
+logger = logging.getLogger('LoadGenerator')
+
+SERVER_SCRIPT = Path(__file__).parent / "exercise_analyzer_server.py"
+MESSAGE_FORMATS = ("simple", "data", "compact", "reduced", "legacy", "classic")
+# Server CPU / RSS come from /proc; elsewhere (Windows) they are reported as None
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else None
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else None
+
+
+def encode_message(message_format: str, exercise_type: str, frame: np.ndarray, frame_id: int,
+                   request_id: str, timestamp_ms: int, session_id: Optional[str] = None) -> str:
+    """One landmark frame as a server input line in the given message format"""
+    if message_format == "simple":
+        data = {"exercise": exercise_type, "landmarks": [{"x": x, "y": y} for x, y, _, _ in frame]}
+    elif message_format == "data":
+        data = {"type": "data", "exercise": exercise_type, "frame": frame_id,
+                "points": [{"x": x, "y": y, "v": v} for x, y, _, v in frame]}
+    elif message_format == "compact":
+        data = {"t": "landmarks", "e": exercise_type, "id": frame_id, "p": frame}
+    elif message_format == "reduced":
+        data = {"t": "reduced", "e": exercise_type, "id": frame_id, "p": LANDMARK_MANIFESTS[exercise_type].reduce(frame)}
+    else:
+        landmarks = [{"x": x, "y": y, "z": z, "visibility": v} for x, y, z, v in frame]
+        data = {"exerciseType": exercise_type, "poseLandmarks": landmarks, "frameId": frame_id}
+        if message_format == "legacy":
+            data["type"] = "landmarks"
+
+    data["requestId"] = request_id
+    data["timestamp"] = timestamp_ms
+    if session_id is not None:
+        data["sessionId"] = session_id
+    return json.dumps(data)
+
+
+def parse_mix(mix: str) -> List[Tuple[str, float]]:
+    """"squat=2,plank=1" -> [("squat", 2.0), ("plank", 1.0)]"""
+    weights = []
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ANALYZER_DATASETS:
+            raise ValueError(f"Unknown exercise type in mix: {name}")
+        weights.append((name, float(weight) if weight else 1.0))
+    return weights
+
+
+def assign_exercises(mix: List[Tuple[str, float]], sessions: int) -> List[str]:
+    """Spread sessions over the mix in proportion to the weights"""
+    total = sum(weight for _, weight in mix)
+    assigned = []
+    credit = {name: 0.0 for name, _ in mix}
+    for _ in range(sessions):
+        for name, weight in mix:
+            credit[name] += weight / total
+        name = max(credit, key=credit.get)
+        credit[name] -= 1.0
+        assigned.append(name)
+    return assigned
+
+
+class ServerProcess:
+    """exercise_analyzer_server.py as a child process, with a reader thread matching responses"""
+
+    def __init__(self, python: str = sys.executable):
+        self.process = subprocess.Popen(
+            [python, str(SERVER_SCRIPT)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, bufsize=1, cwd=str(SERVER_SCRIPT.parent)
+        )
+        ready = json.loads(self.process.stdout.readline())
+        if ready.get("status") != "ready":
+            raise RuntimeError(f"Server did not start: {ready}")
+
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.latencies = []
+        self.errors = 0
+        self.received = 0
+        self.response_bytes = 0
+        self.event_responses = 0
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+
+    def _read(self) -> None:
+        for line in self.process.stdout:
+            try:
+                response = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            received_at = time.perf_counter()
+            with self.lock:
+                sent_at = self.pending.pop(response.get("requestId"), None)
+                if sent_at is None:
+                    continue
+                self.received += 1
+                self.response_bytes += len(line)
+                if "events" in response:
+                    self.event_responses += 1
+                self.latencies.append(received_at - sent_at)
+                if not response.get("success", False):
+                    self.errors += 1
+
+    def send(self, request_id: str, line: str) -> None:
+        with self.lock:
+            self.pending[request_id] = time.perf_counter()
+        self.process.stdin.write(line + "\n")
+        self.process.stdin.flush()
+
+    def reset_counters(self) -> None:
+        with self.lock:
+            self.latencies = []
+            self.errors = 0
+            self.received = 0
+            self.response_bytes = 0
+            self.event_responses = 0
+
+    def expire(self, timeout: float) -> int:
+        """Drop requests older than the timeout, returning how many timed out"""
+        now = time.perf_counter()
+        with self.lock:
+            expired = [request_id for request_id, sent_at in self.pending.items() if now - sent_at > timeout]
+            for request_id in expired:
+                del self.pending[request_id]
+        return len(expired)
+
+    def usage(self) -> Tuple[Optional[float], Optional[float]]:
+        """Server CPU seconds and RSS in MB, or None where /proc is not available"""
+        if CLOCK_TICKS is None:
+            return None, None
+        try:
+            with open(f"/proc/{self.process.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{self.process.pid}/statm") as f:
+                rss_pages = int(f.read().split()[1])
+        except OSError:
+            return None, None
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        return cpu_seconds, rss_pages * PAGE_SIZE / (1024 * 1024)
+
+    def stop(self) -> None:
+        try:
+            self.process.stdin.write("EXIT\n")
+            self.process.stdin.flush()
+            self.process.wait(timeout=5)
+        except Exception:
+            self.process.kill()
+
+
+def warm_up(server: ServerProcess, streams: Dict[str, np.ndarray], message_format: str,
+            timeout: float) -> None:
+    """Send one frame per exercise so analyzer loading is not counted as latency"""
+    for exercise_type, stream in streams.items():
+        request_id = f"warmup-{exercise_type}"
+        server.send(request_id, encode_message(message_format, exercise_type, stream[0].tolist(), 0, request_id, 0))
+
+    deadline = time.perf_counter() + timeout * 10
+    while time.perf_counter() < deadline:
+        with server.lock:
+            if not server.pending:
+                return
+        time.sleep(0.05)
+    server.expire(0.0)
+
+
+def subscribe_events(server: ServerProcess, exercises: List[str], timeout: float) -> None:
+    """Switch every session of a level to acknowledged event output"""
+    for session, exercise_type in enumerate(exercises):
+        request_id = f"subscribe-{session}"
+        server.send(request_id, json.dumps({"requestId": request_id, "command": "subscribe",
+                                            "exerciseType": exercise_type, "sessionId": f"load-{session}",
+                                            "mode": "events", "ack": True}))
+
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        with server.lock:
+            if not server.pending:
+                return
+        time.sleep(0.01)
+    server.expire(0.0)
+
+
+def run_level(server: ServerProcess, streams: Dict[str, np.ndarray], exercises: List[str],
+              fps: float, duration: float, message_format: str, timeout: float,
+              events: bool = False) -> Dict[str, Any]:
+    """Drive the server with one session per entry of `exercises` for `duration` seconds"""
+    if events:
+        subscribe_events(server, exercises, timeout)
+    server.reset_counters()
+    frame_lists = {name: stream.tolist() for name, stream in streams.items()}
+    interval = 1.0 / fps
+
+    start = time.perf_counter()
+    cpu_start, _ = server.usage()
+    # (next send time, session index, frame number)
+    schedule = [(start + i * interval / len(exercises), i, 0) for i in range(len(exercises))]
+    heapq.heapify(schedule)
+
+    sent = 0
+    request_bytes = 0
+    timeouts = 0
+    queue_samples = []
+    rss_samples = []
+    next_sample = start
+    while schedule and schedule[0][0] < start + duration:
+        send_at, session, frame_number = heapq.heappop(schedule)
+        delay = send_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+        exercise_type = exercises[session]
+        frames = frame_lists[exercise_type]
+        frame = frames[frame_number % len(frames)]
+        request_id = f"load-{session}-{frame_number}"
+        line = encode_message(message_format, exercise_type, frame, frame_number, request_id,
+                              int((send_at - start) * 1000), f"load-{session}" if events else None)
+        server.send(request_id, line)
+        sent += 1
+        request_bytes += len(line)
+        heapq.heappush(schedule, (send_at + interval, session, frame_number + 1))
+
+        now = time.perf_counter()
+        if now >= next_sample:
+            timeouts += server.expire(timeout)
+            with server.lock:
+                queue_samples.append((now - start, len(server.pending)))
+            rss = server.usage()[1]
+            if rss is not None:
+                rss_samples.append(rss)
+            next_sample = now + 0.5
+
+    send_elapsed = time.perf_counter() - start
+    offered = len(exercises) * fps
+
+    # Let the server drain what it already received
+    drain_deadline = time.perf_counter() + timeout
+    while time.perf_counter() < drain_deadline:
+        with server.lock:
+            if not server.pending:
+                break
+        time.sleep(0.01)
+    timeouts += server.expire(0.0)
+    elapsed = time.perf_counter() - start
+    cpu_end, rss_end = server.usage()
+
+    with server.lock:
+        latencies_ms = np.array(server.latencies) * 1000
+        received = server.received
+        errors = server.errors
+        response_bytes = server.response_bytes
+        event_responses = server.event_responses
+
+    queue = np.array(queue_samples) if queue_samples else np.zeros((0, 2))
+    # Least-squares growth of waiting requests over the run
+    queue_slope = float(np.polyfit(queue[:, 0], queue[:, 1], 1)[0]) if len(queue) > 2 else 0.0
+
+    def percentile(q: float) -> Optional[float]:
+        return round(float(np.percentile(latencies_ms, q)), 2) if len(latencies_ms) else None
+
+    return {
+        "sessions": len(exercises),
+        "exerciseMix": {name: exercises.count(name) for name in sorted(set(exercises))},
+        "format": message_format,
+        "events": events,
+        "offeredFps": round(offered, 1),
+        "sentFps": round(sent / send_elapsed, 1),
+        "throughputFps": round(received / elapsed, 1),
+        "sent": sent,
+        "received": received,
+        "errorRate": round(errors / sent, 4) if sent else 0.0,
+        "timeoutRate": round(timeouts / sent, 4) if sent else 0.0,
+        "requestBytesPerFrame": round(request_bytes / sent, 1) if sent else None,
+        "responseBytesPerFrame": round(response_bytes / received, 1) if received else None,
+        "eventResponseRate": round(event_responses / received, 4) if received else None,
+        "p50Ms": percentile(50),
+        "p95Ms": percentile(95),
+        "p99Ms": percentile(99),
+        "maxMs": round(float(latencies_ms.max()), 2) if len(latencies_ms) else None,
+        "maxQueue": int(queue[:, 1].max()) if len(queue) else 0,
+        "queueGrowthPerSecond": round(queue_slope, 2),
+        "serverCpuPercent": round(100 * (cpu_end - cpu_start) / elapsed, 1)
+        if cpu_start is not None and cpu_end is not None else None,
+        "serverRssMb": round(max(rss_samples + [rss_end]), 1) if rss_end is not None else None
+    }
+
+
+def is_saturated(level: Dict[str, Any], max_p95_ms: float) -> bool:
+    """The server did not keep up with the offered load"""
+    return (level["sentFps"] < 0.95 * level["offeredFps"]
+            or level["received"] < 0.95 * level["sent"]
+            or level["timeoutRate"] > 0.0
+            or (level["p95Ms"] is not None and level["p95Ms"] > max_p95_ms))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test the exercise analyzer server")
+    parser.add_argument("--sessions", type=int, default=4, help="Concurrent sessions (start level when ramping)")
+    parser.add_argument("--fps", type=float, default=30.0, help="Frames per second per session")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per load level")
+    parser.add_argument("--mix", default="squat", help='Exercise mix, e.g. "squat=2,plank=1,lunge=1"')
+    parser.add_argument("--format", choices=MESSAGE_FORMATS, default="compact")
+    parser.add_argument("--timeout", type=float, default=5.0, help="Seconds before a request counts as timed out")
+    parser.add_argument("--events", action="store_true",
+                        help="Subscribe the sessions to event output instead of full results")
+    parser.add_argument("--find-saturation", action="store_true",
+                        help="Double the sessions until the server saturates")
+    parser.add_argument("--max-sessions", type=int, default=256)
+    parser.add_argument("--max-p95-ms", type=float, default=100.0,
+                        help="p95 round trip above which a level counts as saturated")
+    parser.add_argument("--output", help="Write the level results as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    streams = {}
+    for name, _ in mix:
+        try:
+            streams[name] = load_stream(ANALYZER_DATASETS[name])
+        except Exception as e:
+            logger.error(f"Dropping {name} from the mix, its dataset could not be loaded: {type(e).__name__}: {str(e)}")
+    mix = [(name, weight) for name, weight in mix if name in streams]
+    if not mix:
+        parser.error("no exercise in --mix has a loadable dataset")
+    server = ServerProcess()
+    levels = []
+    sustained = None
+    try:
+        warm_up(server, streams, args.format, args.timeout)
+        sessions = args.sessions
+        while True:
+            level = run_level(server, streams, assign_exercises(mix, sessions), args.fps,
+                              args.duration, args.format, args.timeout, args.events)
+            level["saturated"] = is_saturated(level, args.max_p95_ms)
+            levels.append(level)
+            print(json.dumps(level))
+            sys.stdout.flush()
+
+            if not level["saturated"]:
+                sustained = level
+            if not args.find_saturation or level["saturated"] or sessions >= args.max_sessions:
+                break
+            sessions = min(sessions * 2, args.max_sessions)
+    finally:
+        server.stop()
+
+    report = {"levels": levels}
+    if args.find_saturation:
+        report["saturation"] = {
+            "sustainedSessions": sustained["sessions"] if sustained else 0,
+            "sustainedFps": sustained["throughputFps"] if sustained else 0.0,
+            "saturatedSessions": levels[-1]["sessions"] if levels[-1]["saturated"] else None
+        }
+        print(json.dumps(report["saturation"]))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
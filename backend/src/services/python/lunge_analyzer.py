@@ -9,6 +9,12 @@ from pathlib import Path
 from typing import Dict, List, Tuple, Any, Optional, Union
 import time
 
+from model_cascade import ModelCascade, classify
+from prediction_cache import PredictionCache
+from diagnostics import DIAG
+from error_codes import ERROR_TABLES
+from dense_network import DenseNetwork
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -20,6 +26,10 @@ handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s -
 logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
+ERRORS = ERROR_TABLES["lunge"]
+LEFT_KNEE_ANGLE, RIGHT_KNEE_ANGLE, KNEE_OVER_TOE = ERRORS.codes(
+    "left_knee_angle", "right_knee_angle", "knee_over_toe")
+
 # MediaPipe pose landmark indices
 LANDMARK_INDICES = {
     "NOSE": 0,
@@ -264,9 +274,10 @@ def _detect_knee_over_toe_geometric(landmarks: List[Dict[str, float]]) -> bool:
         # Combine the checks - if any detect an error, flag it
         left_error = knee_over_toe or (knee_over_ankle and ratio_error)
         
-        logger.info(f"Left knee-toe: knee_x={left_knee_x:.3f}, ankle_x={left_ankle_x:.3f}, foot_x={left_foot_x:.3f}, " +
-                   f"diff={left_knee_x-left_foot_x:.3f}, knee_over_toe={knee_over_toe}, " +
-                   f"knee_over_ankle={knee_over_ankle}, ratio_error={ratio_error}, error={left_error}")
+        if DIAG.on("lunge"):
+            DIAG.emit("lunge", "knee_toe", side="left", knee_x=left_knee_x, ankle_x=left_ankle_x,
+                      foot_x=left_foot_x, knee_over_toe=knee_over_toe, knee_over_ankle=knee_over_ankle,
+                      ratio_error=ratio_error, error=left_error)
     
     if right_knee_v > 0.5 and right_foot_v > 0.5:
         # For right side (assuming x increases from right to left in the image)
@@ -290,11 +301,11 @@ def _detect_knee_over_toe_geometric(landmarks: List[Dict[str, float]]) -> bool:
         # Combine the checks - if any detect an error, flag it
         right_error = knee_over_toe or (knee_over_ankle and ratio_error)
         
-        logger.info(f"Right knee-toe: knee_x={right_knee_x:.3f}, ankle_x={right_ankle_x:.3f}, foot_x={right_foot_x:.3f}, " +
-                   f"diff={right_foot_x-right_knee_x:.3f}, knee_over_toe={knee_over_toe}, " +
-                   f"knee_over_ankle={knee_over_ankle}, ratio_error={ratio_error}, error={right_error}")
+        if DIAG.on("lunge"):
+            DIAG.emit("lunge", "knee_toe", side="right", knee_x=right_knee_x, ankle_x=right_ankle_x,
+                      foot_x=right_foot_x, knee_over_toe=knee_over_toe, knee_over_ankle=knee_over_ankle,
+                      ratio_error=ratio_error, error=right_error)
     
-    logger.info(f"Knee over toe geometric check - Left error: {left_error}, Right error: {right_error}")
     
     return left_error or right_error
 
@@ -338,7 +349,10 @@ def get_static_file_url(path: str) -> str:
         return str(current_path)
     
     # For the lunge model, we need to check subfolder paths
-    if path.startswith("err_") and "sklearn" not in path:
+    if "_dp." in path:
+        # Deep learning models (and their exported bundles) live in the dp subfolder
+        core_path = Path(__file__).parent.parent.parent.parent.parent / "core" / "lunge_model" / "model" / "dp" / Path(path).name
+    elif path.startswith("err_") and "sklearn" not in path:
         # Look in sklearn subfolder for error detection models
         core_path = Path(__file__).parent.parent.parent.parent.parent / "core" / "lunge_model" / "model" / "sklearn" / Path(path).name
     elif path.startswith("stage_") and "sklearn" not in path:
@@ -368,6 +382,9 @@ class LungeAnalyzer:
     # Thresholds
     PREDICTION_PROB_THRESHOLD = 0.8
     KNEE_ANGLE_THRESHOLD = [60, 125]
+    # Front knee angle at or below which the stage is "down" and at or above
+    # which it is "init", for the geometric quality tier
+    STAGE_KNEE_ANGLES = [110, 150]
     
     def __init__(self):
         """Initialize the lunge analyzer"""
@@ -384,6 +401,40 @@ class LungeAnalyzer:
         # Load ML models for stage and error detection
         self.load_machine_learning_model()
         
+        # Optional stage LR -> SVC (or NumPy dense network) cascade, off until
+        # enable_cascade() is called
+        self.CASCADE_MARGIN = 0.9
+        self.CASCADE_HEAVY_MODELS = {
+            "svc": "stage_SVC_model.pkl",
+            "dp": "stage_lunge_dp.npz"
+        }
+        self.heavy_model_name = "svc"
+        self.heavy_stage_model = None
+        self.cascade = None
+        self.use_cascade = False
+        
+        # Optional LRU cache of classifier outputs keyed by quantized features,
+        # off until enable_prediction_cache() is called
+        self.prediction_cache = PredictionCache("lunge")
+        self.use_prediction_cache = False
+        
+        # Stateless predictions precomputed by predict_batch(), set during offline
+        # replay (see analyze_session.py)
+        self.prediction_replay = None
+        
+        # Per-request stage timing, set by the server for sampled requests
+        # (see request_trace.py)
+        self.trace = None
+        
+        # Emit [code, value] pairs instead of error dicts, set per call by the
+        # server for sessions that loaded the error code table
+        self.compact_errors = False
+        
+        # Quality tier of the current call, set by the server while it sheds
+        # load (see quality_controller.py): "cheap" runs the stage LR model
+        # alone, "geometric" takes the stage from the knee angles
+        self.quality_tier = "full"
+        
         logger.info("Lunge analyzer initialized")
     
     def _initialize_model_paths(self):
@@ -516,11 +567,16 @@ class LungeAnalyzer:
         """
         Determine the current stage of the lunge exercise using ML model only
         """
+        if self.prediction_replay is not None:
+            return self.prediction_replay.current()
+        if self.quality_tier == "geometric":
+            return self.detect_stage_geometric(landmarks)
+        
         try:
             # Use ML model for stage detection
             if hasattr(self, 'stage_model') and self.stage_model is not None and self.input_scaler is not None:
                 try:
-                    start_time = time.time()
+                    start_time = time.perf_counter()
                     
                     # Create a MediaPipe-compatible results object
                     landmark_objects = []
@@ -539,23 +595,22 @@ class LungeAnalyzer:
                     # Extract keypoints for the model
                     row = extract_important_keypoints(processed_result, self.important_landmarks)
                     X = pd.DataFrame([row], columns=self.headers[1:])
+                    if self.trace is not None:
+                        self.trace.mark("feature_extraction")
                     
                     # Scale the features
                     X_scaled = pd.DataFrame(self.input_scaler.transform(X))
+                    if self.trace is not None:
+                        self.trace.mark("scaling")
                     
                     # Make prediction
-                    stage_predicted_class = self.stage_model.predict(X_scaled)[0]
-                    stage_probabilities = self.stage_model.predict_proba(X_scaled)[0]
+                    stage_predicted_class, stage_probabilities = self._classify_stage(X_scaled)
+                    if self.trace is not None:
+                        self.trace.mark("inference")
                     
-                    # Log prediction results in a single line
-                    class_probs = {
-                        "I": f"{stage_probabilities[0]:.3f}",
-                        "M": f"{stage_probabilities[1]:.3f}", 
-                        "D": f"{stage_probabilities[2]:.3f}"
-                    }
-                    
-                    end_time = time.time()
-                    logger.debug(f"Stage prediction: {stage_predicted_class}, Probs: {class_probs}, Time: {(end_time - start_time)*1000:.2f}ms")
+                    if DIAG.on("lunge"):
+                        DIAG.emit("lunge", "stage_prediction", predicted_class=stage_predicted_class,
+                                  probabilities=stage_probabilities, ms=(time.perf_counter() - start_time) * 1000)
                     
                     # Map predicted class to stage
                     stage_map = {
@@ -578,7 +633,153 @@ class LungeAnalyzer:
             logger.error(f"Error in stage detection: {str(e)}")
             return "unknown"
     
-    def analyze_pose(self, landmarks: List[Dict[str, float]]) -> Dict[str, Any]:
+    def detect_stage_geometric(self, landmarks: List[Dict[str, float]]) -> str:
+        """
+        Determine the stage from the front (more bent) knee angle, without
+        the ML model
+        """
+        try:
+            knee_analysis = analyze_knee_angle(landmarks, "unknown")
+            front_knee_angle = min(knee_analysis["left"]["angle"], knee_analysis["right"]["angle"])
+            if self.trace is not None:
+                self.trace.mark("geometry")
+            
+            if front_knee_angle <= self.STAGE_KNEE_ANGLES[0]:
+                return "down"
+            if front_knee_angle >= self.STAGE_KNEE_ANGLES[1]:
+                return "init"
+            return "mid"
+        except Exception as e:
+            logger.error(f"Error in geometric stage detection: {str(e)}")
+            return "unknown"
+    
+    def predict_batch(self, frames: np.ndarray) -> Optional[List[str]]:
+        """
+        Vectorized detect_stage for a (frames, 33, 4) landmark array: one
+        stage per frame, or None if the stage model is unavailable
+        """
+        if getattr(self, 'stage_model', None) is None or self.input_scaler is None:
+            return None
+        
+        indices = [LANDMARK_INDICES[lm] for lm in self.important_landmarks]
+        X = pd.DataFrame(frames[:, indices, :].reshape(len(frames), -1).astype(np.float64), columns=self.headers[1:])
+        X_scaled = pd.DataFrame(self.input_scaler.transform(X))
+        
+        stage_map = {
+            "I": "init",
+            "M": "mid",
+            "D": "down"
+        }
+        return [stage_map.get(predicted_class, "unknown") for predicted_class in self.stage_model.predict(X_scaled)]
+    
+    def _classify_stage(self, X_scaled) -> Tuple[Any, np.ndarray]:
+        """Classify scaled features with the stage model, through the prediction cache and cascade when enabled"""
+        cache_key = None
+        if self.use_prediction_cache:
+            cache_key = self.prediction_cache.make_key(X_scaled)
+            cached = self.prediction_cache.get(cache_key)
+            if self.trace is not None:
+                self.trace.note("cache", "hit" if cached is not None else "miss")
+            if cached is not None:
+                return cached
+        
+        if self.quality_tier == "cheap":
+            # Never escalated, and not cached: the cache holds the full tier's answers
+            predicted_class, probabilities = classify(self.stage_model, X_scaled)
+            if self.trace is not None:
+                self.trace.note("model", "lr")
+            return predicted_class, probabilities
+        
+        if self.use_cascade and self.cascade is not None:
+            predicted_class, probabilities, escalated = self.cascade.predict(X_scaled)
+            model_name = self.heavy_model_name if escalated else "lr"
+        else:
+            predicted_class, probabilities = classify(self.stage_model, X_scaled)
+            model_name = "lr"
+        if self.trace is not None:
+            self.trace.note("model", model_name)
+        
+        if cache_key is not None:
+            self.prediction_cache.put(cache_key, (predicted_class, probabilities))
+        return predicted_class, probabilities
+    
+    def enable_cascade(self, margin: Optional[float] = None, heavy_model: Optional[str] = None) -> bool:
+        """
+        Run the stage LR model first and escalate to the heavy stage model
+        ("svc", or "dp" for the exported deep learning model) only when the
+        LR confidence is below the cascade margin
+        """
+        if margin is not None:
+            self.CASCADE_MARGIN = float(margin)
+        
+        if self.stage_model is None:
+            logger.error("Cannot enable cascade: stage model not loaded")
+            return False
+        
+        if heavy_model is not None and heavy_model != self.heavy_model_name:
+            if heavy_model not in self.CASCADE_HEAVY_MODELS:
+                logger.error(f"Unknown cascade heavy model: {heavy_model}")
+                return False
+            self.heavy_model_name = heavy_model
+            self.heavy_stage_model = None
+        
+        if self.heavy_stage_model is None:
+            heavy_path = get_static_file_url(self.CASCADE_HEAVY_MODELS[self.heavy_model_name])
+            try:
+                if heavy_path.endswith(".npz"):
+                    # Reorder the network outputs to the LR model's class order
+                    self.heavy_stage_model = DenseNetwork.load(heavy_path).with_class_order(self.stage_model.classes_)
+                else:
+                    with open(heavy_path, "rb") as f:
+                        self.heavy_stage_model = pickle.load(f)
+                logger.info(f"Loaded cascade heavy stage model from: {heavy_path}")
+            except Exception as e:
+                logger.error(f"Error loading cascade heavy stage model: {e}")
+                return False
+            
+            if self.cascade is not None:
+                self.cascade.heavy_model = self.heavy_stage_model
+                self.cascade.reset_stats()
+        
+        if self.cascade is None:
+            self.cascade = ModelCascade("lunge", self.stage_model, self.heavy_stage_model, self.CASCADE_MARGIN)
+        self.cascade.margin = self.CASCADE_MARGIN
+        self.use_cascade = True
+        self.prediction_cache.clear()
+        return True
+    
+    def disable_cascade(self) -> None:
+        """Go back to the single stage LR model"""
+        self.use_cascade = False
+        self.prediction_cache.clear()
+    
+    def get_cascade_stats(self) -> Optional[Dict[str, Any]]:
+        """Escalation rate and latency of the cascade, if it was ever enabled"""
+        if self.cascade is None:
+            return None
+        stats = self.cascade.get_stats()
+        stats["enabled"] = self.use_cascade
+        stats["heavyModel"] = self.heavy_model_name
+        return stats
+    
+    def enable_prediction_cache(self, max_entries: Optional[int] = None, quantization: Optional[float] = None) -> bool:
+        """Memoize classifier outputs for inputs that quantize to a seen feature vector"""
+        self.prediction_cache.configure(max_entries, quantization)
+        self.use_prediction_cache = True
+        return True
+    
+    def disable_prediction_cache(self) -> None:
+        """Stop using and drop the cached classifier outputs"""
+        self.use_prediction_cache = False
+        self.prediction_cache.clear()
+    
+    def get_prediction_cache_stats(self) -> Dict[str, Any]:
+        """Hit rate and occupancy of the prediction cache"""
+        stats = self.prediction_cache.get_stats()
+        stats["enabled"] = self.use_prediction_cache
+        return stats
+    
+    def analyze_pose(self, landmarks: List[Dict[str, float]], timestamp: Optional[float] = None) -> Dict[str, Any]:
         """
         Analyze a single frame of lunge pose
         """
@@ -594,9 +795,10 @@ class LungeAnalyzer:
                         "message": "Missing or insufficient landmarks"
                     }
                 }
+            if self.trace is not None:
+                self.trace.mark("validation")
             
             # Create a MediaPipe-compatible results object for ML detection
-            logger.info("Starting pose analysis")
             try:
                 # Create a compatible structure that matches what MediaPipe would provide
                 landmark_objects = []
@@ -611,19 +813,26 @@ class LungeAnalyzer:
                 
                 pose_landmarks = type('obj', (object,), {'landmark': landmark_objects})
                 processed_result = type('obj', (object,), {'pose_landmarks': pose_landmarks})
-                logger.debug("MediaPipe-compatible result object created")
             except Exception as e:
                 logger.error(f"Error creating MediaPipe-compatible result: {e}")
                 logger.error(traceback.format_exc())
                 processed_result = None
+            if self.trace is not None:
+                self.trace.mark("feature_extraction")
             
             # Detect the current stage using ML model if available
             current_stage = self.detect_stage(landmarks)
-            logger.info(f"Detected stage: {current_stage}")
+            if DIAG.on("lunge"):
+                DIAG.emit("lunge", "stage", stage=current_stage)
+            if self.trace is not None:
+                self.trace.mark("inference")
             
             # Update the rep counter
             self.rep_counter.update_stage(current_stage)
-            logger.info(f"Current rep count: {self.rep_counter.get_count()}")
+            if DIAG.on("lunge"):
+                DIAG.emit("lunge", "rep_count", rep_count=self.rep_counter.get_count)
+            if self.trace is not None:
+                self.trace.mark("state_update")
             
             # Initialize error list
             errors = []
@@ -642,11 +851,10 @@ class LungeAnalyzer:
             
             # Only analyze form in down position
             if current_stage == "down":
-                logger.info("In down position, checking for errors")
-                
                 # Analyze knee angles
                 knee_analysis = analyze_knee_angle(landmarks, current_stage)
-                logger.info(f"Knee angles - Left: {knee_analysis['left']['angle']:.1f}°, Right: {knee_analysis['right']['angle']:.1f}°")
+                if DIAG.on("lunge"):
+                    DIAG.emit("lunge", "knee_angles", left=knee_analysis['left']['angle'], right=knee_analysis['right']['angle'])
                 
                 # Store knee angles in metrics
                 metrics["leftKneeAngle"] = knee_analysis["left"]["angle"]
@@ -655,26 +863,15 @@ class LungeAnalyzer:
                 # Check for knee angle errors
                 if knee_analysis["error"]:
                     error_flags["kneeAngleError"] = True
-                    logger.warning("Knee angle error detected")
                     
                     # Check which knee has the error
                     if knee_analysis["left"]["error"]:
                         error_flags["leftKneeError"] = True
-                        errors.append({
-                            "type": "knee_angle",
-                            "message": "Left knee angle is not in proper range. Aim for 60-125 degrees.",
-                            "severity": "high"
-                        })
-                        logger.warning("Left knee angle error")
+                        errors.append([LEFT_KNEE_ANGLE, None])
                     
                     if knee_analysis["right"]["error"]:
                         error_flags["rightKneeError"] = True
-                        errors.append({
-                            "type": "knee_angle",
-                            "message": "Right knee angle is not in proper range. Aim for 60-125 degrees.",
-                            "severity": "high"
-                        })
-                        logger.warning("Right knee angle error")
+                        errors.append([RIGHT_KNEE_ANGLE, None])
                 
                 # Check for knee over toe error using ML model if available
                 knee_over_toe = self.detect_knee_over_toe(landmarks, processed_result)
@@ -682,31 +879,29 @@ class LungeAnalyzer:
                 
                 if knee_over_toe:
                     error_flags["kneeOverToeError"] = True
-                    errors.append({
-                        "type": "knee_over_toe",
-                        "message": "Knee is extending beyond toes. Ensure proper alignment.",
-                        "severity": "high"
-                    })
-                    logger.warning("Knee over toe error detected")
+                    errors.append([KNEE_OVER_TOE, None])
+            if self.trace is not None:
+                self.trace.mark("geometry")
             
             # Calculate form score based on errors
             form_score = self.calculate_form_score(errors)
-            logger.info(f"Form score: {form_score}")
             
             # Log final analysis summary
-            logger.info(f"Analysis complete - Stage: {current_stage}, Score: {form_score}, Errors: {len(errors)}")
+            if DIAG.on("lunge"):
+                DIAG.emit("lunge", "result", stage=current_stage, form_score=form_score,
+                          errors=lambda: [ERRORS.types[code] for code, _ in errors])
             
             # Return the analysis result
+            result = {
+                "stage": current_stage,
+                "metrics": metrics,
+                "errorFlags": error_flags,
+                "formScore": form_score,
+                "repCount": self.rep_counter.get_count()
+            }
             return {
                 "success": True,
-                "result": {
-                    "stage": current_stage,
-                    "metrics": metrics,
-                    "errors": errors,
-                    "errorFlags": error_flags,
-                    "formScore": form_score,
-                    "repCount": self.rep_counter.get_count()
-                }
+                "result": ERRORS.put_errors(result, errors, self.compact_errors)
             }
             
         except Exception as e:
@@ -721,27 +916,17 @@ class LungeAnalyzer:
                 }
             }
     
-    def calculate_form_score(self, errors: List[Dict[str, str]]) -> int:
+    def calculate_form_score(self, errors: List[list]) -> int:
         """
-        Calculate form score based on detected errors
+        Calculate form score from the integer weights of the detected error codes
         
         Args:
-            errors: List of form errors
+            errors: List of [code, value] pairs
             
         Returns:
             Form score (0-100)
         """
-        base_score = 100
-        
-        for error in errors:
-            if error["severity"] == "high":
-                base_score -= 20
-            elif error["severity"] == "medium":
-                base_score -= 10
-            elif error["severity"] == "low":
-                base_score -= 5
-        
-        return max(0, min(100, base_score))
+        return ERRORS.form_score(errors)
     
     def reset_counter(self):
         """Reset the repetition counter"""
@@ -761,9 +946,7 @@ class LungeAnalyzer:
         Detect knee over toe error using geometric method primarily
         """
         try:
-            logger.info("Using geometric detection for knee over toe error")
             result = _detect_knee_over_toe_geometric(landmarks)
-            logger.info(f"Knee over toe error detected: {result}")
             return result
         
         except Exception as e:
@@ -0,0 +1,182 @@
+import time
+import logging
+from array import array
+from typing import Any, Dict, List, Optional
+
+from session_aggregates import metric_value
+
+logger = logging.getLogger('MetricTimelines')
+
+# Result metrics charted per exercise ("formScore" is read from the result itself)
+TIMELINE_METRICS = {
+    "squat": ("kneeAngle", "formScore"),
+    "bicep": ("leftCurlAngle", "rightCurlAngle", "formScore"),
+    "lunge": ("leftKneeAngle", "rightKneeAngle", "formScore"),
+    "plank": ("formScore",),
+    "situp": ("torsoAngle", "formScore"),
+    "shoulder_press": ("leftArmAngle", "rightArmAngle", "formScore"),
+    "bench_press": ("leftShoulderAngle", "rightShoulderAngle", "formScore"),
+    "pushup": ("leftArmAngle", "rightArmAngle", "formScore"),
+    "lateral_raise": ("leftArmAngle", "rightArmAngle", "formScore"),
+}
+
+
+def lttb(times: List[float], values: List[float], max_points: int) -> List[List[float]]:
+    """
+    Largest-triangle-three-buckets: at most `max_points` [time, value] points
+    that keep the visual shape of the series (first and last always kept)
+    """
+    n = len(times)
+    if n <= max_points:
+        return [[times[i], values[i]] for i in range(n)]
+    if max_points < 3:
+        return [[times[0], values[0]], [times[-1], values[-1]]][:max(max_points, 0)]
+
+    points = [[times[0], values[0]]]
+    bucket_size = (n - 2) / (max_points - 2)
+    selected = 0
+    for bucket in range(max_points - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        # The next bucket's average is the third corner of the triangle
+        next_start, next_end = end, min(int((bucket + 2) * bucket_size) + 1, n)
+        count = next_end - next_start
+        avg_time = sum(times[next_start:next_end]) / count
+        avg_value = sum(values[next_start:next_end]) / count
+
+        selected_time, selected_value = times[selected], values[selected]
+        best_area, best = -1.0, start
+        for i in range(start, end):
+            area = abs((selected_time - avg_time) * (values[i] - selected_value)
+                       - (selected_time - times[i]) * (avg_value - selected_value))
+            if area > best_area:
+                best_area, best = area, i
+        points.append([times[best], values[best]])
+        selected = best
+    points.append([times[-1], values[-1]])
+    return points
+
+
+class Timeline:
+    """
+    One metric of one session in at most `capacity` points. When full, the
+    series is halved by min/max buckets (every 4 consecutive points keep
+    their lowest and highest, in time order, and the first point is always
+    kept), and from then on new frames are reduced the same way before
+    they are stored: each `bucket` frames add their min and max only. The
+    series always spans the whole session at an even resolution and keeps
+    the extremes of each rep.
+    """
+
+    def __init__(self, capacity: int = 512):
+        self.capacity = max(8, capacity - capacity % 4)
+        self.times = array('d')
+        self.values = array('d')
+        self.bucket = 1
+        self.pending = 0
+        self.low = None
+        self.high = None
+
+    def add(self, t: float, value: float) -> None:
+        if self.bucket == 1:
+            self._append(t, value)
+            return
+        if self.pending == 0 or value < self.low[1]:
+            self.low = (t, value)
+        if self.pending == 0 or value > self.high[1]:
+            self.high = (t, value)
+        self.pending += 1
+        if self.pending == self.bucket:
+            self.pending = 0
+            for point_time, point_value in sorted({self.low, self.high}):
+                self._append(point_time, point_value)
+
+    def _append(self, t: float, value: float) -> None:
+        self.times.append(t)
+        self.values.append(value)
+        if len(self.times) >= self.capacity:
+            self._compact()
+
+    def _compact(self) -> None:
+        times, values = array('d'), array('d')
+        for start in range(0, len(self.times), 4):
+            bucket = range(start, min(start + 4, len(self.times)))
+            low = min(bucket, key=self.values.__getitem__)
+            high = max(bucket, key=self.values.__getitem__)
+            keep = {low, high, 0} if start == 0 else {low, high}
+            for i in sorted(keep):
+                times.append(self.times[i])
+                values.append(self.values[i])
+        self.times, self.values = times, values
+        # Stored points were 1 frame each at first, then a min/max pair per bucket
+        self.bucket = 4 if self.bucket == 1 else self.bucket * 2
+
+    def export(self, max_points: int) -> List[List[float]]:
+        times, values = list(self.times), list(self.values)
+        if self.pending:
+            for point_time, point_value in sorted({self.low, self.high}):
+                times.append(point_time)
+                values.append(point_value)
+        return [[round(t, 3), round(v, 2)] for t, v in lttb(times, values, max_points)]
+
+
+class SessionTimelines:
+    """The charted metrics of one session, timed in seconds from its first frame"""
+
+    def __init__(self, exercise_type: str, capacity: int = 512):
+        self.exercise_type = exercise_type
+        self.timelines = {name: Timeline(capacity) for name in TIMELINE_METRICS.get(exercise_type, ("formScore",))}
+        self.start_time = None
+        self.frames = 0
+
+    def update(self, result: Dict[str, Any], timestamp: Optional[float] = None) -> None:
+        now = timestamp if timestamp is not None else time.time()
+        if self.start_time is None:
+            self.start_time = now
+        self.frames += 1
+        metrics = result.get("metrics") or {}
+        for name, timeline in self.timelines.items():
+            value = metric_value(result.get(name) if name == "formScore" else metrics.get(name))
+            if value is not None:
+                timeline.add(now - self.start_time, value)
+
+    def export(self, max_points: int) -> Dict[str, Any]:
+        return {
+            "exerciseType": self.exercise_type,
+            "frames": self.frames,
+            "series": {name: timeline.export(max_points) for name, timeline in self.timelines.items()}
+        }
+
+
+class MetricTimelines:
+    """Timelines by session id (by exercise type for requests without one); the oldest is dropped past `max_sessions`"""
+
+    def __init__(self, capacity: int = 512, max_sessions: int = 1024):
+        self.capacity = capacity
+        self.max_sessions = max_sessions
+        self.sessions = {}
+
+    def update(self, key: str, exercise_type: str, result: Dict[str, Any], timestamp: Optional[float] = None) -> None:
+        timelines = self.sessions.get(key)
+        if timelines is None or timelines.exercise_type != exercise_type:
+            timelines = SessionTimelines(exercise_type, self.capacity)
+            self.sessions.pop(key, None)
+            self.sessions[key] = timelines
+            while len(self.sessions) > self.max_sessions:
+                del self.sessions[next(iter(self.sessions))]
+        timelines.update(result, timestamp)
+
+    def export(self, key: str, max_points: int = 200, reset: bool = False) -> Optional[Dict[str, Any]]:
+        """The session's series of at most `max_points` points, or None if it has no results"""
+        timelines = self.sessions.pop(key, None) if reset else self.sessions.get(key)
+        return timelines.export(max_points) if timelines is not None else None
+
+    def clear(self) -> None:
+        self.sessions = {}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self.sessions),
+            "maxSessions": self.max_sessions,
+            "capacity": self.capacity
+        }
@@ -0,0 +1,78 @@
+import time
+import logging
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+logger = logging.getLogger('ModelCascade')
+
+
+def classify(model, X) -> Tuple[Any, np.ndarray]:
+    """
+    Run a single classifier the same way the analyzers always have:
+    predicted class from predict(), probabilities from predict_proba()
+    """
+    predicted_class = model.predict(X)[0]
+    probabilities = model.predict_proba(X)[0]
+    return predicted_class, probabilities
+
+
+class ModelCascade:
+    """
+    Confidence-gated cascade of a cheap and an expensive classifier.
+
+    The cheap model classifies every frame. Only when its highest class
+    probability is below `margin` is the frame escalated to the heavy model,
+    whose answer is then used instead. Both models must share the same
+    (already scaled) input features and class labels.
+    """
+
+    def __init__(self, exercise_type: str, cheap_model, heavy_model, margin: float = 0.9):
+        self.exercise_type = exercise_type
+        self.cheap_model = cheap_model
+        self.heavy_model = heavy_model
+        self.margin = margin
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Clear escalation and latency counters"""
+        self.frames = 0
+        self.escalations = 0
+        self.cheap_time = 0.0
+        self.heavy_time = 0.0
+
+    def predict(self, X) -> Tuple[Any, np.ndarray, bool]:
+        """
+        Classify one row of scaled features.
+        Returns: (predicted_class, probabilities, escalated)
+        """
+        start_time = time.perf_counter()
+        predicted_class, probabilities = classify(self.cheap_model, X)
+        cheap_done = time.perf_counter()
+
+        self.frames += 1
+        self.cheap_time += cheap_done - start_time
+
+        if self.heavy_model is None or probabilities.max() >= self.margin:
+            return predicted_class, probabilities, False
+
+        predicted_class, probabilities = classify(self.heavy_model, X)
+        self.escalations += 1
+        self.heavy_time += time.perf_counter() - cheap_done
+        return predicted_class, probabilities, True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Escalation rate and average per-tier latency in milliseconds"""
+        frames = self.frames
+        escalations = self.escalations
+        return {
+            "exerciseType": self.exercise_type,
+            "margin": self.margin,
+            "heavyModelLoaded": self.heavy_model is not None,
+            "frames": frames,
+            "escalations": escalations,
+            "escalationRate": round(escalations / frames, 4) if frames else 0.0,
+            "avgCheapMs": round(self.cheap_time * 1000 / frames, 3) if frames else 0.0,
+            "avgHeavyMs": round(self.heavy_time * 1000 / escalations, 3) if escalations else 0.0,
+            "avgTotalMs": round((self.cheap_time + self.heavy_time) * 1000 / frames, 3) if frames else 0.0
+        }
@@ -0,0 +1,166 @@
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger('MotionGate')
+
+
+class MotionGate:
+    """
+    Reuse the last stateless prediction while the body is (nearly) still.
+
+    The gate remembers the important landmarks of the last frame that went
+    through the classifier. A new frame whose largest (x, y) displacement
+    from those landmarks is below `threshold` (normalized image units) gets
+    the cached prediction instead of a new inference. Every
+    `refresh_interval` consecutive reuses the next frame is forced through the
+    classifier anyway, and the refreshed prediction is compared with the
+    cached one to measure how often skipping would have been wrong.
+
+    Predictions are (label, confidence) pairs; a refresh counts as a
+    disagreement when the label changes. Only cache pure classifier outputs
+    here, rep counters and other state machines still have to see every frame.
+    """
+
+    def __init__(self, exercise_type: str, landmark_indices: List[int],
+                 threshold: float = 0.005, refresh_interval: int = 15):
+        self.exercise_type = exercise_type
+        self.landmark_indices = list(landmark_indices)
+        self.threshold = threshold
+        self.refresh_interval = refresh_interval
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget the cached prediction and clear the counters"""
+        self.reference_points = None
+        self.cached_prediction = None
+        self.frames_since_inference = 0
+        self.refresh_pending = False
+        self.frames = 0
+        self.skipped = 0
+        self.refreshes = 0
+        self.disagreements = 0
+
+    def _points(self, landmarks: List[Dict[str, float]]) -> Optional[np.ndarray]:
+        if any(idx >= len(landmarks) for idx in self.landmark_indices):
+            return None
+        return np.array(
+            [[landmarks[idx].get('x', 0.0), landmarks[idx].get('y', 0.0)] for idx in self.landmark_indices],
+            dtype=np.float64
+        )
+
+    def lookup(self, landmarks: List[Dict[str, float]]) -> Optional[Tuple[Any, float]]:
+        """
+        Return the cached prediction if this frame may skip inference,
+        otherwise None (the caller must then classify and call store())
+        """
+        self.frames += 1
+        self.refresh_pending = False
+
+        if self.cached_prediction is None or self.reference_points is None:
+            return None
+
+        points = self._points(landmarks)
+        if points is None:
+            return None
+
+        displacement = np.sqrt(((points - self.reference_points) ** 2).sum(axis=1)).max()
+        if displacement >= self.threshold:
+            return None
+
+        if self.frames_since_inference >= self.refresh_interval:
+            self.refresh_pending = True
+            return None
+
+        self.frames_since_inference += 1
+        self.skipped += 1
+        return self.cached_prediction
+
+    def store(self, landmarks: List[Dict[str, float]], prediction: Tuple[Any, float]) -> None:
+        """Remember the prediction just made for this frame"""
+        if self.refresh_pending:
+            self.refreshes += 1
+            if prediction[0] != self.cached_prediction[0]:
+                self.disagreements += 1
+                logger.debug(f"{self.exercise_type} gate refresh disagreed: {self.cached_prediction} -> {prediction}")
+            self.refresh_pending = False
+
+        self.reference_points = self._points(landmarks)
+        self.cached_prediction = prediction
+        self.frames_since_inference = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Skip ratio and how often forced refreshes changed the answer"""
+        return {
+            "exerciseType": self.exercise_type,
+            "threshold": self.threshold,
+            "refreshInterval": self.refresh_interval,
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "skipRatio": round(self.skipped / self.frames, 4) if self.frames else 0.0,
+            "refreshes": self.refreshes,
+            "refreshDisagreements": self.disagreements,
+            "disagreementRate": round(self.disagreements / self.refreshes, 4) if self.refreshes else 0.0
+        }
+
+
+class MotionGates:
+    """
+    One MotionGate per session. The server shares an analyzer between all
+    sessions of an exercise, so each session's frames must be compared with
+    that session's previous frame, not with whichever session came last.
+    Gates are keyed by the analyzer's `session_key` (None for callers
+    without sessions); the oldest is dropped past `max_sessions`.
+    """
+
+    def __init__(self, exercise_type: str, landmark_indices: List[int],
+                 threshold: float = 0.005, refresh_interval: int = 15, max_sessions: int = 1024):
+        self.exercise_type = exercise_type
+        self.landmark_indices = list(landmark_indices)
+        self.threshold = threshold
+        self.refresh_interval = refresh_interval
+        self.max_sessions = max_sessions
+        self.gates = {}
+
+    def get(self, key: Optional[str]) -> MotionGate:
+        gate = self.gates.get(key)
+        if gate is None:
+            gate = MotionGate(self.exercise_type, self.landmark_indices, self.threshold, self.refresh_interval)
+            self.gates[key] = gate
+            while len(self.gates) > self.max_sessions:
+                del self.gates[next(iter(self.gates))]
+        return gate
+
+    def configure(self, threshold: Optional[float] = None, refresh_interval: Optional[int] = None) -> None:
+        """Re-tune the gates of all sessions, current and future"""
+        if threshold is not None:
+            self.threshold = float(threshold)
+        if refresh_interval is not None:
+            self.refresh_interval = int(refresh_interval)
+        for gate in self.gates.values():
+            gate.threshold = self.threshold
+            gate.refresh_interval = self.refresh_interval
+
+    def reset(self) -> None:
+        """Forget every session's gate"""
+        self.gates = {}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Skip ratio and refresh disagreements over the current sessions"""
+        frames = sum(gate.frames for gate in self.gates.values())
+        skipped = sum(gate.skipped for gate in self.gates.values())
+        refreshes = sum(gate.refreshes for gate in self.gates.values())
+        disagreements = sum(gate.disagreements for gate in self.gates.values())
+        return {
+            "exerciseType": self.exercise_type,
+            "threshold": self.threshold,
+            "refreshInterval": self.refresh_interval,
+            "sessions": len(self.gates),
+            "frames": frames,
+            "skipped": skipped,
+            "skipRatio": round(skipped / frames, 4) if frames else 0.0,
+            "refreshes": refreshes,
+            "refreshDisagreements": disagreements,
+            "disagreementRate": round(disagreements / refreshes, 4) if refreshes else 0.0
+        }
@@ -0,0 +1,243 @@
+"""
+Differential test of optimized analyzer configurations against the reference.
+
+    python parity_harness.py --analyzers plank lunge --configs batched cascade_dp motion_gate
+    python parity_harness.py --session recording.okrec --configs prediction_cache --tolerance formScore=1
+
+The same frame stream (a core/ dataset stream as in benchmark_analyzers.py,
+or a recorded session) is run through a fresh analyzer in its default
+configuration and through a fresh analyzer with the optimization enabled.
+Every field of every response is compared (numbers within a tolerance,
+everything else exactly). The report gives per-field divergence counts, the
+first divergent frame and the speedup; a configuration passes when the
+fraction of divergent frames is at most --max-divergence.
+
+Configurations can be combined with "+", e.g. "batched+prediction_cache".
+"""
+import sys
+import json
+import time
+import inspect
+import logging
+import argparse
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from analyze_session import ANALYZER_CLASSES, analyze_frames, create_analyzer, load_session
+
+logger = logging.getLogger('ParityHarness')
+
+# Optimization -> (analyzer method that enables it, keyword arguments)
+OPTIMIZATIONS = {
+    "cascade": ("enable_cascade", {}),
+    "cascade_dp": ("enable_cascade", {"heavy_model": "dp"}),
+    "motion_gate": ("enable_motion_gate", {}),
+    "prediction_cache": ("enable_prediction_cache", {}),
+}
+# Batched inference replay (see analyze_session.py) is handled by the runner
+BATCHED = "batched"
+
+
+def flatten_response(value: Any, prefix: str = "") -> Dict[str, Any]:
+    """Nested response -> {"result.metrics.kneeAngle": 20.2, "result.errors[0].type": ...}"""
+    fields = {}
+    if isinstance(value, dict):
+        for key, item in value.items():
+            fields.update(flatten_response(item, f"{prefix}.{key}" if prefix else key))
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            fields.update(flatten_response(item, f"{prefix}[{i}]"))
+        if not value:
+            fields[prefix] = []
+    else:
+        fields[prefix] = value
+    return fields
+
+
+def _tolerance(field: str, tolerances: Dict[str, float], atol: float) -> float:
+    """Tolerance for a field, by full path or by its last component"""
+    if field in tolerances:
+        return tolerances[field]
+    return tolerances.get(field.rsplit(".", 1)[-1].split("[")[0], atol)
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def diff_fields(reference: Dict[str, Any], optimized: Dict[str, Any],
+                tolerances: Dict[str, float], atol: float) -> List[str]:
+    """Fields whose values differ beyond tolerance (or exist on one side only)"""
+    divergent = []
+    for field in reference.keys() | optimized.keys():
+        if field not in reference or field not in optimized:
+            divergent.append(field)
+            continue
+
+        expected, actual = reference[field], optimized[field]
+        if _is_number(expected) and _is_number(actual):
+            if abs(expected - actual) > _tolerance(field, tolerances, atol):
+                divergent.append(field)
+        elif expected != actual:
+            divergent.append(field)
+    return sorted(divergent)
+
+
+def configure(analyzer, config: str) -> bool:
+    """
+    Apply a "+"-joined configuration to an analyzer. Returns whether to use
+    batched replay, or raises ValueError if the analyzer does not support it.
+    """
+    batched = False
+    for name in config.split("+"):
+        if name == BATCHED:
+            if not hasattr(analyzer, "predict_batch"):
+                raise ValueError("no batched inference path")
+            batched = True
+            continue
+        if name not in OPTIMIZATIONS:
+            raise ValueError(f"unknown optimization: {name}")
+
+        method_name, kwargs = OPTIMIZATIONS[name]
+        method = getattr(analyzer, method_name, None)
+        if method is None or not set(kwargs) <= set(inspect.signature(method).parameters):
+            raise ValueError(f"{name} is not supported")
+        if method(**kwargs) is False:
+            raise ValueError(f"{name} could not be enabled")
+    return batched
+
+
+def run_parity(exercise_type: str, frames: np.ndarray, timestamps: np.ndarray, config: str,
+               tolerances: Optional[Dict[str, float]] = None, atol: float = 1e-6,
+               max_divergence: float = 0.0) -> Dict[str, Any]:
+    """Compare the reference analyzer with one optimized configuration over a stream"""
+    tolerances = tolerances or {}
+    report = {"exerciseType": exercise_type, "config": config, "frames": int(len(frames))}
+
+    optimized_analyzer = create_analyzer(exercise_type)
+    try:
+        batched = configure(optimized_analyzer, config)
+    except ValueError as e:
+        report["skipped"] = str(e)
+        return report
+
+    keep_response = lambda index, timestamp, response: flatten_response(response)
+
+    # Runs are sequential: some analyzers keep hold/rep state at module level
+    start = time.perf_counter()
+    reference = analyze_frames(create_analyzer(exercise_type), frames, timestamps, False, keep_response)
+    reference_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    optimized = analyze_frames(optimized_analyzer, frames, timestamps, batched, keep_response)
+    optimized_seconds = time.perf_counter() - start
+
+    field_counts = {}
+    divergent_frames = 0
+    first_divergence = None
+    for index, (expected, actual) in enumerate(zip(reference, optimized)):
+        fields = diff_fields(expected, actual, tolerances, atol)
+        if not fields:
+            continue
+
+        divergent_frames += 1
+        for field in fields:
+            field_counts[field] = field_counts.get(field, 0) + 1
+        if first_divergence is None:
+            first_divergence = {
+                "frame": index,
+                "timestamp": float(timestamps[index]),
+                "fields": {field: {"reference": expected.get(field), "optimized": actual.get(field)}
+                           for field in fields}
+            }
+
+    divergence = divergent_frames / len(frames) if len(frames) else 0.0
+    report.update({
+        "divergentFrames": divergent_frames,
+        "divergence": round(divergence, 4),
+        "fieldDivergence": dict(sorted(field_counts.items(), key=lambda item: -item[1])),
+        "firstDivergence": first_divergence,
+        "referenceSeconds": round(reference_seconds, 3),
+        "optimizedSeconds": round(optimized_seconds, 3),
+        "speedup": round(reference_seconds / optimized_seconds, 2) if optimized_seconds > 0 else None,
+        "passed": divergence <= max_divergence
+    })
+    return report
+
+
+def parse_tolerances(items: List[str]) -> Dict[str, float]:
+    """["formScore=1", "result.metrics.kneeAngle=0.5"] -> {field: tolerance}"""
+    tolerances = {}
+    for item in items:
+        field, _, value = item.partition("=")
+        tolerances[field] = float(value)
+    return tolerances
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Check optimized analyzer paths against the reference outputs")
+    parser.add_argument("--analyzers", nargs="*", default=list(ANALYZER_CLASSES),
+                        help="Exercise types to check on their benchmark dataset streams")
+    parser.add_argument("--session", help="Use a recorded session (.jsonl/.npy/.npz/.okrec) instead")
+    parser.add_argument("--exercise", help="Exercise type of --session if not recorded in it")
+    parser.add_argument("--configs", nargs="+",
+                        default=[BATCHED] + list(OPTIMIZATIONS),
+                        help='Configurations to check, e.g. batched cascade_dp "batched+motion_gate"')
+    parser.add_argument("--atol", type=float, default=1e-6, help="Default absolute tolerance for numbers")
+    parser.add_argument("--tolerance", nargs="*", default=[],
+                        help="Per-field tolerances, by path or field name: formScore=1")
+    parser.add_argument("--max-divergence", type=float, default=0.0,
+                        help="Fraction of divergent frames a configuration may have and still pass")
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--output", help="Write the reports as JSON")
+    args = parser.parse_args(argv)
+
+    # The analyzers log every frame
+    logging.disable(logging.WARNING)
+    tolerances = parse_tolerances(args.tolerance)
+
+    load_errors = []
+    if args.session:
+        session = load_session(Path(args.session), args.exercise, args.fps)
+        streams = {session["exerciseType"]: (session["frames"], session["timestamps"])}
+    else:
+        from benchmark_analyzers import ANALYZER_DATASETS, load_stream
+        streams = {}
+        for exercise_type in args.analyzers:
+            try:
+                frames = load_stream(ANALYZER_DATASETS[exercise_type])
+            except Exception as e:
+                # A missing dataset fails this analyzer's checks, not the run
+                for config in args.configs:
+                    report = {"exerciseType": exercise_type, "config": config,
+                              "error": f"{type(e).__name__}: {str(e)}"}
+                    load_errors.append(report)
+                continue
+            streams[exercise_type] = (frames, np.arange(len(frames)) / args.fps)
+
+    reports = []
+    for report in load_errors:
+        reports.append(report)
+        print(json.dumps(report))
+    for exercise_type, (frames, timestamps) in streams.items():
+        for config in args.configs:
+            try:
+                report = run_parity(exercise_type, frames, timestamps, config,
+                                    tolerances, args.atol, args.max_divergence)
+            except Exception as e:
+                report = {"exerciseType": exercise_type, "config": config,
+                          "error": f"{type(e).__name__}: {str(e)}"}
+            reports.append(report)
+            print(json.dumps(report))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=2)
+    failed = [r for r in reports if "error" in r or r.get("passed") is False]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,11 +9,21 @@ import time
 from pathlib import Path
 from typing import Dict, List, Tuple, Any, Optional, Union
 
+from model_cascade import ModelCascade, classify
+from prediction_cache import PredictionCache
+from dense_network import DenseNetwork
+from motion_gate import MotionGates
+from diagnostics import DIAG
+from error_codes import ERROR_TABLES
+
 # Setup logging
 logging.basicConfig(level=logging.INFO,
                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('plank_analyzer')
 
+ERRORS = ERROR_TABLES["plank"]
+HIGH_BACK, LOW_BACK = ERRORS.codes("high_back", "low_back")
+
 # Define required landmarks for plank - these match the notebook exactly
 IMPORTANT_LMS = [
     "NOSE",               # 0
@@ -118,19 +128,19 @@ class PlankPoseAnalysis:
         self.stage = "unknown"  # Will be 'correct', 'high_back', 'low_back', or 'unknown'
         self.duration_seconds = 0
         self.form_score = 100
-        self.errors = []
+        self.errors = []  # [code, value] pairs
         self.metrics = {}
     
-    def to_dict(self) -> Dict[str, Any]:
+    def to_dict(self, compact_errors: bool = False) -> Dict[str, Any]:
         """Convert analysis to dictionary for JSON response"""
-        return {
+        result = {
             "stage": self.stage,
             "durationInSeconds": self.duration_seconds,
             "holdTime": self.duration_seconds,  # Add hold time field
             "formScore": self.form_score,
-            "errors": self.errors,
             "metrics": self.metrics
         }
+        return ERRORS.put_errors(result, self.errors, compact_errors)
 
 class PlankAnalyzer:
     """Analyzer for plank poses"""
@@ -157,12 +167,55 @@ class PlankAnalyzer:
         # Thresholds for analysis
         self.VISIBILITY_THRESHOLD = 0.6
         self.PREDICTION_THRESHOLD = 0.6  # Same threshold as notebook (line 180)
+        self.STRAIGHT_BODY_ANGLE = 165  # Shoulder-hip-ankle angle of a straight body (geometric tier)
         
         # Load ML models
         self.model = None
         self.input_scaler = None
         self._load_models()
         
+        # Optional LR -> SVC (or NumPy dense network) cascade, off until
+        # enable_cascade() is called
+        self.CASCADE_MARGIN = 0.9
+        self.CASCADE_HEAVY_MODELS = {
+            "svc": "SVC_model.pkl",
+            "dp": "plank_dp.npz"
+        }
+        self.heavy_model_name = "svc"
+        self.heavy_model = None
+        self.cascade = None
+        self.use_cascade = False
+        
+        # Optional LRU cache of classifier outputs keyed by quantized features,
+        # off until enable_prediction_cache() is called
+        self.prediction_cache = PredictionCache("plank")
+        self.use_prediction_cache = False
+        
+        # Optional motion gates (one per session) that reuse the session's last
+        # prediction while the body is still, off until enable_motion_gate() is called
+        self.motion_gates = MotionGates("plank", [LANDMARK_INDICES[lm] for lm in IMPORTANT_LMS])
+        self.use_motion_gate = False
+        
+        # Stateless predictions precomputed by predict_batch(), set during offline
+        # replay (see analyze_session.py)
+        self.prediction_replay = None
+        
+        # Per-request stage timing, set by the server for sampled requests
+        # (see request_trace.py)
+        self.trace = None
+        
+        # Emit [code, value] pairs instead of error dicts, set per call by the
+        # server for sessions that loaded the error code table
+        self.compact_errors = False
+        
+        # Quality tier of the current call, set by the server while it sheds
+        # load (see quality_controller.py): "cheap" runs the LR model alone,
+        # "geometric" takes the stage from the shoulder-hip-ankle line
+        self.quality_tier = "full"
+        
+        # Session of the current call (picks its motion gate), set by the server
+        self.session_key = None
+        
         logger.info("Plank analyzer initialized")
     
     def _load_models(self):
@@ -231,7 +284,6 @@ class PlankAnalyzer:
             # Create a list for all 4 values (x, y, z, visibility) to match training data
             data = []
             lm_len = len(landmarks)
-            logger.info(f"Extracting all 4 coordinates from {lm_len} landmarks")
             
             for lm_name in IMPORTANT_LMS:
                 lm_index = LANDMARK_INDICES[lm_name]
@@ -246,13 +298,13 @@ class PlankAnalyzer:
                         keypoint.get('visibility', 0.0)
                     ])
                 else:
-                    logger.warning(f"Landmark {lm_name} (index {lm_index}) is out of range for landmarks array length {lm_len}")
+                    if DIAG.on("plank"):
+                        DIAG.emit("plank", "missing_landmark", name=lm_name, index=lm_index, count=lm_len)
                     # If landmark is missing, add zeros
                     data.append([0.0, 0.0, 0.0, 0.0])
             
             # Flatten to match model input format - will give us 68 features (17 landmarks * 4 coordinates)
             result = np.array(data).flatten().tolist()
-            logger.info(f"Extracted {len(result)} features (x,y,z,visibility)")
             return result
         except Exception as e:
             logger.error(f"Error extracting keypoints: {str(e)}")
@@ -261,7 +313,85 @@ class PlankAnalyzer:
     
     def detect_plank_stage_with_ml(self, landmarks: List[Dict[str, float]]) -> Tuple[str, float]:
         """
-        Detect plank stage using ML model.
+        Detect plank stage using ML model, skipping inference for near-static
+        frames when the motion gate is enabled
+        """
+        if self.prediction_replay is not None:
+            return self.prediction_replay.current()
+        if self.quality_tier == "geometric":
+            return self.detect_plank_stage_geometric(landmarks)
+        
+        if not self.use_motion_gate or self.model is None:
+            return self._predict_plank_stage(landmarks)
+        
+        motion_gate = self.motion_gates.get(self.session_key)
+        cached = motion_gate.lookup(landmarks)
+        if self.trace is not None:
+            self.trace.note("gate", "skip" if cached is not None else "refresh" if motion_gate.refresh_pending else "infer")
+        if cached is not None:
+            return cached
+        
+        predicted_stage, confidence = self._predict_plank_stage(landmarks)
+        if confidence > 0 and self.quality_tier == "full":
+            # Fallback results (confidence 0.0) and cheap-tier answers are never reused
+            motion_gate.store(landmarks, (predicted_stage, confidence))
+        return predicted_stage, confidence
+    
+    def detect_plank_stage_geometric(self, landmarks: List[Dict[str, float]]) -> Tuple[str, float]:
+        """
+        Detect plank stage without the ML model: the body is straight when the
+        shoulder-hip-ankle angle (midpoints of both sides) is at least
+        STRAIGHT_BODY_ANGLE, otherwise the hips are above (high back) or below
+        (low back) the shoulder-ankle line
+        """
+        try:
+            def midpoint(left: str, right: str) -> np.ndarray:
+                a, b = landmarks[LANDMARK_INDICES[left]], landmarks[LANDMARK_INDICES[right]]
+                return np.array([(a['x'] + b['x']) / 2, (a['y'] + b['y']) / 2])
+            
+            shoulder = midpoint("LEFT_SHOULDER", "RIGHT_SHOULDER")
+            hip = midpoint("LEFT_HIP", "RIGHT_HIP")
+            ankle = midpoint("LEFT_ANKLE", "RIGHT_ANKLE")
+            
+            to_shoulder, to_ankle = shoulder - hip, ankle - hip
+            cosine = np.dot(to_shoulder, to_ankle) / (np.linalg.norm(to_shoulder) * np.linalg.norm(to_ankle))
+            angle = np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0)))
+            if self.trace is not None:
+                self.trace.mark("geometry")
+            
+            if angle >= self.STRAIGHT_BODY_ANGLE:
+                return "correct", 1.0
+            # Image y grows downwards: a hip above the line has the smaller y
+            line = ankle - shoulder
+            line_y = shoulder[1] + (line[1] / line[0]) * (hip[0] - shoulder[0]) if line[0] != 0 else hip[1]
+            return ("high_back" if hip[1] < line_y else "low_back"), 1.0
+        except Exception as e:
+            logger.error(f"Error in geometric stage detection: {str(e)}")
+            return "correct", 0.0
+    
+    def predict_batch(self, frames: np.ndarray) -> Optional[List[Tuple[str, float]]]:
+        """
+        Vectorized _predict_plank_stage for a (frames, 33, 4) landmark array:
+        one (stage, confidence) per frame, or None if the scaled model path
+        is unavailable
+        """
+        if self.model is None or self.input_scaler is None:
+            return None
+        
+        indices = [LANDMARK_INDICES[lm] for lm in IMPORTANT_LMS]
+        X = pd.DataFrame(frames[:, indices, :].reshape(len(frames), -1).astype(np.float64), columns=HEADERS[1:])
+        X = pd.DataFrame(self.input_scaler.transform(X))
+        
+        predicted_classes = self.model.predict(X)
+        confidences = self.model.predict_proba(X).max(axis=1)
+        return [
+            (self.STAGE_MAPPING.get(self.CLASS_LABELS.get(predicted_class), "unknown"), confidence)
+            for predicted_class, confidence in zip(predicted_classes, confidences)
+        ]
+    
+    def _predict_plank_stage(self, landmarks: List[Dict[str, float]]) -> Tuple[str, float]:
+        """
+        Run the plank ML model on one frame.
         Matches the detection flow in the notebook exactly.
         """
         try:
@@ -279,27 +409,30 @@ class PlankAnalyzer:
             
             # Create DataFrame with column names matching exactly the notebook (HEADERS[1:] skips the 'label' column)
             X = pd.DataFrame([row], columns=HEADERS[1:])
-            logger.info(f"Input DataFrame shape: {X.shape}")
+            if self.trace is not None:
+                self.trace.mark("feature_extraction")
             
             try:
                 # First try exact approach from notebook with scaling
                 if self.input_scaler is not None:
                     try:
                         # This is exactly like the notebook, but might fail due to dimension mismatch
-                        logger.info("Attempting to scale input data")
-                        logger.info(f"Input data has {X.shape[1]} features, scaler expects {self.input_scaler.n_features_in_ if hasattr(self.input_scaler, 'n_features_in_') else 'unknown'}")
-                        
                         X_scaled = self.input_scaler.transform(X)
                         X = pd.DataFrame(X_scaled)  # Notebook creates a new DataFrame with scaled values
+                        if self.trace is not None:
+                            self.trace.mark("scaling")
                         
                         # Make prediction with scaled data
-                        predicted_class = self.model.predict(X)[0]
-                        prediction_probabilities = self.model.predict_proba(X)[0]
+                        predicted_class, prediction_probabilities = self._classify(X)
+                        if self.trace is not None:
+                            self.trace.mark("inference")
                         confidence = prediction_probabilities[prediction_probabilities.argmax()]
                         
                         # Get class label exactly as notebook does
                         predicted_label = self.CLASS_LABELS.get(predicted_class)
-                        logger.info(f"ML prediction (with scaling): Class {predicted_class} ({predicted_label}) with confidence {confidence}")
+                        if DIAG.on("plank"):
+                            DIAG.emit("plank", "ml_prediction", predicted_class=predicted_class,
+                                      label=predicted_label, confidence=confidence, scaled=True)
                         
                         # Map to our stage format
                         predicted_stage = self.STAGE_MAPPING.get(predicted_label, "unknown")
@@ -309,18 +442,21 @@ class PlankAnalyzer:
                         # Continue to direct prediction
                 
                 # Fallback to direct prediction without scaling
-                logger.info("Making direct prediction without scaling")
-                
                 # Remove column names to avoid warnings about feature names
                 X_array = X.values
                 
                 predicted_class = self.model.predict(X_array)[0]
                 prediction_probabilities = self.model.predict_proba(X_array)[0]
+                if self.trace is not None:
+                    self.trace.note("model", "lr_unscaled")
+                    self.trace.mark("inference")
                 confidence = prediction_probabilities[prediction_probabilities.argmax()]
                 
                 # Get class label exactly as notebook does
                 predicted_label = self.CLASS_LABELS.get(predicted_class)
-                logger.info(f"ML prediction (direct): Class {predicted_class} ({predicted_label}) with confidence {confidence}")
+                if DIAG.on("plank"):
+                    DIAG.emit("plank", "ml_prediction", predicted_class=predicted_class,
+                              label=predicted_label, confidence=confidence, scaled=False)
                 
                 # Map to our stage format
                 predicted_stage = self.STAGE_MAPPING.get(predicted_label, "unknown")
@@ -333,52 +469,154 @@ class PlankAnalyzer:
             logger.error(f"Error in ML stage detection: {str(e)}")
             return "correct", 0.0
     
-    def detect_errors(self, plank_stage: str) -> List[Dict[str, str]]:
-        """Detect errors in plank form based on the detected stage"""
+    def _classify(self, X) -> Tuple[Any, np.ndarray]:
+        """Classify scaled features, through the prediction cache and cascade when enabled"""
+        cache_key = None
+        if self.use_prediction_cache:
+            cache_key = self.prediction_cache.make_key(X)
+            cached = self.prediction_cache.get(cache_key)
+            if self.trace is not None:
+                self.trace.note("cache", "hit" if cached is not None else "miss")
+            if cached is not None:
+                return cached
+        
+        if self.quality_tier == "cheap":
+            # Never escalated, and not cached: the cache holds the full tier's answers
+            predicted_class, prediction_probabilities = classify(self.model, X)
+            if self.trace is not None:
+                self.trace.note("model", "lr")
+            return predicted_class, prediction_probabilities
+        
+        if self.use_cascade and self.cascade is not None:
+            predicted_class, prediction_probabilities, escalated = self.cascade.predict(X)
+            model_name = self.heavy_model_name if escalated else "lr"
+        else:
+            predicted_class, prediction_probabilities = classify(self.model, X)
+            model_name = "lr"
+        if self.trace is not None:
+            self.trace.note("model", model_name)
+        
+        if cache_key is not None:
+            self.prediction_cache.put(cache_key, (predicted_class, prediction_probabilities))
+        return predicted_class, prediction_probabilities
+    
+    def enable_cascade(self, margin: Optional[float] = None, heavy_model: Optional[str] = None) -> bool:
+        """
+        Run the LR model first and escalate to the heavy model ("svc", or "dp"
+        for the exported deep learning model) only when the LR confidence is
+        below the cascade margin
+        """
+        if margin is not None:
+            self.CASCADE_MARGIN = float(margin)
+        
+        if self.model is None:
+            logger.error("Cannot enable cascade: plank model not loaded")
+            return False
+        
+        if heavy_model is not None and heavy_model != self.heavy_model_name:
+            if heavy_model not in self.CASCADE_HEAVY_MODELS:
+                logger.error(f"Unknown cascade heavy model: {heavy_model}")
+                return False
+            self.heavy_model_name = heavy_model
+            self.heavy_model = None
+        
+        if self.heavy_model is None:
+            heavy_path = get_static_file_url(self.CASCADE_HEAVY_MODELS[self.heavy_model_name])
+            try:
+                if heavy_path.endswith(".npz"):
+                    self.heavy_model = DenseNetwork.load(heavy_path).with_class_order(self.model.classes_)
+                else:
+                    with open(heavy_path, "rb") as f:
+                        self.heavy_model = pickle.load(f)
+                logger.info(f"Loaded cascade heavy model from: {heavy_path}")
+            except Exception as e:
+                logger.error(f"Error loading cascade heavy model: {str(e)}")
+                return False
+            
+            if self.cascade is not None:
+                self.cascade.heavy_model = self.heavy_model
+                self.cascade.reset_stats()
+        
+        if self.cascade is None:
+            self.cascade = ModelCascade("plank", self.model, self.heavy_model, self.CASCADE_MARGIN)
+        self.cascade.margin = self.CASCADE_MARGIN
+        self.use_cascade = True
+        self.prediction_cache.clear()
+        return True
+    
+    def disable_cascade(self) -> None:
+        """Go back to the single LR model"""
+        self.use_cascade = False
+        self.prediction_cache.clear()
+    
+    def get_cascade_stats(self) -> Optional[Dict[str, Any]]:
+        """Escalation rate and latency of the cascade, if it was ever enabled"""
+        if self.cascade is None:
+            return None
+        stats = self.cascade.get_stats()
+        stats["enabled"] = self.use_cascade
+        stats["heavyModel"] = self.heavy_model_name
+        return stats
+    
+    def enable_prediction_cache(self, max_entries: Optional[int] = None, quantization: Optional[float] = None) -> bool:
+        """Memoize classifier outputs for inputs that quantize to a seen feature vector"""
+        self.prediction_cache.configure(max_entries, quantization)
+        self.use_prediction_cache = True
+        return True
+    
+    def disable_prediction_cache(self) -> None:
+        """Stop using and drop the cached classifier outputs"""
+        self.use_prediction_cache = False
+        self.prediction_cache.clear()
+    
+    def get_prediction_cache_stats(self) -> Dict[str, Any]:
+        """Hit rate and occupancy of the prediction cache"""
+        stats = self.prediction_cache.get_stats()
+        stats["enabled"] = self.use_prediction_cache
+        return stats
+    
+    def enable_motion_gate(self, threshold: Optional[float] = None, refresh_interval: Optional[int] = None) -> bool:
+        """
+        Reuse the last ML prediction while the important landmarks move less
+        than `threshold`, forcing a new inference every `refresh_interval` frames
+        """
+        self.motion_gates.configure(threshold, refresh_interval)
+        if not self.use_motion_gate:
+            self.motion_gates.reset()
+        self.use_motion_gate = True
+        return True
+    
+    def disable_motion_gate(self) -> None:
+        """Run the ML model on every frame again"""
+        self.use_motion_gate = False
+    
+    def get_motion_gate_stats(self) -> Dict[str, Any]:
+        """Skip ratio and refresh disagreements of the motion gates"""
+        stats = self.motion_gates.get_stats()
+        stats["enabled"] = self.use_motion_gate
+        return stats
+    
+    def detect_errors(self, plank_stage: str) -> List[list]:
+        """Detect errors in plank form based on the detected stage, as [code, value] pairs"""
         errors = []
         
         if plank_stage == "high_back":
-            errors.append({
-                "type": "high_back",
-                "message": "Your lower back is raised too high. Flatten your back to maintain proper form.",
-                "severity": "high"
-            })
+            errors.append([HIGH_BACK, None])
         elif plank_stage == "low_back":
-            errors.append({
-                "type": "low_back",
-                "message": "Your lower back is dipping too low. Engage your core to maintain a straight line from head to heels.",
-                "severity": "high"
-            })
+            errors.append([LOW_BACK, None])
         
         return errors
     
-    def calculate_form_score(self, errors: List[Dict[str, str]]) -> int:
-        """Calculate form score based on detected errors"""
-        score = 100
-        
-        for error in errors:
-            if error["severity"] == "high":
-                score -= 20
-            elif error["severity"] == "medium":
-                score -= 10
-            elif error["severity"] == "low":
-                score -= 5
-        
-        # Ensure score is between 0 and 100
-        return max(0, min(100, score))
+    def calculate_form_score(self, errors: List[list]) -> int:
+        """Calculate form score from the integer weights of the detected error codes"""
+        return ERRORS.form_score(errors)
     
-    def analyze_pose(self, landmarks: List[Dict[str, float]]) -> Dict[str, Any]:
+    def analyze_pose(self, landmarks: List[Dict[str, float]], timestamp: Optional[float] = None) -> Dict[str, Any]:
         """Analyze the plank pose and return results"""
         global _PLANK_HOLD_TIME, _LAST_ANALYSIS_TIME, _LAST_FORM_CORRECT
         analysis = PlankPoseAnalysis()
         
         try:
-            # Debug logging
-            logger.info(f"PlankAnalyzer.analyze_pose called with {len(landmarks) if landmarks else 'None'} landmarks")
-            if landmarks and len(landmarks) > 0:
-                first_landmark = landmarks[0]
-                logger.info(f"First landmark sample: {first_landmark}")
-            
             # Input validation - match pattern used by other analyzers
             if not landmarks or not isinstance(landmarks, list):
                 logger.error(f"Invalid landmarks data: {type(landmarks)}")
@@ -414,20 +652,26 @@ class PlankAnalyzer:
                     }
                 }
             
+            if self.trace is not None:
+                self.trace.mark("validation")
+            
             # Use ML model to detect plank stage
             stage, confidence = self.detect_plank_stage_with_ml(landmarks)
+            if self.trace is not None:
+                self.trace.mark("inference")
             
             # Matching notebook - only use prediction if confidence is high enough
             if confidence >= self.PREDICTION_THRESHOLD:
                 analysis.stage = stage
-                logger.info(f"Using detected stage: {stage} with confidence {confidence}")
+                if DIAG.on("plank"):
+                    DIAG.emit("plank", "stage", stage=stage, confidence=confidence)
             else:
                 analysis.stage = "unknown"
-                logger.info(f"Low confidence prediction: {confidence} < {self.PREDICTION_THRESHOLD}, treating as unknown")
+                if DIAG.on("plank"):
+                    DIAG.emit("plank", "low_confidence", stage=stage, confidence=confidence, threshold=self.PREDICTION_THRESHOLD)
             
             # Fallback to "correct" if prediction failed, to allow the timer to continue
             if analysis.stage == "unknown":
-                logger.info("Using fallback to 'correct' stage")
                 analysis.stage = "correct"
             
             # Detect form errors
@@ -437,32 +681,10 @@ class PlankAnalyzer:
             form_score = self.calculate_form_score(errors)
             
             # Update the hold time based on the form
-            current_time = time.time()
-            is_correct_form = analysis.stage == "correct"
-            
-            # Initialize the last analysis time if this is the first call
-            if _LAST_ANALYSIS_TIME is None:
-                _LAST_ANALYSIS_TIME = current_time
-                _LAST_FORM_CORRECT = is_correct_form
-                logger.info(f"First analysis call, initializing timer. Form correct: {is_correct_form}")
-            else:
-                # Calculate time elapsed since last analysis
-                time_elapsed = current_time - _LAST_ANALYSIS_TIME
-                
-                # Only increment hold time if the form is correct
-                if is_correct_form:
-                    _PLANK_HOLD_TIME += time_elapsed
-                    logger.info(f"Form is correct, incrementing hold time by {time_elapsed:.2f}s to {_PLANK_HOLD_TIME:.2f}s")
-                else:
-                    logger.info(f"Form is incorrect ({analysis.stage}), hold time remains at {_PLANK_HOLD_TIME:.2f}s")
-                
-                # Update the last analysis time
-                _LAST_ANALYSIS_TIME = current_time
-                _LAST_FORM_CORRECT = is_correct_form
+            self.advance_hold_time(analysis.stage, timestamp)
             
             # Update the duration in the analysis object
             analysis.duration_seconds = int(_PLANK_HOLD_TIME)
-            logger.info(f"Current hold time: {analysis.duration_seconds}s (raw: {_PLANK_HOLD_TIME:.2f}s)")
             
             # Update analysis object
             analysis.errors = errors
@@ -483,22 +705,16 @@ class PlankAnalyzer:
             # Create the final response
             response = {
                 "success": True,
-                "result": {
-                    "stage": analysis.stage,
-                    "durationInSeconds": analysis.duration_seconds,
-                    "holdTime": analysis.duration_seconds,  # Add holdTime at root level too
-                    "formScore": analysis.form_score,
-                    "errors": analysis.errors,
-                    "metrics": analysis.metrics
-                }
+                "result": analysis.to_dict(self.compact_errors)
             }
             
-            # Log the key fields in the response to help with debugging
-            logger.info(f"RESPONSE: hold_time={response['result']['holdTime']}s, " +
-                       f"duration={response['result']['durationInSeconds']}s, " +
-                       f"metrics.holdTime={response['result']['metrics']['holdTime']}s, " +
-                       f"form_score={response['result']['formScore']}, " +
-                       f"stage={response['result']['stage']}")
+            if self.trace is not None:
+                self.trace.mark("state_update")
+            
+            # Key fields of the response
+            if DIAG.on("plank"):
+                DIAG.emit("plank", "result", hold_time=_PLANK_HOLD_TIME, form_score=form_score,
+                          stage=analysis.stage, errors=lambda: [ERRORS.types[code] for code, _ in errors])
             
             return response
             
@@ -513,6 +729,57 @@ class PlankAnalyzer:
                 }
             }
 
+    def advance_hold_time(self, stage: str, timestamp: Optional[float] = None) -> None:
+        """
+        Advance the hold timer to this frame, counting the time since the last
+        one only while the form is correct
+        """
+        global _PLANK_HOLD_TIME, _LAST_ANALYSIS_TIME, _LAST_FORM_CORRECT
+        # Clocked by the frame capture time when the client sends one
+        current_time = timestamp if timestamp is not None else time.time()
+        is_correct_form = stage == "correct"
+        
+        # Initialize the last analysis time if this is the first call
+        if _LAST_ANALYSIS_TIME is None:
+            _LAST_ANALYSIS_TIME = current_time
+            _LAST_FORM_CORRECT = is_correct_form
+            if DIAG.on("plank"):
+                DIAG.emit("plank", "timer_start", form_correct=is_correct_form)
+        else:
+            # Calculate time elapsed since last analysis
+            # (late/out-of-order frames never subtract hold time)
+            time_elapsed = max(0.0, current_time - _LAST_ANALYSIS_TIME)
+        
+            # Only increment hold time if the form is correct
+            if is_correct_form:
+                _PLANK_HOLD_TIME += time_elapsed
+                if DIAG.on("plank"):
+                    DIAG.emit("plank", "hold", elapsed=time_elapsed, hold_time=_PLANK_HOLD_TIME)
+            else:
+                if DIAG.on("plank"):
+                    DIAG.emit("plank", "hold_paused", stage=stage, hold_time=_PLANK_HOLD_TIME)
+        
+            # Update the last analysis time
+            _LAST_ANALYSIS_TIME = current_time
+            _LAST_FORM_CORRECT = is_correct_form
+    
+    def advance_duplicate(self, result: Dict[str, Any], timestamp: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Result for a frame identical to the previous one (see frame_dedup.py):
+        the previous result, with only the hold timer moved on
+        """
+        analysis_result = result.get("result")
+        if not result.get("success", False) or not analysis_result:
+            return result
+        self.advance_hold_time(analysis_result.get("stage", "correct"), timestamp)
+        duration_seconds = int(_PLANK_HOLD_TIME)
+        analysis_result["durationInSeconds"] = duration_seconds
+        analysis_result["holdTime"] = duration_seconds
+        metrics = dict(analysis_result.get("metrics") or {})
+        metrics["holdTime"] = duration_seconds
+        analysis_result["metrics"] = metrics
+        return result
+    
     def reset_rep_counter(self) -> bool:
         """Reset the timer for plank exercise"""
         global _PLANK_HOLD_TIME, _LAST_ANALYSIS_TIME, _LAST_FORM_CORRECT
@@ -0,0 +1,92 @@
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger('PredictionCache')
+
+
+class PredictionCache:
+    """
+    Bounded LRU memo of classifier outputs keyed by quantized input features.
+
+    Only the stateless step (classifier input features -> class/probabilities)
+    may be cached here. Stage/rep state machines must run on every frame, so
+    their outputs never go in. Features are snapped to a grid of
+    `quantization` (in the units of the classifier input, i.e. standardized
+    features for the scaled models) so that frames differing only by
+    landmark jitter share an entry.
+    """
+
+    def __init__(self, exercise_type: str, max_entries: int = 4096, quantization: float = 0.05):
+        self.exercise_type = exercise_type
+        self.max_entries = max_entries
+        self.quantization = quantization
+        self.entries = OrderedDict()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Clear hit/miss counters"""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def clear(self) -> None:
+        """Drop all entries, e.g. after the underlying model changed"""
+        self.entries.clear()
+
+    def configure(self, max_entries: Optional[int] = None, quantization: Optional[float] = None) -> None:
+        """Change the size bound or quantization step"""
+        if quantization is not None and float(quantization) != self.quantization:
+            if float(quantization) <= 0:
+                raise ValueError("quantization must be positive")
+            self.quantization = float(quantization)
+            # Existing keys were built on the old grid
+            self.clear()
+        if max_entries is not None:
+            if int(max_entries) < 1:
+                raise ValueError("maxEntries must be at least 1")
+            self.max_entries = int(max_entries)
+            self._evict()
+
+    def make_key(self, X) -> bytes:
+        """Quantized feature vector as a hashable key"""
+        values = np.asarray(X, dtype=np.float64).ravel()
+        return np.floor(values / self.quantization + 0.5).astype(np.int64).tobytes()
+
+    def get(self, key: bytes) -> Optional[Tuple[Any, np.ndarray]]:
+        """Cached (class, probabilities) for a key, or None on a miss"""
+        prediction = self.entries.get(key)
+        if prediction is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return prediction
+
+    def put(self, key: bytes, prediction: Tuple[Any, np.ndarray]) -> None:
+        """Store a (class, probabilities) result, evicting the least recently used entries"""
+        self.entries[key] = prediction
+        self.entries.move_to_end(key)
+        self._evict()
+
+    def _evict(self) -> None:
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit rate and occupancy"""
+        lookups = self.hits + self.misses
+        return {
+            "exerciseType": self.exercise_type,
+            "maxEntries": self.max_entries,
+            "quantization": self.quantization,
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions
+        }
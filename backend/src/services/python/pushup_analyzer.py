@@ -4,6 +4,9 @@ import sys
 import logging
 from typing import Dict, List, Tuple, Any, Optional, Union
 
+from diagnostics import DIAG
+from error_codes import ERROR_TABLES
+
 # Setup logging
 logging.basicConfig(level=logging.INFO,
                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -20,26 +23,30 @@ REQUIRED_LANDMARKS = [
     27, 28   # ankles
 ]
 
+ERRORS = ERROR_TABLES["pushup"]
+VISIBILITY, UNEVEN_ARMS, INCOMPLETE_PUSHUP, BACK_ALIGNMENT = ERRORS.codes(
+    "visibility", "uneven_arms", "incomplete_pushup", "back_alignment")
+
 class PushupPoseAnalysis:
     """Class to hold pushup analysis results"""
     def __init__(self):
         self.stage = "unknown"
         self.rep_count = 0
         self.form_score = 100
-        self.errors = []
+        self.errors = []  # [code, value] pairs
         self.metrics = {}
         self.is_visible = True
     
-    def to_dict(self) -> Dict[str, Any]:
+    def to_dict(self, compact_errors: bool = False) -> Dict[str, Any]:
         """Convert analysis to dictionary for JSON response"""
-        return {
+        result = {
             "stage": self.stage,
             "repCount": self.rep_count,
             "formScore": self.form_score,
-            "errors": self.errors,
             "metrics": self.metrics,
             "isVisible": self.is_visible
         }
+        return ERRORS.put_errors(result, self.errors, compact_errors)
 
 class PushupAnalyzer:
     """Analyzer for pushup poses"""
@@ -64,6 +71,9 @@ class PushupAnalyzer:
         self.ANGLE_DOWN_THRESHOLD = 120  # Was 110 - increased to make it easier to detect DOWN position
         self.ANGLE_DELTA_THRESHOLD = 10
         
+        # Set per call by the server for sessions that loaded the error code table
+        self.compact_errors = False
+        
         logger.info("Pushup analyzer initialized with UP threshold: %d, DOWN threshold: %d", 
                    self.ANGLE_UP_THRESHOLD, self.ANGLE_DOWN_THRESHOLD)
     
@@ -100,17 +110,13 @@ class PushupAnalyzer:
         visibility_percentage = visible_count / total_required
         return visibility_percentage >= 0.7
     
-    def detect_errors(self, landmarks: List[Dict[str, float]], metrics: Dict[str, float]) -> List[Dict[str, str]]:
-        """Detect errors in the pushup form"""
+    def detect_errors(self, landmarks: List[Dict[str, float]], metrics: Dict[str, float]) -> List[list]:
+        """Detect errors in the pushup form as [code, value] pairs"""
         errors = []
         
         # Check for visibility issues
         if not self.check_visibility(landmarks):
-            errors.append({
-                "type": "visibility",
-                "message": "Cannot see body clearly. Adjust your position.",
-                "severity": "high"
-            })
+            errors.append([VISIBILITY, None])
             return errors
         
         # Check for uneven arm angles
@@ -118,19 +124,11 @@ class PushupAnalyzer:
         right_arm_angle = metrics.get("rightArmAngle", 0)
         
         if abs(left_arm_angle - right_arm_angle) > 20:
-            errors.append({
-                "type": "uneven_arms",
-                "message": "Arms are uneven. Keep shoulders level.",
-                "severity": "medium"
-            })
+            errors.append([UNEVEN_ARMS, None])
         
         # Check for proper form
         if self.current_stage == "down" and (left_arm_angle > 120 or right_arm_angle > 120):
-            errors.append({
-                "type": "incomplete_pushup",
-                "message": "Go lower for a complete push-up.",
-                "severity": "medium"
-            })
+            errors.append([INCOMPLETE_PUSHUP, None])
         
         # Check back alignment
         # For simplicity, we'll use the alignment of shoulders and hips as a proxy
@@ -143,11 +141,7 @@ class PushupAnalyzer:
         hip_y = (left_hip["y"] + right_hip["y"]) / 2
         
         if abs(shoulder_y - hip_y) > 0.1:  # Threshold for back alignment
-            errors.append({
-                "type": "back_alignment",
-                "message": "Keep your back straight during push-ups.",
-                "severity": "high"
-            })
+            errors.append([BACK_ALIGNMENT, None])
         
         return errors
     
@@ -155,10 +149,6 @@ class PushupAnalyzer:
         """Determine the current stage of the exercise"""
         avg_angle = (left_arm_angle + right_arm_angle) / 2
         
-        # Enhanced logging for debugging rep counting issues
-        logger.info(f"Current arm angle: {avg_angle:.1f} degrees, Left: {left_arm_angle:.1f}, Right: {right_arm_angle:.1f}")
-        logger.info(f"Previous stage: {self.current_stage}, Required for UP: > {self.ANGLE_UP_THRESHOLD}, Required for DOWN: < {self.ANGLE_DOWN_THRESHOLD}")
-        
         if avg_angle > self.ANGLE_UP_THRESHOLD:
             return "up"
         elif avg_angle < self.ANGLE_DOWN_THRESHOLD:
@@ -166,22 +156,11 @@ class PushupAnalyzer:
         else:
             return "middle"
     
-    def calculate_form_score(self, errors: List[Dict[str, str]]) -> int:
-        """Calculate a form score based on detected errors"""
-        score = 100
-        
-        for error in errors:
-            if error["severity"] == "high":
-                score -= 15
-            elif error["severity"] == "medium":
-                score -= 10
-            elif error["severity"] == "low":
-                score -= 5
-        
-        # Ensure score is between 0 and 100
-        return max(0, min(100, score))
+    def calculate_form_score(self, errors: List[list]) -> int:
+        """Calculate a form score from the integer weights of the detected error codes"""
+        return ERRORS.form_score(errors)
     
-    def analyze_pose(self, landmarks: List[Dict[str, float]]) -> Dict[str, Any]:
+    def analyze_pose(self, landmarks: List[Dict[str, float]], timestamp: Optional[float] = None) -> Dict[str, Any]:
         """Analyze the pushup pose and return results"""
         analysis = PushupPoseAnalysis()
         
@@ -189,14 +168,10 @@ class PushupAnalyzer:
             # Check visibility first
             analysis.is_visible = self.check_visibility(landmarks)
             if not analysis.is_visible:
-                analysis.errors.append({
-                    "type": "visibility",
-                    "message": "Cannot see body clearly. Adjust your position.",
-                    "severity": "high"
-                })
+                analysis.errors.append([VISIBILITY, None])
                 return {
                     "success": True,
-                    "result": analysis.to_dict()
+                    "result": analysis.to_dict(self.compact_errors)
                 }
             
             # Extract key landmarks
@@ -221,27 +196,25 @@ class PushupAnalyzer:
             # Detect current stage
             current_stage = self.detect_stage(left_arm_angle, right_arm_angle)
             
-            # Log stage transition for debugging
+            # Record stage transitions
             if current_stage != self.current_stage:
-                logger.info(f"Stage changed: {self.current_stage} -> {current_stage}")
+                if DIAG.on("pushup"):
+                    DIAG.emit("pushup", "transition", previous=self.current_stage, stage=current_stage,
+                              left_angle=left_arm_angle, right_angle=right_arm_angle, went_down=self.went_down)
             
             # Enhanced rep counting logic:
             # 1. If going to DOWN position, mark that we've reached down
             if current_stage == "down":
                 self.went_down = True
-                logger.info("Went to DOWN position - marking for potential rep")
                 
             # 2. Count rep when transitioning from down to up (either directly or through middle)
             if current_stage == "up" and self.went_down:
                 # Count a rep if we were previously down or in middle after being down
                 if self.current_stage in ["down", "middle"]:
-                self.counter += 1
-                    logger.info(f"Push-up rep counted! Total: {self.counter}, Transition: {self.current_stage} -> {current_stage}")
+                    self.counter += 1
+                    if DIAG.on("pushup"):
+                        DIAG.emit("pushup", "rep_counted", count=self.counter, previous=self.current_stage, stage=current_stage)
                     self.went_down = False  # Reset for next rep
-                
-            # Additional logging for state changes
-            elif self.current_stage != current_stage:
-                logger.info(f"Stage changed but NO rep counted: {self.current_stage} -> {current_stage}")
             
             # Update stage
             self.previous_stage = self.current_stage
@@ -262,7 +235,7 @@ class PushupAnalyzer:
             
             return {
                 "success": True,
-                "result": analysis.to_dict()
+                "result": analysis.to_dict(self.compact_errors)
             }
             
         except Exception as e:
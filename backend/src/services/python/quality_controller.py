@@ -0,0 +1,208 @@
+import sys
+import time
+import queue
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger('QualityController')
+
+# Analysis quality tiers, most to least expensive:
+#   full      - ML models (with cascade escalation when enabled) plus geometry
+#   cheap     - only the cheapest model of the analyzer, never escalated
+#   geometric - no ML at all; stages and errors from joint angles only
+QUALITY_TIERS = ("full", "cheap", "geometric")
+
+# Tiers each analyzer implements. The others are geometric already and
+# always run at "full".
+ANALYZER_TIERS = {
+    "squat": ("full", "geometric"),
+    "bicep": ("full", "cheap", "geometric"),
+    "lunge": ("full", "cheap", "geometric"),
+    "plank": ("full", "cheap", "geometric"),
+}
+
+
+def supported_tiers(exercise_type: str) -> Tuple[str, ...]:
+    return ANALYZER_TIERS.get(exercise_type, ("full",))
+
+
+class InputQueue:
+    """
+    Request lines read from stdin by a daemon thread, so the server loop can
+    see how many requests are waiting and how long each one waited. End of
+    input is delivered as "EXIT".
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdin
+        self.lines = queue.Queue()
+        self.thread = threading.Thread(target=self._read, name="InputQueue", daemon=True)
+        self.thread.start()
+
+    def _read(self) -> None:
+        try:
+            for line in self.stream:
+                self.lines.put((line.strip(), time.perf_counter()))
+        except Exception as e:
+            logger.error(f"Error reading input: {str(e)}")
+        self.lines.put(("EXIT", time.perf_counter()))
+
+    def get(self) -> Tuple[str, float]:
+        """Next line and the perf_counter time it was read"""
+        return self.lines.get()
+
+    def depth(self) -> int:
+        return self.lines.qsize()
+
+
+class QualityController:
+    """
+    Steps sessions down quality tiers while the server is overloaded and
+    back up once it has recovered.
+
+    Load is the request queue depth and the EMA of request latency (time
+    waiting in the queue plus analysis time). The server is overloaded when
+    either reaches its high mark and healthy when both are at or below their
+    low marks; in between nothing changes. While overloaded, one session
+    moves one tier down every `step_down_interval` seconds, starting with
+    the session whose requests cost the most. After `step_up_hold` healthy
+    seconds, the most degraded session moves one tier up, and the hold
+    starts over, so recovery is slower than shedding. A tier forced by the
+    quality command wins over the controller for its session.
+
+    Loading an analyzer blocks the request loop for a while; warm_up()
+    (called by the server after each load) makes observe() ignore requests
+    until the backlog that built up behind the load has drained to the low
+    depth mark, so a cold start does not shed its first sessions.
+    """
+
+    def __init__(self, high_depth: int = 8, low_depth: int = 1, high_latency_ms: float = 150.0,
+                 low_latency_ms: float = 50.0, step_down_interval: float = 0.5, step_up_hold: float = 3.0,
+                 smoothing: float = 0.2, max_sessions: int = 1024):
+        self.enabled = True
+        self.high_depth = high_depth
+        self.low_depth = low_depth
+        self.high_latency_ms = high_latency_ms
+        self.low_latency_ms = low_latency_ms
+        self.step_down_interval = step_down_interval
+        self.step_up_hold = step_up_hold
+        self.smoothing = smoothing
+        self.max_sessions = max_sessions
+        self.reset()
+
+    def reset(self) -> None:
+        # key -> {"exerciseType", "level" (index into its supported tiers), "costMs", "forced"}
+        self.sessions = {}
+        self.latency_ms = 0.0
+        self.queue_depth = 0
+        self.last_step = 0.0
+        self.healthy_since = None
+        self.steps_down = 0
+        self.steps_up = 0
+        self.warming_up = False
+        self.warmups = 0
+
+    def configure(self, enabled: Optional[bool] = None, **thresholds: Any) -> None:
+        if enabled is not None:
+            self.enabled = bool(enabled)
+            if not self.enabled:
+                for session in self.sessions.values():
+                    session["level"] = 0
+        for name, value in thresholds.items():
+            if value is not None:
+                setattr(self, name, type(getattr(self, name))(value))
+
+    def _session(self, key: str, exercise_type: str) -> Dict[str, Any]:
+        session = self.sessions.get(key)
+        if session is None or session["exerciseType"] != exercise_type:
+            session = {"exerciseType": exercise_type, "level": 0, "costMs": 0.0, "forced": None}
+            self.sessions.pop(key, None)
+            self.sessions[key] = session
+            while len(self.sessions) > self.max_sessions:
+                del self.sessions[next(iter(self.sessions))]
+        return session
+
+    def tier(self, key: str, exercise_type: str) -> str:
+        """Tier to analyze the session's next frame at"""
+        session = self._session(key, exercise_type)
+        tiers = supported_tiers(exercise_type)
+        if session["forced"] is not None:
+            return session["forced"] if session["forced"] in tiers else tiers[-1]
+        return tiers[session["level"]] if self.enabled else "full"
+
+    def force(self, key: str, exercise_type: str, tier: Optional[str]) -> None:
+        """Pin a session to a tier (None hands it back to the controller)"""
+        if tier is not None and tier not in QUALITY_TIERS:
+            raise ValueError(f"Unknown quality tier: {tier}")
+        self._session(key, exercise_type)["forced"] = tier
+
+    def observe(self, key: str, exercise_type: str, wait_ms: float, analysis_ms: float, queue_depth: int,
+                now: Optional[float] = None) -> None:
+        """Record one analyzed request and adjust the tiers"""
+        if self.warming_up:
+            if queue_depth <= self.low_depth:
+                self.warming_up = False
+            return
+        now = now if now is not None else time.monotonic()
+        session = self._session(key, exercise_type)
+        session["costMs"] += self.smoothing * (analysis_ms - session["costMs"])
+        self.latency_ms += self.smoothing * (wait_ms + analysis_ms - self.latency_ms)
+        self.queue_depth = queue_depth
+        if self.enabled:
+            self._adjust(now)
+
+    def warm_up(self) -> None:
+        """Ignore requests until the queue is back at the low depth mark (an analyzer was just loaded)"""
+        self.warming_up = True
+        self.warmups += 1
+
+    def _adjust(self, now: float) -> None:
+        if self.queue_depth >= self.high_depth or self.latency_ms >= self.high_latency_ms:
+            self.healthy_since = None
+            if now - self.last_step >= self.step_down_interval:
+                candidates = [
+                    session for session in self.sessions.values()
+                    if session["forced"] is None and session["level"] < len(supported_tiers(session["exerciseType"])) - 1
+                ]
+                if candidates:
+                    session = max(candidates, key=lambda s: s["costMs"])
+                    session["level"] += 1
+                    self.steps_down += 1
+                    self.last_step = now
+                    logger.warning(f"Overloaded (queue {self.queue_depth}, latency {self.latency_ms:.1f} ms): "
+                                   f"{session['exerciseType']} session down to "
+                                   f"{supported_tiers(session['exerciseType'])[session['level']]}")
+        elif self.queue_depth <= self.low_depth and self.latency_ms <= self.low_latency_ms:
+            if self.healthy_since is None:
+                self.healthy_since = now
+            elif now - self.healthy_since >= self.step_up_hold:
+                degraded = [session for session in self.sessions.values() if session["level"] > 0]
+                if degraded:
+                    session = max(degraded, key=lambda s: s["level"])
+                    session["level"] -= 1
+                    self.steps_up += 1
+                self.healthy_since = now
+        else:
+            self.healthy_since = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        tiers = {}
+        for key, session in self.sessions.items():
+            tier = self.tier(key, session["exerciseType"])
+            tiers[tier] = tiers.get(tier, 0) + 1
+        return {
+            "enabled": self.enabled,
+            "queueDepth": self.queue_depth,
+            "latencyMs": round(self.latency_ms, 2),
+            "highDepth": self.high_depth,
+            "lowDepth": self.low_depth,
+            "highLatencyMs": self.high_latency_ms,
+            "lowLatencyMs": self.low_latency_ms,
+            "stepsDown": self.steps_down,
+            "stepsUp": self.steps_up,
+            "warmingUp": self.warming_up,
+            "warmups": self.warmups,
+            "sessions": len(self.sessions),
+            "sessionsByTier": tiers
+        }
@@ -0,0 +1,257 @@
+"""
+Batch rep segmentation for stored sessions.
+
+    python rep_segmentation.py session.npz --exercise bicep --output reps.csv
+
+Instead of replaying an analyzer's per-frame state machine, the exercise's
+driving joint angle is computed for all frames at once, the frames are
+split into rest / working states with hysteresis thresholds, and each
+rest -> working -> rest cycle becomes one rep. For each rep this reports
+range of motion, eccentric / concentric tempo and time under tension. The
+live state machine's count for the same input is reported next to it so
+the two can be compared.
+"""
+import sys
+import json
+import logging
+import argparse
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from scipy.signal import find_peaks
+
+from kernels import KERNELS
+from squat_analyzer import ANGLE_THRESHOLDS as SQUAT_ANGLE_THRESHOLDS
+
+logger = logging.getLogger('RepSegmentation')
+
+# MediaPipe pose landmark indices
+LEFT_SHOULDER, RIGHT_SHOULDER = 11, 12
+LEFT_ELBOW, RIGHT_ELBOW = 13, 14
+LEFT_WRIST, RIGHT_WRIST = 15, 16
+LEFT_HIP, RIGHT_HIP = 23, 24
+LEFT_KNEE, RIGHT_KNEE = 25, 26
+LEFT_ANKLE, RIGHT_ANKLE = 27, 28
+
+VISIBILITY = 3
+
+
+def joint_angles(frames: np.ndarray, a: int, b: int, c: int) -> np.ndarray:
+    """
+    Angle a-b-c at landmark b in degrees (0-180) for every frame, from x/y
+    only, as the analyzers' calculate_angle functions compute it
+    """
+    return KERNELS.joint_angles(frames[:, :, :2].astype(np.float64), a, b, c)
+
+
+def visible(frames: np.ndarray, indices: List[int], threshold: float) -> np.ndarray:
+    """Frames in which all the given landmarks are more visible than the threshold"""
+    return np.all(frames[:, indices, VISIBILITY] > threshold, axis=1)
+
+
+def squat_series(frames: np.ndarray) -> Dict[str, np.ndarray]:
+    """Mean knee angle, where SquatAnalyzer.determine_stage would see all its landmarks"""
+    required = [LEFT_HIP, RIGHT_HIP, LEFT_KNEE, RIGHT_KNEE, LEFT_ANKLE, RIGHT_ANKLE,
+                LEFT_SHOULDER, RIGHT_SHOULDER]
+    knee = (joint_angles(frames, LEFT_HIP, LEFT_KNEE, LEFT_ANKLE)
+            + joint_angles(frames, RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE)) / 2
+    return {"knee": np.where(np.all(frames[:, required, VISIBILITY] >= 0.5, axis=1), knee, np.nan)}
+
+
+def bicep_series(frames: np.ndarray) -> Dict[str, np.ndarray]:
+    """Curl angle of each arm, as BicepPoseAnalysis computes it"""
+    series = {}
+    for side, (shoulder, elbow, wrist) in (("left", (LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST)),
+                                           ("right", (RIGHT_SHOULDER, RIGHT_ELBOW, RIGHT_WRIST))):
+        curl = joint_angles(frames, shoulder, elbow, wrist)
+        series[side] = np.where(visible(frames, [shoulder, elbow, wrist], 0.65), curl, np.nan)
+    return series
+
+
+def situp_series(frames: np.ndarray) -> Dict[str, np.ndarray]:
+    """Torso angle on the side with the better visible knee, as SitupPoseAnalysis picks it"""
+    left = joint_angles(frames, LEFT_SHOULDER, LEFT_HIP, LEFT_KNEE)
+    right = joint_angles(frames, RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE)
+    use_right = frames[:, RIGHT_KNEE, VISIBILITY] > frames[:, LEFT_KNEE, VISIBILITY]
+    is_visible = (visible(frames, [LEFT_SHOULDER, LEFT_HIP, LEFT_KNEE], 0.3)
+                  | visible(frames, [RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE], 0.3))
+    return {"torso": np.where(is_visible, np.where(use_right, right, left), np.nan)}
+
+
+# Driving angle and thresholds per exercise. The angle is high at rest (standing,
+# arm extended, lying down) and drops while working; `rest` and `work` are the
+# hysteresis thresholds, taken from the analyzers where they have one.
+SEGMENTATION_SPECS = {
+    # SquatAnalyzer ANGLE_THRESHOLDS up / down (its geometric stage rule)
+    "squat": {"series": squat_series, "rest": float(SQUAT_ANGLE_THRESHOLDS["up"]),
+              "work": float(SQUAT_ANGLE_THRESHOLDS["down"])},
+    # BicepAnalyzer stage_down_threshold / stage_up_threshold
+    "bicep": {"series": bicep_series, "rest": 120.0, "work": 100.0},
+    # SitupPoseAnalysis DOWN_ANGLE_THRESHOLD / UP_ANGLE_THRESHOLD
+    "situp": {"series": situp_series, "rest": 120.0, "work": 90.0},
+}
+
+
+def _last_true_index(mask: np.ndarray) -> np.ndarray:
+    """For every frame, index of the latest frame up to it where mask was set (-1 if none)"""
+    return np.maximum.accumulate(np.where(mask, np.arange(len(mask)), -1))
+
+
+def hysteresis_state(angle: np.ndarray, rest_threshold: float, work_threshold: float) -> np.ndarray:
+    """
+    Working state per frame: set once the angle drops below work_threshold,
+    cleared once it rises above rest_threshold, held in between and on
+    frames without an angle (NaN). Sessions start at rest.
+    """
+    return KERNELS.hysteresis_state(np.asarray(angle, dtype=np.float64), rest_threshold, work_threshold)
+
+
+def segment_reps(angle: np.ndarray, timestamps: np.ndarray, rest_threshold: float,
+                 work_threshold: float, prominence: float = 10.0) -> List[Dict[str, Any]]:
+    """
+    Split one angle series into reps.
+
+    A rep starts on the first frame after the angle last left the rest zone
+    (> rest_threshold) and ends on the frame it returns there; a rep still
+    in progress at the end of the session is returned with complete=False.
+    The bottom of the rep is its deepest valley with at least `prominence`
+    degrees (falling back to the minimum if the rep has no such valley);
+    range of motion runs from the highest angle since the previous rep.
+    """
+    if len(angle) == 0:
+        return []
+
+    working = hysteresis_state(angle, rest_threshold, work_threshold)
+    transitions = np.diff(working.astype(np.int8), prepend=0, append=0)
+    entries = np.flatnonzero(transitions == 1)
+    exits = np.flatnonzero(transitions == -1)
+
+    with np.errstate(invalid="ignore"):
+        last_rest = _last_true_index(angle > rest_threshold)
+    starts = last_rest[entries] + 1
+
+    filled = np.where(np.isnan(angle), np.nanmax(angle) if np.any(~np.isnan(angle)) else 0.0, angle)
+    valleys, _ = find_peaks(-filled, prominence=prominence)
+
+    reps = []
+    previous_end = 0
+    for start, exit_index in zip(starts, exits):
+        complete = exit_index < len(angle)
+        end = exit_index if complete else len(angle) - 1
+
+        window = angle[start:end + 1]
+        in_rep = valleys[(valleys >= start) & (valleys <= end)]
+        bottom = in_rep[np.argmin(angle[in_rep])] if len(in_rep) else start + int(np.nanargmin(window))
+
+        # Range of motion is measured from the top of the preceding rest phase
+        top = np.nanmax(angle[previous_end:end + 1])
+        previous_end = end
+        reps.append({
+            "startFrame": int(start),
+            "bottomFrame": int(bottom),
+            "endFrame": int(end),
+            "complete": bool(complete),
+            "startTime": float(timestamps[start]),
+            "rangeOfMotion": round(float(top - angle[bottom]), 2),
+            "minAngle": round(float(angle[bottom]), 2),
+            "eccentricSeconds": round(float(timestamps[bottom] - timestamps[start]), 3),
+            "concentricSeconds": round(float(timestamps[end] - timestamps[bottom]), 3),
+            "timeUnderTension": round(float(timestamps[end] - timestamps[start]), 3)
+        })
+    return reps
+
+
+def live_rep_count(exercise_type: str, frames: np.ndarray, timestamps: np.ndarray) -> Optional[int]:
+    """Final repCount of the exercise's analyzer replayed over the same frames"""
+    from analyze_session import analyze_frames, get_analyzer
+
+    rows = analyze_frames(get_analyzer(exercise_type), frames, timestamps)
+    counts = [row["repCount"] for row in rows if row["success"] and row.get("repCount") is not None]
+    return int(counts[-1]) if counts else None
+
+
+def segment_session(exercise_type: str, frames: np.ndarray, timestamps: np.ndarray,
+                    rest_threshold: Optional[float] = None, work_threshold: Optional[float] = None,
+                    prominence: float = 10.0, compare_live: bool = True) -> Dict[str, Any]:
+    """
+    Segment every driving-angle series of a session (one per arm for
+    bicep curls) and compare the rep count with the live state machine's
+    """
+    if exercise_type not in SEGMENTATION_SPECS:
+        raise ValueError(f"No rep segmentation for exercise type: {exercise_type}")
+
+    spec = SEGMENTATION_SPECS[exercise_type]
+    rest_threshold = spec["rest"] if rest_threshold is None else rest_threshold
+    work_threshold = spec["work"] if work_threshold is None else work_threshold
+    if work_threshold >= rest_threshold:
+        raise ValueError("work threshold must be below the rest threshold")
+
+    series = spec["series"](np.asarray(frames))
+    reps = []
+    counts = {}
+    for name, angle in series.items():
+        series_reps = segment_reps(angle, timestamps, rest_threshold, work_threshold, prominence)
+        counts[name] = sum(rep["complete"] for rep in series_reps)
+        reps.extend(dict(rep, series=name) for rep in series_reps)
+
+    # Like BicepAnalyzer, a session counts the reps of its busiest side
+    rep_count = max(counts.values()) if counts else 0
+    live_count = live_rep_count(exercise_type, frames, timestamps) if compare_live else None
+
+    return {
+        "exerciseType": exercise_type,
+        "frames": int(len(frames)),
+        "restThreshold": rest_threshold,
+        "workThreshold": work_threshold,
+        "repCount": rep_count,
+        "seriesRepCounts": counts,
+        "liveRepCount": live_count,
+        "divergence": None if live_count is None else rep_count - live_count,
+        "reps": reps
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from analyze_session import load_session
+
+    parser = argparse.ArgumentParser(description="Segment reps of a recorded session from joint angles")
+    parser.add_argument("session", help=".jsonl, .npy, .npz or .okrec session file")
+    parser.add_argument("--exercise", choices=list(SEGMENTATION_SPECS),
+                        help="Exercise type (default: taken from the recording)")
+    parser.add_argument("--fps", type=float, default=30.0,
+                        help="Frame rate assumed for frames without a timestamp")
+    parser.add_argument("--rest-threshold", type=float, help="Angle above which the body is at rest")
+    parser.add_argument("--work-threshold", type=float, help="Angle below which a rep is under way")
+    parser.add_argument("--prominence", type=float, default=10.0,
+                        help="Minimum valley prominence (degrees) for the bottom of a rep")
+    parser.add_argument("--no-live", action="store_true", help="Skip the live state machine comparison")
+    parser.add_argument("--output", help="Write per-rep rows to this .csv or .jsonl file")
+    args = parser.parse_args(argv)
+
+    kernels = KERNELS.select()
+    logger.info(f"Kernels: {kernels['backend']} ({kernels['reason']}, {kernels['compileSeconds']}s)")
+
+    # The analyzers log every frame, which would dominate the live comparison
+    logging.disable(logging.WARNING)
+
+    session = load_session(Path(args.session), args.exercise, args.fps)
+    summary = segment_session(
+        session["exerciseType"], session["frames"], session["timestamps"],
+        args.rest_threshold, args.work_threshold, args.prominence, not args.no_live
+    )
+
+    if args.output:
+        reps = pd.DataFrame(summary["reps"])
+        if args.output.endswith(".jsonl"):
+            reps.to_json(args.output, orient="records", lines=True)
+        else:
+            reps.to_csv(args.output, index=False)
+
+    print(json.dumps({key: value for key, value in summary.items() if key != "reps"}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
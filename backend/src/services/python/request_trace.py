@@ -0,0 +1,122 @@
+import time
+import random
+from typing import Any, Dict, Optional
+
+from latency_histogram import LatencyHistogram
+
+# Stages in pipeline order, for reporting
+STAGES = (
+    "decode",
+    "validation",
+    "feature_extraction",
+    "scaling",
+    "inference",
+    "geometry",
+    "state_update",
+    "analysis",
+    "record",
+    "encode",
+)
+
+
+class RequestTrace:
+    """
+    Per-request stage timings in nanoseconds.
+
+    Timing is lap-style: mark(stage) charges the time since the previous
+    mark (or since the trace was created) to `stage`, so the server and the
+    analyzer can both mark the stages they own without passing start times
+    around. A stage marked more than once accumulates. Whatever an analyzer
+    does not mark itself ends up in the server's "analysis" mark.
+
+    note() records decisions taken on the way (model used, cache hit/miss,
+    motion gate skip/infer/refresh).
+    """
+
+    __slots__ = ("stages", "notes", "start", "last")
+
+    def __init__(self, start: Optional[int] = None):
+        self.stages = {}
+        self.notes = {}
+        self.start = self.last = start if start is not None else time.perf_counter_ns()
+
+    def mark(self, stage: str) -> None:
+        now = time.perf_counter_ns()
+        self.stages[stage] = self.stages.get(stage, 0) + now - self.last
+        self.last = now
+
+    def note(self, key: str, value: Any) -> None:
+        self.notes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "stagesNs": self.stages,
+            "totalNs": self.last - self.start,
+            **self.notes
+        }
+
+
+class TraceStats:
+    """
+    Sampling decision and per-exercise, per-stage latency histograms of the
+    traced requests
+    """
+
+    def __init__(self, sample_rate: float = 0.0, include_in_response: bool = True):
+        self.sample_rate = sample_rate
+        self.include_in_response = include_in_response
+        self.reset()
+
+    def reset(self) -> None:
+        self.histograms = {}
+        self.decisions = {}
+        self.traced = 0
+
+    def configure(self, sample_rate: Optional[float] = None, include_in_response: Optional[bool] = None) -> None:
+        if sample_rate is not None:
+            if not 0.0 <= float(sample_rate) <= 1.0:
+                raise ValueError("sampleRate must be between 0 and 1")
+            self.sample_rate = float(sample_rate)
+        if include_in_response is not None:
+            self.include_in_response = bool(include_in_response)
+
+    def sample(self, requested: bool = False, start: Optional[int] = None) -> Optional[RequestTrace]:
+        """
+        A new trace (timed from `start`, a perf_counter_ns() value) if this
+        request is sampled or asks for one, else None
+        """
+        if requested or (self.sample_rate > 0.0 and random.random() < self.sample_rate):
+            return RequestTrace(start)
+        return None
+
+    def record(self, exercise_type: str, trace: RequestTrace) -> None:
+        """Add a finished trace to the exercise's histograms"""
+        self.traced += 1
+        histograms = self.histograms.setdefault(exercise_type, {})
+        for stage, duration in trace.stages.items():
+            histograms.setdefault(stage, LatencyHistogram()).record(duration)
+        histograms.setdefault("total", LatencyHistogram()).record(trace.last - trace.start)
+
+        decisions = self.decisions.setdefault(exercise_type, {})
+        for key, value in trace.notes.items():
+            counts = decisions.setdefault(key, {})
+            counts[str(value)] = counts.get(str(value), 0) + 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Per-exercise stage latency percentiles (ms) and decision counts"""
+        order = {stage: i for i, stage in enumerate(STAGES + ("total",))}
+        exercises = {}
+        for exercise_type, histograms in self.histograms.items():
+            exercises[exercise_type] = {
+                "stages": {
+                    stage: histograms[stage].get_stats()
+                    for stage in sorted(histograms, key=lambda stage: order.get(stage, len(order)))
+                },
+                "decisions": self.decisions.get(exercise_type, {})
+            }
+        return {
+            "sampleRate": self.sample_rate,
+            "includeInResponse": self.include_in_response,
+            "traced": self.traced,
+            "exercises": exercises
+        }
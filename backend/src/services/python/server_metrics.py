@@ -0,0 +1,296 @@
+import os
+import sys
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+try:
+    import fcntl
+    import termios
+    import resource
+except ImportError:  # Windows: no pipe backlog or RSS readings
+    fcntl = termios = resource = None
+
+from latency_histogram import LatencyHistogram
+
+logger = logging.getLogger('ServerMetrics')
+
+PREFIX = "okgym_analyzer"
+
+# Prometheus histogram bucket bounds for request latency, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _label_value(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{key}="{_label_value(value)}"' for key, value in labels.items()) + "}"
+
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size of this process (Linux), or None"""
+    if resource is None:
+        return None
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def pending_input_bytes(stream=None) -> Optional[int]:
+    """Bytes written to the input pipe but not read yet, or None if unknown"""
+    stream = stream or sys.stdin
+    if fcntl is None:
+        return None
+    try:
+        buffer = bytearray(4)
+        fcntl.ioctl(stream.fileno(), termios.FIONREAD, buffer)
+        return int.from_bytes(buffer, sys.byteorder)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class ExerciseMetrics:
+    """Counters and the request latency histogram of one exercise type"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = {}
+        self.timeouts = 0
+        self.dropped_frames = 0
+        self.model_load_seconds = None
+        self.latency = LatencyHistogram()
+        # session id -> (last frame id, last seen monotonic time)
+        self.sessions = {}
+
+
+class ServerMetrics:
+    """
+    Per-exercise request counters, errors by `error.type`, timeouts (requests
+    the server took longer than `timeout_seconds` to answer, i.e. that the
+    Node client will already have given up on), dropped frames (gaps in a
+    session's frame ids), model load time, active sessions (seen within
+    `session_idle_seconds`) and the request latency histogram (queue wait
+    plus processing), plus
+    process-wide queue depth and RSS.
+
+    The queue depth is the number of lines read but not handled yet plus
+    an estimate of those still in the stdin pipe (its pending bytes over
+    the average request size). get_stats() is the `metrics` command
+    answer; to_prometheus() renders the same data in the Prometheus text
+    format, which start_textfile() writes periodically for the node
+    exporter's textfile collector.
+    """
+
+    def __init__(self, timeout_seconds: float = 5.0, session_idle_seconds: float = 30.0):
+        self.timeout_seconds = timeout_seconds
+        self.session_idle_seconds = session_idle_seconds
+        self.lock = threading.Lock()
+        self.textfile = None
+        self.textfile_interval = 15.0
+        self.textfile_thread = None
+        self.textfile_stop = threading.Event()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.exercises = {}
+            self.started = time.time()
+            self.input_bytes = 0
+            self.input_lines = 0
+            self.queue_depth = 0
+            self.max_queue_depth = 0
+
+    def _exercise(self, exercise_type: str) -> ExerciseMetrics:
+        metrics = self.exercises.get(exercise_type)
+        if metrics is None:
+            metrics = self.exercises[exercise_type] = ExerciseMetrics()
+        return metrics
+
+    def record_input(self, line_bytes: int, queued_lines: int = 0) -> None:
+        """Count a received request line and sample the input backlog"""
+        pending = pending_input_bytes()
+        with self.lock:
+            self.input_bytes += line_bytes
+            self.input_lines += 1
+            if pending is not None:
+                in_pipe = round(pending * self.input_lines / self.input_bytes) if self.input_bytes else 0
+                self.queue_depth = queued_lines + in_pipe
+                self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def record_model_load(self, exercise_type: str, seconds: float) -> None:
+        with self.lock:
+            self._exercise(exercise_type).model_load_seconds = seconds
+
+    def record_request(self, exercise_type: str, duration_ns: int, response: Dict[str, Any],
+                       session_id: Optional[str] = None, frame_id: Any = None, wait_ns: int = 0) -> None:
+        """
+        Count one answered request and its outcome. `wait_ns` is the time
+        the request spent in the input queue before `duration_ns` of
+        processing; the latency histogram and the timeout check use both.
+        """
+        now = time.monotonic()
+        total_ns = wait_ns + duration_ns
+        with self.lock:
+            metrics = self._exercise(exercise_type)
+            metrics.requests += 1
+            metrics.latency.record(total_ns)
+            if total_ns > self.timeout_seconds * 1e9:
+                metrics.timeouts += 1
+
+            if not response.get("success", False):
+                error_type = (response.get("error") or {}).get("type", "UNKNOWN")
+                metrics.errors[error_type] = metrics.errors.get(error_type, 0) + 1
+
+            if session_id is not None:
+                last_frame_id, _ = metrics.sessions.get(session_id, (None, now))
+                if isinstance(frame_id, int) and not isinstance(frame_id, bool):
+                    if isinstance(last_frame_id, int) and frame_id > last_frame_id + 1:
+                        metrics.dropped_frames += frame_id - last_frame_id - 1
+                    if last_frame_id is None or frame_id > last_frame_id:
+                        last_frame_id = frame_id
+                metrics.sessions[session_id] = (last_frame_id, now)
+
+    def record_error(self, exercise_type: str, error_type: str) -> None:
+        """Count a request that failed before it reached an analyzer"""
+        with self.lock:
+            metrics = self._exercise(exercise_type)
+            metrics.requests += 1
+            metrics.errors[error_type] = metrics.errors.get(error_type, 0) + 1
+
+    def _active_sessions(self, metrics: ExerciseMetrics, now: float) -> int:
+        """Sessions seen recently; forgets idle ones"""
+        idle = [session for session, (_, seen) in metrics.sessions.items() if now - seen > self.session_idle_seconds]
+        for session in idle:
+            del metrics.sessions[session]
+        return len(metrics.sessions)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Snapshot of every metric, latencies in milliseconds"""
+        now = time.monotonic()
+        with self.lock:
+            exercises = {
+                exercise_type: {
+                    "requests": metrics.requests,
+                    "errors": dict(metrics.errors),
+                    "timeouts": metrics.timeouts,
+                    "droppedFrames": metrics.dropped_frames,
+                    "activeSessions": self._active_sessions(metrics, now),
+                    "modelLoadSeconds": round(metrics.model_load_seconds, 3) if metrics.model_load_seconds is not None else None,
+                    "latencyMs": metrics.latency.get_stats()
+                }
+                for exercise_type, metrics in self.exercises.items()
+            }
+            rss = rss_bytes()
+            return {
+                "uptimeSeconds": round(time.time() - self.started, 1),
+                "queueDepth": self.queue_depth,
+                "maxQueueDepth": self.max_queue_depth,
+                "rssMb": round(rss / (1024 * 1024), 1) if rss is not None else None,
+                "textfile": str(self.textfile) if self.textfile is not None else None,
+                "exercises": exercises
+            }
+
+    def to_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        now = time.monotonic()
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+        with self.lock:
+            exercises = sorted(self.exercises.items())
+
+            metric("requests_total", "counter", "Analysis requests answered")
+            for exercise_type, metrics in exercises:
+                lines.append(f"{PREFIX}_requests_total{_labels(exercise=exercise_type)} {metrics.requests}")
+
+            metric("errors_total", "counter", "Failed requests by error type")
+            for exercise_type, metrics in exercises:
+                for error_type, count in sorted(metrics.errors.items()):
+                    lines.append(f"{PREFIX}_errors_total{_labels(exercise=exercise_type, type=error_type)} {count}")
+
+            metric("timeouts_total", "counter", f"Requests that took longer than {self.timeout_seconds}s")
+            for exercise_type, metrics in exercises:
+                lines.append(f"{PREFIX}_timeouts_total{_labels(exercise=exercise_type)} {metrics.timeouts}")
+
+            metric("dropped_frames_total", "counter", "Frame ids skipped within a session")
+            for exercise_type, metrics in exercises:
+                lines.append(f"{PREFIX}_dropped_frames_total{_labels(exercise=exercise_type)} {metrics.dropped_frames}")
+
+            metric("active_sessions", "gauge", f"Sessions seen in the last {self.session_idle_seconds}s")
+            for exercise_type, metrics in exercises:
+                lines.append(f"{PREFIX}_active_sessions{_labels(exercise=exercise_type)} {self._active_sessions(metrics, now)}")
+
+            metric("model_load_seconds", "gauge", "Time taken to load the exercise analyzer")
+            for exercise_type, metrics in exercises:
+                if metrics.model_load_seconds is not None:
+                    lines.append(f"{PREFIX}_model_load_seconds{_labels(exercise=exercise_type)} {metrics.model_load_seconds:.6f}")
+
+            metric("request_duration_seconds", "histogram", "Request time from receipt to answer, queue wait included")
+            for exercise_type, metrics in exercises:
+                bounds = [int(bound * 1e9) for bound in LATENCY_BUCKETS]
+                for bound, count in metrics.latency.cumulative_buckets(bounds):
+                    labels = _labels(exercise=exercise_type, le=f"{bound / 1e9:g}")
+                    lines.append(f"{PREFIX}_request_duration_seconds_bucket{labels} {count}")
+                lines.append(f"{PREFIX}_request_duration_seconds_bucket{_labels(exercise=exercise_type, le='+Inf')} {metrics.latency.count}")
+                lines.append(f"{PREFIX}_request_duration_seconds_sum{_labels(exercise=exercise_type)} {metrics.latency.total / 1e9:.6f}")
+                lines.append(f"{PREFIX}_request_duration_seconds_count{_labels(exercise=exercise_type)} {metrics.latency.count}")
+
+            metric("queue_depth", "gauge", "Estimated requests waiting on stdin")
+            lines.append(f"{PREFIX}_queue_depth {self.queue_depth}")
+
+        rss = rss_bytes()
+        if rss is not None:
+            metric("resident_memory_bytes", "gauge", "Resident set size of the analyzer process")
+            lines.append(f"{PREFIX}_resident_memory_bytes {rss}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self) -> None:
+        """Atomically replace the textfile with the current metrics"""
+        if self.textfile is None:
+            return
+        temporary = self.textfile.with_name(self.textfile.name + f".{os.getpid()}.tmp")
+        temporary.write_text(self.to_prometheus())
+        os.replace(temporary, self.textfile)
+
+    def _textfile_loop(self) -> None:
+        while not self.textfile_stop.wait(self.textfile_interval):
+            try:
+                self.write_textfile()
+            except OSError as e:
+                logger.error(f"Error writing metrics textfile: {str(e)}")
+
+    def start_textfile(self, path: str, interval: float = 15.0) -> None:
+        """Write the metrics to `path` (a *.prom file) every `interval` seconds"""
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self.stop_textfile()
+        self.textfile = Path(path)
+        self.textfile_interval = float(interval)
+        self.textfile.parent.mkdir(parents=True, exist_ok=True)
+        self.write_textfile()
+
+        self.textfile_stop = threading.Event()
+        self.textfile_thread = threading.Thread(target=self._textfile_loop, name="metrics-textfile", daemon=True)
+        self.textfile_thread.start()
+
+    def stop_textfile(self) -> None:
+        """Stop the periodic writes, leaving a last up-to-date file behind"""
+        if self.textfile_thread is None:
+            return
+        self.textfile_stop.set()
+        self.textfile_thread.join(timeout=5)
+        self.textfile_thread = None
+        try:
+            self.write_textfile()
+        except OSError as e:
+            logger.error(f"Error writing metrics textfile: {str(e)}")
+        self.textfile = None
@@ -0,0 +1,198 @@
+import math
+import time
+import numbers
+import logging
+from typing import Any, Dict, Optional
+
+from error_codes import error_types
+
+logger = logging.getLogger('SessionAggregates')
+
+# Result metrics summarized per exercise (plank has no angles; the max of its
+# hold time is the longest correct hold)
+AGGREGATE_METRICS = {
+    "squat": ("kneeAngle", "hipAngle", "ankleAngle"),
+    "bicep": ("leftCurlAngle", "rightCurlAngle", "leftUpperArmAngle", "rightUpperArmAngle"),
+    "lunge": ("leftKneeAngle", "rightKneeAngle"),
+    "plank": ("holdTime",),
+    "situp": ("torsoAngle", "kneeAngle"),
+    "shoulder_press": ("leftArmAngle", "rightArmAngle"),
+    "bench_press": ("leftShoulderAngle", "rightShoulderAngle"),
+    "pushup": ("leftArmAngle", "rightArmAngle"),
+    "lateral_raise": ("leftArmAngle", "rightArmAngle"),
+}
+
+# Form scores are integers 0-100; the sketch counts them in buckets this wide
+FORM_SCORE_BUCKET = 5
+
+
+def metric_value(value: Any) -> Optional[float]:
+    """A result metric as a float, or None if it is missing or not a number"""
+    if isinstance(value, numbers.Real) and not isinstance(value, bool):
+        value = float(value)
+        return value if math.isfinite(value) else None
+    return None
+
+
+class RunningStats:
+    """Count, mean, variance (Welford), min and max of a stream of numbers"""
+
+    __slots__ = ("count", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.count == 0:
+            return {"count": 0}
+        variance = self.m2 / self.count
+        return {
+            "count": self.count,
+            "mean": round(self.mean, 2),
+            "variance": round(variance, 2),
+            "std": round(math.sqrt(variance), 2),
+            "min": round(self.min, 2),
+            "max": round(self.max, 2),
+            "range": round(self.max - self.min, 2)
+        }
+
+
+class SessionAggregate:
+    """
+    Running summary of one session's results, in constant memory.
+
+    Each summarized angle keeps Welford running statistics, whose min and
+    max give the range of motion. Errors are counted by type (frames
+    showing them), and the time between consecutive frames is credited to
+    the earlier frame's stage, with gaps capped at `max_frame_gap` seconds
+    so pauses in the stream do not count. The form score keeps running
+    statistics plus a fixed histogram from which quantiles are estimated.
+    """
+
+    def __init__(self, exercise_type: str, max_frame_gap: float = 1.0):
+        self.exercise_type = exercise_type
+        self.metric_names = AGGREGATE_METRICS.get(exercise_type, ())
+        self.max_frame_gap = max_frame_gap
+        self.metrics = {name: RunningStats() for name in self.metric_names}
+        self.form_score = RunningStats()
+        self.form_score_buckets = [0] * (100 // FORM_SCORE_BUCKET + 1)
+        self.error_counts = {}
+        self.stage_seconds = {}
+        self.stage_frames = {}
+        self.frames = 0
+        self.rep_count = 0
+        self.first_time = None
+        self.last_time = None
+        self.last_stage = None
+
+    def update(self, result: Dict[str, Any], timestamp: Optional[float] = None) -> None:
+        now = timestamp if timestamp is not None else time.time()
+        self.frames += 1
+
+        metrics = result.get("metrics") or {}
+        for name, stats in self.metrics.items():
+            value = metric_value(metrics.get(name))
+            if value is not None:
+                stats.add(value)
+
+        form_score = metric_value(result.get("formScore"))
+        if form_score is not None:
+            self.form_score.add(form_score)
+            bucket = int(min(max(form_score, 0), 100)) // FORM_SCORE_BUCKET
+            self.form_score_buckets[bucket] += 1
+
+        for error_type in error_types(self.exercise_type, result):
+            self.error_counts[error_type] = self.error_counts.get(error_type, 0) + 1
+
+        stage = result.get("stage")
+        self.stage_frames[stage] = self.stage_frames.get(stage, 0) + 1
+        if self.last_time is not None and now > self.last_time:
+            elapsed = min(now - self.last_time, self.max_frame_gap)
+            self.stage_seconds[self.last_stage] = self.stage_seconds.get(self.last_stage, 0.0) + elapsed
+        if self.first_time is None:
+            self.first_time = now
+        self.last_time = now
+        self.last_stage = stage
+
+        rep_count = result.get("repCount")
+        if isinstance(rep_count, int):
+            self.rep_count = rep_count
+
+    def form_score_quantile(self, q: float) -> Optional[int]:
+        """Lower bound of the histogram bucket holding the q quantile"""
+        total = sum(self.form_score_buckets)
+        if total == 0:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for bucket, count in enumerate(self.form_score_buckets):
+            seen += count
+            if seen > rank:
+                return bucket * FORM_SCORE_BUCKET
+        return 100
+
+    def summary(self) -> Dict[str, Any]:
+        form_score = self.form_score.to_dict()
+        form_score["histogram"] = {
+            str(bucket * FORM_SCORE_BUCKET): count for bucket, count in enumerate(self.form_score_buckets) if count
+        }
+        form_score["bucketWidth"] = FORM_SCORE_BUCKET
+        for name, q in (("p10", 0.1), ("p50", 0.5), ("p90", 0.9)):
+            form_score[name] = self.form_score_quantile(q)
+        return {
+            "exerciseType": self.exercise_type,
+            "frames": self.frames,
+            "durationSeconds": round(self.last_time - self.first_time, 3) if self.first_time is not None else 0.0,
+            "repCount": self.rep_count,
+            "metrics": {name: stats.to_dict() for name, stats in self.metrics.items()},
+            "formScore": form_score,
+            "errorCounts": dict(self.error_counts),
+            "stageSeconds": {str(stage): round(seconds, 3) for stage, seconds in self.stage_seconds.items()},
+            "stageFrames": {str(stage): count for stage, count in self.stage_frames.items()}
+        }
+
+
+class SessionAggregates:
+    """Aggregates by session id (by exercise type for requests without one); the oldest is dropped past `max_sessions`"""
+
+    def __init__(self, max_sessions: int = 1024):
+        self.max_sessions = max_sessions
+        self.sessions = {}
+
+    def update(self, key: str, exercise_type: str, result: Dict[str, Any], timestamp: Optional[float] = None) -> None:
+        aggregate = self.sessions.get(key)
+        if aggregate is None or aggregate.exercise_type != exercise_type:
+            aggregate = SessionAggregate(exercise_type)
+            self.sessions.pop(key, None)
+            self.sessions[key] = aggregate
+            while len(self.sessions) > self.max_sessions:
+                del self.sessions[next(iter(self.sessions))]
+        aggregate.update(result, timestamp)
+
+    def summary(self, key: str, reset: bool = False) -> Optional[Dict[str, Any]]:
+        """The session's summary, or None if it has no results; `reset` starts it over"""
+        aggregate = self.sessions.pop(key, None) if reset else self.sessions.get(key)
+        return aggregate.summary() if aggregate is not None else None
+
+    def clear(self) -> None:
+        self.sessions = {}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self.sessions),
+            "maxSessions": self.max_sessions
+        }
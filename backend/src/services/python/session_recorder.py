@@ -0,0 +1,241 @@
+import math
+import time
+import queue
+import struct
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator
+
+import numpy as np
+
+from error_codes import error_types
+
+logger = logging.getLogger('SessionRecorder')
+
+# File layout: FILE_HEADER, then records of
+#   uint32 body length | RECORD_HEADER | session, exercise, request id,
+#   stage, "|"-joined error types (utf-8) | landmarks as float32 (n, 4)
+MAGIC = b"OKREC\x00"
+VERSION = 1
+FILE_HEADER = struct.Struct("<6sH")
+RECORD_LENGTH = struct.Struct("<I")
+# received time, client timestamp, frame id, rep count, hold time, form score,
+# success, error count, number of landmarks, then the five string lengths
+RECORD_HEADER = struct.Struct("<ddqiffBBBBBBBH")
+LANDMARK_FIELDS = 4
+RECORDING_SUFFIX = ".okrec"
+
+
+def _encode(value: Any, limit: int = 255) -> bytes:
+    return str(value if value is not None else "").encode("utf-8")[:limit]
+
+
+def _as_int(value: Any, default: int = -1) -> int:
+    return int(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else default
+
+
+def _as_float(value: Any) -> float:
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else math.nan
+
+
+def pack_record(received_time: float, session_id: str, exercise_type: str, request_id: str,
+                frame: Dict[str, Any], response: Dict[str, Any]) -> bytes:
+    """One decoded frame and the key fields of its analysis result as a binary record"""
+    landmarks = frame["landmarks"]
+    values = np.array(
+        [[lm.get('x', 0.0), lm.get('y', 0.0), lm.get('z', 0.0), lm.get('visibility', 0.0)]
+         for lm in landmarks[:255]],
+        dtype=np.float32
+    ).reshape(-1, LANDMARK_FIELDS)
+
+    result = response.get("result") or {}
+    errors = error_types(exercise_type, result)
+    strings = [
+        _encode(session_id),
+        _encode(exercise_type),
+        _encode(request_id),
+        _encode(result.get("stage")),
+        _encode("|".join(sorted({str(error_type or "") for error_type in errors})), 65535)
+    ]
+
+    header = RECORD_HEADER.pack(
+        received_time,
+        _as_float(frame.get("timestamp")),
+        _as_int(frame.get("frameId")),
+        _as_int(result.get("repCount")),
+        _as_float(result.get("holdTime")),
+        _as_float(result.get("formScore")),
+        1 if response.get("success") else 0,
+        min(len(errors), 255),
+        len(values),
+        *[len(s) for s in strings]
+    )
+    body = b"".join([header] + strings + [values.tobytes()])
+    return RECORD_LENGTH.pack(len(body)) + body
+
+
+def read_recording(path: Path) -> Iterator[Dict[str, Any]]:
+    """Iterate over the records of a recording file"""
+    with open(path, "rb") as f:
+        magic, version = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a session recording")
+        if version != VERSION:
+            raise ValueError(f"Unsupported recording version {version} in {path}")
+
+        while True:
+            length_bytes = f.read(RECORD_LENGTH.size)
+            if len(length_bytes) < RECORD_LENGTH.size:
+                return
+            (length,) = RECORD_LENGTH.unpack(length_bytes)
+            body = f.read(length)
+            if len(body) < length:
+                # Truncated tail of a log that was not closed cleanly
+                logger.warning(f"Truncated record at the end of {path}")
+                return
+
+            (received_time, timestamp, frame_id, rep_count, hold_time, form_score,
+             success, error_count, num_landmarks, *string_lengths) = RECORD_HEADER.unpack_from(body)
+
+            offset = RECORD_HEADER.size
+            strings = []
+            for string_length in string_lengths:
+                strings.append(body[offset:offset + string_length].decode("utf-8"))
+                offset += string_length
+            session_id, exercise_type, request_id, stage, error_types = strings
+
+            landmarks = np.frombuffer(body, dtype=np.float32, count=num_landmarks * LANDMARK_FIELDS,
+                                      offset=offset).reshape(num_landmarks, LANDMARK_FIELDS)
+
+            yield {
+                "receivedTime": received_time,
+                "timestamp": None if math.isnan(timestamp) else timestamp,
+                "sessionId": session_id,
+                "exerciseType": exercise_type,
+                "requestId": request_id,
+                "frameId": None if frame_id < 0 else frame_id,
+                "landmarks": landmarks,
+                "success": bool(success),
+                "stage": stage or None,
+                "repCount": None if rep_count < 0 else rep_count,
+                "holdTime": None if math.isnan(hold_time) else hold_time,
+                "formScore": None if math.isnan(form_score) else form_score,
+                "errorCount": error_count,
+                "errorTypes": error_types.split("|") if error_types else []
+            }
+
+
+class SessionRecorder:
+    """
+    Append-only binary log of the frames the server analyzes.
+
+    record() only puts references onto a bounded queue; packing and file I/O
+    happen on a background thread. If the writer falls behind, records are
+    dropped (and counted) rather than slowing the request loop. Files rotate
+    once they reach `max_bytes` or have been open for `max_seconds`.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024,
+                 max_seconds: float = 3600.0, queue_size: int = 10000):
+        if int(max_bytes) < 1:
+            raise ValueError("maxBytes must be at least 1")
+        if float(max_seconds) <= 0:
+            raise ValueError("maxSeconds must be positive")
+
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_bytes)
+        self.max_seconds = float(max_seconds)
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        self.file = None
+        self.current_path = None
+        self.file_opened_at = 0.0
+        self.file_bytes = 0
+        self.files_written = []
+        self.records_written = 0
+        self.bytes_written = 0
+        self.dropped = 0
+        self.write_errors = 0
+
+        self.thread = threading.Thread(target=self._run, name="SessionRecorder", daemon=True)
+        self.thread.start()
+        logger.info(f"Recording sessions to {self.directory}")
+
+    def record(self, session_id: str, exercise_type: str, request_id: str,
+               frame: Dict[str, Any], response: Dict[str, Any]) -> None:
+        """Queue one analyzed frame; never blocks"""
+        # The decoded landmark list and the nested result are not modified
+        # after analysis, but the server adds response fields (requestId,
+        # processingTime, ...) to the top level once this returns, so the
+        # writer thread gets a shallow copy of that level only
+        try:
+            self.queue.put_nowait((time.time(), session_id, exercise_type, request_id, frame, dict(response)))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            try:
+                record = pack_record(*item)
+                if self.file is None or self._should_rotate(item[0]):
+                    self._rotate(item[0])
+                self.file.write(record)
+                self.file_bytes += len(record)
+                self.bytes_written += len(record)
+                self.records_written += 1
+
+                if self.queue.empty():
+                    self.file.flush()
+            except Exception as e:
+                self.write_errors += 1
+                logger.error(f"Error writing session record: {str(e)}")
+
+        self._close_file()
+
+    def _should_rotate(self, now: float) -> bool:
+        return self.file_bytes >= self.max_bytes or now - self.file_opened_at >= self.max_seconds
+
+    def _rotate(self, now: float) -> None:
+        self._close_file()
+        name = f"session-{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{len(self.files_written):04d}{RECORDING_SUFFIX}"
+        self.current_path = self.directory / name
+        self.file = open(self.current_path, "ab", buffering=1024 * 1024)
+        header = FILE_HEADER.pack(MAGIC, VERSION)
+        self.file.write(header)
+        self.file_opened_at = now
+        self.file_bytes = len(header)
+        self.files_written.append(str(self.current_path))
+
+    def _close_file(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Write out queued records and close the current file"""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Files, record counts and drops"""
+        return {
+            "enabled": self.thread.is_alive(),
+            "directory": str(self.directory),
+            "currentFile": str(self.current_path) if self.current_path else None,
+            "files": list(self.files_written),
+            "maxBytes": self.max_bytes,
+            "maxSeconds": self.max_seconds,
+            "recordsWritten": self.records_written,
+            "bytesWritten": self.bytes_written,
+            "queueDepth": self.queue.qsize(),
+            "dropped": self.dropped,
+            "writeErrors": self.write_errors
+        }
+
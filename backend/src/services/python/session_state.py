@@ -0,0 +1,241 @@
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from kernels import KERNELS
+
+logger = logging.getLogger('SessionState')
+
+# Stage names are stored as small integer codes, one table per exercise
+EXERCISE_STAGES = {
+    "squat": ("none", "down", "up", "unknown"),
+    "bicep": ("down", "up"),
+    "situp": ("down", "up"),
+}
+
+
+class SessionStateStore:
+    """
+    Struct-of-arrays rep state for many sessions of one exercise.
+
+    Each session owns one row in a set of preallocated columns (stage, rep
+    count, in-rep flag, tracked extreme angle, last rep time) plus a
+    fixed-length ring buffer of recent stages, so per-session memory does not
+    grow with the number of frames. Capacity doubles when full and freed rows
+    are reused. The update_* functions below apply the analyzers' stage and
+    rep rules to all rows that received a frame in a batch at once; a batch
+    holds at most one frame per row. Past `max_sessions` (if set) the row of
+    the least recently used session is released.
+
+    The squat, bicep and situp analyzers keep their rep state here, one row
+    per session, once their enable_state_store() is called.
+    """
+
+    def __init__(self, exercise_type: str, capacity: int = 64, history_length: int = 5,
+                 max_sessions: Optional[int] = None):
+        if exercise_type not in EXERCISE_STAGES:
+            raise ValueError(f"No stage table for exercise type: {exercise_type}")
+
+        self.exercise_type = exercise_type
+        self.stages = EXERCISE_STAGES[exercise_type]
+        self.stage_codes = {stage: code for code, stage in enumerate(self.stages)}
+        self.history_length = history_length
+        self.max_sessions = max_sessions
+
+        self.session_rows = {}
+        self.free_rows = []
+        self.capacity = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int) -> None:
+        """Grow every column to `capacity` rows, keeping existing values"""
+        def grow(column: Optional[np.ndarray], fill, dtype, shape=()) -> np.ndarray:
+            new_column = np.full((capacity,) + shape, fill, dtype=dtype)
+            if column is not None:
+                new_column[:len(column)] = column
+            return new_column
+
+        first = self.capacity == 0
+        self.active = grow(None if first else self.active, False, bool)
+        self.stage = grow(None if first else self.stage, 0, np.int8)
+        self.rep_count = grow(None if first else self.rep_count, 0, np.int64)
+        self.in_rep = grow(None if first else self.in_rep, False, bool)
+        self.extreme_angle = grow(None if first else self.extreme_angle, np.nan, np.float64)
+        self.last_counted_time = grow(None if first else self.last_counted_time, 0.0, np.float64)
+        self.history = grow(None if first else self.history, -1, np.int8, (self.history_length,))
+        self.history_pos = grow(None if first else self.history_pos, 0, np.int32)
+
+        self.free_rows.extend(range(capacity - 1, self.capacity - 1, -1))
+        self.capacity = capacity
+
+    def add_session(self, session_id: str, stage: Optional[str] = None,
+                    extreme_angle: float = np.nan) -> int:
+        """Claim a row for a session (idempotent) and return its index"""
+        if session_id in self.session_rows:
+            # Keep session_rows in least- to most-recently-used order for eviction
+            row = self.session_rows.pop(session_id)
+            self.session_rows[session_id] = row
+            return row
+
+        if not self.free_rows:
+            self._allocate(self.capacity * 2)
+
+        row = self.free_rows.pop()
+        self.session_rows[session_id] = row
+        self.active[row] = True
+        self._reset_row(row, stage, extreme_angle)
+        if self.max_sessions is not None:
+            while len(self.session_rows) > self.max_sessions:
+                self.remove_session(next(iter(self.session_rows)))
+        return row
+
+    def remove_session(self, session_id: str) -> None:
+        """Release a session's row for reuse"""
+        row = self.session_rows.pop(session_id, None)
+        if row is not None:
+            self.active[row] = False
+            self.free_rows.append(row)
+
+    def reset_session(self, session_id: str, stage: Optional[str] = None,
+                      extreme_angle: float = np.nan) -> None:
+        """Zero a session's counters, as the analyzers' reset() methods do"""
+        row = self.session_rows.get(session_id)
+        if row is not None:
+            self._reset_row(row, stage, extreme_angle)
+
+    def _reset_row(self, row: int, stage: Optional[str], extreme_angle: float) -> None:
+        self.stage[row] = self.stage_codes[stage] if stage is not None else 0
+        self.rep_count[row] = 0
+        self.in_rep[row] = False
+        self.extreme_angle[row] = extreme_angle
+        self.last_counted_time[row] = 0.0
+        self.history[row] = -1
+        self.history_pos[row] = 0
+
+    def reset_all(self) -> None:
+        """Zero the counters of every session"""
+        for row in self.session_rows.values():
+            self._reset_row(row, None, np.nan)
+
+    def rows(self, session_ids: Sequence[str]) -> np.ndarray:
+        """Row indices for a batch of sessions, adding unknown sessions"""
+        return np.array([self.add_session(session_id) for session_id in session_ids], dtype=np.int64)
+
+    def encode(self, stages: Sequence[str]) -> np.ndarray:
+        """Stage names -> stage codes"""
+        return np.array([self.stage_codes[stage] for stage in stages], dtype=np.int8)
+
+    def push_history(self, rows: np.ndarray, stage_codes: np.ndarray) -> None:
+        """Append one stage per row to the ring buffers"""
+        self.history[rows, self.history_pos[rows]] = stage_codes
+        self.history_pos[rows] = (self.history_pos[rows] + 1) % self.history_length
+
+    def get_history(self, session_id: str) -> List[str]:
+        """Recent stages of a session, oldest first"""
+        row = self.session_rows[session_id]
+        ordered = np.roll(self.history[row], -int(self.history_pos[row]))
+        return [self.stages[code] for code in ordered if code >= 0]
+
+    def get_session(self, session_id: str) -> Dict[str, Any]:
+        """Current state of one session"""
+        row = self.session_rows[session_id]
+        return {
+            "sessionId": session_id,
+            "stage": self.stages[self.stage[row]],
+            "repCount": int(self.rep_count[row]),
+            "inRep": bool(self.in_rep[row]),
+            "extremeAngle": None if np.isnan(self.extreme_angle[row]) else float(self.extreme_angle[row]),
+            "lastCountedTime": float(self.last_counted_time[row]),
+            "stageHistory": self.get_history(session_id)
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Occupancy and memory footprint of the store"""
+        columns = (self.active, self.stage, self.rep_count, self.in_rep, self.extreme_angle,
+                   self.last_counted_time, self.history, self.history_pos)
+        return {
+            "exerciseType": self.exercise_type,
+            "sessions": len(self.session_rows),
+            "maxSessions": self.max_sessions,
+            "capacity": self.capacity,
+            "historyLength": self.history_length,
+            "bytes": int(sum(column.nbytes for column in columns))
+        }
+
+
+def update_squat_reps(store: SessionStateStore, rows: np.ndarray, stages: Sequence[str]) -> np.ndarray:
+    """
+    RepCounter.update for a batch of rows: a rep counts on a direct
+    down -> up transition after a down position was seen.
+    Returns a mask of rows that counted a rep on this frame.
+    """
+    codes = store.encode(stages)
+    down, up = store.stage_codes["down"], store.stage_codes["up"]
+
+    in_rep, counted = KERNELS.squat_reps(store.stage[rows], store.in_rep[rows], codes, down, up)
+
+    store.in_rep[rows] = in_rep
+    store.rep_count[rows] += counted
+    store.stage[rows] = codes
+    store.push_history(rows, codes)
+    return counted
+
+
+def update_bicep_reps(store: SessionStateStore, rows: np.ndarray, curl_angles: np.ndarray,
+                      stage_down_threshold: float, stage_up_threshold: float,
+                      peak_contraction_threshold: float,
+                      lean_back_error: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """
+    Counter and peak-contraction rules of BicepPoseAnalysis.analyze_pose for
+    a batch of visible arm rows (one row per session and side). Rows with a
+    lean back error only update the counter, as in the analyzer.
+    Returns masks of counted reps and peak contraction errors, and the peak
+    angle that triggered each error.
+    """
+    curl_angles = np.asarray(curl_angles, dtype=np.float64)
+    down, up = store.stage_codes["down"], store.stage_codes["up"]
+    evaluate = np.ones(len(rows), dtype=bool) if lean_back_error is None else ~np.asarray(lean_back_error, dtype=bool)
+
+    # Stage/counter update, then track the lowest curl angle while up and
+    # judge and reset it once back down
+    stage, peak, counted, peak_error, error_angles = KERNELS.bicep_reps(
+        store.stage[rows], store.extreme_angle[rows], curl_angles, evaluate, down, up,
+        stage_down_threshold, stage_up_threshold, peak_contraction_threshold
+    )
+
+    store.stage[rows] = stage
+    store.rep_count[rows] += counted
+    store.extreme_angle[rows] = peak
+    store.push_history(rows, stage)
+    return {"counted": counted, "peakContractionError": peak_error, "peakAngle": error_angles}
+
+
+def update_situp_reps(store: SessionStateStore, rows: np.ndarray, torso_angles: np.ndarray,
+                      is_down_position: np.ndarray, is_up_position: np.ndarray,
+                      min_angle_change: np.ndarray, current_time: float,
+                      min_rep_interval: float = 1.0) -> np.ndarray:
+    """
+    Stage and rep rules of SitupPoseAnalysis.analyze_pose for a batch of rows,
+    given the per-row down/up position flags and required angle change the
+    analyzer derives from posture. Returns a mask of rows that counted a rep.
+    """
+    torso_angles = np.asarray(torso_angles, dtype=np.float64)
+    is_down_position = np.asarray(is_down_position, dtype=bool)
+    is_up_position = np.asarray(is_up_position, dtype=bool)
+    min_angle_change = np.broadcast_to(np.asarray(min_angle_change, dtype=np.float64), torso_angles.shape)
+    down, up = store.stage_codes["down"], store.stage_codes["up"]
+
+    # Track the minimum angle while lying down; count on rising from down
+    stage, min_angle, counted = KERNELS.situp_reps(
+        store.stage[rows], store.in_rep[rows], store.extreme_angle[rows], store.last_counted_time[rows],
+        torso_angles, is_down_position, is_up_position, min_angle_change,
+        float(current_time), float(min_rep_interval), down, up
+    )
+
+    store.stage[rows] = stage
+    store.extreme_angle[rows] = min_angle
+    store.rep_count[rows] += counted
+    store.last_counted_time[rows] = np.where(counted, current_time, store.last_counted_time[rows])
+    store.push_history(rows, stage)
+    return counted
@@ -6,6 +6,9 @@ import os
 import traceback
 from typing import List, Dict, Any, Tuple, Literal, Optional
 
+from diagnostics import DIAG
+from error_codes import ERROR_TABLES
+
 # Configure logging
 logging.basicConfig(
     level=logging.WARNING,
@@ -13,6 +16,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger('ShoulderPressAnalyzer')
 
+ERRORS = ERROR_TABLES['shoulder_press']
+UNEVEN_PRESSING, INCOMPLETE_PRESS = ERRORS.codes('uneven_pressing', 'incomplete_press')
+
 # Error types
 ERROR_TYPES = Literal[
     'INVALID_INPUT',
@@ -176,7 +182,7 @@ class ShoulderPressPoseAnalysis:
     def analyze_pose(self, landmarks):
         """
         Analyze the shoulder press pose and detect errors
-        Returns: (left_angle, right_angle, is_visible, errors)
+        Returns: (left_angle, right_angle, is_visible, errors as [code, value] pairs)
         """
         left_angle = None
         right_angle = None
@@ -221,26 +227,19 @@ class ShoulderPressPoseAnalysis:
             elif previous_stage == "counting":
                 self.stage = "down"
                 self.counter += 1
-                logger.info(f"Shoulder Press rep counted: {self.counter}")
+                if DIAG.on("shoulder_press"):
+                    DIAG.emit("shoulder_press", "rep_counted", count=self.counter, left_angle=left_angle, right_angle=right_angle)
             else:
                 self.stage = "down"
         
         # Check for uneven pressing (more than 15 degrees difference)
         if abs(left_angle - right_angle) > 15:
-            errors.append({
-                "type": "uneven_pressing",
-                "severity": "medium",
-                "message": "Keep both arms even during the press"
-            })
+            errors.append([UNEVEN_PRESSING, None])
             self.detected_errors["UNEVEN_PRESSING"] += 1
         
         # Check for incomplete pressing form
         if self.stage == "up" and (left_angle > 100 or right_angle > 100):
-            errors.append({
-                "type": "incorrect_form",
-                "severity": "low",
-                "message": "Press the weights fully overhead for complete range of motion"
-            })
+            errors.append([INCOMPLETE_PRESS, None])
             self.detected_errors["INCOMPLETE_PRESS"] += 1
         
         # Update previous angles
@@ -260,6 +259,10 @@ class ShoulderPressAnalyzer:
                 visibility_threshold=self.visibility_threshold
             )
             
+            # Emit [code, value] pairs instead of error dicts, set per call by
+            # the server for sessions that loaded the error code table
+            self.compact_errors = False
+            
             logger.info("ShoulderPressAnalyzer initialized successfully")
         except Exception as e:
             logger.error(f"Error initializing ShoulderPressAnalyzer: {e}")
@@ -277,33 +280,22 @@ class ShoulderPressAnalyzer:
         
         logger.warning(f"RESET_DEBUG: Shoulder Press counter reset from {old_count} to {new_count}")
     
-    def calculate_form_score(self, errors: List[Dict[str, str]]) -> float:
-        """Calculate form score based on errors."""
-        base_score = 100
-        
-        for error in errors:
-            if error['severity'] == 'high':
-                base_score -= 20
-            elif error['severity'] == 'medium':
-                base_score -= 10
-            elif error['severity'] == 'low':
-                base_score -= 5
-        
-        return max(0, min(100, base_score))
+    def calculate_form_score(self, errors: List[list]) -> float:
+        """Calculate form score from the integer weights of the error codes."""
+        return ERRORS.form_score(errors)
     
-    def analyze_pose(self, landmarks: List[Dict[str, float]]) -> Dict[str, Any]:
+    def analyze_pose(self, landmarks: List[Dict[str, float]], timestamp: Optional[float] = None) -> Dict[str, Any]:
         """
         Analyze the pose data and return metrics, stage, errors, and scores.
         
         Args:
             landmarks: List of landmark dictionaries with x, y, z and visibility.
+            timestamp: Capture time of the frame in seconds; wall clock if omitted.
                 
         Returns:
             Dictionary with stage, metrics, errors, repCount, and formScore.
         """
         try:
-            logger.info("SHOULDER_PRESS_DEBUG: Starting pose analysis")
-            
             if not landmarks or not isinstance(landmarks, list):
                 logger.error("SHOULDER_PRESS_DEBUG: No pose landmarks provided in input data")
                 return {
@@ -330,7 +322,6 @@ class ShoulderPressAnalyzer:
             
             # Use landmarks directly
             raw_landmarks = landmarks
-            logger.info(f"SHOULDER_PRESS_DEBUG: Received {len(raw_landmarks)} landmarks")
             
             # Default values in case of errors
             stage = "down"
@@ -340,10 +331,8 @@ class ShoulderPressAnalyzer:
             errors = []
             
             # Analyze shoulder press pose
-            logger.info("SHOULDER_PRESS_DEBUG: Analyzing shoulder press pose")
             try:
                 left_angle, right_angle, is_visible, errors = self.analyzer.analyze_pose(raw_landmarks)
-                logger.info(f"SHOULDER_PRESS_DEBUG: Pose analysis complete. Left angle: {left_angle}, Right angle: {right_angle}, Visible: {is_visible}")
             except Exception as analyze_err:
                 logger.error(f"SHOULDER_PRESS_DEBUG: Error in shoulder press pose analysis: {analyze_err}")
                 logger.error(traceback.format_exc())
@@ -353,7 +342,6 @@ class ShoulderPressAnalyzer:
             form_score = 100
             try:
                 form_score = self.calculate_form_score(errors)
-                logger.info(f"SHOULDER_PRESS_DEBUG: Form score: {form_score}")
             except Exception as score_err:
                 logger.error(f"SHOULDER_PRESS_DEBUG: Error calculating form score: {score_err}")
             
@@ -361,14 +349,12 @@ class ShoulderPressAnalyzer:
             rep_count = 0
             try:
                 rep_count = self.analyzer.get_counter()
-                logger.info(f"SHOULDER_PRESS_DEBUG: Repetition count: {rep_count}")
             except Exception as rep_err:
                 logger.error(f"SHOULDER_PRESS_DEBUG: Error getting rep count: {rep_err}")
             
             # Get current stage
             try:
                 stage = self.analyzer.stage
-                logger.info(f"SHOULDER_PRESS_DEBUG: Current stage: {stage}")
             except Exception as stage_err:
                 logger.error(f"SHOULDER_PRESS_DEBUG: Error getting stage: {stage_err}")
                 stage = "down"  # Default to down stage
@@ -380,17 +366,20 @@ class ShoulderPressAnalyzer:
                 "isVisible": is_visible
             }
             
-            logger.info("SHOULDER_PRESS_DEBUG: Analysis complete, returning results")
+            if DIAG.on("shoulder_press"):
+                DIAG.emit("shoulder_press", "result", stage=stage, rep_count=rep_count, left_angle=left_angle,
+                          right_angle=right_angle, visible=is_visible, form_score=form_score,
+                          errors=lambda: [ERRORS.types[code] for code, _ in errors])
             # Return complete analysis result
+            result = {
+                'stage': stage,
+                'metrics': metrics,
+                'formScore': form_score,
+                'repCount': rep_count
+            }
             return {
                 'success': True,
-                'result': {
-                    'stage': stage,
-                    'metrics': metrics,
-                    'errors': errors,
-                    'formScore': form_score,
-                    'repCount': rep_count
-                }
+                'result': ERRORS.put_errors(result, errors, self.compact_errors)
             }
             
         except Exception as e:
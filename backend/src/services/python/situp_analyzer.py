@@ -7,6 +7,10 @@ import traceback
 import time
 from typing import List, Dict, Any, Tuple, Literal, Optional
 
+from diagnostics import DIAG
+from session_state import SessionStateStore, update_situp_reps
+from error_codes import ERROR_TABLES
+
 # Configure logging
 logging.basicConfig(
     level=logging.WARNING,
@@ -14,6 +18,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger('SitupAnalyzer')
 
+ERRORS = ERROR_TABLES['situp']
+STRAIGHT_LEGS, IMPROPER_KNEE_ANGLE, INCOMPLETE_SITUP = ERRORS.codes(
+    'straight_legs', 'improper_knee_angle', 'incomplete_situp')
+
 # Error types
 ERROR_TYPES = Literal[
     'INVALID_INPUT',
@@ -84,8 +92,9 @@ def calculate_angle(a: list, b: list, c: list) -> float:
         if angle2 > 180.0:
             angle2 = 360 - angle2
             
-        # Log both calculations
-        logger.info(f"Angle calculation methods: arccos: {angle:.1f}°, arctan2: {angle2:.1f}°")
+        # Record both calculations
+        if DIAG.on("situp"):
+            DIAG.emit("situp", "angle_methods", arccos=angle, arctan2=angle2)
         
         # Use the arccos method as it's more reliable for our use case
         return angle
@@ -132,14 +141,20 @@ class SitupPoseAnalysis:
         self.knee_position_quality = "unknown"  # Track knee position quality (ideal, acceptable, straight)
         self.head_pos = None  # Head position for determining down position
         
+        # Optional per-session rep state (see session_state.py): when set,
+        # counter / stage / minimum angle / last rep time live in the row of
+        # `state_key` and the attributes above mirror that row during a call
+        self.state_store = None
+        self.state_key = None
+        
         # Error tracking
         self.detected_errors = {
             "INCOMPLETE_SITUP": 0,
             "STRAIGHT_LEGS": 0
         }
         
-    def reset(self):
-        """Reset counters and error tracking"""
+    def reset(self, state_key=None):
+        """Reset counters and error tracking (with a state store: only the row of `state_key`, or every row if None)"""
         self.counter = 0
         self.stage = "down"
         self.is_visible = True
@@ -148,6 +163,11 @@ class SitupPoseAnalysis:
         self.is_in_rep = False
         self.knee_position_quality = "unknown"
         self.head_pos = None
+        if self.state_store is not None:
+            if state_key is not None:
+                self.state_store.reset_session(state_key)
+            else:
+                self.state_store.reset_all()
         self.detected_errors = {
             "INCOMPLETE_SITUP": 0,
             "STRAIGHT_LEGS": 0
@@ -156,6 +176,15 @@ class SitupPoseAnalysis:
     def get_counter(self) -> int:
         """Return the current repetition count"""
         return self.counter
+    
+    def load_state(self) -> None:
+        """Mirror the state store row of `state_key` in counter / stage / min angle / last rep time"""
+        row = self.state_store.rows([self.state_key])[0]
+        self.counter = int(self.state_store.rep_count[row])
+        self.stage = self.state_store.stages[self.state_store.stage[row]]
+        min_angle = self.state_store.extreme_angle[row]
+        self.min_angle_detected = 180 if np.isnan(min_angle) else float(min_angle)
+        self.last_counted_time = float(self.state_store.last_counted_time[row])
         
     def get_joints(self, landmarks) -> bool:
         """
@@ -180,24 +209,6 @@ class SitupPoseAnalysis:
             self.is_visible = False
             return self.is_visible
         
-        # Log visibility values for debugging
-        try:
-            head_vis = landmarks[head_idx]['visibility']
-            l_shoulder_vis = landmarks[shoulder_idx]['visibility']
-            l_hip_vis = landmarks[hip_idx]['visibility']
-            l_knee_vis = landmarks[knee_idx]['visibility']
-            l_ankle_vis = landmarks[ankle_idx]['visibility'] if ankle_idx < len(landmarks) else 0
-            
-            r_shoulder_vis = landmarks[r_shoulder_idx]['visibility']
-            r_hip_vis = landmarks[r_hip_idx]['visibility']
-            r_knee_vis = landmarks[r_knee_idx]['visibility']
-            r_ankle_vis = landmarks[r_ankle_idx]['visibility'] if r_ankle_idx < len(landmarks) else 0
-            
-            logger.info(f"Visibility scores - Head: {head_vis:.2f}, L shoulder: {l_shoulder_vis:.2f}, L hip: {l_hip_vis:.2f}, L knee: {l_knee_vis:.2f}, L ankle: {l_ankle_vis:.2f}")
-            logger.info(f"Visibility scores - R shoulder: {r_shoulder_vis:.2f}, R hip: {r_hip_vis:.2f}, R knee: {r_knee_vis:.2f}, R ankle: {r_ankle_vis:.2f}")
-        except Exception as e:
-            logger.error(f"Error logging visibility: {e}")
-        
         # Check visibility for left side
         l_joints_visibility = [
             landmarks[shoulder_idx]['visibility'],
@@ -223,15 +234,14 @@ class SitupPoseAnalysis:
             # Choose which side to use (prefer the side with better knee visibility)
             use_right_side = (landmarks[r_knee_idx]['visibility'] > landmarks[knee_idx]['visibility'])
             
-            logger.info(f"Using {'right' if use_right_side else 'left'} side for angle calculation")
-            
             if use_right_side:
                 shoulder_idx = r_shoulder_idx
                 hip_idx = r_hip_idx
                 knee_idx = r_knee_idx
                 ankle_idx = r_ankle_idx
         else:
-            logger.warning("Poor visibility for both left and right sides")
+            if DIAG.on("situp"):
+                DIAG.emit("situp", "low_visibility", left=l_joints_visibility, right=r_joints_visibility)
             self.is_visible = False
             return self.is_visible
 
@@ -255,15 +265,8 @@ class SitupPoseAnalysis:
                 landmarks[head_idx]['x'],
                 landmarks[head_idx]['y'],
             ]
-            logger.info(f"Head position: ({self.head_pos[0]:.2f}, {self.head_pos[1]:.2f})")
         else:
             self.head_pos = None
-            logger.info("Head not visible enough")
-        
-        # Log joint coordinates for debugging
-        logger.info(f"Joint positions - Shoulder: ({self.shoulder[0]:.2f}, {self.shoulder[1]:.2f})")
-        logger.info(f"Joint positions - Hip: ({self.hip[0]:.2f}, {self.hip[1]:.2f})")
-        logger.info(f"Joint positions - Knee: ({self.knee[0]:.2f}, {self.knee[1]:.2f})")
         
         # Get ankle if visible enough
         if ankle_idx < len(landmarks) and landmarks[ankle_idx]['visibility'] > self.visibility_threshold:
@@ -271,24 +274,25 @@ class SitupPoseAnalysis:
                 landmarks[ankle_idx]['x'],
                 landmarks[ankle_idx]['y'],
             ]
-            logger.info(f"Joint positions - Ankle: ({self.ankle[0]:.2f}, {self.ankle[1]:.2f})")
         else:
             self.ankle = None
-            logger.info("Ankle not visible enough")
 
         return self.is_visible
             
-    def analyze_pose(self, landmarks):
+    def analyze_pose(self, landmarks, timestamp=None):
         """
         Analyze the sit-up pose and detect errors
-        Returns: (torso_angle, knee_angle, is_visible, errors)
+        Returns: (torso_angle, knee_angle, is_visible, errors as [code, value] pairs)
         """
         torso_angle = None
         knee_angle = None
         errors = []
-        current_time = time.time()
+        # Frame capture time drives the rep interval check; wall clock is the fallback
+        current_time = timestamp if timestamp is not None else time.time()
         
         # Get joint positions
+        if self.state_store is not None:
+            self.load_state()
         self.get_joints(landmarks)
         
         # Cancel calculation if visibility is poor
@@ -299,60 +303,47 @@ class SitupPoseAnalysis:
         if self.ankle is not None:
             try:
                 knee_angle = int(calculate_angle(self.hip, self.knee, self.ankle))
-                logger.info(f"Current knee angle: {knee_angle} degrees")
                 
                 # Categorize knee bend quality
                 if knee_angle >= self.KNEE_IDEAL_MIN and knee_angle <= self.KNEE_IDEAL_MAX:
                     self.knee_position_quality = "ideal"
-                    logger.info("Knee position: IDEAL bend (40-45°)")
                 elif knee_angle > self.KNEE_IDEAL_MAX and knee_angle <= self.KNEE_ACCEPTABLE_MAX:
                     self.knee_position_quality = "acceptable"
-                    logger.info("Knee position: ACCEPTABLE bend (45-90°)")
                 elif knee_angle > self.KNEE_STRAIGHT_THRESHOLD:
                     self.knee_position_quality = "straight"
-                    logger.info("Knee position: STRAIGHT legs (>150°)")
                 else:
                     self.knee_position_quality = "other"
-                    logger.info(f"Knee position: OTHER angle ({knee_angle}°)")
                 
                 # Add appropriate feedback based on knee position
                 if self.knee_position_quality == "straight":
-                    errors.append({
-                        "type": "straight_legs",
-                        "severity": "high",
-                        "message": "Bend your knees to approximately 40-45 degrees for ideal form"
-                    })
+                    errors.append([STRAIGHT_LEGS, None])
                     self.detected_errors["STRAIGHT_LEGS"] += 1
-                    logger.warning(f"Straight legs detected: {knee_angle}° (ideal is 40-45°)")
                 elif self.knee_position_quality != "ideal" and self.knee_position_quality != "acceptable":
-                    errors.append({
-                        "type": "improper_knee_angle",
-                        "severity": "medium",
-                        "message": f"Adjust knee bend closer to 40-45 degrees for ideal form (current: {knee_angle}°)"
-                    })
-                    logger.warning(f"Improper knee angle: {knee_angle}° (ideal is 40-45°)")
+                    errors.append([IMPROPER_KNEE_ANGLE, knee_angle])
             except Exception as e:
                 logger.error(f"Error calculating knee angle: {e}")
                 knee_angle = None
                 self.knee_position_quality = "unknown"
         else:
-            logger.warning("Ankle not visible, can't calculate knee angle")
+            if DIAG.on("situp"):
+                DIAG.emit("situp", "ankle_not_visible")
             self.knee_position_quality = "unknown"
         
         # Calculate torso angle (between shoulder, hip, and knee)
         try:
             torso_angle = int(calculate_angle(self.shoulder, self.hip, self.knee))
-            logger.info(f"Current torso angle: {torso_angle} degrees")
         except Exception as e:
             logger.error(f"Error calculating torso angle: {e}")
             torso_angle = 180  # Default to flat position
         
         # Limit extreme angles to reasonable range
         if torso_angle > 180:
-            logger.warning(f"Capping extreme torso angle: {torso_angle} -> 180")
+            if DIAG.on("situp"):
+                DIAG.emit("situp", "torso_angle_capped", torso_angle=torso_angle)
             torso_angle = 180
         elif torso_angle < 0:
-            logger.warning(f"Capping negative torso angle: {torso_angle} -> 0")
+            if DIAG.on("situp"):
+                DIAG.emit("situp", "torso_angle_capped", torso_angle=torso_angle)
             torso_angle = 0
         
         # Determine the current position (up/down) based on torso angle and head position
@@ -369,7 +360,6 @@ class SitupPoseAnalysis:
             # Ideal knee bend (40-45°) - widen down range, narrow up range
             down_threshold = 110  # Reduced from 120 for wider down range
             up_threshold = 85  # Reduced from 90 for narrower up range
-            logger.info(f"Using modified thresholds for ideal knee bend (40-45°): down={down_threshold}°, up={up_threshold}°")
         elif self.knee_position_quality == "acceptable":
             # Acceptable knee bend (45-90°) - slightly adjusted thresholds
             down_threshold += 5  # Require slightly higher angle for down
@@ -386,68 +376,79 @@ class SitupPoseAnalysis:
                 # Head is near the bottom of the frame
                 if self.head_pos[1] > 0.7:  # y-coordinate > 0.7 means head is in bottom 30% of frame
                     is_down_position = True
-                    logger.info(f"Down position detected - torso angle: {torso_angle}°, head position: {self.head_pos[1]:.2f}, threshold: {down_threshold}°")
                 else:
-                    logger.info(f"Head not near ground - position: {self.head_pos[1]:.2f}")
+                    if DIAG.on("situp"):
+                        DIAG.emit("situp", "head_not_down", head_y=self.head_pos[1], torso_angle=torso_angle)
             else:
                 # If head not visible, just use torso angle
                 is_down_position = True
-                logger.info(f"Down position detected based on torso angle only: {torso_angle}° >= {down_threshold}°")
         
         # Check for up position - torso is more vertical (less than 90 degrees)
         if torso_angle < up_threshold:
             is_up_position = True
-            logger.info(f"Up position detected - torso angle: {torso_angle}° < {up_threshold}°")
         
-        # Track minimum angle when in down position
-        if is_down_position and not self.is_in_rep:
-            if torso_angle < self.min_angle_detected:
-                self.min_angle_detected = torso_angle
-                logger.info(f"Updated minimum angle: {self.min_angle_detected}")
+        if self.state_store is not None:
+            # Minimum angle tracking, stage and rep rules applied to this session's row
+            previous_stage = self.stage
+            counted = update_situp_reps(
+                self.state_store, self.state_store.rows([self.state_key]), [torso_angle],
+                [is_down_position], [is_up_position], [min_angle_change], current_time, self.min_rep_interval
+            )
+            self.load_state()
+            angle_change = self.min_angle_detected - torso_angle
+            if counted[0] and DIAG.on("situp"):
+                DIAG.emit("situp", "rep_counted", count=self.counter, knee_position=self.knee_position_quality, angle_change=angle_change)
+        else:
+            # Track minimum angle when in down position
+            if is_down_position and not self.is_in_rep:
+                if torso_angle < self.min_angle_detected:
+                    self.min_angle_detected = torso_angle
             
-            self.stage = "down"
+                self.stage = "down"
         
-        # Detect rep based on angle change
-        angle_change = self.min_angle_detected - torso_angle
-        logger.info(f"Angle change from minimum: {angle_change}° (knee position: {self.knee_position_quality}, min required: {min_angle_change}°)")
+            # Detect rep based on angle change
+            angle_change = self.min_angle_detected - torso_angle
         
-        # Previous stage tracking
-        previous_stage = self.stage
+            # Previous stage tracking
+            previous_stage = self.stage
         
-        # Handle state transitions
-        if is_down_position:
-            # We're in the down position
-            if self.stage != "down":
-                logger.info(f"Transitioning to down position - angle: {torso_angle}°")
-                self.stage = "down"
-        elif is_up_position and previous_stage == "down":
-            # We've transitioned from down to up - count a rep
-            self.stage = "up"
+            # Handle state transitions
+            if is_down_position:
+                # We're in the down position
+                if self.stage != "down":
+                    self.stage = "down"
+            elif is_up_position and previous_stage == "down":
+                # We've transitioned from down to up - count a rep
+                self.stage = "up"
             
-            # Only count if enough time has passed and sufficient angle change based on knee position
-            if current_time - self.last_counted_time >= self.min_rep_interval and angle_change >= min_angle_change:
-                self.counter += 1
-                logger.info(f"Sit-up rep counted: {self.counter} with {self.knee_position_quality} knee position (angle change: {angle_change}°)")
-                self.last_counted_time = current_time
-            else:
-                if angle_change < min_angle_change:
-                    logger.info(f"Insufficient angle change for rep count: {angle_change}° < {min_angle_change}°")
+                # Only count if enough time has passed and sufficient angle change based on knee position
+                if current_time - self.last_counted_time >= self.min_rep_interval and angle_change >= min_angle_change:
+                    self.counter += 1
+                    if DIAG.on("situp"):
+                        DIAG.emit("situp", "rep_counted", count=self.counter, knee_position=self.knee_position_quality, angle_change=angle_change)
+                    self.last_counted_time = current_time
                 else:
-                    logger.info(f"Ignored rapid rep: {current_time - self.last_counted_time:.2f}s < {self.min_rep_interval}s")
-        elif is_up_position:
-            self.stage = "up"
+                    if angle_change < min_angle_change:
+                        if DIAG.on("situp"):
+                            DIAG.emit("situp", "rep_rejected", reason="angle_change", angle_change=angle_change, required=min_angle_change)
+                    else:
+                        if DIAG.on("situp"):
+                            DIAG.emit("situp", "rep_rejected", reason="interval", interval=current_time - self.last_counted_time)
+            elif is_up_position:
+                self.stage = "up"
+        
         
-        # Log any stage transitions
+        # Record any stage transitions
         if previous_stage != self.stage:
-            logger.info(f"Stage transition: {previous_stage} -> {self.stage} (angle: {torso_angle}°)")
+            if DIAG.on("situp"):
+                DIAG.emit("situp", "transition", previous=previous_stage, stage=self.stage,
+                          torso_angle=torso_angle, knee_angle=knee_angle,
+                          knee_position=self.knee_position_quality, angle_change=angle_change,
+                          down_threshold=down_threshold, up_threshold=up_threshold)
         
         # Detect incomplete situp
         if self.stage == "up" and torso_angle >= up_threshold:
-            errors.append({
-                "type": "incomplete_situp",
-                "severity": "medium",
-                "message": f"Sit up more to reach at least a {up_threshold}° angle (current: {torso_angle}°)"
-            })
+            errors.append([INCOMPLETE_SITUP, [up_threshold, torso_angle]])
             self.detected_errors["INCOMPLETE_SITUP"] += 1
         
         return torso_angle, knee_angle, self.is_visible, errors
@@ -463,6 +464,14 @@ class SitupAnalyzer:
                 visibility_threshold=self.visibility_threshold
             )
             
+            # Emit [code, value] pairs instead of error dicts, set per call by
+            # the server for sessions that loaded the error code table
+            self.compact_errors = False
+            
+            # Session of the current call (picks its row in the state store),
+            # set by the server
+            self.session_key = None
+            
             logger.info("SitupAnalyzer initialized successfully")
             logger.info("""
             SITUP DETECTION CONFIGURATION:
@@ -479,43 +488,57 @@ class SitupAnalyzer:
             logger.error(traceback.format_exc())
             raise
 
-    def reset_rep_counter(self) -> None:
-        """Reset repetition counter"""
+    def reset_rep_counter(self, session_key: Optional[str] = None) -> None:
+        """Reset repetition counter (with the state store enabled, only the session's row when a session_key is given)"""
         logger.warning("RESET_DEBUG: Resetting rep counter in SitupAnalyzer")
         old_count = self.analyzer.get_counter()
         
-        self.analyzer.reset()
+        self.analyzer.reset(session_key)
         
         new_count = self.analyzer.get_counter()
         
         logger.warning(f"RESET_DEBUG: Situp counter reset from {old_count} to {new_count}")
     
-    def calculate_form_score(self, errors: List[Dict[str, str]]) -> float:
-        """Calculate form score based on errors."""
-        base_score = 100
-        
-        for error in errors:
-            if error['severity'] == 'high':
-                base_score -= 20
-            elif error['severity'] == 'medium':
-                base_score -= 10
-            elif error['severity'] == 'low':
-                base_score -= 5
-        
-        return max(0, min(100, base_score))
+    def enable_state_store(self) -> bool:
+        """
+        Keep rep state per session in a SessionStateStore row (keyed by
+        session_key) instead of in the pose analysis shared by all sessions
+        """
+        if self.analyzer.state_store is None:
+            self.analyzer.state_store = SessionStateStore("situp", max_sessions=1024)
+        return True
+    
+    def disable_state_store(self) -> None:
+        """Go back to the shared pose analysis state"""
+        self.analyzer.state_store = None
+    
+    def get_state_store_stats(self) -> Dict[str, Any]:
+        """Occupancy of the state store"""
+        store = self.analyzer.state_store
+        if store is None:
+            return {"exerciseType": "situp", "enabled": False}
+        stats = store.get_stats()
+        stats["enabled"] = True
+        return stats
     
-    def analyze_pose(self, landmarks: List[Dict[str, float]]) -> Dict[str, Any]:
+    def calculate_form_score(self, errors: List[list]) -> float:
+        """Calculate form score from the integer weights of the error codes."""
+        return ERRORS.form_score(errors)
+    
+    def analyze_pose(self, landmarks: List[Dict[str, float]], timestamp: Optional[float] = None) -> Dict[str, Any]:
         """
         Analyze the pose data and return metrics, stage, errors, and scores.
         
         Args:
             landmarks: List of landmark dictionaries with x, y, z and visibility.
+            timestamp: Capture time of the frame in seconds; wall clock if omitted.
                 
         Returns:
             Dictionary with stage, metrics, errors, repCount, and formScore.
         """
         try:
-            logger.info("\n==== SITUP_DEBUG: Starting pose analysis ====")
+            # Rep state of the session being analyzed, when kept in the state store
+            self.analyzer.state_key = self.session_key
             
             if not landmarks or not isinstance(landmarks, list):
                 logger.error("SITUP_DEBUG: No pose landmarks provided in input data")
@@ -543,7 +566,6 @@ class SitupAnalyzer:
             
             # Use landmarks directly
             raw_landmarks = landmarks
-            logger.info(f"SITUP_DEBUG: Received {len(raw_landmarks)} landmarks")
             
             # Default values in case of errors
             stage = "down"
@@ -553,10 +575,8 @@ class SitupAnalyzer:
             errors = []
             
             # Analyze situp pose
-            logger.info("SITUP_DEBUG: Analyzing situp pose")
             try:
-                torso_angle, knee_angle, is_visible, errors = self.analyzer.analyze_pose(raw_landmarks)
-                logger.info(f"SITUP_DEBUG: Pose analysis complete. Torso angle: {torso_angle}, Knee angle: {knee_angle}, Visible: {is_visible}")
+                torso_angle, knee_angle, is_visible, errors = self.analyzer.analyze_pose(raw_landmarks, timestamp)
             except Exception as analyze_err:
                 logger.error(f"SITUP_DEBUG: Error in situp pose analysis: {analyze_err}")
                 logger.error(traceback.format_exc())
@@ -566,7 +586,6 @@ class SitupAnalyzer:
             form_score = 100
             try:
                 form_score = self.calculate_form_score(errors)
-                logger.info(f"SITUP_DEBUG: Form score: {form_score}")
             except Exception as score_err:
                 logger.error(f"SITUP_DEBUG: Error calculating form score: {score_err}")
             
@@ -574,14 +593,12 @@ class SitupAnalyzer:
             rep_count = 0
             try:
                 rep_count = self.analyzer.get_counter()
-                logger.info(f"SITUP_DEBUG: Repetition count: {rep_count}")
             except Exception as rep_err:
                 logger.error(f"SITUP_DEBUG: Error getting rep count: {rep_err}")
             
             # Get current stage
             try:
                 stage = self.analyzer.stage
-                logger.info(f"SITUP_DEBUG: Current stage: {stage}")
             except Exception as stage_err:
                 logger.error(f"SITUP_DEBUG: Error getting stage: {stage_err}")
                 stage = "down"  # Default to down stage
@@ -593,17 +610,20 @@ class SitupAnalyzer:
                 "isVisible": is_visible
             }
             
-            logger.info("SITUP_DEBUG: Analysis complete, returning results")
+            if DIAG.on("situp"):
+                DIAG.emit("situp", "result", stage=stage, rep_count=rep_count, torso_angle=torso_angle,
+                          knee_angle=knee_angle, visible=is_visible, form_score=form_score,
+                          errors=lambda: [ERRORS.types[code] for code, _ in errors])
             # Return complete analysis result
+            result = {
+                'stage': stage,
+                'metrics': metrics,
+                'formScore': form_score,
+                'repCount': rep_count
+            }
             return {
                 'success': True,
-                'result': {
-                    'stage': stage,
-                    'metrics': metrics,
-                    'errors': errors,
-                    'formScore': form_score,
-                    'repCount': rep_count
-                }
+                'result': ERRORS.put_errors(result, errors, self.compact_errors)
             }
             
         except Exception as e:
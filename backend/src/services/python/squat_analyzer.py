@@ -8,6 +8,12 @@ import logging
 from pathlib import Path
 from typing import List, Dict, Any, Tuple, Literal, Optional
 import time
+from collections import deque
+from motion_gate import MotionGates
+from prediction_cache import PredictionCache
+from session_state import SessionStateStore, update_squat_reps
+from diagnostics import DIAG
+from error_codes import ERROR_TABLES
 
 # Configure logging - reduce logging level to WARNING for better performance
 logging.basicConfig(
@@ -19,6 +25,13 @@ logger = logging.getLogger('SquatAnalyzer')
 # Optimization: Pre-compute squared values for common calculations
 VISIBILITY_THRESHOLD_SQ = 0.36  # 0.6^2
 
+ERRORS = ERROR_TABLES['squat']
+FEET_TOO_CLOSE, FEET_TOO_WIDE, KNEES_TOO_CLOSE, KNEES_TOO_WIDE = ERRORS.codes(
+    'feet_too_close', 'feet_too_wide', 'knees_too_close', 'knees_too_wide')
+# Placement class (1 = too close, 2 = too wide) -> error code
+FOOT_PLACEMENT_ERRORS = {1: FEET_TOO_CLOSE, 2: FEET_TOO_WIDE}
+KNEE_PLACEMENT_ERRORS = {1: KNEES_TOO_CLOSE, 2: KNEES_TOO_WIDE}
+
 # Error types matching TypeScript interface
 ERROR_TYPES = Literal[
     'INVALID_INPUT',
@@ -48,6 +61,13 @@ STAGE_TYPES = Literal[
     'unknown'
 ]
 
+# Knee angles (degrees) of the standing and squatting positions, the fallback
+# for the ML model; rep_segmentation.py segments squats with the same pair
+ANGLE_THRESHOLDS = {
+    "up": 140,        # Standing position
+    "down": 90        # Squatting position
+}
+
 class RepCounter:
     """Tracks squat repetitions based on stage transitions."""
     def __init__(self):
@@ -59,41 +79,52 @@ class RepCounter:
         # Track time between transitions to detect quick reps
         self._last_transition_time = 0
         # Store the last few stages to detect patterns
-        self._stage_history = []
+        self._stage_history = deque(maxlen=5)
+        # Optional per-session rep state (see session_state.py): when set,
+        # updates go to the row of `state_key` instead of the attributes above
+        self.state_store = None
+        self.state_key = None
 
-    def update(self, current_stage: str, confidence: float = 0.0) -> None:
+    def update(self, current_stage: str, confidence: float = 0.0, timestamp: Optional[float] = None) -> None:
         """
         Update rep count based on stage transitions between down and up.
         Simplified for two-stage model (down/up only).
+        `timestamp` is the frame capture time in seconds (wall clock if omitted).
         """
         # Store confidence score
         self._stage_confidence = confidence
         
+        if self.state_store is not None:
+            rows = self.state_store.rows([self.state_key])
+            counted = update_squat_reps(self.state_store, rows, [current_stage])
+            if counted[0] and DIAG.on("squat"):
+                DIAG.emit("squat", "rep_counted", rep_count=self.get_count(), confidence=confidence)
+            return
+        
         # Track current time for transition detection
-        current_time = time.time() * 1000  # Current time in milliseconds
+        current_time = (timestamp if timestamp is not None else time.time()) * 1000  # Current time in milliseconds
         
-        # Add to stage history (keep only last 5 stages)
+        # Add to stage history (the deque keeps only the last 5 stages)
         self._stage_history.append(current_stage)
-        if len(self._stage_history) > 5:
-            self._stage_history.pop(0)
         
         # Detect stage transitions
         is_transition = current_stage != self._last_stage
         
         # Log transitions for debugging
         if is_transition and self._last_stage is not None:
-            logger.warning(f"TRANSITION: {self._last_stage} -> {current_stage}, confidence={confidence:.2f}")
+            if DIAG.on("squat"):
+                DIAG.emit("squat", "transition", previous=self._last_stage, stage=current_stage, confidence=confidence)
         
         # Handle stage transitions - simple two-state model
         if current_stage == 'down':
             # When we detect a down position, mark the start of a potential rep
             self._in_rep = True
-            logger.warning("Down position detected")
             
         elif current_stage == 'up' and self._in_rep and self._last_stage == 'down':
             # Count rep when transitioning from down to up directly
             self._rep_count += 1
-            logger.warning(f"Rep counted: {self._rep_count} with confidence {self._stage_confidence:.2f}")
+            if DIAG.on("squat"):
+                DIAG.emit("squat", "rep_counted", rep_count=self._rep_count, confidence=self._stage_confidence)
             self._in_rep = False  # Reset rep state
         
         # Update last stage
@@ -101,16 +132,31 @@ class RepCounter:
 
     def get_count(self) -> int:
         """Get current rep count."""
+        if self.state_store is not None:
+            return int(self.state_store.rep_count[self.state_store.rows([self.state_key])[0]])
         return self._rep_count
 
-    def reset(self) -> None:
-        """Reset rep counter."""
+    @property
+    def last_stage(self) -> Optional[str]:
+        """Stage of the last update, None before the first."""
+        if self.state_store is not None:
+            stage = self.state_store.stages[self.state_store.stage[self.state_store.rows([self.state_key])[0]]]
+            return None if stage == "none" else stage
+        return self._last_stage
+
+    def reset(self, state_key: Optional[str] = None) -> None:
+        """Reset rep counter (with a state store: only the row of `state_key`, or every row if None)."""
         self._last_stage = None
         self._rep_count = 0
         self._in_rep = False
         self._stage_confidence = 0.0
         self._last_transition_time = 0
-        self._stage_history = []
+        self._stage_history.clear()
+        if self.state_store is not None:
+            if state_key is not None:
+                self.state_store.reset_session(state_key)
+            else:
+                self.state_store.reset_all()
 
 class SquatAnalyzer:
     def __init__(self):
@@ -158,10 +204,7 @@ class SquatAnalyzer:
             }
             
             # Angle thresholds as fallback for ML model
-            self.ANGLE_THRESHOLDS = {
-                "up": 140,        # Standing position
-                "down": 90        # Squatting position
-            }
+            self.ANGLE_THRESHOLDS = ANGLE_THRESHOLDS
             
             # Initialize landmark mapping 
             self.landmark_map = {
@@ -199,6 +242,35 @@ class SquatAnalyzer:
             # Add motion smoothing for stable stage detection
             self.last_stages = []  # Store last 3 stage predictions
             
+            # Optional motion gates (one per session) that reuse the session's last
+            # ML prediction while the body is still, off until enable_motion_gate() is called
+            self.motion_gates = MotionGates("squat", [self.landmark_map[lm] for lm in self.IMPORTANT_LMS])
+            self.use_motion_gate = False
+            
+            # Optional LRU cache of classifier outputs keyed by quantized
+            # (raw, unscaled) landmark features
+            self.prediction_cache = PredictionCache("squat", quantization=0.005)
+            self.use_prediction_cache = False
+            
+            # Stateless predictions precomputed by predict_batch(), set during
+            # offline replay (see analyze_session.py)
+            self.prediction_replay = None
+            
+            # Per-request stage timing, set by the server for sampled
+            # requests (see request_trace.py)
+            self.trace = None
+            
+            # Emit [code, value] pairs instead of error dicts, set per call by
+            # the server for sessions that loaded the error code table
+            self.compact_errors = False
+            
+            # Quality tier of the current call ("full" or "geometric"), set
+            # by the server while it sheds load (see quality_controller.py)
+            self.quality_tier = "full"
+            
+            # Session of the current call (picks its motion gate), set by the server
+            self.session_key = None
+            
         except Exception as e:
             logger.error(f"Error initializing SquatAnalyzer: {str(e)}")
             raise
@@ -344,12 +416,15 @@ class SquatAnalyzer:
                 
         return analyzed_results
 
-    def analyze_pose(self, landmarks: List[Dict[str, float]]) -> Dict[str, Any]:
+    def analyze_pose(self, landmarks: List[Dict[str, float]], timestamp: Optional[float] = None) -> Dict[str, Any]:
         """
         Analyzes a pose and returns the analysis result.
         Optimized for rep counting with ML model classification.
         """
         try:
+            # Rep state of the session being analyzed, when kept in the state store
+            self.rep_counter.state_key = self.session_key
+            
             # Input validation
             if not landmarks or not isinstance(landmarks, list):
                 return {
@@ -373,8 +448,13 @@ class SquatAnalyzer:
                         }
                     }
             
+            if self.trace is not None:
+                self.trace.mark("validation")
+            
             # Determine squat stage - this is critical and must be done first
-            stage = self.determine_stage(landmarks)
+            stage = self.determine_stage(landmarks, timestamp)
+            if self.trace is not None:
+                self.trace.mark("state_update")
             
             # Important: The rep counter is updated inside the determine_stage method
             # We don't need to update it again here
@@ -385,38 +465,17 @@ class SquatAnalyzer:
             # Process placement results into errors
             form_errors = []
             
-            # Process foot placement
-            foot_placement = placement_analysis["foot_placement"]
-            if foot_placement == 1:
-                form_errors.append({
-                    'type': 'foot_placement',
-                    'severity': 'high',
-                    'message': 'Feet too close together'
-                })
-            elif foot_placement == 2:
-                form_errors.append({
-                    'type': 'foot_placement',
-                    'severity': 'high',
-                    'message': 'Feet too far apart'
-                })
-                
-            # Process knee placement
-            knee_placement = placement_analysis["knee_placement"]
-            if knee_placement == 1:
-                form_errors.append({
-                    'type': 'knee_placement',
-                    'severity': 'high',
-                    'message': 'Knees too close together'
-                })
-            elif knee_placement == 2:
-                form_errors.append({
-                    'type': 'knee_placement',
-                    'severity': 'high',
-                    'message': 'Knees too far apart'
-                })
+            foot_error = FOOT_PLACEMENT_ERRORS.get(placement_analysis["foot_placement"])
+            if foot_error is not None:
+                form_errors.append([foot_error, None])
+            knee_error = KNEE_PLACEMENT_ERRORS.get(placement_analysis["knee_placement"])
+            if knee_error is not None:
+                form_errors.append([knee_error, None])
             
             # Calculate metrics - do this after all critical validations
             metrics = self.calculate_metrics(landmarks)
+            if self.trace is not None:
+                self.trace.mark("geometry")
             if metrics is None:
                 return {
                     'success': False,
@@ -434,17 +493,18 @@ class SquatAnalyzer:
             rep_count = self.rep_counter.get_count()
             
             # Log the analysis result for debugging
-            logger.info(f"Sending analysis result: stage={stage}, score={form_score}, reps={rep_count}")
-            
+            if DIAG.on("squat"):
+                DIAG.emit("squat", "result", stage=stage, form_score=form_score, rep_count=rep_count)
+            
+            result = {
+                'stage': stage,
+                'metrics': metrics,
+                'formScore': form_score,
+                'repCount': rep_count
+            }
             return {
                 'success': True,
-                'result': {
-                    'stage': stage,
-                    'metrics': metrics,
-                    'errors': form_errors,
-                    'formScore': form_score,
-                    'repCount': rep_count
-                }
+                'result': ERRORS.put_errors(result, form_errors, self.compact_errors)
             }
 
         except Exception as e:
@@ -458,29 +518,96 @@ class SquatAnalyzer:
                 }
             }
 
-    def calculate_form_score(self, errors: List[Dict[str, str]]) -> float:
-        """Calculate form score based on errors."""
-        base_score = 100
-        
-        for error in errors:
-            if error['severity'] == 'high':
-                base_score -= 20
-            elif error['severity'] == 'medium':
-                base_score -= 10
-            elif error['severity'] == 'low':
-                base_score -= 5
-        
-        return max(0, min(100, base_score))
+    def calculate_form_score(self, errors: List[list]) -> float:
+        """Calculate form score from the integer weights of the error codes."""
+        return ERRORS.form_score(errors)
 
-    def reset_rep_counter(self) -> None:
-        """Reset the repetition counter. Should be called between sets."""
+    def reset_rep_counter(self, session_key: Optional[str] = None) -> None:
+        """
+        Reset the repetition counter. Should be called between sets. With
+        the state store enabled, only the session's row is reset when a
+        session_key is given.
+        """
         logger.warning("RESET_DEBUG: Resetting rep counter in SquatAnalyzer")  # Use warning level for higher visibility
         old_count = self.rep_counter.get_count()
-        self.rep_counter.reset()
+        self.rep_counter.reset(session_key)
         new_count = self.rep_counter.get_count()
         logger.warning(f"RESET_DEBUG: Rep counter reset from {old_count} to {new_count}")  # Use warning level for higher visibility
 
-    def determine_stage(self, landmarks: List[Dict[str, float]]) -> str:
+    def enable_state_store(self) -> bool:
+        """
+        Keep rep state per session in a SessionStateStore row (keyed by
+        session_key) instead of one RepCounter shared by all sessions
+        """
+        if self.rep_counter.state_store is None:
+            self.rep_counter.state_store = SessionStateStore("squat", max_sessions=1024)
+        return True
+    
+    def disable_state_store(self) -> None:
+        """Go back to the shared RepCounter state"""
+        self.rep_counter.state_store = None
+    
+    def get_state_store_stats(self) -> Dict[str, Any]:
+        """Occupancy of the state store"""
+        store = self.rep_counter.state_store
+        if store is None:
+            return {"exerciseType": "squat", "enabled": False}
+        stats = store.get_stats()
+        stats["enabled"] = True
+        return stats
+    
+    def enable_motion_gate(self, threshold: Optional[float] = None, refresh_interval: Optional[int] = None) -> bool:
+        """
+        Reuse the last ML prediction while the important landmarks move less
+        than `threshold`, forcing a new inference every `refresh_interval` frames.
+        The rep counter still sees every frame.
+        """
+        self.motion_gates.configure(threshold, refresh_interval)
+        if not self.use_motion_gate:
+            self.motion_gates.reset()
+        self.use_motion_gate = True
+        return True
+    
+    def disable_motion_gate(self) -> None:
+        """Run the ML model on every frame again"""
+        self.use_motion_gate = False
+    
+    def get_motion_gate_stats(self) -> Dict[str, Any]:
+        """Skip ratio and refresh disagreements of the motion gates"""
+        stats = self.motion_gates.get_stats()
+        stats["enabled"] = self.use_motion_gate
+        return stats
+    
+    def predict_batch(self, frames: np.ndarray) -> Optional[List[Tuple[Any, float]]]:
+        """
+        Vectorized ML step of determine_stage for a (frames, 33, 4) landmark
+        array: one (predicted_class, max_probability) per frame
+        """
+        indices = [self.landmark_map[lm] for lm in self.IMPORTANT_LMS]
+        features = pd.DataFrame(frames[:, indices, :].reshape(len(frames), -1).astype(np.float64))
+        
+        predicted_classes = self.model.predict(features)
+        max_probabilities = self.model.predict_proba(features).max(axis=1)
+        return list(zip(predicted_classes, max_probabilities))
+    
+    def enable_prediction_cache(self, max_entries: Optional[int] = None, quantization: Optional[float] = None) -> bool:
+        """Memoize classifier outputs for inputs that quantize to a seen feature vector"""
+        self.prediction_cache.configure(max_entries, quantization)
+        self.use_prediction_cache = True
+        return True
+    
+    def disable_prediction_cache(self) -> None:
+        """Stop using and drop the cached classifier outputs"""
+        self.use_prediction_cache = False
+        self.prediction_cache.clear()
+    
+    def get_prediction_cache_stats(self) -> Dict[str, Any]:
+        """Hit rate and occupancy of the prediction cache"""
+        stats = self.prediction_cache.get_stats()
+        stats["enabled"] = self.use_prediction_cache
+        return stats
+    
+    def determine_stage(self, landmarks: List[Dict[str, float]], timestamp: Optional[float] = None) -> str:
         """
         Determine the current stage of the squat using ML prediction only.
         """
@@ -502,34 +629,72 @@ class SquatAnalyzer:
             
             # Early return if landmarks are missing
             if not all(idx < len(landmarks) for idx in required_indices):
-                logger.warning("Missing required landmarks for stage determination")
+                if DIAG.on("squat"):
+                    DIAG.emit("squat", "missing_landmarks", step="stage")
                 return 'unknown'
             
             # Stricter visibility check similar to original implementation
             for idx in required_indices:
                 if landmarks[idx]['visibility'] < stage_visibility_threshold:
-                    logger.debug(f"Landmark at index {idx} has low visibility: {landmarks[idx]['visibility']}")
+                    if DIAG.on("squat"):
+                        DIAG.emit("squat", "low_visibility", index=idx, visibility=landmarks[idx]['visibility'])
                     return 'unknown'
                     
+            if self.quality_tier == "geometric":
+                stage_prediction = self.determine_stage_geometric(landmarks)
+                if self.trace is not None:
+                    self.trace.mark("geometry")
+                self.rep_counter.update(stage_prediction, 1.0, timestamp)
+                return stage_prediction
+            
             # Use ML model with reduced threshold for better sensitivity
             stage_prediction = 'unknown'
             prediction_confidence = 0.0
             
             try:
-                # Extract features for ML model
-                features = pd.DataFrame([self.extract_important_keypoints(landmarks)])
-                
-                # Make prediction using ML model
-                predictions = self.model.predict(features)
-                probabilities = self.model.predict_proba(features)
-                
-                # Get the highest probability and its class
-                max_prob = max(probabilities[0])
-                predicted_class = predictions[0]
+                # Precomputed during offline replay, or reused while the body is still (motion gate)
+                motion_gate = None
+                if self.prediction_replay is not None:
+                    cached = self.prediction_replay.current()
+                else:
+                    motion_gate = self.motion_gates.get(self.session_key) if self.use_motion_gate else None
+                    cached = motion_gate.lookup(landmarks) if motion_gate is not None else None
+                    if motion_gate is not None and self.trace is not None:
+                        self.trace.note("gate", "skip" if cached is not None else "refresh" if motion_gate.refresh_pending else "infer")
+                if cached is not None:
+                    predicted_class, max_prob = cached
+                else:
+                    # Extract features for ML model
+                    features = pd.DataFrame([self.extract_important_keypoints(landmarks)])
+                    if self.trace is not None:
+                        self.trace.mark("feature_extraction")
+                    
+                    # Make prediction using ML model (memoized when the prediction cache is on)
+                    cache_key = self.prediction_cache.make_key(features) if self.use_prediction_cache else None
+                    cached_prediction = self.prediction_cache.get(cache_key) if cache_key is not None else None
+                    if cache_key is not None and self.trace is not None:
+                        self.trace.note("cache", "hit" if cached_prediction is not None else "miss")
+                    if cached_prediction is not None:
+                        predicted_class, class_probabilities = cached_prediction
+                    else:
+                        predicted_class, class_probabilities = self.model.predict(features)[0], self.model.predict_proba(features)[0]
+                        if self.trace is not None:
+                            self.trace.note("model", "lr")
+                        if cache_key is not None:
+                            self.prediction_cache.put(cache_key, (predicted_class, class_probabilities))
+                    
+                    # Get the highest probability and its class
+                    max_prob = max(class_probabilities)
+                    
+                    # Debug log the ML prediction
+                    if DIAG.on("squat"):
+                        DIAG.emit("squat", "ml_prediction", predicted_class=predicted_class, confidence=max_prob, probabilities=class_probabilities)
+                    
+                    if motion_gate is not None:
+                        motion_gate.store(landmarks, (predicted_class, max_prob))
                 prediction_confidence = max_prob
-                
-                # Debug log the ML prediction
-                logger.warning(f"ML MODEL DEBUG: Predicted class={predicted_class}, confidence={max_prob:.4f}, probabilities={probabilities[0]}")
+                if self.trace is not None:
+                    self.trace.mark("inference")
                 
                 # Map class to stage according to original model: 0=down, 1=up
                 # There is no middle stage in the original model
@@ -539,10 +704,12 @@ class SquatAnalyzer:
                     elif predicted_class == 1:
                         stage_prediction = 'up'
                     else:
-                        logger.warning(f"Unknown class prediction: {predicted_class}")
+                        if DIAG.on("squat"):
+                            DIAG.emit("squat", "unknown_class", predicted_class=predicted_class)
                         stage_prediction = 'unknown'
                 else:
-                    logger.warning(f"Low confidence prediction: class={predicted_class}, conf={max_prob:.4f}")
+                    if DIAG.on("squat"):
+                        DIAG.emit("squat", "low_confidence", predicted_class=predicted_class, confidence=max_prob)
                     # For low confidence, still use the predicted class to improve sensitivity
                     if predicted_class == 0:
                         stage_prediction = 'down'
@@ -557,10 +724,11 @@ class SquatAnalyzer:
             # If ML gave us a prediction, use it
             if stage_prediction != 'unknown':
                 # Log the final prediction
-                logger.warning(f"STAGE DETECTED: {stage_prediction} with confidence {prediction_confidence:.4f}")
+                if DIAG.on("squat"):
+                    DIAG.emit("squat", "stage", stage=stage_prediction, confidence=prediction_confidence)
                 
                 # Update the rep counter
-                self.rep_counter.update(stage_prediction, prediction_confidence)
+                self.rep_counter.update(stage_prediction, prediction_confidence, timestamp)
                 return stage_prediction
             
             # If no prediction, return unknown
@@ -570,6 +738,27 @@ class SquatAnalyzer:
             logger.error(f"Error determining stage: {str(e)}")
             return 'unknown'
 
+    def determine_stage_geometric(self, landmarks: List[Dict[str, float]]) -> str:
+        """
+        Stage from the mean knee angle (ANGLE_THRESHOLDS), used instead of
+        the ML model in the geometric quality tier. Between the thresholds
+        the last stage is kept, so a rep is still one down -> up transition.
+        """
+        knee_angles = []
+        for side in ("LEFT", "RIGHT"):
+            hip = landmarks[self.landmark_map[f"{side}_HIP"]]
+            knee = landmarks[self.landmark_map[f"{side}_KNEE"]]
+            ankle = landmarks[self.landmark_map[f"{side}_ANKLE"]]
+            knee_angles.append(self.calculate_angle([hip['x'], hip['y']], [knee['x'], knee['y']],
+                                                    [ankle['x'], ankle['y']]))
+        knee_angle = sum(knee_angles) / len(knee_angles)
+        
+        if knee_angle <= self.ANGLE_THRESHOLDS["down"]:
+            return 'down'
+        if knee_angle >= self.ANGLE_THRESHOLDS["up"]:
+            return 'up'
+        return self.rep_counter.last_stage or 'up'
+
     def calculate_metrics(self, landmarks: List[Dict[str, float]]) -> Optional[Dict[str, float]]:
         """
         Calculate various metrics from the pose data.
@@ -586,13 +775,15 @@ class SquatAnalyzer:
             
             # Early return if landmarks are missing
             if not all(idx < len(landmarks) for idx in required_indices):
-                logger.warning("Missing required landmarks for metrics calculation")
+                if DIAG.on("squat"):
+                    DIAG.emit("squat", "missing_landmarks", step="metrics")
                 return None
                 
             # Check visibility before calculating
             for idx in required_indices:
                 if landmarks[idx]['visibility'] < self.VISIBILITY_THRESHOLD:
-                    logger.debug(f"Low visibility for landmark at index {idx}")
+                    if DIAG.on("squat"):
+                        DIAG.emit("squat", "low_visibility", index=idx, visibility=landmarks[idx]['visibility'])
                     # Continue with calculation, will use what we have
             
             # Calculate widths using both left and right sides for robustness